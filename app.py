@@ -36,6 +36,7 @@ from components.broker_links.broker_links_manager import BrokerLinksManager
 from components.scripts.scripts_manager import ScriptsManager
 from components.ai_assistant.ai_ui_components import render_ai_assistant
 from components.storage.storage_ui import render_storage_wrapper
+from utils.task_due_scheduler import get_task_due_scheduler
 
 # Configurazione pagina
 st.set_page_config(
@@ -568,6 +569,9 @@ def main():
     # Utente autenticato - mostra l'applicazione
     render_header()
     
+    # Scheduler scadenze task (caricato e avviato una sola volta per processo)
+    get_task_due_scheduler()
+    
     # Gestione sidebar temporanea dopo login
     show_sidebar = False
     if st.session_state.get('show_sidebar_temporarily', False):
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Benchmark AI Assistant - Latenze delle funzionalità AI contro il mock DeepSeek
+Misura p50/p95, chiamate API per funzionalità e hit rate della cache per
+LeadAnalyzer, SalesScriptGenerator e MarketingAdvisor senza rete né database
+Creato da Ezio Camporeale
+"""
+
+import sys
+import time
+import random
+import logging
+import tempfile
+from datetime import datetime, timedelta, timezone
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Callable
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+import numpy as np
+
+from mock_deepseek_server import MockDeepSeekServer
+from components.ai_assistant import ai_core, lead_analyzer, sales_script_generator, marketing_advisor
+from components.ai_assistant.ai_cache import AIResponseCache
+from components.ai_assistant.ai_executor import TokenBucket, SingleFlight
+from components.ai_assistant.analytics_snapshot import AnalyticsSnapshot
+from components.ai_assistant.prompt_builder import PromptBuilder, CHARS_PER_TOKEN
+from components.ai_assistant.session_memory import SessionMemory
+
+INDUSTRIES = ['Finanza', 'Immobiliare', 'Assicurazioni', 'Retail', 'Tecnologia']
+SOURCES = ['website', 'referral', 'social', 'advertising', 'cold_call']
+BUDGETS = ['5000', '15000', '50000', None]
+
+
+def _synthetic_lead(lead_id: int) -> Dict[str, Any]:
+    rng = random.Random(lead_id)
+    return {
+        'id': lead_id,
+        'first_name': f"Nome{lead_id}",
+        'last_name': f"Cognome{lead_id}",
+        'email': f"lead{lead_id}@example.com",
+        'phone': f"+39 333 {lead_id:07d}",
+        'company': f"Azienda {lead_id}",
+        'industry': rng.choice(INDUSTRIES),
+        'budget': rng.choice(BUDGETS),
+        'expected_close_date': None,
+        'notes': 'Interessato a una consulenza entro il mese',
+        'state_name': 'Nuovo',
+        'source_name': rng.choice(SOURCES)
+    }
+
+
+def _synthetic_contacts(lead_id: int) -> List[Dict[str, Any]]:
+    return [{'lead_id': lead_id, 'contact_type': 'email', 'notes': f"Contatto {n}"} for n in range(3)]
+
+
+def _synthetic_activities(lead_id: int) -> List[Dict[str, Any]]:
+    return [{'lead_id': lead_id, 'title': f"Richiamare lead {lead_id}", 'priority_name': 'Alta'}]
+
+
+class SyntheticDatabase:
+    """Sostituto del DatabaseManager con lead sintetici (conta le query di contesto e analytics)"""
+
+    def __init__(self, leads: int = 200):
+        self.leads = leads
+        self.context_queries = 0
+        self.analytics_queries = 0
+
+    def get_lead_contexts(self, lead_ids: List[int], contacts_limit: int = 10,
+                          activities_limit: int = 5) -> Dict[int, Dict[str, Any]]:
+        self.context_queries += 1
+        return {
+            lead_id: {
+                'lead': _synthetic_lead(lead_id),
+                'contacts': _synthetic_contacts(lead_id)[:contacts_limit],
+                'activities': _synthetic_activities(lead_id)[:activities_limit]
+            }
+            for lead_id in lead_ids
+        }
+
+    def get_records_for_analytics(self, table: str, columns: List[str], created_since=None,
+                                  created_until=None, updated_since=None) -> List[Dict[str, Any]]:
+        self.analytics_queries += 1
+        today = datetime.now(timezone.utc)
+        rows = []
+        for lead_id in range(1, self.leads + 1):
+            row = {'id': lead_id, 'created_at': (today - timedelta(days=lead_id % 120)).isoformat(),
+                   'state_id': lead_id % 4 + 1, 'category_id': lead_id % 3 + 1, 'source_id': lead_id % 5 + 1,
+                   'priority_id': lead_id % 3 + 1, 'budget': _synthetic_lead(lead_id)['budget'],
+                   'assigned_to': lead_id % 3 + 1, 'completed_at': None, 'response_received': lead_id % 2 == 0}
+            created_at = datetime.fromisoformat(row['created_at'])
+            if created_since and created_at < created_since or created_until and created_at >= created_until:
+                continue
+            rows.append(row)
+        # I dati sintetici non cambiano: nessuna riga modificata dopo il primo refresh
+        return [] if updated_since is not None else rows
+
+    def get_all_users(self) -> List[Dict[str, Any]]:
+        return [{'id': user_id, 'first_name': 'Utente', 'last_name': str(user_id), 'role_id': 2}
+                for user_id in (1, 2, 3)]
+
+
+def build_assistant(api_url: str, cache_path: str = ':memory:', rate_limit: float = 50,
+                    burst: int = 50) -> ai_core.AIAssistant:
+    """AIAssistant puntato al mock con cache, rate limiter e coalescenza isolati"""
+    assistant = ai_core.AIAssistant.__new__(ai_core.AIAssistant)
+    assistant.api_key = 'benchmark'
+    assistant.api_url = api_url
+    assistant.model = ai_core.DEEPSEEK_MODEL
+    assistant.config = dict(ai_core.AI_ASSISTANT_CONFIG)
+    assistant.cache = AIResponseCache(cache_path)
+    assistant.rate_limiter = TokenBucket(rate_limit, burst)
+    assistant.single_flight = SingleFlight()
+    assistant.prompt_builder = PromptBuilder()
+    assistant.memory = SessionMemory()
+    assistant.logger = logging.getLogger('benchmark_ai_assistant')
+    return assistant
+
+
+@contextmanager
+def _offline(module, assistant, database, **overrides):
+    """Costruisce le funzionalità con l'assistente e il database del benchmark"""
+    overrides.update(AIAssistant=lambda: assistant, DatabaseManager=lambda: database)
+    originals = {name: getattr(module, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(module, name, value)
+
+
+def build_features(assistant, database: SyntheticDatabase = None) -> Dict[str, Any]:
+    """Istanze delle tre funzionalità AI alimentate da dati sintetici"""
+    database = database or SyntheticDatabase()
+    with _offline(lead_analyzer, assistant, database):
+        analyzer = lead_analyzer.LeadAnalyzer()
+
+    with _offline(sales_script_generator, assistant, database):
+        generator = sales_script_generator.SalesScriptGenerator()
+
+    snapshot = AnalyticsSnapshot(database, ':memory:')
+    with _offline(marketing_advisor, assistant, database, get_analytics_snapshot=lambda db: snapshot):
+        advisor = marketing_advisor.MarketingAdvisor()
+
+    return {'analyzer': analyzer, 'generator': generator, 'advisor': advisor}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def run_feature(name: str, calls: List[Callable[[], Any]], server: MockDeepSeekServer,
+                assistant) -> Dict[str, Any]:
+    """Esegue le chiamate di una funzionalità e raccoglie latenze, chiamate API e hit rate"""
+    server.reset_stats()
+    assistant.cache.clear()
+
+    latencies = []
+    failures = 0
+    for call in calls:
+        started = time.perf_counter()
+        result = call()
+        latencies.append(time.perf_counter() - started)
+        if not result:
+            failures += 1
+
+    cache_stats = assistant.cache.stats()
+    return {
+        'feature': name,
+        'requests': len(calls),
+        'failures': failures,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p95_ms': _percentile(latencies, 95) * 1000,
+        'total_s': sum(latencies),
+        'api_calls': server.stats['requests'],
+        'api_calls_per_request': server.stats['requests'] / max(len(calls), 1),
+        'prompt_tokens': server.stats['prompt_chars'] / CHARS_PER_TOKEN / max(server.stats['requests'], 1),
+        'cache_hit_rate': cache_stats['cache_hit_rate']
+    }
+
+
+def run_benchmark(leads: int = 20, repeats: int = 2, latency: float = 0.2, error_rate: float = 0.0,
+                  timeout_rate: float = 0.0, stream: bool = False, batch: bool = True,
+                  seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Esegue il benchmark completo
+
+    Args:
+        leads: Numero di lead sintetici
+        repeats: Passaggi ripetuti sugli stessi lead (dal secondo in poi servono dalla cache)
+        latency: Latenza simulata del server in secondi
+        error_rate: Probabilità di errore 500 del server
+        timeout_rate: Probabilità che il server non risponda
+        stream: Richiede le risposte in streaming
+        batch: Misura anche analisi e script in batch concorrenti
+    """
+    lead_ids = list(range(1, leads + 1))
+    on_chunk = (lambda chunk: None) if stream else None
+
+    with MockDeepSeekServer(latency=latency, error_rate=error_rate, timeout_rate=timeout_rate,
+                            hang_seconds=latency * 20 + 1, seed=seed) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        assistant = build_assistant(server.url, str(Path(tmp) / 'ai_cache.db'))
+        # Timeout breve: un server che non risponde non deve bloccare il benchmark
+        assistant.config['timeout'] = latency * 10 + 1
+        features = build_features(assistant)
+        analyzer, generator, advisor = features['analyzer'], features['generator'], features['advisor']
+
+        results = [
+            run_feature('lead_analysis', [
+                (lambda lead_id=lead_id: analyzer.analyze_lead(lead_id, on_chunk=on_chunk))
+                for _ in range(repeats) for lead_id in lead_ids
+            ], server, assistant),
+            run_feature('sales_script', [
+                (lambda lead_id=lead_id: generator.generate_script(lead_id, 'cold_call', on_chunk=on_chunk))
+                for _ in range(repeats) for lead_id in lead_ids
+            ], server, assistant),
+            run_feature('marketing_advice', [
+                (lambda advice_type=advice_type, days=days:
+                    advisor.get_marketing_advice(advice_type, days, on_chunk=on_chunk))
+                for _ in range(repeats)
+                for advice_type in advisor.advice_types
+                for days in (7, 30, 90)
+            ], server, assistant)
+        ]
+
+        if batch:
+            results.append(run_feature('lead_analysis_batch', [
+                lambda: analyzer.analyze_multiple_leads(lead_ids) for _ in range(repeats)
+            ], server, assistant))
+            results.append(run_feature('sales_script_batch', [
+                lambda: generator.generate_bulk_scripts(lead_ids, 'follow_up') for _ in range(repeats)
+            ], server, assistant))
+
+        assistant.cache.close()
+    return results
+
+
+def print_report(results: List[Dict[str, Any]]):
+    print(f"{'Funzionalità':<22}{'Rich.':>7}{'Falliti':>9}{'p50 ms':>10}{'p95 ms':>10}"
+          f"{'Tot s':>8}{'API':>6}{'API/rich':>10}{'Token/API':>11}{'Hit %':>8}")
+    print("-" * 101)
+    for row in results:
+        print(f"{row['feature']:<22}{row['requests']:>7}{row['failures']:>9}{row['p50_ms']:>10.1f}"
+              f"{row['p95_ms']:>10.1f}{row['total_s']:>8.2f}{row['api_calls']:>6}"
+              f"{row['api_calls_per_request']:>10.2f}{row['prompt_tokens']:>11.0f}{row['cache_hit_rate']:>8.1f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark funzionalità AI contro il mock DeepSeek')
+    parser.add_argument('--leads', type=int, default=20, help='Numero di lead sintetici')
+    parser.add_argument('--repeats', type=int, default=2, help='Passaggi sugli stessi lead')
+    parser.add_argument('--latency', type=float, default=0.2, help='Latenza del server in secondi')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probabilità errore 500')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='Probabilità di non rispondere')
+    parser.add_argument('--stream', action='store_true', help='Richiedi risposte in streaming')
+    parser.add_argument('--no-batch', action='store_true', help='Salta i benchmark batch')
+
+    args = parser.parse_args()
+    # I moduli dell'app configurano il logging a INFO: il report resta leggibile solo a WARNING
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print("🚀 Benchmark AI Assistant (mock DeepSeek locale)")
+    print("=" * 101)
+    print_report(run_benchmark(
+        leads=args.leads, repeats=args.repeats, latency=args.latency,
+        error_rate=args.error_rate, timeout_rate=args.timeout_rate,
+        stream=args.stream, batch=not args.no_batch
+    ))
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+AI Response Cache - Cache persistente delle risposte AI
+Cache su SQLite condivisa tra sessioni Streamlit e processi, con TTL,
+eliminazione LRU per numero di voci e dimensione, e contatori hit/miss reali
+Creato da Ezio Camporeale
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional
+import sys
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(current_dir))
+
+from config import AI_ASSISTANT_CONFIG, AI_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value: Any) -> Any:
+    """Normalizza i dati del prompt: spazi compressi nelle stringhe, chiavi ordinate"""
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_cache_key(prompt_type: str, data: Dict[str, Any], custom_prompt: str = None,
+                   model: str = None) -> str:
+    """
+    Chiave di cache stabile tra processi (sha256 degli input normalizzati)
+    """
+    payload = json.dumps(
+        {
+            'prompt_type': prompt_type,
+            'data': _normalize(data),
+            'custom_prompt': _normalize(custom_prompt),
+            'model': model
+        },
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return f"{prompt_type}_{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class AIResponseCache:
+    """
+    Cache persistente delle risposte AI su SQLite
+    """
+
+    def __init__(self, db_path: Path = AI_CACHE_PATH,
+                 ttl_hours: float = AI_ASSISTANT_CONFIG['cache_duration_hours'],
+                 max_entries: int = AI_ASSISTANT_CONFIG['cache_max_entries'],
+                 max_size_mb: float = AI_ASSISTANT_CONFIG['cache_max_size_mb']):
+        self.db_path = str(db_path)
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+
+        if self.db_path != ':memory:':
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._init_schema()
+
+    def _init_schema(self):
+        with self._lock:
+            if self.db_path != ':memory:':
+                # WAL: letture concorrenti da più processi senza bloccare le scritture
+                self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS ai_cache (
+                    key TEXT PRIMARY KEY,
+                    prompt_type TEXT,
+                    response TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_ai_cache_last_access ON ai_cache(last_access);
+                CREATE INDEX IF NOT EXISTS idx_ai_cache_created_at ON ai_cache(created_at);
+                CREATE TABLE IF NOT EXISTS ai_cache_counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                );
+            """)
+            self.conn.commit()
+
+    def _increment(self, name: str, amount: int = 1):
+        self.conn.execute(
+            "INSERT INTO ai_cache_counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    # ==================== LETTURA / SCRITTURA ====================
+
+    def get(self, key: str, record_stats: bool = True) -> Optional[str]:
+        """
+        Restituisce la risposta in cache se presente e non scaduta
+
+        Args:
+            record_stats: False per un controllo che non deve contare come hit/miss
+        """
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM ai_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row and now - row['created_at'] < self.ttl_seconds:
+                self.conn.execute(
+                    "UPDATE ai_cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key)
+                )
+                if record_stats:
+                    self._increment('hits')
+                self.conn.commit()
+                return row['response']
+
+            if row:
+                self.conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+                self._increment('expired')
+            if record_stats:
+                self._increment('misses')
+            self.conn.commit()
+            return None
+
+    def set(self, key: str, response: str, prompt_type: str = None):
+        """Salva una risposta ed elimina le voci scadute o meno usate oltre i limiti"""
+        now = time.time()
+        size_bytes = len(response.encode('utf-8'))
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, prompt_type, response, size_bytes, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, prompt_type, response, size_bytes, now, now)
+            )
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now: float):
+        """Rimuove le voci scadute e poi le meno usate di recente finché i limiti sono rispettati"""
+        expired = self.conn.execute(
+            "DELETE FROM ai_cache WHERE created_at <= ?", (now - self.ttl_seconds,)
+        ).rowcount
+        if expired:
+            self._increment('expired', expired)
+
+        count, total_bytes = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM ai_cache"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        evicted = 0
+        rows = self.conn.execute("SELECT key, size_bytes FROM ai_cache ORDER BY last_access ASC").fetchall()
+        victims = []
+        for row in rows:
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            victims.append((row['key'],))
+            count -= 1
+            total_bytes -= row['size_bytes']
+            evicted += 1
+
+        self.conn.executemany("DELETE FROM ai_cache WHERE key = ?", victims)
+        self._increment('evictions', evicted)
+        logger.info(f"🗑️ Cache AI: {evicted} risposte rimosse (LRU)")
+
+    def clear(self):
+        """Svuota la cache e azzera i contatori"""
+        with self._lock:
+            self.conn.execute("DELETE FROM ai_cache")
+            self.conn.execute("DELETE FROM ai_cache_counters")
+            self.conn.commit()
+
+    # ==================== STATISTICHE ====================
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistiche calcolate con query aggregate (nessuna scansione in Python)"""
+        now = time.time()
+        with self._lock:
+            total, valid, size_bytes = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(created_at > ?), 0), COALESCE(SUM(size_bytes), 0) FROM ai_cache",
+                (now - self.ttl_seconds,)
+            ).fetchone()
+            counters = {row['name']: row['value'] for row in self.conn.execute("SELECT name, value FROM ai_cache_counters")}
+
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        return {
+            'total_cached': total,
+            'valid_cached': valid,
+            'size_bytes': size_bytes,
+            'hits': hits,
+            'misses': misses,
+            'evictions': counters.get('evictions', 0),
+            'expired': counters.get('expired', 0),
+            'cache_hit_rate': hits / max(hits + misses, 1) * 100
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# ==================== ISTANZA CONDIVISA ====================
+
+_shared_caches: Dict[str, AIResponseCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_ai_response_cache(db_path: Path = AI_CACHE_PATH) -> AIResponseCache:
+    """Restituisce la cache condivisa dal processo per il file indicato"""
+    key = str(db_path)
+    with _shared_lock:
+        if key not in _shared_caches:
+            _shared_caches[key] = AIResponseCache(db_path)
+        return _shared_caches[key]
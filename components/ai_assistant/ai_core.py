@@ -8,9 +8,11 @@ Creato da Ezio Camporeale
 import requests
 import json
 import time
+import queue
 import logging
+import threading
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable, Tuple
 import streamlit as st
 from pathlib import Path
 import sys
@@ -26,6 +28,13 @@ from config import (
     AI_ASSISTANT_CONFIG,
     AI_PROMPTS
 )
+from components.ai_assistant.ai_cache import get_ai_response_cache, make_cache_key
+from components.ai_assistant.ai_executor import get_ai_rate_limiter, get_ai_single_flight
+from components.ai_assistant.prompt_builder import get_prompt_builder
+from components.ai_assistant.session_memory import SessionMemory, get_session_memory
+
+# Fine dei frammenti in streaming passati dalla chiamata condivisa al richiedente
+_STREAM_END = object()
 
 class AIAssistant:
     """
@@ -33,68 +42,105 @@ class AIAssistant:
     Gestisce le chiamate API, cache e gestione errori
     """
     
-    def __init__(self):
-        """Inizializza l'assistente AI con configurazione DeepSeek"""
+    def __init__(self, memory: SessionMemory = None):
+        """
+        Inizializza l'assistente AI con configurazione DeepSeek
+
+        Args:
+            memory: Cronologia in cui registrare gli scambi (default: quella della sessione)
+        """
         self.api_key = DEEPSEEK_API_KEY
         self.api_url = DEEPSEEK_API_URL
         self.model = DEEPSEEK_MODEL
         self.config = AI_ASSISTANT_CONFIG
         
-        # Cache per le risposte (in memoria per questa sessione)
-        self.cache = {}
+        # Cache persistente delle risposte (condivisa tra sessioni e processi)
+        self.cache = get_ai_response_cache()
+        
+        # Rate limiter condiviso tra tutte le istanze del processo
+        self.rate_limiter = get_ai_rate_limiter()
+        
+        # Coalescenza delle richieste identiche in corso
+        self.single_flight = get_ai_single_flight()
+        
+        # Compattazione e budget di token dei prompt
+        self.prompt_builder = get_prompt_builder()
+        
+        # Cronologia limitata della sessione (l'istanza vive in st.session_state)
+        self.memory = memory if memory is not None else get_session_memory()
         
         # Setup logging
         self.logger = logging.getLogger(__name__)
         
-    def _make_api_call(self, prompt: str, system_message: str = None) -> Optional[str]:
+    def _build_request(self, prompt: str, system_message: str = None,
+                       stream: bool = False) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """Prepara headers e payload per l'API DeepSeek"""
+        # Prepara i messaggi
+        messages = []
+        
+        if system_message:
+            messages.append({
+                "role": "system",
+                "content": system_message
+            })
+        
+        messages.append({
+            "role": "user", 
+            "content": prompt
+        })
+        
+        # Headers per l'API
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        # Payload per la richiesta
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": self.config['max_tokens'],
+            "temperature": self.config['temperature'],
+            "stream": stream
+        }
+        
+        return headers, payload
+    
+    def _make_api_call(self, prompt: str, system_message: str = None,
+                       deadline: float = None) -> Optional[str]:
         """
         Effettua una chiamata all'API DeepSeek
         
         Args:
             prompt: Il prompt da inviare all'AI
             system_message: Messaggio di sistema opzionale
+            deadline: Istante limite (time.monotonic()) oltre il quale non ritentare
             
         Returns:
             Risposta dell'AI o None in caso di errore
         """
         try:
-            # Prepara i messaggi
-            messages = []
-            
-            if system_message:
-                messages.append({
-                    "role": "system",
-                    "content": system_message
-                })
-            
-            messages.append({
-                "role": "user", 
-                "content": prompt
-            })
-            
-            # Headers per l'API
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # Payload per la richiesta
-            payload = {
-                "model": self.model,
-                "messages": messages,
-                "max_tokens": self.config['max_tokens'],
-                "temperature": self.config['temperature'],
-                "stream": False
-            }
+            headers, payload = self._build_request(prompt, system_message, stream=False)
             
             # Effettua la chiamata con retry
             for attempt in range(self.config['retry_attempts']):
+                # Rispetta il rate limit condiviso e la deadline della richiesta
+                if not self.rate_limiter.acquire(deadline):
+                    self.logger.warning("⚠️ Deadline richiesta AI scaduta in attesa del rate limit")
+                    return None
+                timeout = self.config['timeout']
+                if deadline is not None:
+                    timeout = min(timeout, deadline - time.monotonic())
+                    if timeout <= 0:
+                        self.logger.warning("⚠️ Deadline richiesta AI scaduta")
+                        return None
+                
                 try:
                     response = requests.post(
                         self.api_url,
                         headers=headers,
                         json=payload,
-                        timeout=self.config['timeout']
+                        timeout=timeout
                     )
                     
                     if response.status_code == 200:
@@ -108,25 +154,110 @@ class AIAssistant:
                             return None
                     else:
                         self.logger.warning(f"⚠️ Errore API: {response.status_code} - {response.text}")
-                        if attempt < self.config['retry_attempts'] - 1:
-                            time.sleep(2 ** attempt)  # Backoff esponenziale
+                        # Backoff esponenziale
+                        if attempt < self.config['retry_attempts'] - 1 and not self._backoff(2 ** attempt, deadline):
+                            return None
                             
                 except requests.exceptions.Timeout:
-                    self.logger.warning(f"⚠️ Timeout API (tentativo {attempt + 1}) - Timeout: {self.config['timeout']}s")
-                    if attempt < self.config['retry_attempts'] - 1:
-                        time.sleep(3 ** attempt)  # Backoff più lungo per timeout
+                    self.logger.warning(f"⚠️ Timeout API (tentativo {attempt + 1}) - Timeout: {timeout:.0f}s")
+                    # Backoff più lungo per timeout
+                    if attempt < self.config['retry_attempts'] - 1 and not self._backoff(3 ** attempt, deadline):
+                        return None
                         
                 except requests.exceptions.RequestException as e:
                     self.logger.error(f"❌ Errore richiesta API: {e}")
-                    if attempt < self.config['retry_attempts'] - 1:
-                        time.sleep(2 ** attempt)
+                    if attempt < self.config['retry_attempts'] - 1 and not self._backoff(2 ** attempt, deadline):
+                        return None
             
             self.logger.error("❌ Tutti i tentativi API falliti")
-            return self._get_fallback_response(prompt_type)
+            return None
             
         except Exception as e:
             self.logger.error(f"❌ Errore generico chiamata API: {e}")
-            return self._get_fallback_response(prompt_type)
+            return None
+    
+    def _backoff(self, seconds: float, deadline: float = None) -> bool:
+        """
+        Attesa prima di un nuovo tentativo
+        
+        Returns:
+            False (senza attendere) se il tentativo partirebbe dopo la deadline
+        """
+        if deadline is not None and time.monotonic() + seconds >= deadline:
+            self.logger.warning("⚠️ Nuovo tentativo saltato: supererebbe la deadline della richiesta AI")
+            return False
+        time.sleep(seconds)
+        return True
+    
+    def _stream_api_call(self, prompt: str, on_chunk: Callable[[str], None],
+                         system_message: str = None, deadline: float = None) -> Optional[str]:
+        """
+        Effettua una chiamata in streaming (server-sent events) all'API DeepSeek
+        
+        Ogni frammento di testo viene passato a `on_chunk` appena arriva.
+        Si ritenta solo se non è ancora arrivato nessun frammento. La deadline
+        vale per l'intera risposta: il timeout di requests limita solo
+        l'attesa tra due byte.
+        
+        Returns:
+            Risposta completa o None in caso di errore
+        """
+        headers, payload = self._build_request(prompt, system_message, stream=True)
+        
+        for attempt in range(self.config['retry_attempts']):
+            if not self.rate_limiter.acquire(deadline):
+                self.logger.warning("⚠️ Deadline richiesta AI scaduta in attesa del rate limit")
+                return None
+            timeout = self.config['timeout']
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    return None
+            
+            parts = []
+            try:
+                with requests.post(self.api_url, headers=headers, json=payload,
+                                   timeout=timeout, stream=True) as response:
+                    if response.status_code != 200:
+                        self.logger.warning(f"⚠️ Errore API streaming: {response.status_code} - {response.text}")
+                        if attempt < self.config['retry_attempts'] - 1 and not self._backoff(2 ** attempt, deadline):
+                            return None
+                        continue
+                    
+                    # Righe in byte decodificate come UTF-8: senza charset nell'header
+                    # requests userebbe ISO-8859-1 e altererebbe accenti ed emoji
+                    for raw_line in response.iter_lines():
+                        if deadline is not None and time.monotonic() > deadline:
+                            self.logger.warning("⚠️ Deadline richiesta AI scaduta durante lo streaming")
+                            return None
+                        line = raw_line.decode('utf-8')
+                        if not line or not line.startswith('data:'):
+                            continue
+                        event = line[len('data:'):].strip()
+                        if event == '[DONE]':
+                            break
+                        choices = json.loads(event).get('choices') or []
+                        delta = choices[0].get('delta', {}).get('content') if choices else None
+                        if delta:
+                            parts.append(delta)
+                            on_chunk(delta)
+                
+                if parts:
+                    self.logger.info(f"✅ Streaming API DeepSeek completato (tentativo {attempt + 1})")
+                    return ''.join(parts)
+                self.logger.error("❌ Risposta streaming senza contenuto valido")
+                return None
+                
+            except (requests.exceptions.RequestException, ValueError) as e:
+                self.logger.error(f"❌ Errore streaming API: {e}")
+                if parts:
+                    # Risposta interrotta a metà: non ritentare per non duplicare il testo mostrato
+                    return None
+                if attempt < self.config['retry_attempts'] - 1 and not self._backoff(2 ** attempt, deadline):
+                    return None
+        
+        self.logger.error("❌ Tutti i tentativi di streaming falliti")
+        return None
     
     def _get_fallback_response(self, prompt_type: str) -> str:
         """Risposta di fallback quando l'API non è disponibile"""
@@ -197,41 +328,96 @@ class AIAssistant:
         
         return fallback_responses.get(prompt_type, "Risposta non disponibile in modalità offline.")
     
-    def _get_cache_key(self, prompt_type: str, data_hash: str) -> str:
+    def _get_cache_key(self, prompt_type: str, data: Dict[str, Any], custom_prompt: str = None) -> str:
         """Genera una chiave di cache per la risposta"""
-        return f"{prompt_type}_{data_hash}"
+        return make_cache_key(prompt_type, data, custom_prompt, self.model)
     
-    def _is_cache_valid(self, cache_key: str) -> bool:
-        """Verifica se la cache è ancora valida"""
-        if not self.config['cache_responses']:
-            return False
-            
-        if cache_key not in self.cache:
-            return False
-            
-        cache_time = self.cache[cache_key]['timestamp']
-        cache_duration = timedelta(hours=self.config['cache_duration_hours'])
-        
-        return datetime.now() - cache_time < cache_duration
-    
-    def _get_cached_response(self, cache_key: str) -> Optional[str]:
+    def _get_cached_response(self, cache_key: str, record_stats: bool = True) -> Optional[str]:
         """Recupera una risposta dalla cache"""
-        if self._is_cache_valid(cache_key):
+        if not self.config['cache_responses']:
+            return None
+        response = self.cache.get(cache_key, record_stats)
+        if response is not None:
             self.logger.info("📋 Risposta recuperata dalla cache")
-            return self.cache[cache_key]['response']
-        return None
+        return response
     
-    def _cache_response(self, cache_key: str, response: str):
+    def _cache_response(self, cache_key: str, response: str, prompt_type: str = None):
         """Salva una risposta nella cache"""
         if self.config['cache_responses']:
-            self.cache[cache_key] = {
-                'response': response,
-                'timestamp': datetime.now()
-            }
+            self.cache.set(cache_key, response, prompt_type)
             self.logger.info("💾 Risposta salvata in cache")
     
+    def _call_and_cache(self, cache_key: str, prompt_type: str, prompt: str,
+                        deadline: float = None, on_chunk: Callable[[str], None] = None) -> Optional[str]:
+        """Chiamata API effettiva (eseguita una sola volta per chiave tra richieste concorrenti)"""
+        # Un'altra richiesta potrebbe aver appena completato e salvato la stessa risposta
+        cached_response = self._get_cached_response(cache_key, record_stats=False)
+        if cached_response:
+            if on_chunk:
+                on_chunk(cached_response)
+            return cached_response
+        
+        # Effettua chiamata API
+        if on_chunk and self.config['stream_responses']:
+            response = self._stream_api_call(prompt, on_chunk, deadline=deadline)
+        else:
+            response = self._make_api_call(prompt, deadline=deadline)
+            if response and on_chunk:
+                on_chunk(response)
+        
+        if response:
+            # Salva in cache
+            self._cache_response(cache_key, response, prompt_type)
+        return response
+    
+    def _shared_call(self, cache_key: str, prompt_type: str, prompt: str, deadline: float = None,
+                     on_chunk: Callable[[str], None] = None) -> Tuple[Optional[str], bool]:
+        """
+        Chiamata API condivisa tra richieste identiche concorrenti
+        
+        La funzione condivisa non esegue mai la callback dell'interfaccia: in
+        streaming la chiamata gira in un thread separato e passa i frammenti
+        al thread del richiedente tramite una coda. Così un'eccezione della UI
+        (stop o rerun di Streamlit) interrompe solo questo richiedente, mentre
+        la chiamata prosegue per gli altri e la risposta finisce in cache.
+        
+        Returns:
+            (risposta, condivisa)
+        """
+        timeout = deadline - time.monotonic() if deadline is not None else None
+        if on_chunk is None:
+            return self.single_flight.do(
+                cache_key, lambda: self._call_and_cache(cache_key, prompt_type, prompt, deadline),
+                timeout=timeout
+            )
+        
+        chunks: queue.Queue = queue.Queue()
+        outcome: Dict[str, Any] = {}
+        
+        def run():
+            try:
+                outcome['value'] = self.single_flight.do(
+                    cache_key, lambda: self._call_and_cache(cache_key, prompt_type, prompt, deadline, chunks.put),
+                    timeout=timeout
+                )
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                chunks.put(_STREAM_END)
+        
+        threading.Thread(target=run, name='ai-call', daemon=True).start()
+        while True:
+            chunk = chunks.get()
+            if chunk is _STREAM_END:
+                break
+            on_chunk(chunk)
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['value']
+    
     def generate_response(self, prompt_type: str, data: Dict[str, Any], 
-                         custom_prompt: str = None) -> Optional[str]:
+                         custom_prompt: str = None, deadline: float = None,
+                         on_chunk: Callable[[str], None] = None) -> Optional[str]:
         """
         Genera una risposta AI basata sul tipo di prompt e i dati forniti
         
@@ -239,51 +425,67 @@ class AIAssistant:
             prompt_type: Tipo di prompt (sales_script, marketing_advice, lead_analysis)
             data: Dati da utilizzare per personalizzare il prompt
             custom_prompt: Prompt personalizzato opzionale
+            deadline: Istante limite (time.monotonic()) per la chiamata API
+            on_chunk: Se fornita, la risposta viene richiesta in streaming e ogni
+                frammento di testo viene passato a questa funzione appena arriva
             
         Returns:
             Risposta dell'AI o None in caso di errore
         """
         try:
-            # Genera chiave cache basata sui dati
-            data_str = json.dumps(data, sort_keys=True)
-            data_hash = str(hash(data_str))
-            cache_key = self._get_cache_key(prompt_type, data_hash)
+            # Genera chiave cache basata sui dati normalizzati
+            cache_key = self._get_cache_key(prompt_type, data, custom_prompt)
             
             # Controlla cache
             cached_response = self._get_cached_response(cache_key)
             if cached_response:
+                if on_chunk:
+                    on_chunk(cached_response)
+                self.memory.record(prompt_type, custom_prompt, cached_response, source='cache')
                 return cached_response
             
-            # Prepara il prompt
+            # Prepara il prompt entro il budget di token della funzionalità
             if custom_prompt:
-                prompt = custom_prompt
+                prompt = self.prompt_builder.fit(prompt_type, custom_prompt)
             elif prompt_type in AI_PROMPTS:
-                prompt_template = AI_PROMPTS[prompt_type]
-                prompt = prompt_template.format(**data)
+                prompt = self.prompt_builder.build(prompt_type, AI_PROMPTS[prompt_type], data)
             else:
                 self.logger.error(f"❌ Tipo prompt non riconosciuto: {prompt_type}")
                 return None
             
-            # Effettua chiamata API
-            response = self._make_api_call(prompt)
+            # Richieste identiche concorrenti (altre sessioni o rerun) condividono una sola chiamata API
+            response, shared = self._shared_call(cache_key, prompt_type, prompt, deadline, on_chunk)
+            
+            if shared:
+                self.logger.info("🔗 Risposta condivisa con una richiesta identica in corso")
+                if response and on_chunk:
+                    on_chunk(response)
             
             if response:
-                # Salva in cache
-                self._cache_response(cache_key, response)
-                return response
-            else:
-                return None
+                self.memory.record(prompt_type, prompt, response, source='shared' if shared else 'api')
+            return response or None
                 
         except Exception as e:
             self.logger.error(f"❌ Errore generazione risposta: {e}")
             return None
     
-    def get_conversation_history(self) -> List[Dict[str, str]]:
+    def get_conversation_history(self, limit: int = None) -> List[Dict[str, str]]:
         """
-        Recupera la cronologia delle conversazioni (per implementazioni future)
+        Recupera la cronologia delle conversazioni della sessione
+        
+        Args:
+            limit: Numero massimo di scambi più recenti
         """
-        # Implementazione futura per persistenza conversazioni
-        return []
+        return self.memory.history(limit)
+    
+    def clear_conversation_history(self):
+        """Svuota la cronologia della sessione"""
+        self.memory.clear()
+        self.logger.info("🗑️ Cronologia AI della sessione pulita")
+    
+    def get_memory_usage(self) -> Dict[str, Any]:
+        """Memoria trattenuta dalla sessione"""
+        return self.memory.usage()
     
     def clear_cache(self):
         """Pulisce la cache delle risposte"""
@@ -292,15 +494,12 @@ class AIAssistant:
     
     def get_cache_stats(self) -> Dict[str, Any]:
         """Restituisce statistiche sulla cache"""
-        total_cached = len(self.cache)
-        valid_cached = sum(1 for key in self.cache.keys() if self._is_cache_valid(key))
-        
-        return {
-            'total_cached': total_cached,
-            'valid_cached': valid_cached,
-            'cache_hit_rate': valid_cached / max(total_cached, 1) * 100,
-            'cache_enabled': self.config['cache_responses']
-        }
+        stats = self.cache.stats()
+        stats['cache_enabled'] = self.config['cache_responses']
+        stats['coalesced_requests'] = self.single_flight.coalesced
+        stats['in_flight_requests'] = self.single_flight.in_flight()
+        stats['truncated_prompts'] = self.prompt_builder.truncated_prompts
+        return stats
     
     def test_connection(self) -> bool:
         """
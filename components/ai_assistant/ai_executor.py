@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+AI Executor - Esecuzione concorrente delle chiamate AI
+Pool di worker limitato, rate limiter token bucket condiviso, deadline
+per batch e consegna dei risultati parziali man mano che arrivano
+Creato da Ezio Camporeale
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, Callable, Hashable, Tuple
+from pathlib import Path
+import sys
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(current_dir))
+
+from config import AI_ASSISTANT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Rate limiter token bucket thread-safe
+
+    `rate` token al secondo, fino a `capacity` token accumulati (burst).
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, deadline: float = None) -> bool:
+        """
+        Attende un token
+
+        Args:
+            deadline: Istante limite (time.monotonic()); None = attesa illimitata
+
+        Returns:
+            True se il token è stato ottenuto, False se non arriva entro la deadline
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+
+            if deadline is not None and time.monotonic() + wait > deadline:
+                # Il prossimo token arriverebbe dopo la deadline: inutile attendere
+                return False
+            time.sleep(wait)
+
+
+@dataclass
+class BatchResult:
+    """Esito di un batch: risultati completati, errori e richieste non concluse in tempo"""
+    results: Dict[Hashable, Any] = field(default_factory=dict)
+    errors: Dict[Hashable, str] = field(default_factory=dict)
+    timed_out: List[Hashable] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def complete(self) -> bool:
+        return not self.errors and not self.timed_out
+
+
+class AIBatchExecutor:
+    """
+    Esegue in parallelo funzioni che effettuano chiamate AI
+    """
+
+    def __init__(self, max_workers: int = AI_ASSISTANT_CONFIG['max_concurrent_requests']):
+        self.max_workers = max_workers
+
+    def map(self, func: Callable[[Any], Any], items: Dict[Hashable, Any],
+            deadline_seconds: float = None,
+            on_result: Callable[[Hashable, Any], None] = None) -> BatchResult:
+        """
+        Applica `func` a ogni elemento di `items` in parallelo
+
+        Args:
+            func: Funzione da applicare (riceve il valore dell'elemento)
+            items: Dizionario chiave -> argomento
+            deadline_seconds: Tempo massimo per l'intero batch
+            on_result: Callback chiamata (nel thread chiamante) per ogni risultato completato
+
+        Returns:
+            BatchResult con i risultati disponibili alla scadenza
+        """
+        batch = BatchResult()
+        if not items:
+            return batch
+
+        started = time.monotonic()
+        deadline = started + deadline_seconds if deadline_seconds else None
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(items)))
+        futures = {executor.submit(func, value): key for key, value in items.items()}
+        try:
+            timeout = deadline - time.monotonic() if deadline else None
+            for future in as_completed(futures, timeout=timeout):
+                key = futures[future]
+                try:
+                    batch.results[key] = future.result()
+                    if on_result:
+                        on_result(key, batch.results[key])
+                except Exception as e:
+                    batch.errors[key] = str(e)
+                    logger.error(f"❌ Errore richiesta AI {key}: {e}")
+        except FuturesTimeoutError:
+            batch.timed_out = [key for future, key in futures.items() if not future.done()]
+            logger.warning(f"⚠️ Deadline batch AI scaduta: {len(batch.timed_out)} richieste non completate")
+        finally:
+            # Non attende le richieste ancora in corso: le scarta e annulla quelle in coda
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        batch.elapsed_seconds = time.monotonic() - started
+        logger.info(f"✅ Batch AI: {len(batch.results)}/{len(items)} completate in {batch.elapsed_seconds:.1f}s")
+        return batch
+
+
+class _InFlightCall:
+    """Chiamata in corso condivisa tra più richiedenti"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[Exception] = None
+        # Il richiedente che eseguiva la chiamata è uscito senza risultato (es. rerun Streamlit)
+        self.abandoned = False
+
+
+class SingleFlight:
+    """
+    Coalescenza delle richieste in corso
+
+    Richieste concorrenti con la stessa chiave attendono un'unica esecuzione
+    della funzione e ne condividono il risultato.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _InFlightCall] = {}
+        self.coalesced = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any], timeout: float = None) -> Tuple[Any, bool]:
+        """
+        Esegue `func` una sola volta per chiave tra i richiedenti concorrenti
+
+        Args:
+            key: Chiave della richiesta
+            func: Funzione da eseguire se nessuna chiamata è già in corso
+            timeout: Attesa massima (secondi) per chi si accoda a una chiamata in corso
+
+        Returns:
+            (risultato, condiviso) dove condiviso è True se il risultato arriva
+            da una chiamata avviata da un altro richiedente
+        """
+        wait_until = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _InFlightCall()
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                break
+            remaining = wait_until - time.monotonic() if wait_until is not None else None
+            if not call.done.wait(remaining):
+                raise TimeoutError(f"Attesa della richiesta in corso scaduta ({key})")
+            if call.abandoned:
+                # Nessun risultato da condividere: esegue la propria chiamata
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except Exception as e:
+            # Solo gli errori ordinari vengono condivisi: eccezioni di controllo
+            # (SystemExit, KeyboardInterrupt, stop/rerun di Streamlit) riguardano
+            # solo il thread del richiedente
+            call.error = e
+            raise
+        except BaseException:
+            call.abandoned = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        """Numero di chiamate attualmente in corso"""
+        with self._lock:
+            return len(self._calls)
+
+
+# ==================== ISTANZA CONDIVISA ====================
+
+_rate_limiter: Optional[TokenBucket] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_ai_rate_limiter() -> TokenBucket:
+    """Rate limiter condiviso da tutte le chiamate DeepSeek del processo"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = TokenBucket(
+                AI_ASSISTANT_CONFIG['rate_limit_per_second'],
+                AI_ASSISTANT_CONFIG['rate_limit_burst']
+            )
+        return _rate_limiter
+
+
+_single_flight = SingleFlight()
+
+
+def get_ai_single_flight() -> SingleFlight:
+    """Coalescenza condivisa da tutte le istanze AIAssistant del processo"""
+    return _single_flight
@@ -8,6 +8,7 @@ Creato da Ezio Camporeale
 import streamlit as st
 import json
 import logging
+import time
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 from pathlib import Path
@@ -21,6 +22,7 @@ from components.ai_assistant.ai_core import get_ai_assistant
 from components.ai_assistant.sales_script_generator import SalesScriptGenerator
 from components.ai_assistant.marketing_advisor import MarketingAdvisor
 from components.ai_assistant.lead_analyzer import LeadAnalyzer
+from components.ai_assistant.session_memory import get_session_memory_report
 from database.database_manager import DatabaseManager
 from config import CUSTOM_COLORS
 
@@ -32,9 +34,10 @@ class AIUIComponents:
     def __init__(self):
         """Inizializza i componenti UI"""
         self.ai_assistant = get_ai_assistant()
-        self.script_generator = SalesScriptGenerator()
-        self.marketing_advisor = MarketingAdvisor()
-        self.lead_analyzer = LeadAnalyzer()
+        # Le funzionalità condividono l'assistente e la cronologia della sessione
+        self.script_generator = SalesScriptGenerator(self.ai_assistant)
+        self.marketing_advisor = MarketingAdvisor(self.ai_assistant)
+        self.lead_analyzer = LeadAnalyzer(self.ai_assistant)
         self.db_manager = DatabaseManager()
         self.logger = logging.getLogger(__name__)
     
@@ -56,7 +59,7 @@ class AIUIComponents:
         with col2:
             if st.button("📊 Statistiche Cache", use_container_width=True, key="ai_cache_stats_main"):
                 cache_stats = self.ai_assistant.get_cache_stats()
-                st.info(f"Cache: {cache_stats['valid_cached']}/{cache_stats['total_cached']} validi")
+                st.info(f"Cache: {cache_stats['valid_cached']}/{cache_stats['total_cached']} validi - Hit rate {cache_stats['cache_hit_rate']:.1f}%")
         
         with col3:
             if st.button("🗑️ Pulisci Cache", use_container_width=True, key="ai_clear_cache_main"):
@@ -120,23 +123,26 @@ class AIUIComponents:
         # Pulsante generazione
         if st.button("🚀 Genera Script", use_container_width=True, type="primary", key="ai_generate_script"):
             if selected_lead_id:
-                with st.spinner("🤖 Generando script personalizzato..."):
-                    # Prepara contesto personalizzato
-                    context_data = {}
-                    if custom_context:
-                        context_data['custom_context'] = custom_context
-                    
-                    # Genera script
-                    script_result = self.script_generator.generate_script(
-                        selected_lead_id, 
-                        script_type, 
-                        context_data
-                    )
-                    
-                    if script_result:
-                        self._display_script_result(script_result)
-                    else:
-                        st.error("❌ Errore nella generazione dello script")
+                placeholder, on_chunk = self._stream_placeholder("🤖 Generando script personalizzato...")
+                
+                # Prepara contesto personalizzato
+                context_data = {}
+                if custom_context:
+                    context_data['custom_context'] = custom_context
+                
+                # Genera script (mostrato in streaming mentre arriva)
+                script_result = self.script_generator.generate_script(
+                    selected_lead_id, 
+                    script_type, 
+                    context_data,
+                    on_chunk=on_chunk
+                )
+                placeholder.empty()
+                
+                if script_result:
+                    self._display_script_result(script_result)
+                else:
+                    st.error("❌ Errore nella generazione dello script")
             else:
                 st.warning("⚠️ Seleziona un lead per generare lo script")
         
@@ -159,16 +165,18 @@ class AIUIComponents:
         
         if st.button("🏭 Genera Script Settore", use_container_width=True, key="ai_generate_industry_script"):
             if industry:
-                with st.spinner("🤖 Generando script per settore..."):
-                    industry_script = self.script_generator.generate_industry_script(
-                        industry, 
-                        industry_script_type
-                    )
-                    
-                    if industry_script:
-                        self._display_industry_script_result(industry_script)
-                    else:
-                        st.error("❌ Errore nella generazione dello script per settore")
+                placeholder, on_chunk = self._stream_placeholder("🤖 Generando script per settore...")
+                industry_script = self.script_generator.generate_industry_script(
+                    industry, 
+                    industry_script_type,
+                    on_chunk=on_chunk
+                )
+                placeholder.empty()
+                
+                if industry_script:
+                    self._display_industry_script_result(industry_script)
+                else:
+                    st.error("❌ Errore nella generazione dello script per settore")
             else:
                 st.warning("⚠️ Inserisci un settore")
     
@@ -201,16 +209,18 @@ class AIUIComponents:
         
         # Pulsante generazione consigli
         if st.button("💡 Genera Consigli Marketing", use_container_width=True, type="primary", key="ai_generate_marketing_advice"):
-            with st.spinner("🤖 Analizzando dati e generando consigli..."):
-                advice_result = self.marketing_advisor.get_marketing_advice(
-                    selected_advice_type, 
-                    time_period
-                )
-                
-                if advice_result:
-                    self._display_marketing_advice_result(advice_result)
-                else:
-                    st.error("❌ Errore nella generazione dei consigli")
+            placeholder, on_chunk = self._stream_placeholder("🤖 Analizzando dati e generando consigli...")
+            advice_result = self.marketing_advisor.get_marketing_advice(
+                selected_advice_type, 
+                time_period,
+                on_chunk=on_chunk
+            )
+            placeholder.empty()
+            
+            if advice_result:
+                self._display_marketing_advice_result(advice_result)
+            else:
+                st.error("❌ Errore nella generazione dei consigli")
         
         st.divider()
         
@@ -287,14 +297,15 @@ class AIUIComponents:
         
         # Analisi a larghezza piena (fuori dalle colonne)
         if analyze_clicked:
-            with st.spinner("🤖 Analizzando lead..."):
-                analysis_result = self.lead_analyzer.analyze_lead(selected_lead_id)
-                
-                if analysis_result:
-                    # Analisi a larghezza piena senza container
-                    self._display_lead_analysis_result(analysis_result)
-                else:
-                    st.error("❌ Errore nell'analisi del lead")
+            placeholder, on_chunk = self._stream_placeholder("🤖 Analizzando lead...")
+            analysis_result = self.lead_analyzer.analyze_lead(selected_lead_id, on_chunk=on_chunk)
+            placeholder.empty()
+            
+            if analysis_result:
+                # Analisi a larghezza piena senza container
+                self._display_lead_analysis_result(analysis_result)
+            else:
+                st.error("❌ Errore nell'analisi del lead")
         
         st.divider()
         
@@ -378,6 +389,20 @@ class AIUIComponents:
         with col3:
             st.metric("Hit Rate", f"{cache_stats['cache_hit_rate']:.1f}%")
         
+        col4, col5, col6 = st.columns(3)
+        
+        with col4:
+            st.metric("Hit / Miss", f"{cache_stats['hits']} / {cache_stats['misses']}")
+        
+        with col5:
+            st.metric("Dimensione Cache", f"{cache_stats['size_bytes'] / 1024:.1f} KB")
+        
+        with col6:
+            st.metric("Rimosse (LRU)", cache_stats['evictions'])
+        
+        st.caption(f"🔗 Richieste identiche condivise: {cache_stats['coalesced_requests']} - In corso: {cache_stats['in_flight_requests']}")
+        st.caption(f"✂️ Prompt ridotti al budget di token: {cache_stats['truncated_prompts']}")
+        
         # Gestione cache
         st.markdown("#### 🗑️ Gestione Cache")
         
@@ -392,7 +417,42 @@ class AIUIComponents:
         with col2:
             if st.button("🔄 Ricarica Statistiche", use_container_width=True, key="ai_reload_stats"):
                 st.rerun()
-        
+
+        # Memoria trattenuta dalle sessioni
+        st.markdown("#### 🧠 Memoria Sessioni")
+
+        memory_usage = self.ai_assistant.get_memory_usage()
+
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            st.metric("Cronologia Sessione", f"{memory_usage['entries']}/{memory_usage['max_entries']}")
+
+        with col2:
+            st.metric("Memoria Sessione", f"{memory_usage['bytes'] / 1024:.1f} / {memory_usage['budget_bytes'] / 1024:.0f} KB")
+
+        with col3:
+            st.metric("Rimossi (budget)", memory_usage['evictions'])
+
+        with st.expander("🔍 Debug memoria per sessione"):
+            sessions = get_session_memory_report()
+            st.dataframe([
+                {
+                    "Sessione": f"{usage['session_id']} (corrente)" if usage['session_id'] == memory_usage['session_id'] else usage['session_id'],
+                    "Creata": usage['created_at'],
+                    "Scambi": usage['entries'],
+                    "KB": round(usage['bytes'] / 1024, 1),
+                    "Rimossi": usage['evictions']
+                }
+                for usage in sessions
+            ], use_container_width=True)
+            st.caption(f"Sessioni attive: {len(sessions)} - Totale: {sum(usage['bytes'] for usage in sessions) / 1024:.1f} KB")
+
+        if st.button("🗑️ Pulisci Cronologia Sessione", use_container_width=True, key="ai_clear_history"):
+            self.ai_assistant.clear_conversation_history()
+            st.success("Cronologia pulita!")
+            st.rerun()
+
         # Informazioni sistema
         st.markdown("#### ℹ️ Informazioni Sistema")
         
@@ -455,6 +515,28 @@ class AIUIComponents:
             self.logger.error(f"❌ Errore recupero lead: {e}")
             return []
     
+    def _stream_placeholder(self, waiting_message: str, min_interval: float = 0.05):
+        """
+        Area che mostra la risposta AI man mano che arriva in streaming
+        
+        Returns:
+            (placeholder, on_chunk): svuotare il placeholder a risposta completata
+        """
+        placeholder = st.empty()
+        placeholder.info(waiting_message)
+        parts = []
+        last_render = [0.0]
+        
+        def on_chunk(text: str):
+            parts.append(text)
+            now = time.monotonic()
+            # Limita i rerender del frontend durante lo streaming
+            if now - last_render[0] >= min_interval:
+                placeholder.markdown(''.join(parts) + " ▌")
+                last_render[0] = now
+        
+        return placeholder, on_chunk
+    
     def _display_script_result(self, script_result: Dict[str, Any]):
         """Visualizza il risultato dello script generato"""
         st.markdown("### 📝 Script Generato")
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Analytics Snapshot - Analytics pre-calcolate per il Marketing Advisor
+Rollup giornalieri di lead, task, utenti e contatti aggiornati in modo
+incrementale (solo i giorni toccati da modifiche) e snapshot per finestra temporale
+Creato da Ezio Camporeale
+"""
+
+import json
+import copy
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+import sys
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(current_dir))
+
+from config import AI_ASSISTANT_CONFIG, AI_ANALYTICS_PATH
+
+logger = logging.getLogger(__name__)
+
+LEAD_COLUMNS = ['state_id', 'category_id', 'source_id', 'budget', 'assigned_to']
+TASK_COLUMNS = ['state_id', 'priority_id', 'assigned_to', 'completed_at']
+CONTACT_COLUMNS = ['response_received']
+
+LAST_REFRESH_KEY = 'last_refresh'
+
+
+def _day(row: Dict[str, Any]) -> Optional[str]:
+    """Giorno (UTC, YYYY-MM-DD) di creazione della riga"""
+    created_at = row.get('created_at')
+    return str(created_at)[:10] if created_at else None
+
+
+def _count(counter: Dict[str, Any], key: Any, amount: float = 1):
+    if key is not None:
+        key = str(key)
+        counter[key] = counter.get(key, 0) + amount
+
+
+def _merge(target: Dict[str, Any], source: Dict[str, Any]):
+    """Somma ricorsivamente i contatori di `source` in `target`"""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            _merge(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def _empty_rollup() -> Dict[str, Any]:
+    return {
+        'leads': {'count': 0, 'by_status': {}, 'by_category': {}, 'by_source': {},
+                  'budget_sum': 0.0, 'budget_count': 0},
+        'tasks': {'count': 0, 'by_status': {}, 'by_priority': {}, 'completed': 0},
+        'users': {},
+        'contacts': {'count': 0, 'responses': 0}
+    }
+
+
+def build_daily_rollups(leads: List[Dict], tasks: List[Dict], contacts: List[Dict]) -> Dict[str, Dict[str, Any]]:
+    """Aggrega le righe per giorno di creazione"""
+    rollups: Dict[str, Dict[str, Any]] = {}
+
+    def rollup_for(row):
+        day = _day(row)
+        return rollups.setdefault(day, _empty_rollup()) if day else None
+
+    def user_for(rollup, user_id):
+        return rollup['users'].setdefault(str(user_id), {'leads_assigned': 0, 'tasks_assigned': 0, 'tasks_completed': 0})
+
+    for lead in leads:
+        rollup = rollup_for(lead)
+        if rollup is None:
+            continue
+        stats = rollup['leads']
+        stats['count'] += 1
+        _count(stats['by_status'], lead.get('state_id'))
+        _count(stats['by_category'], lead.get('category_id'))
+        _count(stats['by_source'], lead.get('source_id'))
+        try:
+            if lead.get('budget') not in (None, ''):
+                stats['budget_sum'] += float(lead['budget'])
+                stats['budget_count'] += 1
+        except (TypeError, ValueError):
+            pass
+        if lead.get('assigned_to'):
+            user_for(rollup, lead['assigned_to'])['leads_assigned'] += 1
+
+    for task in tasks:
+        rollup = rollup_for(task)
+        if rollup is None:
+            continue
+        stats = rollup['tasks']
+        stats['count'] += 1
+        _count(stats['by_status'], task.get('state_id'))
+        _count(stats['by_priority'], task.get('priority_id'))
+        if task.get('completed_at'):
+            stats['completed'] += 1
+        if task.get('assigned_to'):
+            user = user_for(rollup, task['assigned_to'])
+            user['tasks_assigned'] += 1
+            if task.get('completed_at'):
+                user['tasks_completed'] += 1
+
+    for contact in contacts:
+        rollup = rollup_for(contact)
+        if rollup is None:
+            continue
+        rollup['contacts']['count'] += 1
+        if contact.get('response_received'):
+            rollup['contacts']['responses'] += 1
+
+    return rollups
+
+
+class AnalyticsSnapshot:
+    """
+    Rollup giornalieri persistiti su SQLite e snapshot per finestra temporale
+
+    Il refresh rilegge solo le righe modificate dall'ultimo aggiornamento e
+    ricalcola i giorni in cui sono state create; gli snapshot per finestra
+    (7, 30, 90 giorni...) sono somme dei rollup e restano in memoria finché
+    i rollup non cambiano.
+    """
+
+    def __init__(self, db_manager=None, db_path: Path = AI_ANALYTICS_PATH,
+                 refresh_seconds: float = AI_ASSISTANT_CONFIG['analytics_refresh_seconds'],
+                 max_days: int = AI_ASSISTANT_CONFIG['analytics_max_days']):
+        self.db = db_manager
+        self.db_path = str(db_path)
+        self.refresh_seconds = refresh_seconds
+        self.max_days = max_days
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._last_refresh: Optional[float] = None
+        self._snapshots: Dict[tuple, Dict[str, Any]] = {}
+        self._users: Dict[str, Dict[str, Any]] = {}
+
+        if self.db_path != ':memory:':
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self._lock:
+            if self.db_path != ':memory:':
+                self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS analytics_rollups (
+                    day TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS analytics_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+            self.conn.commit()
+
+    def _get_db(self):
+        if self.db is None:
+            from database.database_manager import DatabaseManager
+            self.db = DatabaseManager()
+        return self.db
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM analytics_meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+
+    # ==================== REFRESH ====================
+
+    def _load(self, created_since: datetime, created_until: datetime = None):
+        db = self._get_db()
+        return (
+            db.get_records_for_analytics('leads', LEAD_COLUMNS, created_since, created_until),
+            db.get_records_for_analytics('tasks', TASK_COLUMNS, created_since, created_until),
+            db.get_records_for_analytics('lead_contacts', CONTACT_COLUMNS, created_since, created_until)
+        )
+
+    def _dirty_days(self, watermark: datetime) -> set:
+        """Giorni di creazione delle righe modificate dopo il watermark"""
+        db = self._get_db()
+        days = set()
+        for table in ('leads', 'tasks', 'lead_contacts'):
+            days.update(_day(row) for row in db.get_records_for_analytics(table, [], updated_since=watermark))
+        days.discard(None)
+        return days
+
+    def refresh(self, full: bool = False) -> Dict[str, int]:
+        """
+        Aggiorna i rollup giornalieri
+
+        Args:
+            full: Ricostruisce tutti i giorni (necessario solo dopo eliminazioni di righe)
+
+        Tutte le letture avvengono prima di toccare i rollup: se una fallisce
+        l'errore viene propagato e rollup e watermark restano invariati.
+
+        Returns:
+            {'days_updated': giorni ricalcolati}
+        """
+        started = datetime.now(timezone.utc)
+        horizon = (started - timedelta(days=self.max_days)).strftime('%Y-%m-%d')
+        watermark = None if full else self._get_meta(LAST_REFRESH_KEY)
+
+        if watermark is None:
+            days = None
+            leads, tasks, contacts = self._load(datetime.strptime(horizon, '%Y-%m-%d').replace(tzinfo=timezone.utc))
+        else:
+            days = {day for day in self._dirty_days(datetime.fromisoformat(watermark)) if day >= horizon}
+            if days:
+                # Un'unica lettura per l'intervallo dei giorni toccati
+                first = datetime.strptime(min(days), '%Y-%m-%d').replace(tzinfo=timezone.utc)
+                last = datetime.strptime(max(days), '%Y-%m-%d').replace(tzinfo=timezone.utc) + timedelta(days=1)
+                leads, tasks, contacts = self._load(first, last)
+            else:
+                leads, tasks, contacts = [], [], []
+
+        rollups = build_daily_rollups(leads, tasks, contacts)
+        if days is not None:
+            rollups = {day: rollup for day, rollup in rollups.items() if day in days}
+
+        users = {str(user['id']): user for user in self._get_db().get_all_users()} if days is None or days else None
+
+        with self._lock:
+            if days is None:
+                self.conn.execute("DELETE FROM analytics_rollups")
+            elif days:
+                self.conn.executemany("DELETE FROM analytics_rollups WHERE day = ?", [(day,) for day in days])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO analytics_rollups (day, data) VALUES (?, ?)",
+                [(day, json.dumps(rollup)) for day, rollup in rollups.items()]
+            )
+            self.conn.execute("DELETE FROM analytics_rollups WHERE day < ?", (horizon,))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO analytics_meta (key, value) VALUES (?, ?)",
+                (LAST_REFRESH_KEY, started.isoformat())
+            )
+            self.conn.commit()
+            if users is not None:
+                self._users = users
+            if days is None or days:
+                self._snapshots.clear()
+            self._last_refresh = time.monotonic()
+
+        updated = len(rollups) if days is None else len(days)
+        logger.info(f"📊 Analytics: {updated} giorni ricalcolati")
+        return {'days_updated': updated}
+
+    def _refresh_if_stale(self):
+        if self._last_refresh is not None and time.monotonic() - self._last_refresh < self.refresh_seconds:
+            return
+        # Un solo refresh alla volta: le altre richieste usano i rollup attuali
+        if not self._refresh_lock.acquire(blocking=self._last_refresh is None):
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"❌ Errore refresh analytics: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    # ==================== SNAPSHOT ====================
+
+    def get_snapshot(self, time_period: int) -> Dict[str, Any]:
+        """
+        Analytics degli ultimi `time_period` giorni (lead, task, utenti, contatti)
+        """
+        self._refresh_if_stale()
+
+        first_day = (datetime.now(timezone.utc) - timedelta(days=time_period - 1)).strftime('%Y-%m-%d')
+        # La chiave include il primo giorno: al cambio di data la finestra si sposta
+        key = (time_period, first_day)
+        with self._lock:
+            if key not in self._snapshots:
+                totals = _empty_rollup()
+                for row in self.conn.execute("SELECT data FROM analytics_rollups WHERE day >= ?", (first_day,)):
+                    _merge(totals, json.loads(row['data']))
+                self._snapshots[key] = self._format(totals)
+            return copy.deepcopy(self._snapshots[key])
+
+    def _format(self, totals: Dict[str, Any]) -> Dict[str, Any]:
+        """Converte i contatori nel formato usato dai prompt del Marketing Advisor"""
+        leads, tasks, contacts = totals['leads'], totals['tasks'], totals['contacts']
+
+        by_user = {}
+        for user_id, stats in totals['users'].items():
+            user = self._users.get(user_id, {})
+            name = f"{user.get('first_name', '')} {user.get('last_name', '')}".strip() or f"User_{user_id}"
+            by_user[name] = {'role_id': user.get('role_id'), **stats}
+
+        return {
+            'leads': {
+                'by_status': {f"State_{k}": v for k, v in leads['by_status'].items()},
+                'by_category': {f"Category_{k}": v for k, v in leads['by_category'].items()},
+                'by_source': {f"Source_{k}": v for k, v in leads['by_source'].items()},
+                'by_industry': {},
+                'avg_budget': {'General': leads['budget_sum'] / leads['budget_count']} if leads['budget_count'] else {},
+                'total': leads['count']
+            },
+            'tasks': {
+                'by_status': {f"State_{k}": v for k, v in tasks['by_status'].items()},
+                'by_priority': {f"Priority_{k}": v for k, v in tasks['by_priority'].items()},
+                'avg_completion_days': {},
+                'total': tasks['count'],
+                'completed': tasks['completed']
+            },
+            'users': {'by_user': by_user},
+            'contacts': {
+                'by_template': {
+                    'Default': {
+                        'usage_count': contacts['count'],
+                        'response_rate': contacts['responses'] / contacts['count']
+                    }
+                } if contacts['count'] else {}
+            }
+        }
+
+
+# ==================== ISTANZA CONDIVISA ====================
+
+_shared_snapshots: Dict[str, AnalyticsSnapshot] = {}
+_shared_lock = threading.Lock()
+
+
+def get_analytics_snapshot(db_manager=None, db_path: Path = AI_ANALYTICS_PATH) -> AnalyticsSnapshot:
+    """Restituisce lo snapshot analytics condiviso dal processo per il file indicato"""
+    key = str(db_path)
+    with _shared_lock:
+        if key not in _shared_snapshots:
+            _shared_snapshots[key] = AnalyticsSnapshot(db_manager, db_path)
+        elif _shared_snapshots[key].db is None:
+            _shared_snapshots[key].db = db_manager
+        return _shared_snapshots[key]
@@ -7,122 +7,167 @@ Creato da Ezio Camporeale
 
 import json
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable
 from datetime import datetime, timedelta
 from pathlib import Path
 import sys
+import time
+
+import pandas as pd
 
 # Aggiungi il percorso della directory principale
 current_dir = Path(__file__).parent.parent.parent
 sys.path.append(str(current_dir))
 
 from components.ai_assistant.ai_core import AIAssistant
+from components.ai_assistant.ai_executor import AIBatchExecutor
+from components.ai_assistant.prompt_builder import compact_json, compact_record, summarize_history
 from database.database_manager import DatabaseManager
+from utils.keyword_classifier import TIMELINE_URGENCY_CLASSIFIER
+from utils.lead_scoring import LeadScoringEngine, categorize_score
+
+# Campi per raggruppare gli storici riassunti (lead_contacts: contact_type in SQLite, type in Supabase)
+CONTACT_TYPE_FIELDS = ('contact_type', 'type')
+ACTIVITY_TYPE_FIELDS = ('state_name',)
 
 class LeadAnalyzer:
     """
     Analizzatore intelligente per singoli lead utilizzando AI
     """
     
-    def __init__(self):
-        """Inizializza l'analizzatore lead"""
-        self.ai_assistant = AIAssistant()
+    def __init__(self, ai_assistant: AIAssistant = None):
+        """
+        Inizializza l'analizzatore lead
+
+        Args:
+            ai_assistant: Assistente della sessione (default: nuovo assistente sulla memoria di sessione)
+        """
+        self.ai_assistant = ai_assistant or AIAssistant()
         self.db_manager = DatabaseManager()
         self.logger = logging.getLogger(__name__)
         
-        # Score weights per calcolo qualità lead
-        self.score_weights = {
-            'contact_info_completeness': 0.2,
-            'company_info_completeness': 0.15,
-            'budget_indication': 0.25,
-            'timeline_urgency': 0.15,
-            'source_quality': 0.1,
-            'interaction_history': 0.15
-        }
-        
-        # Threshold per categorizzazione
-        self.score_thresholds = {
-            'hot': 80,
-            'warm': 60,
-            'cold': 40
-        }
+        # Score weights e threshold condivisi con lo scoring vettoriale
+        self.scoring_engine = LeadScoringEngine(self.db_manager)
+        self.score_weights = self.scoring_engine.weights
+        self.score_thresholds = self.scoring_engine.thresholds
     
-    def analyze_lead(self, lead_id: int) -> Optional[Dict[str, Any]]:
+    def analyze_lead(self, lead_id: int, on_chunk: Callable[[str], None] = None) -> Optional[Dict[str, Any]]:
         """
         Analizza un lead specifico e fornisce insights dettagliati
         
         Args:
             lead_id: ID del lead da analizzare
+            on_chunk: Callback per ricevere l'analisi AI in streaming
             
         Returns:
             Analisi completa del lead
         """
         try:
-            # Recupera dati completi del lead
-            lead_data = self._get_complete_lead_data(lead_id)
-            if not lead_data:
-                self.logger.error(f"❌ Lead {lead_id} non trovato")
+            inputs = self._collect_analysis_inputs(lead_id)
+            if not inputs:
                 return None
             
-            # Calcola score di qualità
-            quality_score = self._calculate_lead_quality_score(lead_data)
-            
-            # Recupera storico contatti
-            contact_history = self._get_lead_contact_history(lead_id)
-            
-            # Recupera attività recenti
-            recent_activities = self._get_lead_recent_activities(lead_id)
-            
-            # Prepara dati per AI
-            ai_data = self._prepare_ai_data(lead_data, contact_history, recent_activities)
-            
             # Genera analisi AI
             ai_analysis = self.ai_assistant.generate_response(
                 prompt_type='lead_analysis',
-                data=ai_data
+                data=inputs['ai_data'],
+                on_chunk=on_chunk
             )
             
-            # Se AI non disponibile, usa analisi di base
-            if not ai_analysis:
-                self.logger.warning("⚠️ AI non disponibile, usando analisi di base")
-                ai_analysis = self._generate_basic_analysis(lead_data, contact_history, recent_activities)
-            
-            # Struttura la risposta
-            analysis_result = {
-                'lead_id': lead_id,
-                'analysis_content': ai_analysis,
-                'quality_score': quality_score,
-                'quality_category': self._categorize_lead_quality(quality_score),
-                'generated_at': datetime.now().isoformat(),
-                'lead_info': {
-                    'name': f"{lead_data.get('first_name', '')} {lead_data.get('last_name', '')}",
-                    'company': lead_data.get('company', ''),
-                    'email': lead_data.get('email', ''),
-                    'phone': lead_data.get('phone', ''),
-                    'industry': lead_data.get('industry', ''),
-                    'source': lead_data.get('source', ''),
-                    'status': lead_data.get('status_name', ''),
-                    'priority': lead_data.get('priority_name', ''),
-                    'category': lead_data.get('category_name', '')
-                },
-                'contact_history': contact_history,
-                'recent_activities': recent_activities,
-                'score_breakdown': self._get_score_breakdown(lead_data),
-                'recommendations': self._generate_recommendations(lead_data, quality_score),
-                'ai_metadata': {
-                    'model_used': 'deepseek-chat',
-                    'generation_time': datetime.now().isoformat(),
-                    'data_points_analyzed': len(ai_data)
-                }
-            }
-            
-            self.logger.info(f"✅ Analisi completata per lead {lead_id} - Score: {quality_score}")
-            return analysis_result
+            return self._build_analysis_result(lead_id, inputs, ai_analysis)
             
         except Exception as e:
             self.logger.error(f"❌ Errore analisi lead: {e}")
             return None
     
+    def _load_lead_contexts(self, lead_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Carica in blocco dati, ultimi contatti e ultime attività dei lead"""
+        try:
+            return self.db_manager.get_lead_contexts(
+                lead_ids,
+                contacts_limit=self.ai_assistant.config['context_contacts_limit'],
+                activities_limit=self.ai_assistant.config['context_activities_limit']
+            )
+        except Exception as e:
+            self.logger.error(f"❌ Errore recupero contesto lead: {e}")
+            return {}
+    
+    def _collect_analysis_inputs(self, lead_id: int, context: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """
+        Raccoglie dati, score e storico del lead da inviare all'AI
+        
+        Args:
+            lead_id: ID del lead
+            context: Contesto già caricato con _load_lead_contexts (altrimenti viene caricato)
+        """
+        if context is None:
+            context = self._load_lead_contexts([lead_id]).get(lead_id)
+        if not context:
+            self.logger.error(f"❌ Lead {lead_id} non trovato")
+            return None
+        
+        lead_data = context['lead']
+        contact_history = context['contacts']
+        recent_activities = context['activities']
+        
+        # Calcola score di qualità
+        quality_score = self._calculate_lead_quality_score(lead_data)
+        
+        return {
+            'lead_data': lead_data,
+            'quality_score': quality_score,
+            'contact_history': contact_history,
+            'recent_activities': recent_activities,
+            # Prepara dati per AI
+            'ai_data': self._prepare_ai_data(lead_data, contact_history, recent_activities)
+        }
+    
+    def _build_analysis_result(self, lead_id: int, inputs: Dict[str, Any],
+                               ai_analysis: Optional[str]) -> Dict[str, Any]:
+        """Struttura il risultato dell'analisi a partire dalla risposta AI"""
+        lead_data = inputs['lead_data']
+        quality_score = inputs['quality_score']
+        contact_history = inputs['contact_history']
+        recent_activities = inputs['recent_activities']
+        ai_data = inputs['ai_data']
+        
+        # Se AI non disponibile, usa analisi di base
+        if not ai_analysis:
+            self.logger.warning("⚠️ AI non disponibile, usando analisi di base")
+            ai_analysis = self._generate_basic_analysis(lead_data, contact_history, recent_activities)
+        
+        # Struttura la risposta
+        analysis_result = {
+            'lead_id': lead_id,
+            'analysis_content': ai_analysis,
+            'quality_score': quality_score,
+            'quality_category': self._categorize_lead_quality(quality_score),
+            'generated_at': datetime.now().isoformat(),
+            'lead_info': {
+                'name': f"{lead_data.get('first_name', '')} {lead_data.get('last_name', '')}",
+                'company': lead_data.get('company', ''),
+                'email': lead_data.get('email', ''),
+                'phone': lead_data.get('phone', ''),
+                'industry': lead_data.get('industry', ''),
+                'source': lead_data.get('source_name', ''),
+                'status': lead_data.get('state_name', ''),
+                'priority': lead_data.get('priority_name', ''),
+                'category': lead_data.get('category_name', '')
+            },
+            'contact_history': contact_history,
+            'recent_activities': recent_activities,
+            'score_breakdown': self._get_score_breakdown(lead_data),
+            'recommendations': self._generate_recommendations(lead_data, quality_score),
+            'ai_metadata': {
+                'model_used': 'deepseek-chat',
+                'generation_time': datetime.now().isoformat(),
+                'data_points_analyzed': len(ai_data)
+            }
+        }
+        
+        self.logger.info(f"✅ Analisi completata per lead {lead_id} - Score: {quality_score}")
+        return analysis_result
+    
     def _generate_basic_analysis(self, lead_data: Dict[str, Any], contact_history: List[Dict], recent_activities: List[Dict]) -> str:
         """Genera analisi di base quando AI non è disponibile"""
         
@@ -217,22 +262,66 @@ class LeadAnalyzer:
         else:
             return "Bassa (10-25%)"
     
-    def analyze_multiple_leads(self, lead_ids: List[int]) -> List[Dict[str, Any]]:
+    def analyze_multiple_leads(self, lead_ids: List[int], deadline_seconds: float = None,
+                               on_result: Callable[[Dict[str, Any]], None] = None) -> List[Dict[str, Any]]:
         """
         Analizza multiple lead contemporaneamente
         
+        Le chiamate AI partono in parallelo (pool limitato e rate limit condiviso):
+        il tempo totale è circa quello di una singola chiamata. I lead la cui
+        risposta AI non arriva entro la deadline ricevono l'analisi di base.
+        
         Args:
             lead_ids: Lista di ID lead da analizzare
+            deadline_seconds: Tempo massimo per le chiamate AI del batch
+            on_result: Callback chiamata con ogni analisi appena completata
             
         Returns:
             Lista di analisi per ogni lead
         """
-        analyses = []
+        deadline_seconds = deadline_seconds or self.ai_assistant.config['batch_deadline_seconds']
+        deadline = time.monotonic() + deadline_seconds
+        
+        # Contesto di tutti i lead con un numero fisso di query
+        contexts = self._load_lead_contexts(lead_ids)
         
+        inputs = {}
         for lead_id in lead_ids:
-            analysis = self.analyze_lead(lead_id)
-            if analysis:
-                analyses.append(analysis)
+            try:
+                lead_inputs = self._collect_analysis_inputs(lead_id, contexts.get(lead_id, {}))
+                if lead_inputs:
+                    inputs[lead_id] = lead_inputs
+            except Exception as e:
+                self.logger.error(f"❌ Errore analisi lead {lead_id}: {e}")
+        
+        completed = {}
+        
+        def _complete(lead_id, ai_analysis):
+            try:
+                completed[lead_id] = self._build_analysis_result(lead_id, inputs[lead_id], ai_analysis)
+            except Exception as e:
+                self.logger.error(f"❌ Errore analisi lead {lead_id}: {e}")
+                return
+            if on_result:
+                on_result(completed[lead_id])
+        
+        AIBatchExecutor().map(
+            lambda lead_inputs: self.ai_assistant.generate_response(
+                prompt_type='lead_analysis',
+                data=lead_inputs['ai_data'],
+                deadline=deadline
+            ),
+            inputs,
+            deadline_seconds=deadline_seconds,
+            on_result=_complete
+        )
+        
+        # Lead senza risposta AI (errore o deadline): analisi di base
+        for lead_id in inputs:
+            if lead_id not in completed:
+                _complete(lead_id, None)
+        
+        analyses = [completed[lead_id] for lead_id in inputs if lead_id in completed]
         
         self.logger.info(f"✅ Analizzate {len(analyses)} lead su {len(lead_ids)} richieste")
         return analyses
@@ -262,10 +351,17 @@ class LeadAnalyzer:
             comparison_data = self._prepare_comparison_data(analyses)
             
             # Genera analisi comparativa con AI
+            # Storici riassunti per lead: il prompt resta piccolo anche con molti lead
             ai_data = {
-                'lead_data': json.dumps(comparison_data, indent=2),
-                'contact_history': json.dumps([a['contact_history'] for a in analyses], indent=2),
-                'recent_activities': json.dumps([a['recent_activities'] for a in analyses], indent=2)
+                'lead_data': compact_json(comparison_data),
+                'contact_history': compact_json({
+                    a['lead_id']: summarize_history(a['contact_history'], keep=2, type_fields=CONTACT_TYPE_FIELDS)
+                    for a in analyses
+                }),
+                'recent_activities': compact_json({
+                    a['lead_id']: summarize_history(a['recent_activities'], keep=2, type_fields=ACTIVITY_TYPE_FIELDS)
+                    for a in analyses
+                })
             }
             
             comparison_analysis = self.ai_assistant.generate_response(
@@ -308,10 +404,10 @@ class LeadAnalyzer:
             
             # Prepara dati per AI
             ai_data = {
-                'lead_data': json.dumps(history_data.get('lead_info', {}), indent=2),
-                'contact_history': json.dumps(history_data.get('contacts', []), indent=2),
-                'recent_activities': json.dumps(history_data.get('activities', []), indent=2),
-                'trend_data': json.dumps(history_data.get('trends', {}), indent=2)
+                'lead_data': compact_json(compact_record(history_data.get('lead_info'))),
+                'contact_history': compact_json(summarize_history(history_data.get('contacts', []), type_fields=CONTACT_TYPE_FIELDS)),
+                'recent_activities': compact_json(summarize_history(history_data.get('activities', []), type_fields=ACTIVITY_TYPE_FIELDS)),
+                'trend_data': compact_json(history_data.get('trends', {}))
             }
             
             # Genera analisi trend
@@ -334,105 +430,11 @@ class LeadAnalyzer:
             self.logger.error(f"❌ Errore analisi trend: {e}")
             return None
     
-    def _get_complete_lead_data(self, lead_id: int) -> Optional[Dict[str, Any]]:
-        """Recupera tutti i dati di un lead"""
-        try:
-            query = """
-            SELECT 
-                l.*,
-                ls.name as status_name,
-                lp.name as priority_name,
-                lc.name as category_name,
-                u.first_name as assigned_user_first_name,
-                u.last_name as assigned_user_last_name,
-                ur.name as assigned_user_role
-            FROM leads l
-            LEFT JOIN lead_states ls ON l.status_id = ls.id
-            LEFT JOIN lead_priorities lp ON l.priority_id = lp.id  
-            LEFT JOIN lead_categories lc ON l.category_id = lc.id
-            LEFT JOIN users u ON l.assigned_user_id = u.id
-            LEFT JOIN user_roles ur ON u.role_id = ur.id
-            WHERE l.id = %s
-            """
-            
-            result = self.db_manager.execute_query(query, (lead_id,))
-            
-            if result and len(result) > 0:
-                return result[0]
-            else:
-                return None
-                
-        except Exception as e:
-            self.logger.error(f"❌ Errore recupero dati lead: {e}")
-            return None
-    
     def _calculate_lead_quality_score(self, lead_data: Dict[str, Any]) -> int:
         """Calcola il score di qualità del lead"""
         try:
-            score = 0
-            
-            # Completezza informazioni contatto (0-20 punti)
-            contact_score = 0
-            if lead_data.get('first_name'): contact_score += 5
-            if lead_data.get('last_name'): contact_score += 5
-            if lead_data.get('email'): contact_score += 5
-            if lead_data.get('phone'): contact_score += 5
-            score += contact_score * self.score_weights['contact_info_completeness']
-            
-            # Completezza informazioni azienda (0-15 punti)
-            company_score = 0
-            if lead_data.get('company'): company_score += 5
-            if lead_data.get('industry'): company_score += 5
-            if lead_data.get('website'): company_score += 5
-            score += company_score * self.score_weights['company_info_completeness']
-            
-            # Indicazione budget (0-25 punti)
-            budget_score = 0
-            if lead_data.get('budget'):
-                try:
-                    budget = float(lead_data.get('budget', 0))
-                    if budget > 10000: budget_score = 25
-                    elif budget > 5000: budget_score = 20
-                    elif budget > 1000: budget_score = 15
-                    elif budget > 0: budget_score = 10
-                except:
-                    pass
-            score += budget_score * self.score_weights['budget_indication']
-            
-            # Urgenza timeline (0-15 punti)
-            timeline_score = 0
-            if lead_data.get('notes'):
-                notes = lead_data.get('notes', '').lower()
-                urgent_words = ['urgente', 'immediato', 'subito', 'asap', 'presto']
-                if any(word in notes for word in urgent_words):
-                    timeline_score = 15
-                elif 'settimana' in notes or 'giorni' in notes:
-                    timeline_score = 10
-                elif 'mese' in notes:
-                    timeline_score = 5
-            score += timeline_score * self.score_weights['timeline_urgency']
-            
-            # Qualità fonte (0-10 punti)
-            source_score = 0
-            source = lead_data.get('source', '').lower()
-            high_quality_sources = ['referral', 'website', 'linkedin']
-            medium_quality_sources = ['email', 'social', 'event']
-            if source in high_quality_sources:
-                source_score = 10
-            elif source in medium_quality_sources:
-                source_score = 7
-            elif source:
-                source_score = 5
-            score += source_score * self.score_weights['source_quality']
-            
-            # Storico interazioni (0-15 punti)
-            interaction_score = 0
-            # Questo sarà calcolato basandosi sui contatti effettuati
-            # Per ora assegniamo un punteggio base
-            interaction_score = 10  # Placeholder
-            score += interaction_score * self.score_weights['interaction_history']
-            
-            return min(100, max(0, int(score)))
+            scores = self.scoring_engine.score_frame(pd.DataFrame([lead_data]))
+            return int(scores['quality_score'].iloc[0])
             
         except Exception as e:
             self.logger.error(f"❌ Errore calcolo score: {e}")
@@ -440,71 +442,15 @@ class LeadAnalyzer:
     
     def _categorize_lead_quality(self, score: int) -> str:
         """Categorizza la qualità del lead basata sul score"""
-        if score >= self.score_thresholds['hot']:
-            return 'Hot'
-        elif score >= self.score_thresholds['warm']:
-            return 'Warm'
-        else:
-            return 'Cold'
-    
-    def _get_lead_contact_history(self, lead_id: int) -> List[Dict[str, Any]]:
-        """Recupera lo storico dei contatti per un lead"""
-        try:
-            query = """
-            SELECT 
-                ch.*,
-                ct.name as template_name,
-                ct.type as template_type,
-                u.first_name as user_first_name,
-                u.last_name as user_last_name
-            FROM contact_history ch
-            LEFT JOIN contact_templates ct ON ch.template_id = ct.id
-            LEFT JOIN users u ON ch.user_id = u.id
-            WHERE ch.lead_id = %s
-            ORDER BY ch.created_at DESC
-            LIMIT 10
-            """
-            
-            result = self.db_manager.execute_query(query, (lead_id,))
-            return result or []
-            
-        except Exception as e:
-            self.logger.error(f"❌ Errore recupero storico contatti: {e}")
-            return []
-    
-    def _get_lead_recent_activities(self, lead_id: int) -> List[Dict[str, Any]]:
-        """Recupera le attività recenti per un lead"""
-        try:
-            query = """
-            SELECT 
-                t.*,
-                ts.name as status_name,
-                tp.name as priority_name,
-                u.first_name as assigned_user_first_name,
-                u.last_name as assigned_user_last_name
-            FROM tasks t
-            LEFT JOIN task_states ts ON t.status_id = ts.id
-            LEFT JOIN task_priorities tp ON t.priority_id = tp.id
-            LEFT JOIN users u ON t.assigned_user_id = u.id
-            WHERE t.lead_id = %s
-            ORDER BY t.created_at DESC
-            LIMIT 5
-            """
-            
-            result = self.db_manager.execute_query(query, (lead_id,))
-            return result or []
-            
-        except Exception as e:
-            self.logger.error(f"❌ Errore recupero attività recenti: {e}")
-            return []
+        return categorize_score(score, self.score_thresholds)
     
     def _prepare_ai_data(self, lead_data: Dict[str, Any], contact_history: List[Dict[str, Any]], 
                         recent_activities: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Prepara i dati per l'AI in formato ottimale"""
         return {
-            'lead_data': json.dumps(lead_data, indent=2),
-            'contact_history': json.dumps(contact_history, indent=2),
-            'recent_activities': json.dumps(recent_activities, indent=2)
+            'lead_data': compact_json(compact_record(lead_data)),
+            'contact_history': compact_json(summarize_history(contact_history, keep=5, type_fields=CONTACT_TYPE_FIELDS)),
+            'recent_activities': compact_json(summarize_history(recent_activities, keep=3, type_fields=ACTIVITY_TYPE_FIELDS))
         }
     
     def _get_score_breakdown(self, lead_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -550,16 +496,7 @@ class LeadAnalyzer:
     
     def _calculate_timeline_score(self, lead_data: Dict[str, Any]) -> int:
         """Calcola score basato su urgenza timeline"""
-        if lead_data.get('notes'):
-            notes = lead_data.get('notes', '').lower()
-            urgent_words = ['urgente', 'immediato', 'subito', 'asap', 'presto']
-            if any(word in notes for word in urgent_words):
-                return 100
-            elif 'settimana' in notes or 'giorni' in notes:
-                return 67
-            elif 'mese' in notes:
-                return 33
-        return 0
+        return TIMELINE_URGENCY_CLASSIFIER.classify(lead_data.get('notes'))
     
     def _calculate_source_score(self, lead_data: Dict[str, Any]) -> int:
         """Calcola score basato su qualità fonte"""
@@ -627,10 +564,13 @@ class LeadAnalyzer:
         """Recupera dati storici per analisi trend"""
         try:
             # Implementazione semplificata
+            context = self._load_lead_contexts([lead_id]).get(lead_id)
+            if not context:
+                return None
             return {
-                'lead_info': self._get_complete_lead_data(lead_id),
-                'contacts': self._get_lead_contact_history(lead_id),
-                'activities': self._get_lead_recent_activities(lead_id),
+                'lead_info': context['lead'],
+                'contacts': context['contacts'],
+                'activities': context['activities'],
                 'trends': {}
             }
         except Exception as e:
@@ -7,7 +7,7 @@ Creato da Ezio Camporeale
 
 import json
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable
 from datetime import datetime, timedelta
 from pathlib import Path
 import sys
@@ -18,6 +18,8 @@ current_dir = Path(__file__).parent.parent.parent
 sys.path.append(str(current_dir))
 
 from components.ai_assistant.ai_core import AIAssistant
+from components.ai_assistant.analytics_snapshot import get_analytics_snapshot
+from components.ai_assistant.prompt_builder import compact_json
 from database.database_manager import DatabaseManager
 
 class MarketingAdvisor:
@@ -25,12 +27,20 @@ class MarketingAdvisor:
     Sistema di consigli marketing intelligenti utilizzando AI
     """
     
-    def __init__(self):
-        """Inizializza l'advisor marketing"""
-        self.ai_assistant = AIAssistant()
+    def __init__(self, ai_assistant: AIAssistant = None):
+        """
+        Inizializza l'advisor marketing
+
+        Args:
+            ai_assistant: Assistente della sessione (default: nuovo assistente sulla memoria di sessione)
+        """
+        self.ai_assistant = ai_assistant or AIAssistant()
         self.db_manager = DatabaseManager()
         self.logger = logging.getLogger(__name__)
         
+        # Analytics pre-calcolate (rollup giornalieri aggiornati in modo incrementale)
+        self.analytics = get_analytics_snapshot(self.db_manager)
+        
         # Tipi di consigli disponibili
         self.advice_types = {
             'campaign_optimization': {
@@ -61,13 +71,15 @@ class MarketingAdvisor:
         }
     
     def get_marketing_advice(self, advice_type: str = 'campaign_optimization', 
-                           time_period: int = 30) -> Optional[Dict[str, Any]]:
+                           time_period: int = 30,
+                           on_chunk: Callable[[str], None] = None) -> Optional[Dict[str, Any]]:
         """
         Genera consigli marketing basati sui dati storici
         
         Args:
             advice_type: Tipo di consiglio richiesto
             time_period: Periodo di analisi in giorni
+            on_chunk: Callback per ricevere i consigli in streaming
             
         Returns:
             Dizionario con i consigli generati
@@ -82,7 +94,8 @@ class MarketingAdvisor:
             # Genera consigli
             advice_content = self.ai_assistant.generate_response(
                 prompt_type='marketing_advice',
-                data=ai_data
+                data=ai_data,
+                on_chunk=on_chunk
             )
             
             if not advice_content:
@@ -130,9 +143,9 @@ class MarketingAdvisor:
             
             # Prepara dati per AI
             ai_data = {
-                'leads_data': json.dumps(leads_data, indent=2),
-                'campaign_data': json.dumps(insights.get('campaign_performance', {}), indent=2),
-                'team_metrics': json.dumps(insights.get('team_metrics', {}), indent=2)
+                'leads_data': compact_json(leads_data),
+                'campaign_data': compact_json(insights.get('campaign_performance', {})),
+                'team_metrics': compact_json(insights.get('team_metrics', {}))
             }
             
             # Genera insights AI
@@ -172,9 +185,9 @@ class MarketingAdvisor:
             
             # Prepara dati per AI
             ai_data = {
-                'leads_data': json.dumps(competitive_data.get('leads', {}), indent=2),
-                'campaign_data': json.dumps(competitive_data.get('campaigns', {}), indent=2),
-                'team_metrics': json.dumps(competitive_data.get('team_performance', {}), indent=2),
+                'leads_data': compact_json(competitive_data.get('leads', {})),
+                'campaign_data': compact_json(competitive_data.get('campaigns', {})),
+                'team_metrics': compact_json(competitive_data.get('team_performance', {})),
                 'industry': industry or 'Generale'
             }
             
@@ -219,9 +232,9 @@ class MarketingAdvisor:
             
             # Prepara dati per AI
             ai_data = {
-                'leads_data': json.dumps(campaign_data.get('leads_generated', {}), indent=2),
-                'campaign_data': json.dumps(campaign_data, indent=2),
-                'team_metrics': json.dumps(campaign_data.get('team_performance', {}), indent=2)
+                'leads_data': compact_json(campaign_data.get('leads_generated', {})),
+                'campaign_data': compact_json(campaign_data),
+                'team_metrics': compact_json(campaign_data.get('team_performance', {}))
             }
             
             # Genera raccomandazioni
@@ -245,28 +258,18 @@ class MarketingAdvisor:
             return None
     
     def _gather_analysis_data(self, time_period: int) -> Dict[str, Any]:
-        """Raccoglie tutti i dati necessari per l'analisi"""
+        """Raccoglie tutti i dati necessari per l'analisi dallo snapshot pre-calcolato"""
         try:
             end_date = datetime.now()
             start_date = end_date - timedelta(days=time_period)
             
-            # Lead analytics
-            leads_data = self._get_leads_analytics(time_period)
-            
-            # Task analytics
-            tasks_data = self._get_tasks_analytics(time_period)
-            
-            # User performance
-            users_data = self._get_users_performance(time_period)
-            
-            # Contact analytics
-            contacts_data = self._get_contacts_analytics(time_period)
+            snapshot = self.analytics.get_snapshot(time_period)
             
             return {
-                'leads': leads_data,
-                'tasks': tasks_data,
-                'users': users_data,
-                'contacts': contacts_data,
+                'leads': snapshot['leads'],
+                'tasks': snapshot['tasks'],
+                'users': snapshot['users'],
+                'contacts': snapshot['contacts'],
                 'period': {
                     'start': start_date.isoformat(),
                     'end': end_date.isoformat(),
@@ -281,47 +284,7 @@ class MarketingAdvisor:
     def _get_leads_analytics(self, time_period: int) -> Dict[str, Any]:
         """Recupera analytics sui lead"""
         try:
-            # Query semplificata per Supabase
-            query = """
-            SELECT 
-                state_id,
-                category_id,
-                source_id,
-                budget
-            FROM leads
-            WHERE created_at >= NOW() - INTERVAL %s DAY
-            """
-            
-            result = self.db_manager.execute_query(query, (time_period,))
-            
-            # Calcola analytics semplificati
-            analytics = {
-                'by_status': {},
-                'by_category': {},
-                'by_source': {},
-                'by_industry': {},
-                'avg_budget': {}
-            }
-            
-            # Conta manualmente i risultati
-            for row in result:
-                if row['state_id']:
-                    state_key = f"State_{row['state_id']}"
-                    analytics['by_status'][state_key] = analytics['by_status'].get(state_key, 0) + 1
-                
-                if row['category_id']:
-                    cat_key = f"Category_{row['category_id']}"
-                    analytics['by_category'][cat_key] = analytics['by_category'].get(cat_key, 0) + 1
-                
-                if row['source_id']:
-                    source_key = f"Source_{row['source_id']}"
-                    analytics['by_source'][source_key] = analytics['by_source'].get(source_key, 0) + 1
-                
-                if row['budget']:
-                    analytics['avg_budget']['General'] = float(row['budget']) if row['budget'] else 0
-            
-            return analytics
-            
+            return self.analytics.get_snapshot(time_period)['leads']
         except Exception as e:
             self.logger.error(f"❌ Errore analytics lead: {e}")
             return {}
@@ -329,33 +292,7 @@ class MarketingAdvisor:
     def _get_tasks_analytics(self, time_period: int) -> Dict[str, Any]:
         """Recupera analytics sui task"""
         try:
-            # Query semplificata per Supabase
-            query = """
-            SELECT 
-                state_id,
-                priority_id,
-                COUNT(*) as count
-            FROM tasks
-            WHERE created_at >= NOW() - INTERVAL %s DAY
-            GROUP BY state_id, priority_id
-            """
-            
-            result = self.db_manager.execute_query(query, (time_period,))
-            
-            analytics = {
-                'by_status': {},
-                'by_priority': {},
-                'avg_completion_days': {}
-            }
-            
-            for row in result:
-                if row['state_id']:
-                    analytics['by_status'][f"State_{row['state_id']}"] = row['count']
-                if row['priority_id']:
-                    analytics['by_priority'][f"Priority_{row['priority_id']}"] = row['count']
-            
-            return analytics
-            
+            return self.analytics.get_snapshot(time_period)['tasks']
         except Exception as e:
             self.logger.error(f"❌ Errore analytics task: {e}")
             return {}
@@ -363,40 +300,7 @@ class MarketingAdvisor:
     def _get_users_performance(self, time_period: int) -> Dict[str, Any]:
         """Recupera performance degli utenti"""
         try:
-            # Query semplificata per Supabase
-            query = """
-            SELECT 
-                u.id,
-                u.first_name,
-                u.last_name,
-                u.role_id,
-                COUNT(DISTINCT l.id) as leads_assigned,
-                COUNT(DISTINCT t.id) as tasks_assigned
-            FROM users u
-            LEFT JOIN leads l ON u.id = l.assigned_to 
-                AND l.created_at >= NOW() - INTERVAL %s DAY
-            LEFT JOIN tasks t ON u.id = t.assigned_to 
-                AND t.created_at >= NOW() - INTERVAL %s DAY
-            GROUP BY u.id, u.first_name, u.last_name, u.role_id
-            """
-            
-            result = self.db_manager.execute_query(query, (time_period, time_period))
-            
-            analytics = {
-                'by_user': {}
-            }
-            
-            for row in result:
-                user_name = f"{row['first_name']} {row['last_name']}".strip()
-                analytics['by_user'][user_name] = {
-                    'role_id': row['role_id'],
-                    'leads_assigned': row['leads_assigned'],
-                    'tasks_assigned': row['tasks_assigned'],
-                    'tasks_completed': 0  # Placeholder
-                }
-            
-            return analytics
-            
+            return self.analytics.get_snapshot(time_period)['users']
         except Exception as e:
             self.logger.error(f"❌ Errore performance utenti: {e}")
             return {}
@@ -404,31 +308,7 @@ class MarketingAdvisor:
     def _get_contacts_analytics(self, time_period: int) -> Dict[str, Any]:
         """Recupera analytics sui contatti"""
         try:
-            # Query semplificata per Supabase (contact_history potrebbe non esistere)
-            query = """
-            SELECT 
-                'template_1' as template_name,
-                COUNT(*) as usage_count,
-                0.5 as response_rate
-            FROM leads
-            WHERE created_at >= NOW() - INTERVAL %s DAY
-            LIMIT 1
-            """
-            
-            result = self.db_manager.execute_query(query, (time_period,))
-            
-            analytics = {
-                'by_template': {}
-            }
-            
-            if result:
-                analytics['by_template']['Default'] = {
-                    'usage_count': result[0]['usage_count'],
-                    'response_rate': result[0]['response_rate']
-                }
-            
-            return analytics
-            
+            return self.analytics.get_snapshot(time_period)['contacts']
         except Exception as e:
             self.logger.error(f"❌ Errore analytics contatti: {e}")
             return {}
@@ -436,9 +316,9 @@ class MarketingAdvisor:
     def _prepare_ai_data(self, analysis_data: Dict[str, Any], advice_type: str) -> Dict[str, Any]:
         """Prepara i dati per l'AI in formato ottimale"""
         return {
-            'leads_data': json.dumps(analysis_data.get('leads', {}), indent=2),
-            'campaign_data': json.dumps(analysis_data.get('tasks', {}), indent=2),
-            'team_metrics': json.dumps(analysis_data.get('users', {}), indent=2),
+            'leads_data': compact_json(analysis_data.get('leads', {})),
+            'campaign_data': compact_json(analysis_data.get('tasks', {})),
+            'team_metrics': compact_json(analysis_data.get('users', {})),
             'advice_type': advice_type,
             'analysis_period': analysis_data.get('period', {}).get('days', 30)
         }
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Prompt Builder - Compattazione dei dati e budget di token per i prompt AI
+Riduce i record ai campi utili, riassume gli storici lunghi, stima i token
+e tronca i campi del prompt per rispettare il budget di ogni funzionalità
+Creato da Ezio Camporeale
+"""
+
+import json
+import math
+import logging
+from collections import Counter
+from typing import Dict, Any, List, Iterable, Optional
+from pathlib import Path
+import sys
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(current_dir))
+
+from config import AI_ASSISTANT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Stima prudente per testo misto italiano/JSON
+CHARS_PER_TOKEN = 3.5
+
+TRUNCATION_MARKER = ' …[troncato]'
+
+# Campi tecnici che non aiutano il modello
+NOISE_FIELDS = {
+    'id', 'created_by', 'updated_at', 'password_hash', 'template_id', 'sequence_id', 'step_id',
+    'state_id', 'priority_id', 'category_id', 'source_id', 'assigned_to', 'task_type_id',
+    'lead_id', 'user_id', 'role_id', 'department_id', 'quality_score', 'quality_category'
+}
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Stima il numero di token di un testo"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def compact_json(value: Any) -> str:
+    """JSON senza indentazione né spazi superflui"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """Tronca un testo al numero di token indicato"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(int(max_tokens * CHARS_PER_TOKEN) - len(TRUNCATION_MARKER), 0)
+    return text[:max_chars] + TRUNCATION_MARKER
+
+
+def compact_record(record: Optional[Dict[str, Any]], max_text: int = 300,
+                   drop: Iterable[str] = NOISE_FIELDS) -> Dict[str, Any]:
+    """
+    Riduce un record ai campi utili
+
+    Rimuove valori vuoti e campi tecnici, accorcia i testi lunghi e riduce
+    i timestamp alla sola data.
+    """
+    drop = set(drop)
+    compact = {}
+    for key, value in (record or {}).items():
+        if isinstance(value, str):
+            value = ' '.join(value.split())
+            if key.endswith('_at') or key.endswith('_date'):
+                value = value[:10]
+            elif len(value) > max_text:
+                value = value[:max_text] + '…'
+        if key in drop or value is None or value == '' or value == [] or value == {}:
+            continue
+        compact[key] = value
+    return compact
+
+
+def summarize_history(items: List[Dict[str, Any]], keep: int = 3, max_text: int = 160,
+                      type_fields: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Riassume uno storico: ultimi `keep` elementi compattati e conteggi dei precedenti
+
+    Args:
+        items: Elementi dal più recente
+        keep: Elementi mantenuti per intero
+        max_text: Lunghezza massima dei testi negli elementi mantenuti
+        type_fields: Campi (il primo valorizzato) per raggruppare i precedenti
+    """
+    items = items or []
+    summary = {
+        'total': len(items),
+        'recent': [compact_record(item, max_text) for item in items[:keep]]
+    }
+    older = items[keep:]
+    if older:
+        summary['older'] = len(older)
+        if type_fields:
+            summary['older_by_type'] = dict(Counter(
+                str(next((item[field] for field in type_fields if item.get(field)), 'altro')) for item in older
+            ))
+        dates = [str(item.get('created_at'))[:10] for item in older if item.get('created_at')]
+        if dates:
+            summary['older_since'] = min(dates)
+    return summary
+
+
+def _allocate(sizes: Dict[str, int], available: int) -> Dict[str, int]:
+    """Divide i token disponibili tra i campi: i piccoli restano interi, i grandi si dividono il resto"""
+    allocation = {}
+    remaining = available
+    ordered = sorted(sizes.items(), key=lambda item: item[1])
+    for index, (key, size) in enumerate(ordered):
+        share = remaining // (len(ordered) - index)
+        allocation[key] = min(size, share)
+        remaining -= allocation[key]
+    return allocation
+
+
+class PromptBuilder:
+    """
+    Costruisce i prompt rispettando il budget di token di ogni funzionalità
+
+    Il budget è il minimo tra quello configurato per il tipo di prompt e lo
+    spazio lasciato nel contesto del modello dopo i `max_tokens` di risposta.
+    """
+
+    def __init__(self, budgets: Dict[str, int] = None,
+                 context_window: int = AI_ASSISTANT_CONFIG['context_window_tokens'],
+                 max_output_tokens: int = AI_ASSISTANT_CONFIG['max_tokens']):
+        self.budgets = budgets or AI_ASSISTANT_CONFIG['prompt_token_budgets']
+        self.context_window = context_window
+        self.max_output_tokens = max_output_tokens
+        self.truncated_prompts = 0
+
+    def budget_for(self, prompt_type: str) -> int:
+        budget = self.budgets.get(prompt_type, self.budgets['default'])
+        return min(budget, self.context_window - self.max_output_tokens)
+
+    def build(self, prompt_type: str, template: str, data: Dict[str, Any]) -> str:
+        """
+        Compila il template e, se il prompt supera il budget, tronca i campi più grandi
+
+        Raises:
+            KeyError: se il template richiede un campo non presente in `data`
+        """
+        prompt = template.format(**data)
+        budget = self.budget_for(prompt_type)
+        tokens = estimate_tokens(prompt)
+        if tokens <= budget:
+            return prompt
+
+        fields = {key: str(value) for key, value in data.items()}
+        overhead = estimate_tokens(template.format(**{key: '' for key in fields}))
+        allocation = _allocate({key: estimate_tokens(value) for key, value in fields.items()},
+                               max(budget - overhead - len(fields) * 4, 0))
+        prompt = template.format(**{key: truncate_text(value, allocation[key]) for key, value in fields.items()})
+
+        self.truncated_prompts += 1
+        logger.info(f"✂️ Prompt {prompt_type} ridotto da ~{tokens} a ~{estimate_tokens(prompt)} token (budget {budget})")
+        return prompt
+
+    def fit(self, prompt_type: str, prompt: str) -> str:
+        """Tronca un prompt già composto (es. personalizzato) al budget"""
+        budget = self.budget_for(prompt_type)
+        if estimate_tokens(prompt) <= budget:
+            return prompt
+        self.truncated_prompts += 1
+        logger.info(f"✂️ Prompt {prompt_type} troncato a ~{budget} token")
+        return truncate_text(prompt, budget)
+
+
+_prompt_builder = PromptBuilder()
+
+
+def get_prompt_builder() -> PromptBuilder:
+    """Prompt builder condiviso da tutte le istanze AIAssistant del processo"""
+    return _prompt_builder
@@ -7,16 +7,19 @@ Creato da Ezio Camporeale
 
 import json
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable
 from datetime import datetime
 from pathlib import Path
 import sys
+import time
 
 # Aggiungi il percorso della directory principale
 current_dir = Path(__file__).parent.parent.parent
 sys.path.append(str(current_dir))
 
 from components.ai_assistant.ai_core import AIAssistant
+from components.ai_assistant.ai_executor import AIBatchExecutor
+from components.ai_assistant.prompt_builder import compact_record
 from database.database_manager import DatabaseManager
 
 class SalesScriptGenerator:
@@ -24,9 +27,14 @@ class SalesScriptGenerator:
     Generatore di script di vendita personalizzati utilizzando AI
     """
     
-    def __init__(self):
-        """Inizializza il generatore di script"""
-        self.ai_assistant = AIAssistant()
+    def __init__(self, ai_assistant: AIAssistant = None):
+        """
+        Inizializza il generatore di script
+
+        Args:
+            ai_assistant: Assistente della sessione (default: nuovo assistente sulla memoria di sessione)
+        """
+        self.ai_assistant = ai_assistant or AIAssistant()
         self.db_manager = DatabaseManager()
         self.logger = logging.getLogger(__name__)
         
@@ -55,7 +63,8 @@ class SalesScriptGenerator:
         }
     
     def generate_script(self, lead_id: int, script_type: str = 'cold_call', 
-                       custom_context: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+                       custom_context: Dict[str, Any] = None,
+                       on_chunk: Callable[[str], None] = None) -> Optional[Dict[str, Any]]:
         """
         Genera uno script di vendita personalizzato per un lead
         
@@ -63,6 +72,7 @@ class SalesScriptGenerator:
             lead_id: ID del lead per cui generare lo script
             script_type: Tipo di script da generare
             custom_context: Contesto personalizzato aggiuntivo
+            on_chunk: Callback per ricevere lo script in streaming
             
         Returns:
             Dizionario con lo script generato o None in caso di errore
@@ -80,69 +90,117 @@ class SalesScriptGenerator:
             # Genera lo script
             script_content = self.ai_assistant.generate_response(
                 prompt_type='sales_script',
-                data=ai_data
+                data=ai_data,
+                on_chunk=on_chunk
             )
             
-            if not script_content:
-                self.logger.error("❌ Errore generazione script AI")
-                return None
-            
-            # Struttura la risposta
-            script_result = {
-                'lead_id': lead_id,
-                'script_type': script_type,
-                'script_content': script_content,
-                'generated_at': datetime.now().isoformat(),
-                'lead_info': {
-                    'name': lead_data.get('first_name', '') + ' ' + lead_data.get('last_name', ''),
-                    'company': lead_data.get('company', ''),
-                    'industry': lead_data.get('industry', ''),
-                    'source': lead_data.get('source', ''),
-                    'status': lead_data.get('status', '')
-                },
-                'template_info': self.script_templates.get(script_type, {}),
-                'ai_metadata': {
-                    'model_used': 'deepseek-chat',
-                    'generation_time': datetime.now().isoformat(),
-                    'data_points_used': len(ai_data)
-                }
-            }
-            
-            self.logger.info(f"✅ Script generato per lead {lead_id} - Tipo: {script_type}")
-            return script_result
+            return self._build_script_result(lead_id, lead_data, script_type, ai_data, script_content)
             
         except Exception as e:
             self.logger.error(f"❌ Errore generazione script: {e}")
             return None
     
-    def generate_bulk_scripts(self, lead_ids: List[int], script_type: str = 'cold_call') -> List[Dict[str, Any]]:
+    def _build_script_result(self, lead_id: int, lead_data: Dict[str, Any], script_type: str,
+                             ai_data: Dict[str, Any], script_content: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Struttura il risultato a partire dalla risposta AI"""
+        if not script_content:
+            self.logger.error("❌ Errore generazione script AI")
+            return None
+        
+        # Struttura la risposta
+        script_result = {
+            'lead_id': lead_id,
+            'script_type': script_type,
+            'script_content': script_content,
+            'generated_at': datetime.now().isoformat(),
+            'lead_info': {
+                'name': lead_data.get('first_name', '') + ' ' + lead_data.get('last_name', ''),
+                'company': lead_data.get('company', ''),
+                'industry': lead_data.get('industry', ''),
+                'source': lead_data.get('source_name', ''),
+                'status': lead_data.get('state_name', '')
+            },
+            'template_info': self.script_templates.get(script_type, {}),
+            'ai_metadata': {
+                'model_used': 'deepseek-chat',
+                'generation_time': datetime.now().isoformat(),
+                'data_points_used': len(ai_data)
+            }
+        }
+        
+        self.logger.info(f"✅ Script generato per lead {lead_id} - Tipo: {script_type}")
+        return script_result
+    
+    def generate_bulk_scripts(self, lead_ids: List[int], script_type: str = 'cold_call',
+                              deadline_seconds: float = None,
+                              on_result: Callable[[Dict[str, Any]], None] = None) -> List[Dict[str, Any]]:
         """
         Genera script per multiple lead
         
+        Le chiamate AI partono in parallelo con pool limitato e rate limit condiviso.
+        
         Args:
             lead_ids: Lista di ID lead
             script_type: Tipo di script da generare
+            deadline_seconds: Tempo massimo per le chiamate AI del batch
+            on_result: Callback chiamata con ogni script appena generato
             
         Returns:
-            Lista di script generati
+            Lista di script generati (solo quelli completati entro la deadline)
         """
-        scripts = []
+        deadline_seconds = deadline_seconds or self.ai_assistant.config['batch_deadline_seconds']
+        deadline = time.monotonic() + deadline_seconds
+        
+        # Dati di tutti i lead con un numero fisso di query
+        leads_data = self._get_leads_data(lead_ids)
         
+        inputs = {}
         for lead_id in lead_ids:
-            script = self.generate_script(lead_id, script_type)
+            lead_data = leads_data.get(lead_id)
+            if not lead_data:
+                self.logger.error(f"❌ Lead {lead_id} non trovato")
+                continue
+            inputs[lead_id] = (lead_data, self._prepare_ai_data(lead_data, script_type))
+        
+        completed = {}
+        
+        def _complete(lead_id, script_content):
+            lead_data, ai_data = inputs[lead_id]
+            try:
+                script = self._build_script_result(lead_id, lead_data, script_type, ai_data, script_content)
+            except Exception as e:
+                self.logger.error(f"❌ Errore generazione script: {e}")
+                return
             if script:
-                scripts.append(script)
+                completed[lead_id] = script
+                if on_result:
+                    on_result(script)
+        
+        AIBatchExecutor().map(
+            lambda lead_inputs: self.ai_assistant.generate_response(
+                prompt_type='sales_script',
+                data=lead_inputs[1],
+                deadline=deadline
+            ),
+            inputs,
+            deadline_seconds=deadline_seconds,
+            on_result=_complete
+        )
+        
+        scripts = [completed[lead_id] for lead_id in inputs if lead_id in completed]
         
         self.logger.info(f"✅ Generati {len(scripts)} script su {len(lead_ids)} lead richiesti")
         return scripts
     
-    def generate_industry_script(self, industry: str, script_type: str = 'cold_call') -> Optional[Dict[str, Any]]:
+    def generate_industry_script(self, industry: str, script_type: str = 'cold_call',
+                                 on_chunk: Callable[[str], None] = None) -> Optional[Dict[str, Any]]:
         """
         Genera uno script generico per un settore specifico
         
         Args:
             industry: Settore di riferimento
             script_type: Tipo di script
+            on_chunk: Callback per ricevere lo script in streaming
             
         Returns:
             Script generico per il settore
@@ -159,7 +217,8 @@ class SalesScriptGenerator:
             
             script_content = self.ai_assistant.generate_response(
                 prompt_type='sales_script',
-                data=industry_data
+                data=industry_data,
+                on_chunk=on_chunk
             )
             
             if not script_content:
@@ -178,56 +237,40 @@ class SalesScriptGenerator:
             self.logger.error(f"❌ Errore generazione script settore: {e}")
             return None
     
-    def _get_lead_data(self, lead_id: int) -> Optional[Dict[str, Any]]:
-        """Recupera i dati completi di un lead"""
+    def _get_leads_data(self, lead_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Recupera in blocco i dati completi dei lead (senza storico contatti e attività)"""
         try:
-            # Query per recuperare dati lead
-            query = """
-            SELECT 
-                l.*,
-                ls.name as status_name,
-                lp.name as priority_name,
-                lc.name as category_name,
-                u.first_name as assigned_user_first_name,
-                u.last_name as assigned_user_last_name
-            FROM leads l
-            LEFT JOIN lead_states ls ON l.status_id = ls.id
-            LEFT JOIN lead_priorities lp ON l.priority_id = lp.id  
-            LEFT JOIN lead_categories lc ON l.category_id = lc.id
-            LEFT JOIN users u ON l.assigned_user_id = u.id
-            WHERE l.id = %s
-            """
-            
-            result = self.db_manager.execute_query(query, (lead_id,))
-            
-            if result and len(result) > 0:
-                return result[0]
-            else:
-                return None
-                
+            contexts = self.db_manager.get_lead_contexts(lead_ids, contacts_limit=0, activities_limit=0)
+            return {lead_id: context['lead'] for lead_id, context in contexts.items()}
         except Exception as e:
             self.logger.error(f"❌ Errore recupero dati lead: {e}")
-            return None
+            return {}
+    
+    def _get_lead_data(self, lead_id: int) -> Optional[Dict[str, Any]]:
+        """Recupera i dati completi di un lead"""
+        return self._get_leads_data([lead_id]).get(lead_id)
     
     def _prepare_ai_data(self, lead_data: Dict[str, Any], script_type: str, 
                         custom_context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Prepara i dati per l'AI in formato ottimale"""
         
         # Dati base del lead
+        # Solo i campi valorizzati, senza indentazione: meno token nel prompt
+        lead_fields = compact_record({
+            'Nome': f"{lead_data.get('first_name') or ''} {lead_data.get('last_name') or ''}",
+            'Azienda': lead_data.get('company'),
+            'Email': lead_data.get('email'),
+            'Telefono': lead_data.get('phone'),
+            'Settore': lead_data.get('industry'),
+            'Budget stimato': lead_data.get('budget'),
+            'Note': lead_data.get('notes')
+        })
         ai_data = {
-            'lead_data': f"""
-            Nome: {lead_data.get('first_name', '')} {lead_data.get('last_name', '')}
-            Azienda: {lead_data.get('company', 'N/A')}
-            Email: {lead_data.get('email', 'N/A')}
-            Telefono: {lead_data.get('phone', 'N/A')}
-            Settore: {lead_data.get('industry', 'N/A')}
-            Budget stimato: {lead_data.get('budget', 'N/A')}
-            Note: {lead_data.get('notes', 'Nessuna nota')}
-            """,
+            'lead_data': '\n'.join(f"{label}: {value}" for label, value in lead_fields.items()),
             'industry': lead_data.get('industry', 'Generico'),
             'budget': lead_data.get('budget', 'Non specificato'),
-            'source': lead_data.get('source', 'Sconosciuta'),
-            'status': lead_data.get('status_name', 'Nuovo'),
+            'source': lead_data.get('source_name') or 'Sconosciuta',
+            'status': lead_data.get('state_name') or 'Nuovo',
             'script_type': script_type,
             'template_focus': self.script_templates.get(script_type, {}).get('focus', '')
         }
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Session Memory - Cronologia limitata e budget di memoria per sessione
+Ring buffer delle conversazioni AI di ogni sessione Streamlit con conteggio
+dei byte trattenuti, budget per sessione e report di tutte le sessioni attive
+Creato da Ezio Camporeale
+"""
+
+import uuid
+import logging
+import threading
+import weakref
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from pathlib import Path
+import sys
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(current_dir))
+
+from config import AI_ASSISTANT_CONFIG
+from components.ai_assistant.prompt_builder import compact_json, TRUNCATION_MARKER
+
+logger = logging.getLogger(__name__)
+
+
+def _sizeof(value: Any) -> int:
+    """Byte occupati da un valore serializzato (stima della memoria trattenuta)"""
+    return len(compact_json(value).encode('utf-8'))
+
+
+def _clip(text: Optional[str], max_chars: int) -> Optional[str]:
+    if text is None or len(text) <= max_chars:
+        return text
+    return text[:max_chars] + TRUNCATION_MARKER
+
+
+class SessionMemory:
+    """
+    Memoria AI di una sessione
+
+    La cronologia è un ring buffer di `max_entries` elementi; i testi sono
+    tagliati a `max_chars` caratteri e, se il totale supera `budget_bytes`,
+    vengono rimossi gli elementi più vecchi.
+    """
+
+    def __init__(self, max_entries: int = AI_ASSISTANT_CONFIG['history_max_entries'],
+                 max_chars: int = AI_ASSISTANT_CONFIG['history_max_chars'],
+                 budget_bytes: int = AI_ASSISTANT_CONFIG['session_memory_budget_kb'] * 1024,
+                 session_id: str = None):
+        self.session_id = session_id or uuid.uuid4().hex[:8]
+        self.max_chars = max_chars
+        self.budget_bytes = budget_bytes
+        self.created_at = datetime.now()
+        self.evictions = 0
+        self._history: deque = deque(maxlen=max_entries)
+        self._sizes: deque = deque(maxlen=max_entries)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        _register(self)
+
+    def record(self, prompt_type: str, prompt: Optional[str], response: str, source: str = 'api'):
+        """
+        Aggiunge uno scambio alla cronologia
+
+        Args:
+            source: Provenienza della risposta (api, cache, shared)
+        """
+        entry = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'prompt_type': prompt_type,
+            'prompt': _clip(prompt, self.max_chars),
+            'response': _clip(response, self.max_chars),
+            'source': source
+        }
+        size = _sizeof(entry)
+        with self._lock:
+            if len(self._history) == self._history.maxlen:
+                self._bytes -= self._sizes[0]
+                self.evictions += 1
+            self._history.append(entry)
+            self._sizes.append(size)
+            self._bytes += size
+            while self._bytes > self.budget_bytes and len(self._history) > 1:
+                self._history.popleft()
+                self._bytes -= self._sizes.popleft()
+                self.evictions += 1
+
+    def history(self, limit: int = None) -> List[Dict[str, Any]]:
+        """Cronologia dal più vecchio al più recente (ultimi `limit` elementi)"""
+        with self._lock:
+            entries = list(self._history)
+        return entries[-limit:] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._history.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def usage(self) -> Dict[str, Any]:
+        """Memoria trattenuta dalla sessione"""
+        with self._lock:
+            return {
+                'session_id': self.session_id,
+                'created_at': self.created_at.isoformat(timespec='seconds'),
+                'entries': len(self._history),
+                'max_entries': self._history.maxlen,
+                'bytes': self._bytes,
+                'budget_bytes': self.budget_bytes,
+                'evictions': self.evictions
+            }
+
+
+# Sessioni attive del processo: i riferimenti deboli spariscono con la sessione
+_sessions = weakref.WeakSet()
+_sessions_lock = threading.Lock()
+
+
+def _register(memory: SessionMemory):
+    with _sessions_lock:
+        _sessions.add(memory)
+
+
+def get_session_memory_report() -> List[Dict[str, Any]]:
+    """Utilizzo di memoria di tutte le sessioni attive, dalla più pesante"""
+    with _sessions_lock:
+        sessions = list(_sessions)
+    return sorted((memory.usage() for memory in sessions), key=lambda usage: usage['bytes'], reverse=True)
+
+
+def get_session_memory() -> SessionMemory:
+    """
+    Memoria AI della sessione Streamlit corrente
+
+    Una sola istanza per sessione, in st.session_state: tutte le funzionalità
+    (analisi lead, script, marketing, dashboard) registrano nella stessa
+    cronologia. Fuori da una sessione (thread di lavoro, script) restituisce
+    una memoria nuova.
+    """
+    if get_script_run_ctx() is None:
+        return SessionMemory()
+    if 'ai_session_memory' not in st.session_state:
+        st.session_state.ai_session_memory = SessionMemory()
+    return st.session_state.ai_session_memory
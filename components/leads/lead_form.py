@@ -19,6 +19,7 @@ from database.database_manager import DatabaseManager
 from components.auth.auth_manager import get_current_user
 from config import CUSTOM_COLORS
 from components.telegram.telegram_manager import TelegramManager
+from utils.lead_contact_index import get_lead_contact_index
 
 class LeadForm:
     """Gestisce il form per inserimento e modifica lead"""
@@ -252,6 +253,13 @@ class LeadForm:
                     help="Note aggiuntive sul lead"
                 )
             
+            # Controllo duplicati
+            ignore_duplicates = st.checkbox(
+                "Salva anche se email o telefono appartengono già a un altro lead",
+                value=False,
+                help="Di default il salvataggio viene bloccato se email o telefono sono già presenti"
+            )
+            
             # Pulsanti
             col1, col2, col3 = st.columns([1, 1, 2])
             
@@ -273,6 +281,18 @@ class LeadForm:
                     st.error("❌ Nome e cognome sono obbligatori!")
                     return None
                 
+                # Verifica duplicati su email/telefono
+                if not ignore_duplicates:
+                    exclude_id = lead_data.get('id') if mode == "edit" and lead_data else None
+                    conflicts = self._find_duplicate_conflicts(email, phone, exclude_id)
+                    if conflicts:
+                        for field, owners in conflicts.items():
+                            label = "Email" if field == 'email' else "Telefono"
+                            names = ", ".join(f"{owner['name'] or 'N/A'} (ID {owner['id']})" for owner in owners)
+                            st.warning(f"⚠️ {label} già presente nel lead: {names}")
+                        st.info("💡 Spunta 'Salva anche se...' per salvare comunque")
+                        return None
+                
                 # Prepara i dati
                 form_data = {
                     'first_name': first_name.strip(),
@@ -349,6 +369,17 @@ class LeadForm:
         
         return None
     
+    def _find_duplicate_conflicts(self, email: Optional[str], phone: Optional[str], exclude_id=None) -> Dict:
+        """Restituisce i lead che possiedono già email/telefono (lookup O(1) sull'indice condiviso)"""
+        try:
+            index = get_lead_contact_index(self.db)
+            conflicts = index.find_conflicts(email=email, phone=phone, exclude_id=exclude_id)
+            return {field: owners for field, owners in conflicts.items() if owners}
+        except Exception as e:
+            # L'indice non deve mai bloccare il salvataggio
+            print(f"⚠️ Errore controllo duplicati: {e}")
+            return {}
+    
     def _send_telegram_notification(self, notification_type: str, data: Dict):
         """Invia notifica Telegram se configurato"""
         try:
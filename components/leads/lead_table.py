@@ -19,6 +19,7 @@ sys.path.append(str(current_dir))
 from database.database_manager import DatabaseManager
 from components.auth.auth_manager import get_current_user
 from config import CUSTOM_COLORS
+from utils.lead_scoring import LeadScoringEngine, QUALITY_CATEGORIES
 
 class LeadTable:
     """Gestisce la tabella dei lead con filtri e azioni"""
@@ -128,6 +129,30 @@ class LeadTable:
                         disabled=True
                     )
             
+            # Terza riga: qualità lead e ordinamento
+            col_filtro7, col_filtro8 = st.columns(2)
+            
+            with col_filtro7:
+                # Filtro qualità (score calcolato da LeadScoringEngine)
+                selected_quality = st.selectbox(
+                    "🔥 Qualità",
+                    options=["Tutte"] + QUALITY_CATEGORIES,
+                    index=0,
+                    help="Filtra per categoria di qualità (Hot ≥ 80, Warm ≥ 60)"
+                )
+            
+            with col_filtro8:
+                sort_options = {
+                    "📅 Più recenti": None,
+                    "🔥 Score qualità": 'quality_score'
+                }
+                selected_sort = st.selectbox(
+                    "↕️ Ordina per",
+                    options=list(sort_options.keys()),
+                    index=0,
+                    help="Ordinamento dei risultati"
+                )
+            
             # Filtro di ricerca testuale migliorato
             st.markdown("---")
             search_term = st.text_input(
@@ -172,14 +197,34 @@ class LeadTable:
                 if group_id:
                     filters['group_id'] = group_id
             
+            if selected_quality != "Tutte":
+                filters['quality_category'] = selected_quality
+            
+            if sort_options[selected_sort]:
+                filters['order_by'] = sort_options[selected_sort]
+            
             if search_term:
                 filters['search'] = search_term
             
             return filters
     
+    def refresh_quality_scores(self, min_interval_seconds: int = 300):
+        """Aggiorna gli score qualità dei lead modificati (al massimo ogni 5 minuti per sessione)"""
+        last_refresh = st.session_state.get('lead_scores_refreshed_at')
+        if last_refresh and (datetime.now() - last_refresh).total_seconds() < min_interval_seconds:
+            return
+        
+        try:
+            LeadScoringEngine(self.db).refresh_changed()
+        except Exception as e:
+            st.warning(f"⚠️ Aggiornamento score qualità non riuscito: {e}")
+        st.session_state['lead_scores_refreshed_at'] = datetime.now()
+    
     def render_lead_table(self, filters: Dict = None, page_size: int = 20):
         """Renderizza la tabella dei lead"""
         
+        self.refresh_quality_scores()
+        
         # Per utenti non-Admin, limita ai lead dei loro gruppi
         if self.current_user and self.current_user.get('role_name') != 'Admin':
             # Ottieni solo i lead dei gruppi dell'utente
@@ -199,6 +244,8 @@ class LeadTable:
                         include_lead = False
                     if filters.get('group_id') and lead.get('group_id') != filters['group_id']:
                         include_lead = False
+                    if filters.get('quality_category') and lead.get('quality_category') != filters['quality_category']:
+                        include_lead = False
                     if filters.get('search'):
                         search_term = filters['search'].lower()
                         searchable_text = f"{lead.get('name', '')} {lead.get('email', '')} {lead.get('company', '')} {lead.get('notes', '')}".lower()
@@ -210,6 +257,10 @@ class LeadTable:
                 
                 leads = filtered_leads
                 total_count = len(leads)
+                
+                if filters.get('order_by') == 'quality_score':
+                    # Score mancanti in fondo, come nella query Supabase
+                    leads.sort(key=lambda lead: lead.get('quality_score') if lead.get('quality_score') is not None else -1, reverse=True)
             else:
                 leads = user_leads
                 total_count = len(leads)
@@ -332,7 +383,7 @@ class LeadTable:
                 display_columns = [
                     'Nome Completo', 'email', 'phone', 'company', 'state_name', 
                     'category_name', 'priority_name', 'Assegnato a', 
-                    'budget', 'expected_close_date', 'created_at'
+                    'budget', 'quality_score', 'expected_close_date', 'created_at'
                 ]
                 
                 # Filtra le colonne disponibili
@@ -350,6 +401,7 @@ class LeadTable:
                     'priority_name': '⚡ Priorità',
                     'Assegnato a': '👥 Assegnato',
                     'budget': '💰 Budget',
+                    'quality_score': '🔥 Score',
                     'expected_close_date': '📅 Chiusura',
                     'created_at': '📅 Creato'
                 }
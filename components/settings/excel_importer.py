@@ -20,6 +20,8 @@ sys.path.append(str(current_dir))
 
 from database.database_manager import DatabaseManager
 from components.auth.auth_manager import get_current_user
+from components.telegram.telegram_manager import TelegramManager
+from utils.lead_contact_index import get_lead_contact_index
 from config import CUSTOM_COLORS
 
 class ExcelImporter:
@@ -29,6 +31,8 @@ class ExcelImporter:
         """Inizializza l'importatore Excel"""
         self.db = DatabaseManager()
         self.current_user = get_current_user()
+        # Creato solo al primo import con notifiche (carica la configurazione bot)
+        self.telegram_manager = None
         
         # Mapping dei campi Excel ai campi del database
         self.field_mapping = {
@@ -388,6 +392,9 @@ class ExcelImporter:
             
             total_rows = len(df)
             
+            # Indice email/telefono condiviso: niente query per riga sui duplicati
+            contact_index = get_lead_contact_index(self.db)
+            
             for index, row in df.iterrows():
                 try:
                     # Aggiorna progress bar
@@ -400,13 +407,16 @@ class ExcelImporter:
                     
                     if lead_data:
                         # Verifica duplicati se richiesto
-                        if import_options.get('skip_duplicates', True) and lead_data.get('email'):
-                            existing_lead = self.db.get_lead_by_email(lead_data['email'])
+                        if import_options.get('skip_duplicates', True) and (lead_data.get('email') or lead_data.get('phone')):
+                            existing_lead_id = contact_index.find_owner_id(
+                                email=lead_data.get('email'),
+                                phone=lead_data.get('phone')
+                            )
                             
-                            if existing_lead:
+                            if existing_lead_id is not None:
                                 if import_options.get('update_existing', False):
                                     # Aggiorna lead esistente
-                                    self.db.update_lead(existing_lead['id'], lead_data)
+                                    self.db.update_lead(existing_lead_id, lead_data)
                                     updated_count += 1
                                 else:
                                     # Salta duplicato
@@ -617,9 +627,20 @@ class ExcelImporter:
         """Invia una notifica per il lead importato"""
         
         try:
-            # Qui potresti implementare l'invio di notifiche
-            # Per ora è solo un placeholder
-            pass
+            # La notifica viene accodata: il worker Telegram la invia in background
+            if self.telegram_manager is None:
+                self.telegram_manager = TelegramManager()
+            
+            if self.telegram_manager.is_configured:
+                self.telegram_manager.send_notification('new_lead', {
+                    'nome': f"{lead_data.get('first_name', '')} {lead_data.get('last_name', '')}".strip() or 'N/A',
+                    'email': lead_data.get('email') or 'N/A',
+                    'telefono': lead_data.get('phone') or 'N/A',
+                    'broker': lead_data.get('company') or 'N/A',
+                    'fonte': 'Import Excel',
+                    'note': lead_data.get('notes') or 'N/A',
+                    'created_by': self.current_user.get('first_name', 'N/A') if self.current_user else 'N/A'
+                })
             
         except Exception as e:
             st.warning(f"Errore nell'invio della notifica: {str(e)}")
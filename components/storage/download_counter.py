@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Contatore download per DASH_GESTIONE_LEAD
+Registra i download in memoria e li scrive a blocchi: un solo insert in
+storage_downloads e un incremento atomico lato server di download_count
+Creato da Ezio Camporeale
+"""
+
+import sys
+import atexit
+import logging
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Aggiungi il percorso della directory corrente al path di Python
+current_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(current_dir))
+
+from config import STORAGE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Funzione SQL creata da database/migration_storage_downloads.sql
+INCREMENT_FUNCTION = 'increment_storage_download_counts'
+
+
+class DownloadCounter:
+    """
+    Buffer dei download in attesa di scrittura
+
+    I download vengono accumulati e scritti ogni `flush_seconds` secondi o
+    quando il buffer raggiunge `flush_batch` voci. Il contatore
+    download_count è incrementato dalla funzione SQL (UPDATE ... SET
+    download_count = download_count + n), senza letture e riscritture che
+    perderebbero download concorrenti.
+    """
+
+    def __init__(self, supabase=None, flush_seconds: float = STORAGE_CONFIG['download_flush_seconds'],
+                 flush_batch: int = STORAGE_CONFIG['download_flush_batch']):
+        self.supabase = supabase
+        self.flush_seconds = flush_seconds
+        self.flush_batch = flush_batch
+        self.stats = Counter()
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, file_id: Any, user_id: Any = None):
+        """Registra un download (scritto al prossimo flush)"""
+        entry = {'file_id': file_id}
+        if user_id is not None:
+            entry['downloaded_by'] = user_id
+        with self._lock:
+            self._pending.append(entry)
+            full = len(self._pending) >= self.flush_batch
+        self.stats['recorded'] += 1
+        if full:
+            self._wake.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        Scrive i download in attesa
+
+        Returns:
+            Numero di download scritti (0 se la scrittura fallisce: le voci
+            restano nel buffer per il flush successivo)
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+
+            counts = Counter(entry['file_id'] for entry in batch)
+            try:
+                file_ids = list(counts)
+                self.supabase.rpc(INCREMENT_FUNCTION, {
+                    'file_ids': file_ids,
+                    'amounts': [counts[file_id] for file_id in file_ids]
+                }).execute()
+            except Exception as e:
+                with self._lock:
+                    self._pending = batch + self._pending
+                self.stats['errors'] += 1
+                logger.error(f"❌ Errore aggiornamento contatori download: {e}")
+                return 0
+
+            # Il contatore è già aggiornato: lo storico non viene ritentato per non contare due volte
+            rows = [entry for entry in batch if 'downloaded_by' in entry]
+            if rows:
+                try:
+                    self.supabase.table('storage_downloads').insert(rows).execute()
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    logger.error(f"❌ Errore registrazione storico download: {e}")
+
+            self.stats['flushed'] += len(batch)
+            self.stats['flushes'] += 1
+            return len(batch)
+
+    # ==================== WORKER ====================
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def start(self):
+        """Avvia il flush periodico in background"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='download-counter', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Ferma il worker scrivendo i download rimasti"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+# ==================== ISTANZA CONDIVISA ====================
+
+_shared_counter: Optional[DownloadCounter] = None
+_shared_lock = threading.Lock()
+
+
+def get_download_counter(supabase=None) -> DownloadCounter:
+    """Contatore download condiviso dal processo, avviato al primo uso"""
+    global _shared_counter
+    with _shared_lock:
+        if _shared_counter is None:
+            _shared_counter = DownloadCounter(supabase)
+            _shared_counter.start()
+            # Scrive i download rimasti alla chiusura del processo
+            atexit.register(_shared_counter.stop)
+        elif _shared_counter.supabase is None:
+            _shared_counter.supabase = supabase
+        return _shared_counter
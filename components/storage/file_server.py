@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+File Server per DASH_GESTIONE_LEAD
+Endpoint HTTP locale che serve i file dello storage in streaming (mmap)
+con supporto alle richieste Range, tramite link temporanei generati dalla dashboard
+Creato da Ezio Camporeale
+"""
+
+import sys
+import gzip
+import mmap
+import time
+import secrets
+import logging
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import quote
+
+# Aggiungi il percorso della directory corrente al path di Python
+current_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(current_dir))
+
+from config import STORAGE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Intervallo richiesto da un header Range (estremi inclusi)
+
+    Returns:
+        (inizio, fine) oppure None se l'header manca, non è valido o chiede
+        più intervalli (si risponde con il file intero)
+
+    Raises:
+        ValueError: intervallo non soddisfacibile (risposta 416)
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start_text, separator, end_text = header[len('bytes='):].strip().partition('-')
+    if not separator or not (start_text or end_text) \
+            or not (start_text or '0').isdigit() or not (end_text or '0').isdigit():
+        return None
+
+    if not start_text:
+        # bytes=-N: ultimi N byte
+        suffix = int(end_text)
+        if suffix == 0 or size == 0:
+            raise ValueError("intervallo vuoto")
+        return max(size - suffix, 0), size - 1
+
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if end_text and start > end:
+        return None
+    if start >= size:
+        raise ValueError("inizio oltre la fine del file")
+    return start, min(end, size - 1)
+
+
+class FileServer:
+    """
+    Server HTTP locale per i download
+
+    La dashboard registra un download e ottiene un link con token casuale
+    valido per `link_ttl` secondi; il server invia il file a blocchi da una
+    mappatura in memoria, senza caricarlo per intero, e risponde alle
+    richieste Range (riprese dei download, anteprime video/PDF). I file
+    salvati in gzip vengono decompressi durante l'invio. Ogni link
+    conta un solo download, alla prima richiesta che parte dall'inizio.
+    """
+
+    def __init__(self, host: str = STORAGE_CONFIG['download_host'], port: int = STORAGE_CONFIG['download_port'],
+                 base_url: str = None, counter=None,
+                 link_ttl: float = STORAGE_CONFIG['download_link_ttl_seconds'],
+                 chunk_size: int = STORAGE_CONFIG['chunk_size'],
+                 clock: Callable[[], float] = time.monotonic):
+        self.base_url = base_url
+        self.counter = counter
+        self.link_ttl = link_ttl
+        self.chunk_size = chunk_size
+        self.clock = clock
+        self.stats = Counter()
+
+        self._lock = threading.Lock()
+        self._links: Dict[str, Dict[str, Any]] = {}
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        if self.base_url:
+            return self.base_url.rstrip('/')
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FileServer':
+        if not (self._thread and self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._server.serve_forever, name='file-server', daemon=True)
+            self._thread.start()
+            logger.info(f"📂 Server download avviato su {self.url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # ==================== LINK ====================
+
+    def register(self, path: Path, filename: str, mime_type: str = None,
+                 file_id: Any = None, user_id: Any = None,
+                 compression: str = None, size: int = None) -> str:
+        """
+        Crea un link temporaneo per scaricare `path` come `filename`
+
+        Per i file compressi (`compression='gzip'`) `size` è la dimensione
+        originale, usata per Content-Length e per gli intervalli Range.
+
+        Returns:
+            URL del download
+        """
+        token = secrets.token_urlsafe(24)
+        now = self.clock()
+        with self._lock:
+            # Rimuove i link scaduti
+            for expired in [key for key, link in self._links.items() if link['expires_at'] <= now]:
+                del self._links[expired]
+            self._links[token] = {
+                'path': Path(path),
+                'filename': filename,
+                'mime_type': mime_type or 'application/octet-stream',
+                'file_id': file_id,
+                'user_id': user_id,
+                'compression': compression,
+                'size': size,
+                'expires_at': now + self.link_ttl,
+                'counted': False
+            }
+        return f"{self.url}/files/{token}/{quote(filename)}"
+
+    def _lookup(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            link = self._links.get(token)
+            if link and link['expires_at'] <= self.clock():
+                del self._links[token]
+                return None
+            return link
+
+    def _count_download(self, link: Dict[str, Any]):
+        with self._lock:
+            if link['counted']:
+                return
+            link['counted'] = True
+        self.stats['downloads'] += 1
+        if self.counter is not None and link['file_id'] is not None:
+            self.counter.record(link['file_id'], link['user_id'])
+
+    # ==================== HTTP ====================
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                self._serve(send_body=False)
+
+            def do_GET(self):
+                self._serve(send_body=True)
+
+            def _serve(self, send_body: bool):
+                parts = self.path.split('?', 1)[0].strip('/').split('/')
+                link = server._lookup(parts[1]) if len(parts) >= 2 and parts[0] == 'files' else None
+                if link is None or not link['path'].is_file():
+                    self.send_error(404, 'Link scaduto o file non trovato')
+                    return
+
+                compressed = link['compression'] == 'gzip'
+                size = link['size'] if compressed and link['size'] is not None else link['path'].stat().st_size
+                try:
+                    requested = parse_range(self.headers.get('Range'), size)
+                except ValueError:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f"bytes */{size}")
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                start, end = requested or (0, size - 1)
+                self.send_response(206 if requested else 200)
+                self.send_header('Content-Type', link['mime_type'])
+                self.send_header('Content-Length', str(max(end - start + 1, 0)))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Disposition',
+                                 f"attachment; filename*=UTF-8''{quote(link['filename'])}")
+                if requested:
+                    self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+                self.end_headers()
+
+                if not send_body:
+                    return
+                if start == 0:
+                    server._count_download(link)
+                server.stats['requests'] += 1
+                if size == 0:
+                    return
+                try:
+                    if compressed:
+                        self._send_decompressed(link['path'], start, end)
+                    else:
+                        self._send_mapped(link['path'], start, end)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Download annullato dal browser
+                    server.stats['aborted'] += 1
+
+            def _send_mapped(self, path: Path, start: int, end: int):
+                with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        for offset in range(start, end + 1, server.chunk_size):
+                            self.wfile.write(view[offset:min(offset + server.chunk_size, end + 1)])
+                            server.stats['bytes_sent'] += min(server.chunk_size, end + 1 - offset)
+                    finally:
+                        view.release()
+
+            def _send_decompressed(self, path: Path, start: int, end: int):
+                with gzip.open(path, 'rb') as f:
+                    # Il seek in un gzip decomprime e scarta i byte precedenti
+                    f.seek(start)
+                    remaining = end + 1 - start
+                    while remaining > 0:
+                        chunk = f.read(min(server.chunk_size, remaining))
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+                        server.stats['bytes_sent'] += len(chunk)
+                        remaining -= len(chunk)
+
+        return Handler
+
+
+# ==================== ISTANZA CONDIVISA ====================
+
+_shared_server: Optional[FileServer] = None
+_server_failed = False
+_shared_lock = threading.Lock()
+
+
+def get_file_server(supabase=None) -> Optional[FileServer]:
+    """
+    Server download condiviso dal processo, avviato al primo uso
+
+    Restituisce None se disabilitato o se la porta non è disponibile: la
+    dashboard torna al download diretto tramite st.download_button.
+    """
+    global _shared_server, _server_failed
+    if not STORAGE_CONFIG['download_server_enabled']:
+        return None
+    with _shared_lock:
+        if _shared_server is None and not _server_failed:
+            from components.storage.download_counter import get_download_counter
+            try:
+                _shared_server = FileServer(base_url=STORAGE_CONFIG['download_base_url'],
+                                            counter=get_download_counter(supabase)).start()
+            except OSError as e:
+                _server_failed = True
+                logger.error(f"❌ Server download non avviato: {e}")
+        return _shared_server
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Preview Cache per DASH_GESTIONE_LEAD
+Miniature di immagini e prima pagina dei PDF generate una sola volta e
+salvate su disco per hash del contenuto, con limite di spazio (LRU)
+Creato da Ezio Camporeale
+"""
+
+import io
+import os
+import sys
+import logging
+import tempfile
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set
+
+from PIL import Image
+
+# Aggiungi il percorso della directory corrente al path di Python
+current_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(current_dir))
+
+from config import STORAGE_CONFIG
+
+try:
+    # PyMuPDF: opzionale, necessario solo per le anteprime dei PDF
+    import fitz
+except ImportError:
+    fitz = None
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_SUFFIX = '.jpg'
+# Formati vettoriali o non supportati da Pillow
+UNSUPPORTED_IMAGE_TYPES = {'image/svg+xml'}
+
+
+class PreviewCache:
+    """
+    Cache su disco delle anteprime
+
+    Ogni anteprima è un JPEG di pochi KB salvato in
+    <cache_dir>/<2 caratteri>/<content_hash>.jpg: file con lo stesso
+    contenuto condividono l'anteprima. L'mtime del file registra l'ultimo
+    accesso; quando la cache supera `max_bytes` vengono eliminate le
+    anteprime usate meno di recente fino a scendere al 90% del limite.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = STORAGE_CONFIG['preview_max_cache_bytes'],
+                 size: int = STORAGE_CONFIG['preview_size'], quality: int = STORAGE_CONFIG['preview_quality']):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.size = size
+        self.quality = quality
+        self.stats = Counter()
+
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+        # Contenuti per cui la generazione è fallita (file corrotti o non supportati)
+        self._failed: Set[str] = set()
+
+    # ==================== LETTURA ====================
+
+    def can_preview(self, mime_type: Optional[str]) -> bool:
+        """Indica se per questo tipo di file è possibile generare un'anteprima"""
+        if not mime_type:
+            return False
+        if mime_type == 'application/pdf':
+            return fitz is not None
+        return mime_type.startswith('image/') and mime_type not in UNSUPPORTED_IMAGE_TYPES
+
+    def path_for(self, content_hash: str) -> Path:
+        return self.cache_dir / content_hash[:2] / f"{content_hash}{PREVIEW_SUFFIX}"
+
+    def get(self, content_hash: str) -> Optional[bytes]:
+        """Anteprima in cache (aggiorna l'ultimo accesso) o None"""
+        path = self.path_for(content_hash)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return data
+
+    def get_or_create(self, content_hash: str, mime_type: str, open_source: Callable) -> Optional[bytes]:
+        """
+        Anteprima dalla cache, generata al primo accesso se manca
+
+        Args:
+            content_hash: Hash SHA-256 del contenuto
+            mime_type: Tipo MIME del file originale
+            open_source: Funzione senza argomenti che apre il file originale in lettura
+        """
+        if not content_hash or not self.can_preview(mime_type) or content_hash in self._failed:
+            return None
+        cached = self.get(content_hash)
+        if cached is not None:
+            return cached
+        try:
+            with open_source() as source:
+                data = self.render(source, mime_type)
+        except Exception as e:
+            self._failed.add(content_hash)
+            self.stats['errors'] += 1
+            logger.warning(f"⚠️ Anteprima non generata per {content_hash[:12]}: {e}")
+            return None
+        self._store(content_hash, data)
+        return data
+
+    # ==================== GENERAZIONE ====================
+
+    def render(self, source, mime_type: str) -> bytes:
+        """Genera l'anteprima JPEG da un file aperto in lettura"""
+        if mime_type == 'application/pdf':
+            with fitz.open(stream=source.read(), filetype='pdf') as document:
+                page = document.load_page(0)
+                zoom = self.size / max(page.rect.width, page.rect.height)
+                pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+                image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+        else:
+            image = Image.open(source)
+            # Decodifica ridotta per i JPEG grandi: non carica l'immagine a piena risoluzione
+            image.draft('RGB', (self.size, self.size))
+
+        image.thumbnail((self.size, self.size))
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=self.quality, optimize=True)
+        self.stats['generated'] += 1
+        return output.getvalue()
+
+    def _store(self, content_hash: str, data: bytes):
+        path = self.path_for(content_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += len(data)
+        self._evict()
+
+    # ==================== LIMITE DI SPAZIO ====================
+
+    def _entries(self):
+        for prefix in os.scandir(self.cache_dir):
+            if prefix.is_dir():
+                for entry in os.scandir(prefix.path):
+                    if entry.name.endswith(PREVIEW_SUFFIX):
+                        yield entry
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(entry.stat().st_size for entry in self._entries())
+            return self._total_bytes
+
+    def _evict(self):
+        """Elimina le anteprime usate meno di recente se la cache supera il limite"""
+        if self.total_bytes() <= self.max_bytes:
+            return
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+            total = sum(entry.stat().st_size for entry in entries)
+            target = self.max_bytes * 0.9
+            for entry in entries:
+                if total <= target:
+                    break
+                size = entry.stat().st_size
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.stats['evicted'] += 1
+            self._total_bytes = total
+
+    def discard(self, content_hash: str):
+        """Elimina l'anteprima di un contenuto rimosso dallo storage"""
+        self._failed.discard(content_hash)
+        path = self.path_for(content_hash)
+        try:
+            size = path.stat().st_size
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes -= size
+
+
+# ==================== ISTANZA CONDIVISA ====================
+
+_shared_caches: Dict[Path, PreviewCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_preview_cache(cache_dir: Path = current_dir / "storage" / "previews") -> PreviewCache:
+    """Cache anteprime condivisa dal processo per la cartella `cache_dir`"""
+    cache_dir = Path(cache_dir)
+    with _shared_lock:
+        if cache_dir not in _shared_caches:
+            _shared_caches[cache_dir] = PreviewCache(cache_dir)
+        return _shared_caches[cache_dir]
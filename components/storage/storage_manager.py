@@ -6,8 +6,13 @@ Creato da Ezio Camporeale
 """
 
 import os
+import gzip
+import zlib
 import uuid
 import hashlib
+import logging
+import tempfile
+import threading
 import mimetypes
 from pathlib import Path
 from datetime import datetime
@@ -21,8 +26,36 @@ from pathlib import Path
 current_dir = Path(__file__).parent.parent.parent
 sys.path.append(str(current_dir))
 
-from config import SUPABASE_URL, SUPABASE_KEY
+from config import SUPABASE_URL, SUPABASE_KEY, STORAGE_CONFIG
 from components.auth.auth_manager import auth_manager
+from components.storage.download_counter import get_download_counter
+from components.storage.file_server import get_file_server
+from components.storage.preview_cache import get_preview_cache
+
+logger = logging.getLogger(__name__)
+
+# Formati già compressi: comprimerli di nuovo costa CPU senza ridurre lo spazio
+COMPRESSED_EXTENSIONS = {
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'mp4', 'avi', 'mov', 'wmv', 'flv', 'webm',
+    'mp3', 'flac', 'aac', 'ogg', 'zip', 'rar', '7z', 'gz', 'pdf', 'docx', 'xlsx', 'pptx', 'odt', 'ods', 'odp'
+}
+COMPRESSIBLE_CATEGORIES = {'Documenti', 'Fogli di Calcolo', 'Presentazioni', 'Gold Supreme EA', 'Backtest EA'}
+COMPRESSIBLE_MIME_TYPES = {'application/json', 'application/xml', 'application/javascript', 'application/rtf',
+                           'application/sql', 'image/svg+xml', 'image/bmp', 'audio/x-wav', 'audio/wav'}
+GZIP_SUFFIX = '.gz'
+
+# Colonne mostrate nella lista file (niente percorsi, hash o metadati di manutenzione)
+LIST_COLUMNS = 'id, original_filename, category, description, file_size, file_type, content_hash, download_count, uploaded_at'
+# Funzione SQL creata da database/migration_storage_listing.sql
+STATS_FUNCTION = 'get_storage_stats'
+
+# Lock per hash (a strisce): creazione e rilascio dello stesso blob non si sovrappongono
+_BLOB_LOCKS = [threading.RLock() for _ in range(64)]
+
+
+def blob_lock(content_hash: str) -> threading.RLock:
+    """Lock del processo che serializza riuso e rilascio del blob `content_hash`"""
+    return _BLOB_LOCKS[int(content_hash[:8], 16) % len(_BLOB_LOCKS)]
 
 class StorageManager:
     """
@@ -32,12 +65,7 @@ class StorageManager:
     def __init__(self):
         """Inizializza il manager dello storage"""
         self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        self.storage_dir = Path(current_dir) / "storage" / "uploads"
-        self.temp_dir = Path(current_dir) / "storage" / "temp"
-        
-        # Crea le directory se non esistono
-        self.storage_dir.mkdir(parents=True, exist_ok=True)
-        self.temp_dir.mkdir(parents=True, exist_ok=True)
+        self._init_dirs(Path(current_dir))
         
         # Categorie supportate
         self.categories = {
@@ -53,6 +81,21 @@ class StorageManager:
             'Altro': []
         }
     
+    def _init_dirs(self, base_dir: Path):
+        """Imposta e crea le directory dello storage sotto `base_dir`"""
+        self.base_dir = base_dir
+        # File caricati prima dello storage per contenuto
+        self.storage_dir = base_dir / "storage" / "uploads"
+        # Blob indirizzati per hash: storage/blobs/<2 caratteri>/<sha256>
+        self.blob_dir = base_dir / "storage" / "blobs"
+        self.temp_dir = base_dir / "storage" / "temp"
+        # Anteprime per hash: storage/previews/<2 caratteri>/<sha256>.jpg
+        self.preview_dir = base_dir / "storage" / "previews"
+        
+        # Crea le directory se non esistono
+        for directory in (self.storage_dir, self.blob_dir, self.temp_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+    
     def get_file_category(self, filename: str) -> str:
         """
         Determina la categoria di un file basandosi sull'estensione e sul nome
@@ -105,21 +148,255 @@ class StorageManager:
         
         return unique_name
     
-    def calculate_file_hash(self, file_path: str) -> str:
+    def calculate_file_hash(self, file_path: str, algorithm: str = 'md5') -> str:
         """
-        Calcola l'hash MD5 di un file per verificare l'integrità
+        Calcola l'hash di un file per verificare l'integrità
         
         Args:
             file_path: Percorso del file
+            algorithm: Algoritmo hashlib (md5 per compatibilità, sha256)
             
         Returns:
-            str: Hash MD5 del file
+            str: Hash esadecimale del file
         """
-        hash_md5 = hashlib.md5()
+        file_hash = hashlib.new(algorithm)
+        chunk_size = STORAGE_CONFIG['chunk_size']
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+    
+    def _read_chunks(self, source):
+        """Blocchi da un file caricato (o qualsiasi oggetto con read())"""
+        chunk_size = STORAGE_CONFIG['chunk_size']
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return iter(lambda: source.read(chunk_size), b"")
+    
+    def _write_temp(self, chunks, hashers=(), compress: bool = False) -> Tuple[str, int, int]:
+        """
+        Scrive i blocchi in un file temporaneo aggiornando gli hash
+        
+        Il file temporaneo sta sullo stesso filesystem dello storage, così il
+        rename finale (os.replace) è atomico. Con `compress` il contenuto è
+        scritto in formato gzip mentre gli hash restano quelli dell'originale.
+        
+        Returns:
+            Tuple[str, int, int]: (percorso temporaneo, byte originali, byte su disco)
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_dir, suffix='.part')
+        file_size = 0
+        compressor = zlib.compressobj(STORAGE_CONFIG['compression_level'], zlib.DEFLATED, 31) if compress else None
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(compressor.compress(chunk) if compressor else chunk)
+                    for file_hash in hashers:
+                        file_hash.update(chunk)
+                    file_size += len(chunk)
+                if compressor:
+                    f.write(compressor.flush())
+                stored_size = f.tell()
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return temp_path, file_size, stored_size
+    
+    def _move_into_place(self, temp_path: str, destination: Path):
+        try:
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temp_path, destination)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    
+    def write_stream(self, source, destination: Path) -> Dict:
+        """
+        Copia un file caricato su disco in un solo passaggio
+        
+        Il contenuto viene letto a blocchi grandi, scritto in un file
+        temporaneo e sottoposto a hash durante la scrittura; il file finale
+        compare solo a copia completata (rename atomico).
+        
+        Args:
+            source: File caricato da Streamlit (o qualsiasi oggetto con read())
+            destination: Percorso finale del file
+            
+        Returns:
+            Dict: file_size, content_hash (SHA-256) e md5_hash
+        """
+        sha256, md5 = hashlib.sha256(), hashlib.md5()
+        temp_path, file_size, _ = self._write_temp(self._read_chunks(source), (sha256, md5))
+        self._move_into_place(temp_path, destination)
+        return {
+            'file_size': file_size,
+            'content_hash': sha256.hexdigest(),
+            'md5_hash': md5.hexdigest()
+        }
+    
+    # ==================== BLOB PER CONTENUTO ====================
+    
+    def blob_relative_path(self, content_hash: str, compression: str = None) -> str:
+        """Percorso relativo (salvato nel database) del blob con questo hash"""
+        suffix = GZIP_SUFFIX if compression == 'gzip' else ''
+        return f"storage/blobs/{content_hash[:2]}/{content_hash}{suffix}"
+    
+    def resolve_path(self, file_path: str) -> Path:
+        """Percorso su disco di un file_path salvato nel database (relativo o assoluto)"""
+        if os.path.isabs(file_path):
+            return Path(file_path)
+        return self.base_dir / file_path
+    
+    def _existing_blob(self, content_hash: str) -> Optional[Tuple[Path, Optional[str]]]:
+        """Blob già salvato per questo hash: (percorso, compressione)"""
+        for compression in (None, 'gzip'):
+            path = self.resolve_path(self.blob_relative_path(content_hash, compression))
+            if path.exists():
+                return path, compression
+        return None
+    
+    def is_compressible(self, filename: str, mime_type: str = None) -> bool:
+        """
+        Indica se conviene provare a comprimere il file
+        
+        Si basa sulla categoria (get_file_category) e sul tipo MIME; i
+        formati già compressi (immagini, video, archivi, Office XML) sono esclusi.
+        """
+        if not STORAGE_CONFIG['compression_enabled']:
+            return False
+        extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        if extension in COMPRESSED_EXTENSIONS:
+            return False
+        mime_type = mime_type or mimetypes.guess_type(filename)[0] or ''
+        return (mime_type.startswith('text/') or mime_type in COMPRESSIBLE_MIME_TYPES
+                or self.get_file_category(filename) in COMPRESSIBLE_CATEGORIES)
+    
+    def _worth_compressing(self, file_size: int, stored_size: int) -> bool:
+        return stored_size <= file_size * (1 - STORAGE_CONFIG['compression_min_saving'])
+    
+    def _gunzip_chunks(self, path: str):
+        chunk_size = STORAGE_CONFIG['chunk_size']
+        with gzip.open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield chunk
+    
+    def open_blob(self, file_info: Dict):
+        """
+        Apre in lettura il contenuto originale di un file (decompresso se serve)
+        
+        Args:
+            file_info: Record di storage_files (file_path e compression)
+        """
+        path = self.resolve_path(file_info['file_path'])
+        if file_info.get('compression') == 'gzip':
+            return gzip.open(path, 'rb')
+        return open(path, 'rb')
+    
+    def store_blob(self, source, filename: str = None, mime_type: str = None) -> Dict:
+        """
+        Salva il contenuto come blob indirizzato dal suo hash SHA-256
+        
+        I file già in memoria (UploadedFile di Streamlit) vengono prima
+        sottoposti a hash senza copie: se il blob esiste già non si scrive
+        nulla su disco. Gli altri stream vengono scritti una sola volta in un
+        file temporaneo, scartato se il contenuto era già presente.
+        
+        I file comprimibili (is_compressible) vengono scritti in gzip durante
+        la stessa copia; se il risparmio è inferiore a `compression_min_saving`
+        il blob viene salvato non compresso.
+        
+        Chi registra il blob in storage_files deve farlo tenendo blob_lock e
+        dopo aver verificato che il blob esista ancora (vedi upload_file).
+        
+        Returns:
+            Dict: file_size, stored_size, compression, content_hash, md5_hash,
+            file_path (relativo) e deduplicated (True se il contenuto era già
+            nello storage)
+        """
+        sha256, md5 = hashlib.sha256(), hashlib.md5()
+        compress = bool(filename) and self.is_compressible(filename, mime_type)
+        buffer = source.getbuffer() if hasattr(source, 'getbuffer') else None
+        
+        if buffer is not None:
+            with buffer:
+                chunk_size = STORAGE_CONFIG['chunk_size']
+                chunks = [buffer[offset:offset + chunk_size] for offset in range(0, len(buffer), chunk_size)]
+                for chunk in chunks:
+                    sha256.update(chunk)
+                    md5.update(chunk)
+                file_size = len(buffer)
+                existing = self._existing_blob(sha256.hexdigest())
+                temp_path = None
+                if existing is None:
+                    temp_path, _, stored_size = self._write_temp(chunks, compress=compress)
+                    if compress and not self._worth_compressing(file_size, stored_size):
+                        os.remove(temp_path)
+                        temp_path, _, stored_size = self._write_temp(chunks)
+                        compress = False
+                for chunk in chunks:
+                    chunk.release()
+        else:
+            temp_path, file_size, stored_size = self._write_temp(self._read_chunks(source), (sha256, md5), compress)
+            existing = self._existing_blob(sha256.hexdigest())
+            if existing is not None:
+                os.remove(temp_path)
+                temp_path = None
+            elif compress and not self._worth_compressing(file_size, stored_size):
+                compressed_path = temp_path
+                temp_path, _, stored_size = self._write_temp(self._gunzip_chunks(compressed_path))
+                os.remove(compressed_path)
+                compress = False
+        
+        content_hash = sha256.hexdigest()
+        if existing is not None:
+            blob_path, compression = existing
+            stored_size = blob_path.stat().st_size
+        else:
+            compression = 'gzip' if compress else None
+            self._move_into_place(temp_path, self.resolve_path(self.blob_relative_path(content_hash, compression)))
+        
+        return {
+            'file_size': file_size,
+            'stored_size': stored_size,
+            'compression': compression,
+            'content_hash': content_hash,
+            'md5_hash': md5.hexdigest(),
+            'file_path': self.blob_relative_path(content_hash, compression),
+            'deduplicated': existing is not None
+        }
+    
+    def count_blob_references(self, content_hash: str) -> int:
+        """Numero di file attivi in storage_files che usano questo blob"""
+        result = self.supabase.table('storage_files').select('id', count='exact') \
+            .eq('content_hash', content_hash).eq('is_active', True).limit(1).execute()
+        return result.count or 0
+    
+    def release_blob(self, content_hash: str) -> bool:
+        """
+        Elimina il blob se nessun file attivo lo usa più
+        
+        Conteggio ed eliminazione avvengono sotto blob_lock: un upload dello
+        stesso contenuto non può registrare il blob mentre viene eliminato.
+        
+        Returns:
+            bool: True se il blob è stato eliminato
+        """
+        with blob_lock(content_hash):
+            if self.count_blob_references(content_hash) > 0:
+                return False
+            existing = self._existing_blob(content_hash)
+            if existing is None:
+                return False
+            blob_path = existing[0]
+            os.remove(blob_path)
+        get_preview_cache(self.preview_dir).discard(content_hash)
+        try:
+            blob_path.parent.rmdir()
+        except OSError:
+            # Altri blob nella stessa cartella
+            pass
+        return True
     
     def upload_file(self, uploaded_file, category: str = None, description: str = None) -> Dict:
         """
@@ -149,89 +426,111 @@ class StorageManager:
                     'message': f'Solo gli amministratori possono caricare file. Utente: {current_user.get("username") if current_user else "None"}, Admin: {is_admin}'
                 }
             
-            # Genera nome file univoco
-            unique_filename = self.generate_unique_filename(uploaded_file.name)
-            file_path = self.storage_dir / unique_filename
-            
-            # Percorso relativo per il database (compatibile con deployment)
-            relative_path = f"storage/uploads/{unique_filename}"
+            # Ottieni informazioni sul file
+            file_type = mimetypes.guess_type(uploaded_file.name)[0] or 'application/octet-stream'
             
-            # Salva il file
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            # Salva il contenuto come blob per hash: un contenuto già presente non viene riscritto
+            stored = self.store_blob(uploaded_file, uploaded_file.name, file_type)
             
             # Determina categoria se non specificata
             if not category:
                 category = self.get_file_category(uploaded_file.name)
             
-            # Calcola hash del file
-            file_hash = self.calculate_file_hash(str(file_path))
-            
-            # Ottieni informazioni sul file
-            file_size = os.path.getsize(file_path)
-            file_type = mimetypes.guess_type(uploaded_file.name)[0] or 'application/octet-stream'
-            
-            # Inserisci record nel database
-            file_data = {
-                'filename': unique_filename,
-                'original_filename': uploaded_file.name,
-                'file_path': relative_path,  # Usa percorso relativo
-                'file_size': file_size,
-                'file_type': file_type,
-                'category': category,
-                'description': description or '',
-                'uploaded_by': current_user.get('user_id') or current_user.get('id')
-            }
-            
-            # Inserisci record nel database (con gestione errori RLS)
-            try:
-                result = self.supabase.table('storage_files').insert(file_data).execute()
-            except Exception as rls_error:
-                # Se fallisce per RLS, prova senza controlli di sicurezza
-                if 'row-level security policy' in str(rls_error).lower():
-                    # Rimuovi uploaded_by per evitare problemi RLS
-                    file_data_safe = file_data.copy()
-                    file_data_safe.pop('uploaded_by', None)
-                    result = self.supabase.table('storage_files').insert(file_data_safe).execute()
-                else:
-                    raise rls_error
+            # Registrazione sotto lock: un'eliminazione dello stesso contenuto non può rilasciare il blob nel frattempo
+            with blob_lock(stored['content_hash']):
+                if self._existing_blob(stored['content_hash']) is None:
+                    # Blob rilasciato da un'eliminazione concorrente prima del lock: si riscrive
+                    uploaded_file.seek(0)
+                    stored = self.store_blob(uploaded_file, uploaded_file.name, file_type)
+                
+                # Inserisci record nel database
+                file_data = {
+                    'filename': stored['content_hash'],
+                    'original_filename': uploaded_file.name,
+                    'file_path': stored['file_path'],  # Percorso relativo del blob
+                    'file_size': stored['file_size'],
+                    'stored_size': stored['stored_size'],
+                    'compression': stored['compression'],
+                    'file_type': file_type,
+                    'content_hash': stored['content_hash'],
+                    'md5_hash': stored['md5_hash'],
+                    'category': category,
+                    'description': description or '',
+                    'uploaded_by': current_user.get('user_id') or current_user.get('id')
+                }
+                
+                # Inserisci record nel database (con gestione errori RLS)
+                try:
+                    result = self.supabase.table('storage_files').insert(file_data).execute()
+                except Exception as rls_error:
+                    # Se fallisce per RLS, prova senza controlli di sicurezza
+                    if 'row-level security policy' in str(rls_error).lower():
+                        # Rimuovi uploaded_by per evitare problemi RLS
+                        file_data_safe = file_data.copy()
+                        file_data_safe.pop('uploaded_by', None)
+                        result = self.supabase.table('storage_files').insert(file_data_safe).execute()
+                    else:
+                        raise rls_error
             
             if result.data:
+                if STORAGE_CONFIG['preview_on_upload']:
+                    # Anteprima generata subito: la lista file la trova già in cache
+                    try:
+                        get_preview_cache(self.preview_dir).get_or_create(stored['content_hash'], file_type, lambda: self.open_blob(stored))
+                    except Exception as e:
+                        # Il file è già salvato: l'anteprima verrà riprovata alla prima visualizzazione
+                        logger.warning(f"⚠️ Anteprima non generata per {uploaded_file.name}: {e}")
+                message = f'File "{uploaded_file.name}" caricato con successo'
+                if stored['deduplicated']:
+                    message += ' (contenuto già presente, nessuna copia aggiuntiva)'
                 return {
                     'success': True,
-                    'message': f'File "{uploaded_file.name}" caricato con successo',
-                    'file_id': result.data[0]['id']
+                    'message': message,
+                    'file_id': result.data[0]['id'],
+                    'deduplicated': stored['deduplicated']
                 }
             else:
-                # Se l'inserimento fallisce, elimina il file
-                os.remove(file_path)
+                # Se l'inserimento fallisce, elimina il blob se non usato da altri file
+                self.release_blob(stored['content_hash'])
                 return {
                     'success': False,
                     'message': 'Errore durante il salvataggio nel database'
                 }
                 
         except Exception as e:
-            # Se c'è un errore, elimina il file se è stato creato
-            if 'file_path' in locals() and os.path.exists(file_path):
-                os.remove(file_path)
+            # Se c'è un errore, elimina il blob se è stato creato e non è usato da altri file
+            if 'stored' in locals():
+                try:
+                    self.release_blob(stored['content_hash'])
+                except Exception:
+                    pass
             return {
                 'success': False,
                 'message': f'Errore durante il caricamento: {str(e)}'
             }
     
-    def get_files(self, category: str = None, search: str = None) -> List[Dict]:
+    def get_files_page(self, category: str = None, search: str = None, after_id: int = None,
+                       page_size: int = STORAGE_CONFIG['page_size']) -> Tuple[List[Dict], Optional[int]]:
         """
-        Recupera la lista dei file disponibili
+        Recupera una pagina della lista dei file (paginazione per chiave)
+        
+        I file sono ordinati per id decrescente (ordine di caricamento, più
+        recenti prima): ogni pagina parte dall'ultimo id della precedente,
+        quindi la query usa l'indice (category, id) senza OFFSET e costa
+        uguale alla prima pagina o alla millesima.
         
         Args:
             category: Filtro per categoria
             search: Termine di ricerca nel nome del file
+            after_id: Ultimo id della pagina precedente (None per la prima)
+            page_size: Numero di file per pagina
             
         Returns:
-            List[Dict]: Lista dei file
+            Tuple[List[Dict], Optional[int]]: (file della pagina, after_id
+            della pagina successiva o None se è l'ultima)
         """
         try:
-            query = self.supabase.table('storage_files').select('*').eq('is_active', True)
+            query = self.supabase.table('storage_files').select(LIST_COLUMNS).eq('is_active', True)
             
             # Applica filtri
             if category and category != 'Tutte':
@@ -240,65 +539,135 @@ class StorageManager:
             if search:
                 query = query.ilike('original_filename', f'%{search}%')
             
-            # Ordina per data di caricamento (più recenti prima)
-            query = query.order('uploaded_at', desc=True)
+            if after_id is not None:
+                query = query.lt('id', after_id)
             
-            result = query.execute()
-            return result.data if result.data else []
+            # Una riga in più indica se esiste una pagina successiva
+            result = query.order('id', desc=True).limit(page_size + 1).execute()
+            files = result.data or []
+            if len(files) > page_size:
+                files = files[:page_size]
+                return files, files[-1]['id']
+            return files, None
             
         except Exception as e:
             st.error(f'Errore durante il recupero dei file: {str(e)}')
-            return []
+            return [], None
     
-    def download_file(self, file_id: int) -> Tuple[bool, str, bytes]:
+    def get_files(self, category: str = None, search: str = None) -> List[Dict]:
         """
-        Prepara un file per il download
+        Recupera la lista completa dei file disponibili, pagina per pagina
+        
+        Args:
+            category: Filtro per categoria
+            search: Termine di ricerca nel nome del file
+            
+        Returns:
+            List[Dict]: Lista dei file
+        """
+        files, after_id = self.get_files_page(category, search)
+        while after_id is not None:
+            page, after_id = self.get_files_page(category, search, after_id)
+            files.extend(page)
+        return files
+    
+    def _get_download_target(self, file_id: int) -> Tuple[Optional[Dict], str]:
+        """File attivo e suo percorso su disco, oppure (None, messaggio di errore)"""
+        result = self.supabase.table('storage_files').select('*').eq('id', file_id).eq('is_active', True).execute()
+        
+        if not result.data:
+            return None, "File non trovato"
+        
+        file_info = result.data[0]
+        # Gestisci percorsi relativi e assoluti
+        file_path = self.resolve_path(file_info['file_path'])
+        
+        # Verifica che il file esista
+        if not file_path.exists():
+            return None, f"File non trovato nel filesystem: {file_path}"
+        
+        file_info['resolved_path'] = file_path
+        return file_info, ''
+    
+    def get_preview(self, file: Dict) -> Optional[bytes]:
+        """
+        Anteprima JPEG di pochi KB di un'immagine o della prima pagina di un PDF
+        
+        Le anteprime sono in cache per hash del contenuto; se manca viene
+        generata dal file originale al primo accesso.
+        
+        Args:
+            file: Record della lista file (id, file_type e content_hash)
+            
+        Returns:
+            Optional[bytes]: Anteprima o None se il file non ne ha una
+        """
+        def open_source():
+            file_info, error = self._get_download_target(file['id'])
+            if file_info is None:
+                raise FileNotFoundError(error)
+            return self.open_blob(file_info)
+        
+        return get_preview_cache(self.preview_dir).get_or_create(file.get('content_hash'), file.get('file_type'), open_source)
+    
+    def _current_user_id(self):
+        current_user = auth_manager.get_current_user()
+        if current_user:
+            return current_user.get('user_id') or current_user.get('id')  # Usa l'ID corretto dell'utente
+        return None
+    
+    def get_download_link(self, file_id: int) -> Tuple[bool, str]:
+        """
+        Link temporaneo al server download locale (streaming e richieste Range)
         
         Args:
             file_id: ID del file da scaricare
             
         Returns:
-            Tuple[bool, str, bytes]: (successo, nome_file, contenuto_file)
+            Tuple[bool, str]: (successo, URL o messaggio di errore); se il server
+            download non è disponibile si usa download_file
         """
         try:
-            # Recupera informazioni sul file
-            result = self.supabase.table('storage_files').select('*').eq('id', file_id).eq('is_active', True).execute()
+            server = get_file_server(self.supabase)
+            if server is None:
+                return False, "Server download non disponibile"
             
-            if not result.data:
-                return False, "File non trovato", b""
+            file_info, error = self._get_download_target(file_id)
+            if file_info is None:
+                return False, error
             
-            file_info = result.data[0]
-            file_path = file_info['file_path']
+            # Il download viene contato dal server quando il browser scarica il file
+            url = server.register(file_info['resolved_path'], file_info['original_filename'],
+                                  file_info.get('file_type'), file_id, self._current_user_id(),
+                                  compression=file_info.get('compression'), size=file_info.get('file_size'))
+            return True, url
             
-            # Gestisci percorsi relativi e assoluti
-            if not os.path.isabs(file_path):
-                # Percorso relativo - costruisci il percorso completo
-                file_path = Path(current_dir) / file_path
-            else:
-                # Percorso assoluto - usa così com'è
-                file_path = Path(file_path)
+        except Exception as e:
+            return False, f"Errore: {str(e)}"
+    
+    def download_file(self, file_id: int) -> Tuple[bool, str, bytes]:
+        """
+        Prepara un file per il download
+        
+        Args:
+            file_id: ID del file da scaricare
             
-            # Verifica che il file esista
-            if not file_path.exists():
-                return False, f"File non trovato nel filesystem: {file_path}", b""
+        Returns:
+            Tuple[bool, str, bytes]: (successo, nome_file, contenuto_file)
+        """
+        try:
+            file_info, error = self._get_download_target(file_id)
+            if file_info is None:
+                return False, error, b""
             
-            # Leggi il contenuto del file
-            with open(file_path, 'rb') as f:
+            # Leggi il contenuto del file (decompresso se salvato in gzip)
+            with self.open_blob(file_info) as f:
                 file_content = f.read()
             
-            # Registra il download
-            current_user = auth_manager.get_current_user()
-            if current_user:
-                download_data = {
-                    'file_id': file_id,
-                    'downloaded_by': current_user.get('user_id') or current_user.get('id')  # Usa l'ID corretto dell'utente
-                }
-                self.supabase.table('storage_downloads').insert(download_data).execute()
-                
-                # Incrementa contatore download
-                self.supabase.table('storage_files').update({
-                    'download_count': file_info['download_count'] + 1
-                }).eq('id', file_id).execute()
+            # Registra il download: storico e contatore scritti a blocchi in background
+            user_id = self._current_user_id()
+            if user_id is not None:
+                get_download_counter(self.supabase).record(file_id, user_id)
             
             return True, file_info['original_filename'], file_content
             
@@ -353,13 +722,17 @@ class StorageManager:
                     raise rls_error
             
             if update_result.data:
-                # Opzionalmente, elimina anche il file fisico
-                file_path = file_info['file_path']
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                    except Exception as e:
-                        st.warning(f'File eliminato dal database ma non dal filesystem: {str(e)}')
+                try:
+                    if file_info.get('content_hash'):
+                        # Blob condiviso: eliminato solo quando sparisce l'ultimo riferimento
+                        self.release_blob(file_info['content_hash'])
+                    else:
+                        # File caricato prima dello storage per contenuto
+                        file_path = self.resolve_path(file_info['file_path'])
+                        if file_path.exists():
+                            os.remove(file_path)
+                except Exception as e:
+                    st.warning(f'File eliminato dal database ma non dal filesystem: {str(e)}')
                 
                 return {
                     'success': True,
@@ -381,35 +754,32 @@ class StorageManager:
         """
         Recupera statistiche sull'utilizzo dello storage
         
+        I conteggi e le somme per categoria sono calcolati nel database dalla
+        funzione get_storage_stats (database/migration_storage_listing.sql),
+        senza scaricare le righe dei file.
+        
+        total_size è la dimensione originale dei file, stored_size lo spazio
+        occupato su disco (ogni blob contato una volta, compresso se salvato
+        in gzip) e saved_size il risparmio di deduplicazione e compressione.
+        
         Returns:
             Dict: Statistiche dello storage
         """
         try:
-            # Conta file totali
-            files_result = self.supabase.table('storage_files').select('id, file_size, category').eq('is_active', True).execute()
-            
-            if not files_result.data:
-                return {
-                    'total_files': 0,
-                    'total_size': 0,
-                    'categories': {}
-                }
-            
-            total_files = len(files_result.data)
-            total_size = sum(file['file_size'] for file in files_result.data)
-            
-            # Raggruppa per categoria
-            categories = {}
-            for file in files_result.data:
-                cat = file['category']
-                if cat not in categories:
-                    categories[cat] = {'count': 0, 'size': 0}
-                categories[cat]['count'] += 1
-                categories[cat]['size'] += file['file_size']
+            result = self.supabase.rpc(STATS_FUNCTION, {}).execute()
+            data = result.data or {}
+            categories = {
+                category: {'count': values['count'], 'size': values['size']}
+                for category, values in (data.get('categories') or {}).items()
+            }
+            total_size = sum(values['size'] for values in categories.values())
+            stored_size = data.get('stored_size') or 0
             
             return {
-                'total_files': total_files,
+                'total_files': sum(values['count'] for values in categories.values()),
                 'total_size': total_size,
+                'stored_size': stored_size,
+                'saved_size': max(total_size - stored_size, 0),
                 'categories': categories
             }
             
@@ -418,6 +788,8 @@ class StorageManager:
             return {
                 'total_files': 0,
                 'total_size': 0,
+                'stored_size': 0,
+                'saved_size': 0,
                 'categories': {}
             }
     
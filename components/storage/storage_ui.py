@@ -172,12 +172,25 @@ def render_file_list(storage_manager: StorageManager, is_admin: bool = False):
             key="file_search"
         )
     
+    # Paginazione per chiave: pila degli after_id delle pagine visitate, azzerata al cambio dei filtri
+    filters = (category_filter, search_term)
+    if st.session_state.get('file_list_filters') != filters:
+        st.session_state.file_list_filters = filters
+        st.session_state.file_list_cursors = [None]
+    cursors = st.session_state.file_list_cursors
+    
     # Recupera file
-    files = storage_manager.get_files(
+    files, next_after_id = storage_manager.get_files_page(
         category=category_filter if category_filter != "Tutte" else None,
-        search=search_term if search_term else None
+        search=search_term if search_term else None,
+        after_id=cursors[-1]
     )
     
+    if not files and len(cursors) > 1:
+        # Pagina svuotata da un'eliminazione: torna alla precedente
+        cursors.pop()
+        st.rerun()
+    
     if not files:
         st.info("📭 Nessun file trovato")
         return
@@ -185,7 +198,15 @@ def render_file_list(storage_manager: StorageManager, is_admin: bool = False):
     # Mostra file in formato tabella
     for file in files:
         with st.container():
-            col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+            col_preview, col1, col2, col3, col4 = st.columns([1, 3, 1, 1, 1])
+            
+            with col_preview:
+                # Miniatura dalla cache anteprime (pochi KB invece del file originale)
+                preview = storage_manager.get_preview(file)
+                if preview:
+                    st.image(preview, use_container_width=True)
+                else:
+                    st.markdown("### 📄")
             
             with col1:
                 # Informazioni file
@@ -202,17 +223,22 @@ def render_file_list(storage_manager: StorageManager, is_admin: bool = False):
             with col3:
                 # Pulsante download
                 if st.button("⬇️", key=f"download_{file['id']}", help="Scarica file"):
-                    success, filename, content = storage_manager.download_file(file['id'])
-                    if success:
-                        st.download_button(
-                            label="💾 Scarica",
-                            data=content,
-                            file_name=filename,
-                            mime=file['file_type'],
-                            key=f"dl_{file['id']}"
-                        )
+                    # Preferisce il server download (streaming, riprese); altrimenti file in memoria
+                    link_ok, url = storage_manager.get_download_link(file['id'])
+                    if link_ok:
+                        st.link_button("💾 Scarica", url)
                     else:
-                        st.error(f"Errore: {filename}")
+                        success, filename, content = storage_manager.download_file(file['id'])
+                        if success:
+                            st.download_button(
+                                label="💾 Scarica",
+                                data=content,
+                                file_name=filename,
+                                mime=file['file_type'],
+                                key=f"dl_{file['id']}"
+                            )
+                        else:
+                            st.error(f"Errore: {filename}")
             
             with col4:
                 # Pulsante elimina (solo admin)
@@ -230,6 +256,20 @@ def render_file_list(storage_manager: StorageManager, is_admin: bool = False):
                             st.warning("Clicca di nuovo per confermare l'eliminazione")
             
             st.markdown("---")
+    
+    # Navigazione tra le pagine
+    if len(cursors) > 1 or next_after_id is not None:
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if st.button("⬅️ Precedente", key="file_list_prev", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        with col_page:
+            st.caption(f"📄 Pagina {len(cursors)}")
+        with col_next:
+            if st.button("Successiva ➡️", key="file_list_next", disabled=next_after_id is None):
+                cursors.append(next_after_id)
+                st.rerun()
 
 def render_storage_sidebar(storage_manager: StorageManager, is_admin: bool):
     """
@@ -241,7 +281,8 @@ def render_storage_sidebar(storage_manager: StorageManager, is_admin: bool):
     stats = storage_manager.get_storage_stats()
     
     st.metric("📁 File Totali", stats['total_files'])
-    st.metric("💾 Spazio Utilizzato", storage_manager.format_file_size(stats['total_size']))
+    st.metric("💾 Spazio Utilizzato", storage_manager.format_file_size(stats['stored_size']),
+              help=f"Dimensione originale dei file: {storage_manager.format_file_size(stats['total_size'])}")
     
     # Categorie
     if stats['categories']:
@@ -288,7 +329,7 @@ def render_storage_stats(storage_manager: StorageManager):
         return
     
     # Metriche principali
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
     
     with col1:
         st.metric("📁 File Totali", stats['total_files'])
@@ -300,6 +341,13 @@ def render_storage_stats(storage_manager: StorageManager):
         avg_size = stats['total_size'] / stats['total_files'] if stats['total_files'] > 0 else 0
         st.metric("📏 Dimensione Media", storage_manager.format_file_size(int(avg_size)))
     
+    with col4:
+        saved_percent = stats['saved_size'] / stats['total_size'] * 100 if stats['total_size'] > 0 else 0
+        st.metric("🗜️ Spazio su Disco", storage_manager.format_file_size(stats['stored_size']),
+                  delta=f"-{storage_manager.format_file_size(stats['saved_size'])} ({saved_percent:.0f}%)",
+                  delta_color="inverse",
+                  help="Spazio risparmiato con deduplicazione e compressione")
+    
     # Grafico categorie
     if stats['categories']:
         st.subheader("📊 Distribuzione per Categoria")
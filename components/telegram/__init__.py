@@ -7,5 +7,8 @@ Creato da Ezio Camporeale
 
 from .telegram_manager import TelegramManager
 from .telegram_settings_ui import TelegramSettingsUI
+from .telegram_outbox import TelegramOutbox, get_telegram_outbox
+from .telegram_bot import TelegramCommandBot, get_telegram_bot
 
-__all__ = ['TelegramManager', 'TelegramSettingsUI']
+__all__ = ['TelegramManager', 'TelegramSettingsUI', 'TelegramOutbox', 'get_telegram_outbox',
+           'TelegramCommandBot', 'get_telegram_bot']
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+🤖 TELEGRAM BOT - Dashboard Gestione Lead
+Comandi del bot Telegram (/stats, /overdue, /lead, /today) ricevuti in long polling
+Le risposte usano solo dati già in memoria: snapshot analytics, indice contatti
+lead e scheduler scadenze task, senza scansioni delle tabelle per comando
+Creato da Ezio Camporeale
+"""
+
+import time
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import requests
+
+from config import TELEGRAM_API_URL, TELEGRAM_CONFIG, TELEGRAM_BOT_CONFIG, APP_BASE_URL
+from components.telegram.telegram_manager import _escape_markdown
+
+logger = logging.getLogger(__name__)
+
+HELP_MESSAGE = """
+🤖 *COMANDI DISPONIBILI*
+
+/stats - Statistiche ultimi {days} giorni
+/today - Riepilogo di oggi
+/overdue - Task scaduti
+/lead <email> - Cerca un lead per email
+""".strip()
+
+
+class TelegramCommandBot:
+    """
+    Bot comandi Telegram in long polling
+
+    Un thread in background chiama getUpdates e risponde ai comandi delle
+    chat autorizzate. Le fonti dati (snapshot analytics, indice contatti,
+    scheduler scadenze) sono le istanze condivise del processo, caricate una
+    sola volta all'avvio del bot e poi mantenute dagli eventi di DatabaseManager.
+    """
+
+    COMMANDS = {
+        '/start': '_cmd_help',
+        '/help': '_cmd_help',
+        '/stats': '_cmd_stats',
+        '/today': '_cmd_today',
+        '/overdue': '_cmd_overdue',
+        '/lead': '_cmd_lead'
+    }
+
+    def __init__(self, bot_token: str, allowed_chat_ids: Iterable[Any], snapshot=None,
+                 contact_index=None, scheduler=None, db_manager=None,
+                 api_url: str = TELEGRAM_API_URL, config: Dict[str, Any] = None,
+                 clock: Callable[[], float] = time.time):
+        self.bot_token = bot_token
+        self.allowed_chat_ids = {str(chat_id) for chat_id in allowed_chat_ids if chat_id}
+        self.snapshot = snapshot
+        self.contact_index = contact_index
+        self.scheduler = scheduler
+        self.db = db_manager
+        self.api_url = api_url
+        self.config = config or TELEGRAM_BOT_CONFIG
+        self.clock = clock
+        self.stats = Counter()
+
+        # Connessione riutilizzata tra getUpdates e sendMessage
+        self.session = requests.Session()
+        self._offset: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ==================== FONTI DATI ====================
+
+    def _get_db(self):
+        if self.db is None:
+            from database.database_manager import DatabaseManager
+            self.db = DatabaseManager()
+        return self.db
+
+    def _get_snapshot(self):
+        if self.snapshot is None:
+            from components.ai_assistant.analytics_snapshot import get_analytics_snapshot
+            self.snapshot = get_analytics_snapshot(self._get_db())
+        return self.snapshot
+
+    def _get_contact_index(self):
+        if self.contact_index is None:
+            from utils.lead_contact_index import get_lead_contact_index
+            self.contact_index = get_lead_contact_index(self._get_db())
+        return self.contact_index
+
+    def _get_scheduler(self):
+        if self.scheduler is None:
+            from utils.task_due_scheduler import get_task_due_scheduler
+            self.scheduler = get_task_due_scheduler(self._get_db())
+        return self.scheduler
+
+    def warm_up(self):
+        """Carica le cache prima del primo comando, così le risposte non attendono il database"""
+        for loader in (self._get_snapshot, self._get_contact_index, self._get_scheduler):
+            try:
+                loader()
+            except Exception as e:
+                logger.error(f"❌ Errore caricamento dati bot Telegram: {e}")
+        try:
+            self._get_snapshot().get_snapshot(self.config['stats_days'])
+        except Exception as e:
+            logger.error(f"❌ Errore preparazione statistiche bot Telegram: {e}")
+
+    # ==================== API TELEGRAM ====================
+
+    def _call(self, method: str, payload: Dict[str, Any], timeout: float) -> Any:
+        url = f"{self.api_url}/bot{self.bot_token}/{method}"
+        response = self.session.post(url, json=payload, timeout=timeout)
+        try:
+            result = response.json()
+        except ValueError:
+            result = {}
+        if response.status_code != 200 or not result.get('ok'):
+            raise RuntimeError(result.get('description') or f"HTTP {response.status_code}")
+        return result['result']
+
+    def _reply(self, chat_id: Any, text: str, reply_to: Any = None):
+        payload = {
+            'chat_id': chat_id,
+            'text': text,
+            'parse_mode': 'Markdown',
+            'disable_web_page_preview': True
+        }
+        if reply_to:
+            payload['reply_to_message_id'] = reply_to
+        self._call('sendMessage', payload, TELEGRAM_CONFIG['timeout'])
+
+    # ==================== POLLING ====================
+
+    def poll_once(self, timeout: float = None) -> int:
+        """
+        Una chiamata getUpdates: gestisce i comandi ricevuti
+
+        Returns:
+            Numero di update ricevuti
+        """
+        timeout = self.config['long_poll_seconds'] if timeout is None else timeout
+        payload = {'timeout': int(timeout), 'allowed_updates': ['message']}
+        if self._offset is not None:
+            payload['offset'] = self._offset
+        updates = self._call('getUpdates', payload, timeout + TELEGRAM_CONFIG['timeout'])
+
+        for update in updates:
+            # L'offset conferma l'update anche se la risposta fallisce: nessun comando ripetuto
+            self._offset = update['update_id'] + 1
+            try:
+                self.handle_update(update)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"❌ Errore comando bot Telegram: {e}")
+        return len(updates)
+
+    def handle_update(self, update: Dict[str, Any]) -> Optional[str]:
+        """Risponde a un messaggio con comando; restituisce il testo inviato"""
+        message = update.get('message') or {}
+        text = (message.get('text') or '').strip()
+        chat_id = (message.get('chat') or {}).get('id')
+        if not text.startswith('/') or chat_id is None:
+            return None
+        if str(chat_id) not in self.allowed_chat_ids:
+            self.stats['ignored'] += 1
+            logger.warning(f"⚠️ Comando Telegram da chat non autorizzata: {chat_id}")
+            return None
+
+        started = time.perf_counter()
+        command, _, argument = text.partition(' ')
+        # Nei gruppi i comandi arrivano come /stats@NomeBot
+        command = command.split('@', 1)[0].lower()
+        handler = getattr(self, self.COMMANDS.get(command, '_cmd_help'))
+        reply = handler(argument.strip())
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        self._reply(chat_id, reply, message.get('message_id'))
+        self.stats['commands'] += 1
+        self.stats[command] += 1
+        logger.info(f"🤖 Comando {command} gestito in {elapsed_ms:.1f} ms")
+        return reply
+
+    def _run(self):
+        self.warm_up()
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                self.stats['poll_errors'] += 1
+                logger.error(f"❌ Errore polling bot Telegram: {e}")
+                self._stop.wait(self.config['error_backoff_seconds'])
+
+    def start(self):
+        """Avvia il long polling in background (una sola volta)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='telegram-bot', daemon=True)
+        self._thread.start()
+        logger.info("🤖 Bot comandi Telegram avviato")
+
+    def stop(self, timeout: float = 5.0):
+        """Ferma il polling (la richiesta getUpdates in corso termina al suo timeout)"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    # ==================== COMANDI ====================
+
+    def _format_due(self, task: Dict[str, Any]) -> str:
+        return datetime.fromtimestamp(task['due_at']).strftime('%d/%m/%Y %H:%M')
+
+    def _task_lines(self, tasks: List[Dict[str, Any]], total: int) -> List[str]:
+        lines = [f"• {_escape_markdown(str(task.get('title') or 'Senza titolo'))} - {self._format_due(task)}"
+                 for task in tasks]
+        if total > len(tasks):
+            lines.append(f"… e altri {total - len(tasks)}")
+        return lines
+
+    def _cmd_help(self, argument: str) -> str:
+        return HELP_MESSAGE.format(days=self.config['stats_days'])
+
+    def _cmd_stats(self, argument: str) -> str:
+        days = self.config['stats_days']
+        data = self._get_snapshot().get_snapshot(days)
+        leads, tasks = data['leads'], data['tasks']
+        completion = tasks['completed'] / tasks['total'] * 100 if tasks['total'] else 0
+        contacts = data['contacts']['by_template'].get('Default', {})
+
+        lines = [
+            f"📊 *STATISTICHE ULTIMI {days} GIORNI*",
+            "",
+            f"👤 *LEAD:* {leads['total']}",
+            f"📋 *TASK:* {tasks['total']} (completati {tasks['completed']}, {completion:.0f}%)",
+            f"🚨 *TASK SCADUTI:* {self._get_scheduler().overdue_count()}"
+        ]
+        if contacts:
+            lines.append(f"📞 *CONTATTI:* {contacts['usage_count']} "
+                         f"(risposta {contacts['response_rate'] * 100:.0f}%)")
+
+        top_users = sorted(data['users']['by_user'].items(), key=lambda item: item[1]['leads_assigned'], reverse=True)
+        top_users = [item for item in top_users if item[1]['leads_assigned']][:3]
+        if top_users:
+            lines += ["", "🏆 *LEAD ASSEGNATI:*"]
+            lines += [f"• {_escape_markdown(name)}: {stats['leads_assigned']}" for name, stats in top_users]
+        return "\n".join(lines)
+
+    def _cmd_today(self, argument: str) -> str:
+        data = self._get_snapshot().get_snapshot(1)
+        scheduler = self._get_scheduler()
+        now = datetime.fromtimestamp(self.clock())
+        end_of_day = datetime.combine(now.date() + timedelta(days=1), datetime.min.time()).timestamp()
+        due_today = scheduler.due_tasks(end_of_day)
+        limit = self.config['list_limit']
+
+        lines = [
+            f"📅 *OGGI {now.strftime('%d/%m/%Y')}*",
+            "",
+            f"👤 Nuovi lead: {data['leads']['total']}",
+            f"📋 Nuovi task: {data['tasks']['total']}",
+            f"🚨 Task scaduti: {scheduler.overdue_count()}",
+            f"⏰ In scadenza oggi: {len(due_today)}"
+        ]
+        if due_today:
+            lines.append("")
+            lines += self._task_lines(due_today[:limit], len(due_today))
+        return "\n".join(lines)
+
+    def _cmd_overdue(self, argument: str) -> str:
+        scheduler = self._get_scheduler()
+        limit = self.config['list_limit']
+        total = scheduler.overdue_count()
+        if not total:
+            return "✅ Nessun task scaduto"
+        lines = [f"🚨 *{total} TASK SCADUTI*", ""]
+        lines += self._task_lines(scheduler.overdue_tasks(limit), total)
+        lines += ["", f"🔗 [Apri la dashboard]({APP_BASE_URL})"]
+        return "\n".join(lines)
+
+    def _cmd_lead(self, argument: str) -> str:
+        if not argument:
+            return "ℹ️ Uso: /lead <email>"
+        index = self._get_contact_index()
+        owners = index.lookup_email(argument)
+        if not owners:
+            return f"🔍 Nessun lead con email {_escape_markdown(argument)}"
+
+        lines = [f"👤 *LEAD TROVATI: {len(owners)}*", ""]
+        for owner in owners[:self.config['list_limit']]:
+            contact = index.get_contact(owner['id']) or {}
+            lines.append(f"• *{_escape_markdown(owner['name'] or 'Senza nome')}* (ID {owner['id']})")
+            if contact.get('phone'):
+                lines.append(f"  📞 {contact['phone']}")
+        lines += ["", f"🔗 [Apri la dashboard]({APP_BASE_URL})"]
+        return "\n".join(lines)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {'running': self.is_running(), **self.stats}
+
+
+# ==================== ISTANZA CONDIVISA ====================
+
+_shared_bot: Optional[TelegramCommandBot] = None
+_shared_lock = threading.Lock()
+
+
+def start_telegram_bot(bot_token: str, chat_id: Any) -> Optional[TelegramCommandBot]:
+    """
+    Avvia (una sola volta per processo) il bot comandi per il token configurato
+
+    Un token diverso ferma il bot precedente; la chat configurata per le
+    notifiche è l'unica autorizzata ai comandi.
+    """
+    global _shared_bot
+    if not TELEGRAM_BOT_CONFIG['enabled'] or not bot_token or not chat_id:
+        return None
+
+    with _shared_lock:
+        if _shared_bot is not None and _shared_bot.bot_token != bot_token:
+            _shared_bot.stop(timeout=0)
+            _shared_bot = None
+        if _shared_bot is None:
+            _shared_bot = TelegramCommandBot(bot_token, [chat_id])
+        _shared_bot.allowed_chat_ids = {str(chat_id)}
+        _shared_bot.start()
+    return _shared_bot
+
+
+def get_telegram_bot() -> Optional[TelegramCommandBot]:
+    """Bot comandi attivo nel processo, se avviato"""
+    return _shared_bot
@@ -6,6 +6,7 @@ Gestisce invio messaggi, configurazione bot e logging
 Creato da Ezio Camporeale
 """
 
+import re
 import requests
 import logging
 from datetime import datetime
@@ -14,10 +15,30 @@ import json
 import time
 import uuid
 
+from config import TELEGRAM_API_URL, TELEGRAM_CONFIG, APP_BASE_URL
+from components.telegram.telegram_outbox import SendResult, get_telegram_outbox
+
 # Configurazione logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Titolo dei messaggi riepilogo per tipo di evento
+DIGEST_TITLES = {
+    'new_lead': ('👤', 'NUOVI LEAD INSERITI'),
+    'lead_status_changed': ('📊', 'STATI LEAD AGGIORNATI'),
+    'lead_assigned': ('👥', 'LEAD ASSEGNATI'),
+    'new_task': ('📋', 'NUOVI TASK CREATI'),
+    'task_completed': ('✅', 'TASK COMPLETATI'),
+    'task_in_progress': ('🚀', 'TASK IN CORSO'),
+    'user_login': ('🔐', 'ACCESSI UTENTE'),
+    'task_due_soon': ('⚠️', 'TASK IN SCADENZA'),
+    'task_overdue': ('🚨', 'TASK SCADUTI')
+}
+
+def _escape_markdown(text: str) -> str:
+    """Protegge i caratteri speciali Markdown nei testi liberi"""
+    return re.sub(r'([_*\[`])', r'\\\1', text)
+
 class TelegramManager:
     """Gestore per le notifiche Telegram nel Dashboard Lead"""
     
@@ -27,9 +48,13 @@ class TelegramManager:
         self.chat_id = None
         self.is_configured = False
         self.supabase_manager = None
+        # Coda persistente: le notifiche partono in background senza bloccare l'interfaccia
+        self.outbox = get_telegram_outbox()
         # Non inizializzare Supabase qui per evitare loop infinito
         # self._init_supabase()
         self._load_configuration()
+        self._start_outbox()
+        self._start_command_bot()
         logger.info("✅ TelegramManager Lead inizializzato")
     
     def _init_supabase(self):
@@ -42,6 +67,21 @@ class TelegramManager:
             logger.error(f"❌ Errore inizializzazione Supabase per TelegramManager Lead: {e}")
             self.supabase_manager = None
     
+    def _start_outbox(self):
+        """Collega la coda alla configurazione corrente e avvia il worker"""
+        if self.is_configured:
+            self.outbox.configure(self._post_message, self._write_notification_logs, self._format_digest_message)
+            self.outbox.start()
+    
+    def _start_command_bot(self):
+        """Avvia il bot comandi (/stats, /overdue, /lead, /today) per la chat configurata"""
+        if self.is_configured:
+            try:
+                from components.telegram.telegram_bot import start_telegram_bot
+                start_telegram_bot(self.bot_token, self.chat_id)
+            except Exception as e:
+                logger.error(f"❌ Errore avvio bot comandi Telegram Lead: {e}")
+    
     def _load_configuration(self):
         """Carica la configurazione Telegram dal database"""
         try:
@@ -103,6 +143,8 @@ class TelegramManager:
                 self.bot_token = bot_token
                 self.chat_id = chat_id
                 self.is_configured = True
+                self._start_outbox()
+                self._start_command_bot()
                 
                 logger.info("✅ Configurazione Telegram Lead salvata nel database")
                 return True, "✅ Configurazione Telegram Lead salvata con successo!"
@@ -120,8 +162,8 @@ class TelegramManager:
                 return False, "❌ Configurazione Telegram non completa"
             
             # Test con getMe
-            url = f"https://api.telegram.org/bot{self.bot_token}/getMe"
-            response = requests.get(url, timeout=10)
+            url = f"{TELEGRAM_API_URL}/bot{self.bot_token}/getMe"
+            response = requests.get(url, timeout=TELEGRAM_CONFIG['timeout'])
             
             if response.status_code == 200:
                 bot_info = response.json()
@@ -142,56 +184,87 @@ class TelegramManager:
             logger.error(f"❌ Errore test connessione Telegram Lead: {e}")
             return False, f"❌ Errore test connessione: {e}"
     
+    def _post_message(self, chat_id: str, message: str, parse_mode: Optional[str] = "Markdown",
+                      disable_web_page_preview: bool = True) -> SendResult:
+        """Chiamata sendMessage; distingue limiti (429), errori definitivi (4xx) e temporanei"""
+        url = f"{TELEGRAM_API_URL}/bot{self.bot_token}/sendMessage"
+        
+        payload = {
+            'chat_id': chat_id,
+            'text': message,
+            'disable_web_page_preview': disable_web_page_preview
+        }
+        if parse_mode:
+            payload['parse_mode'] = parse_mode
+        
+        try:
+            response = requests.post(url, json=payload, timeout=TELEGRAM_CONFIG['timeout'])
+        except requests.exceptions.Timeout:
+            return SendResult(False, 'Timeout')
+        except requests.exceptions.RequestException as e:
+            return SendResult(False, str(e))
+        
+        try:
+            result = response.json()
+        except ValueError:
+            result = {}
+        
+        if response.status_code == 200 and result.get('ok'):
+            message_id = result['result'].get('message_id')
+            logger.info(f"✅ Messaggio Telegram Lead inviato (ID: {message_id})")
+            return SendResult(True)
+        
+        error_desc = result.get('description') or response.text or f"HTTP {response.status_code}"
+        if response.status_code == 429:
+            retry_after = (result.get('parameters') or {}).get('retry_after', 1)
+            return SendResult(False, error_desc, retry_after=retry_after)
+        return SendResult(False, error_desc, permanent=400 <= response.status_code < 500)
+    
     def send_message(self, message: str, parse_mode: str = "Markdown", 
                      disable_web_page_preview: bool = True) -> Tuple[bool, str]:
-        """Invia un messaggio al canale/gruppo Telegram"""
+        """Invia subito un messaggio al canale/gruppo Telegram (attende la risposta dell'API)"""
         try:
             if not self.is_configured:
                 return False, "❌ Configurazione Telegram non completa"
             
-            # Prepara il messaggio
-            url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
+            result = self._post_message(self.chat_id, message, parse_mode, disable_web_page_preview)
             
-            payload = {
-                'chat_id': self.chat_id,
-                'text': message,
-                'parse_mode': parse_mode,
-                'disable_web_page_preview': disable_web_page_preview
-            }
+            if result.ok:
+                # Log del messaggio inviato
+                self._log_notification('message_sent', message, 'sent')
+                return True, f"✅ Messaggio inviato con successo!"
             
-            # Invia il messaggio
-            response = requests.post(url, json=payload, timeout=10)
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('ok'):
-                    message_id = result['result'].get('message_id')
-                    logger.info(f"✅ Messaggio Telegram Lead inviato (ID: {message_id})")
-                    
-                    # Log del messaggio inviato
-                    self._log_notification('message_sent', message, 'sent')
-                    
-                    return True, f"✅ Messaggio inviato con successo!"
-                else:
-                    error_desc = result.get('description', 'Errore sconosciuto')
-                    logger.error(f"❌ Errore invio Telegram Lead: {error_desc}")
-                    self._log_notification('message_failed', message, 'failed', error_desc)
-                    return False, f"❌ Errore invio: {error_desc}"
-            else:
-                error_text = response.text
-                logger.error(f"❌ Errore HTTP {response.status_code}: {error_text}")
-                self._log_notification('message_failed', message, 'failed', error_text)
-                return False, f"❌ Errore HTTP {response.status_code}"
+            logger.error(f"❌ Errore invio Telegram Lead: {result.error}")
+            self._log_notification('message_failed', message, 'failed', result.error)
+            return False, f"❌ Errore invio: {result.error}"
                 
-        except requests.exceptions.Timeout:
-            logger.error("❌ Timeout invio messaggio Telegram Lead")
-            self._log_notification('message_failed', message, 'failed', 'Timeout')
-            return False, "❌ Timeout invio messaggio"
         except Exception as e:
             logger.error(f"❌ Errore invio messaggio Telegram Lead: {e}")
             self._log_notification('message_failed', message, 'failed', str(e))
             return False, f"❌ Errore invio: {e}"
     
+    def queue_message(self, message: str, notification_type: str = 'message',
+                      parse_mode: str = "Markdown", disable_web_page_preview: bool = True,
+                      summary: str = None) -> Tuple[bool, str]:
+        """
+        Accoda un messaggio: lo invia il worker in background
+        
+        I tipi in `digest_types` arrivati nella stessa finestra vengono uniti
+        in un unico messaggio riepilogo (`summary` è la loro riga).
+        """
+        try:
+            if not self.is_configured:
+                return False, "❌ Configurazione Telegram non completa"
+            
+            digest_window = TELEGRAM_CONFIG['digest_window_seconds'] if notification_type in TELEGRAM_CONFIG['digest_types'] else 0
+            self.outbox.enqueue(self.chat_id, message, notification_type, parse_mode, disable_web_page_preview,
+                                digest_window=digest_window, summary=summary)
+            return True, "📤 Messaggio accodato per l'invio"
+            
+        except Exception as e:
+            logger.error(f"❌ Errore accodamento messaggio Telegram Lead: {e}")
+            return False, f"❌ Errore accodamento: {e}"
+    
     def send_notification(self, notification_type: str, data: Dict[str, Any]) -> Tuple[bool, str]:
         """Invia una notifica formattata basata sul tipo"""
         try:
@@ -201,8 +274,8 @@ class TelegramManager:
             if not message:
                 return False, f"❌ Tipo notifica non supportato: {notification_type}"
             
-            # Invia il messaggio
-            return self.send_message(message)
+            # Accoda il messaggio (inviato in background, eventualmente in un riepilogo)
+            return self.queue_message(message, notification_type, summary=self._summarize_notification(notification_type, data))
             
         except Exception as e:
             logger.error(f"❌ Errore invio notifica Lead {notification_type}: {e}")
@@ -225,6 +298,8 @@ class TelegramManager:
                 return self._format_task_in_progress_message(data)
             elif notification_type == "task_due_soon":
                 return self._format_task_due_soon_message(data)
+            elif notification_type == "task_overdue":
+                return self._format_task_overdue_message(data)
             elif notification_type == "new_user":
                 return self._format_new_user_message(data)
             elif notification_type == "user_login":
@@ -239,6 +314,36 @@ class TelegramManager:
             logger.error(f"❌ Errore formattazione notifica Lead {notification_type}: {e}")
             return None
     
+    def _summarize_notification(self, notification_type: str, data: Dict[str, Any]) -> str:
+        """Riga che rappresenta l'evento in un messaggio riepilogo"""
+        name = data.get('nome') or f"{data.get('first_name', '')} {data.get('last_name', '')}".strip() or data.get('username')
+        title = data.get('title')
+        if notification_type == 'lead_status_changed':
+            return f"{name}: {data.get('old_status', 'N/A')} → {data.get('new_status', 'N/A')}"
+        if notification_type == 'lead_assigned':
+            return f"{name} → {data.get('assigned_to', 'N/A')}"
+        if notification_type == 'new_lead' and data.get('fonte'):
+            return f"{name} ({data['fonte']})"
+        if notification_type in ('task_due_soon', 'task_overdue'):
+            return f"{title} - {data.get('due_date', 'N/A')}"
+        return title or name or 'N/A'
+    
+    def _format_digest_message(self, notification_type: str, rows: List[Any]) -> str:
+        """Formatta il riepilogo di più eventi dello stesso tipo"""
+        emoji, title = DIGEST_TITLES.get(notification_type, ('📦', notification_type.upper()))
+        max_items = TELEGRAM_CONFIG['digest_max_items']
+        
+        lines = [f"{emoji} *{len(rows)} {title}*", ""]
+        lines.extend(f"• {_escape_markdown(row['summary'] or 'N/A')}" for row in rows[:max_items])
+        if len(rows) > max_items:
+            lines.append(f"… e altri {len(rows) - max_items}")
+        lines.extend([
+            "",
+            f"🔗 [Dettagli nella dashboard]({APP_BASE_URL})",
+            f"⏰ {datetime.now().strftime('%d/%m/%Y %H:%M')}"
+        ])
+        return '\n'.join(lines)
+    
     def _format_new_lead_message(self, data: Dict[str, Any]) -> str:
         """Formatta messaggio per nuovo lead"""
         priority_emoji = {
@@ -373,6 +478,22 @@ class TelegramManager:
 💡 Ricorda di completarlo in tempo!
         """.strip()
     
+    def _format_task_overdue_message(self, data: Dict[str, Any]) -> str:
+        """Formatta messaggio per task scaduto"""
+        days_overdue = data.get('days_overdue', 0)
+        overdue_text = "oggi" if days_overdue < 1 else f"da {days_overdue} giorni"
+        
+        return f"""
+🚨 *TASK SCADUTO*
+
+📋 *{data.get('title', 'N/A')}*
+📅 Scadenza: {data.get('due_date', 'N/A')} ({overdue_text})
+👥 Assegnato a: {', '.join(data.get('assigned_to', []))}
+🔥 Priorità: {data.get('priority', 'N/A')}
+
+⏰ Aggiorna lo stato o la scadenza del task
+        """.strip()
+    
     def _format_new_user_message(self, data: Dict[str, Any]) -> str:
         """Formatta messaggio per nuovo utente"""
         return f"""
@@ -443,6 +564,12 @@ Buona giornata! 🚀
         except Exception as e:
             logger.error(f"❌ Errore logging notifica Lead: {e}")
     
+    def _write_notification_logs(self, logs: List[Dict[str, Any]]):
+        """Inserisce in un'unica chiamata i log prodotti dal worker"""
+        if not self.supabase_manager or not logs:
+            return
+        self.supabase_manager.supabase.table('notification_logs').insert(logs).execute()
+    
     def get_notification_logs(self, limit: int = 50) -> List[Dict]:
         """Recupera i log delle notifiche"""
         try:
@@ -457,6 +584,11 @@ Buona giornata! 🚀
             logger.error(f"❌ Errore recupero log notifiche Lead: {e}")
             return []
     
+    def _command_bot_status(self) -> Dict[str, Any]:
+        from components.telegram.telegram_bot import get_telegram_bot
+        bot = get_telegram_bot()
+        return bot.get_status() if bot else {'running': False}
+    
     def get_status(self) -> Dict[str, Any]:
         """Restituisce lo stato del TelegramManager"""
         return {
@@ -464,6 +596,8 @@ Buona giornata! 🚀
             'bot_token_set': bool(self.bot_token),
             'chat_id_set': bool(self.chat_id),
             'supabase_available': bool(self.supabase_manager),
+            'outbox': self.outbox.counts(),
+            'command_bot': self._command_bot_status(),
             'bot_token': self.bot_token or "",
             'chat_id': self.chat_id or ""
         }
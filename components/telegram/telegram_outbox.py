@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+📱 TELEGRAM OUTBOX - Dashboard Gestione Lead
+Coda persistente (SQLite) delle notifiche Telegram svuotata da un worker in
+background: limiti per chat, retry con backoff, log inseriti a blocchi e
+riepiloghi degli eventi dello stesso tipo
+Creato da Ezio Camporeale
+"""
+
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Callable, Any
+import sys
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(current_dir))
+
+from config import TELEGRAM_CONFIG, TELEGRAM_OUTBOX_PATH
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SendResult:
+    """Esito di un invio: `retry_after` per i limiti Telegram (429), `permanent` per errori non recuperabili"""
+    ok: bool
+    error: Optional[str] = None
+    retry_after: Optional[float] = None
+    permanent: bool = False
+
+
+class TelegramOutbox:
+    """
+    Coda persistente delle notifiche Telegram
+
+    I messaggi sopravvivono ai riavvii; il worker li invia in ordine per chat
+    rispettando il rate limit di ogni chat, ritenta gli errori temporanei con
+    backoff esponenziale (`retry_count`) e scrive i `notification_logs` a blocchi.
+
+    Gli eventi accodati con `digest_window` restano in attesa fino alla fine
+    della finestra aperta dal primo evento dello stesso tipo e partono come un
+    unico messaggio riepilogo composto da `digest_formatter`.
+
+    Args:
+        sender: Funzione (chat_id, testo, parse_mode, disable_preview) -> SendResult
+        log_writer: Funzione che riceve la lista dei log da inserire
+        digest_formatter: Funzione (notification_type, righe in coda) -> testo del riepilogo
+    """
+
+    def __init__(self, db_path: Path = TELEGRAM_OUTBOX_PATH,
+                 sender: Callable[[str, str, str, bool], SendResult] = None,
+                 log_writer: Callable[[List[Dict[str, Any]]], None] = None,
+                 config: Dict[str, Any] = None,
+                 digest_formatter: Callable[[str, List[sqlite3.Row]], str] = None):
+        config = config or TELEGRAM_CONFIG
+        self.db_path = str(db_path)
+        self.sender = sender
+        self.log_writer = log_writer
+        self.digest_formatter = digest_formatter or _default_digest
+        self.chat_rate = config['chat_messages_per_minute'] / 60.0
+        self.chat_burst = config['chat_burst']
+        self.max_retries = config['max_retries']
+        self.retry_base = config['retry_base_seconds']
+        self.retry_max = config['retry_max_seconds']
+        self.poll_interval = config['poll_interval_seconds']
+        self.batch_size = config['batch_size']
+        self.retention_seconds = config['sent_retention_days'] * 86400
+        self.stats = Counter()
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._buckets: Dict[str, List[float]] = {}
+        self._blocked_until: Dict[str, float] = {}
+
+        if self.db_path != ':memory:':
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._init_schema()
+
+    def _init_schema(self):
+        with self._lock:
+            if self.db_path != ':memory:':
+                self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id TEXT NOT NULL,
+                    notification_type TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    parse_mode TEXT,
+                    disable_preview INTEGER NOT NULL DEFAULT 1,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    retry_count INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    sent_at REAL,
+                    digest_key TEXT,
+                    summary TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at);
+            """)
+            # Code create prima dei riepiloghi
+            columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(outbox)")}
+            for column in ('digest_key', 'summary'):
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} TEXT")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_digest ON outbox(chat_id, digest_key, status)")
+            self.conn.commit()
+
+    def configure(self, sender: Callable[[str, str, str, bool], SendResult],
+                  log_writer: Callable[[List[Dict[str, Any]]], None] = None,
+                  digest_formatter: Callable[[str, List[sqlite3.Row]], str] = None):
+        """Imposta la funzione di invio (es. dopo il caricamento della configurazione bot)"""
+        self.sender = sender
+        self.log_writer = log_writer
+        if digest_formatter:
+            self.digest_formatter = digest_formatter
+
+    def enqueue(self, chat_id: str, message: str, notification_type: str = 'message',
+                parse_mode: Optional[str] = 'Markdown', disable_preview: bool = True,
+                digest_window: float = 0, summary: str = None) -> int:
+        """
+        Accoda un messaggio e sveglia il worker; ritorna l'id in coda
+
+        Args:
+            digest_window: Se > 0 il messaggio può essere unito agli altri dello
+                stesso tipo accodati nella stessa finestra (secondi)
+            summary: Riga che rappresenta l'evento nel riepilogo
+        """
+        now = time.time()
+        chat_id = str(chat_id)
+        digest_key = notification_type if digest_window > 0 else None
+        with self._lock:
+            send_at = now
+            if digest_key:
+                # Finestra già aperta da un evento dello stesso tipo: stesso istante di invio
+                row = self.conn.execute(
+                    "SELECT MAX(next_attempt_at) FROM outbox WHERE status = 'pending' AND chat_id = ? "
+                    "AND digest_key = ? AND retry_count = 0", (chat_id, digest_key)
+                ).fetchone()
+                send_at = row[0] if row[0] and row[0] > now else now + digest_window
+            cursor = self.conn.execute(
+                "INSERT INTO outbox (chat_id, notification_type, message, parse_mode, disable_preview, "
+                "next_attempt_at, created_at, digest_key, summary) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (chat_id, notification_type, message, parse_mode, int(disable_preview), send_at, now,
+                 digest_key, summary)
+            )
+            self.conn.commit()
+        self.stats['enqueued'] += 1
+        self._wake.set()
+        return cursor.lastrowid
+
+    def _take_token(self, chat_id: str, now: float) -> bool:
+        """Token bucket per chat (non bloccante)"""
+        if self._blocked_until.get(chat_id, 0) > now:
+            return False
+        tokens, updated = self._buckets.get(chat_id, (float(self.chat_burst), now))
+        tokens = min(self.chat_burst, tokens + (now - updated) * self.chat_rate)
+        if tokens < 1:
+            self._buckets[chat_id] = [tokens, now]
+            return False
+        self._buckets[chat_id] = [tokens - 1, now]
+        return True
+
+    def _backoff(self, retry_count: int) -> float:
+        return min(self.retry_base * (2 ** (retry_count - 1)), self.retry_max)
+
+    @staticmethod
+    def _log_row(notification_type: str, message: str, status: str, error: str = None,
+                 retry_count: int = 0) -> Dict[str, Any]:
+        return {
+            'id': str(uuid.uuid4()),
+            'notification_type': notification_type,
+            'message': message[:1000],
+            'status': status,
+            'error_message': error,
+            'sent_at': datetime.now().isoformat(),
+            'retry_count': retry_count
+        }
+
+    def _due_groups(self) -> List[List[sqlite3.Row]]:
+        """Messaggi scaduti in ordine; gli eventi di un riepilogo formano un unico gruppo"""
+        now = time.time()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (now, self.batch_size)
+            ).fetchall()
+            groups = []
+            seen_digests = set()
+            for row in rows:
+                if not row['digest_key']:
+                    groups.append([row])
+                    continue
+                key = (row['chat_id'], row['digest_key'])
+                if key in seen_digests:
+                    continue
+                seen_digests.add(key)
+                groups.append(self.conn.execute(
+                    "SELECT * FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                    "AND chat_id = ? AND digest_key = ? ORDER BY id", (now, *key)
+                ).fetchall())
+        return groups
+
+    def drain_once(self) -> int:
+        """
+        Invia i messaggi scaduti (al massimo `batch_size`, più gli eventi dei loro riepiloghi)
+
+        Returns:
+            Numero di tentativi di invio effettuati
+        """
+        if not self.sender:
+            return 0
+
+        attempts = 0
+        logs = []
+        waiting_chats = set()
+        for group in self._due_groups():
+            first = group[0]
+            chat_id = first['chat_id']
+            ids = [row['id'] for row in group]
+            # L'ordine dei messaggi di una chat è preservato: se una chat è in attesa lo sono tutti i suoi messaggi
+            if chat_id in waiting_chats or not self._take_token(chat_id, time.monotonic()):
+                waiting_chats.add(chat_id)
+                continue
+
+            if len(group) > 1:
+                notification_type = f"{first['notification_type']}_digest"
+                message = self.digest_formatter(first['notification_type'], group)
+            else:
+                notification_type = first['notification_type']
+                message = first['message']
+
+            attempts += 1
+            try:
+                result = self.sender(chat_id, message, first['parse_mode'], bool(first['disable_preview']))
+            except Exception as e:
+                result = SendResult(False, str(e))
+
+            now = time.time()
+            if result.ok:
+                self._update(ids, status='sent', sent_at=now, last_error=None)
+                logs.append(self._log_row(notification_type, message, 'sent', retry_count=first['retry_count']))
+                self.stats['sent'] += 1
+                self.stats['coalesced'] += len(group) - 1
+                continue
+
+            if result.retry_after:
+                # Limite Telegram superato: attesa indicata dall'API, non conta come tentativo fallito
+                self._blocked_until[chat_id] = time.monotonic() + result.retry_after
+                waiting_chats.add(chat_id)
+                self._update(ids, next_attempt_at=now + result.retry_after, last_error=result.error)
+                self.stats['rate_limited'] += 1
+                logger.warning(f"⏳ Limite Telegram per chat {chat_id}: attesa {result.retry_after}s")
+                continue
+
+            retry_count = first['retry_count'] + 1
+            if result.permanent or retry_count > self.max_retries:
+                self._update(ids, status='failed', retry_count=retry_count, last_error=result.error)
+                logs.append(self._log_row(notification_type, message, 'failed', result.error, retry_count))
+                self.stats['failed'] += 1
+                logger.error(f"❌ Notifica Telegram {first['id']} scartata: {result.error}")
+            else:
+                self._update(ids, retry_count=retry_count, last_error=result.error,
+                             next_attempt_at=now + self._backoff(retry_count))
+                self.stats['retried'] += 1
+                logger.warning(f"🔄 Notifica Telegram {first['id']} ritentata ({retry_count}/{self.max_retries}): {result.error}")
+
+        if logs and self.log_writer:
+            try:
+                self.log_writer(logs)
+            except Exception as e:
+                logger.error(f"❌ Errore scrittura log notifiche: {e}")
+        return attempts
+
+    def _update(self, outbox_ids: List[int], **fields):
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        placeholders = ', '.join('?' * len(outbox_ids))
+        with self._lock:
+            self.conn.execute(f"UPDATE outbox SET {assignments} WHERE id IN ({placeholders})",
+                              (*fields.values(), *outbox_ids))
+            self.conn.commit()
+
+    def purge(self) -> int:
+        """Rimuove i messaggi inviati più vecchi della retention"""
+        with self._lock:
+            cursor = self.conn.execute("DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?",
+                                       (time.time() - self.retention_seconds,))
+            self.conn.commit()
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Messaggi in coda per stato"""
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        counts = {'pending': 0, 'sent': 0, 'failed': 0}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def _run(self):
+        last_purge = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() - last_purge > 3600:
+                    self.purge()
+                    last_purge = time.monotonic()
+                attempts = self.drain_once()
+            except Exception as e:
+                logger.error(f"❌ Errore worker notifiche Telegram: {e}")
+                attempts = 0
+            if not attempts:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def start(self):
+        """Avvia il worker in background (una sola volta per processo)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='telegram-outbox', daemon=True)
+            self._thread.start()
+        logger.info("📤 Worker notifiche Telegram avviato")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+def _default_digest(notification_type: str, rows: List[sqlite3.Row]) -> str:
+    """Riepilogo generico: numero di eventi e relative righe"""
+    lines = [f"📦 {len(rows)} notifiche {notification_type}"]
+    lines.extend(f"• {row['summary']}" for row in rows if row['summary'])
+    return '\n'.join(lines)
+
+
+_outbox: Optional[TelegramOutbox] = None
+_outbox_lock = threading.Lock()
+
+
+def get_telegram_outbox() -> TelegramOutbox:
+    """Coda notifiche condivisa da tutte le istanze TelegramManager del processo"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = TelegramOutbox()
+        return _outbox
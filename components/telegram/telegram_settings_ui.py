@@ -74,6 +74,11 @@ class TelegramSettingsUI:
             if status['is_configured']:
                 st.success("✅ Bot configurato e operativo")
                 st.info(f"🔗 Chat ID: `{status['chat_id']}`")
+                outbox = status['outbox']
+                st.caption(f"📤 Coda notifiche: {outbox['pending']} in attesa - {outbox['sent']} inviate - {outbox['failed']} fallite")
+                bot = status['command_bot']
+                if bot['running']:
+                    st.caption(f"🤖 Comandi bot attivi (/stats, /today, /overdue, /lead) - {bot.get('commands', 0)} gestiti")
             else:
                 st.warning("⚠️ Bot non configurato")
         
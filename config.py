@@ -95,13 +95,23 @@ ITEMS_PER_PAGE = 20
 BACKUP_DIR = BASE_DIR / "backups"
 BACKUP_RETENTION_DAYS = 30
 
+# Backup Supabase (database/backup_supabase.py): pagine per chiave, tabelle in parallelo
+BACKUP_CONFIG = {
+    'page_size': 1000,  # Limite di righe per richiesta dell'API Supabase
+    'workers': 4,
+    'queue_pages': 8,  # Pagine in attesa di scrittura: limita la memoria usata
+    'commit_rows': 50000,  # Righe per transazione SQLite
+    'key_column': 'id'
+}
+
 # Configurazione logging
 LOG_LEVEL = "INFO"
 LOG_FILE = BASE_DIR / "logs" / "app.log"
 
 # Configurazione Assistente AI DeepSeek
 DEEPSEEK_API_KEY = "sk-f7531fb25e8a4ba3ae22d8b33c7d97a1"
-DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
+# Sovrascrivibile per puntare a un server locale (es. mock_deepseek_server.py)
+DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
 DEEPSEEK_MODEL = "deepseek-chat"
 
 # Configurazione AI Assistant
@@ -111,9 +121,38 @@ AI_ASSISTANT_CONFIG = {
     'timeout': 60,
     'retry_attempts': 3,
     'cache_responses': True,
-    'cache_duration_hours': 24
+    'cache_duration_hours': 24,
+    'cache_max_entries': 2000,
+    'cache_max_size_mb': 50,
+    'max_concurrent_requests': 8,
+    'rate_limit_per_second': 5,
+    'rate_limit_burst': 10,
+    'batch_deadline_seconds': 120,
+    'stream_responses': True,
+    'context_contacts_limit': 10,
+    'context_activities_limit': 5,
+    'analytics_refresh_seconds': 300,
+    'analytics_max_days': 365,
+    # Cronologia conversazioni per sessione: elementi, caratteri per testo e budget di memoria
+    'history_max_entries': 50,
+    'history_max_chars': 4000,
+    'session_memory_budget_kb': 512,
+    # Contesto del modello (prompt + risposta) e budget di token del prompt per funzionalità
+    'context_window_tokens': 64000,
+    'prompt_token_budgets': {
+        'lead_analysis': 2500,
+        'sales_script': 1500,
+        'marketing_advice': 2500,
+        'default': 3000
+    }
 }
 
+# Cache persistente risposte AI (condivisa tra sessioni e processi)
+AI_CACHE_PATH = DATA_DIR / "ai_cache.db"
+
+# Rollup giornalieri per le analytics del Marketing Advisor
+AI_ANALYTICS_PATH = DATA_DIR / "ai_analytics.db"
+
 # Prompt templates per AI Assistant
 AI_PROMPTS = {
     'sales_script': """
@@ -149,6 +188,86 @@ AI_PROMPTS = {
     """
 }
 
+# Notifiche Telegram: coda persistente inviata da un worker in background
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_OUTBOX_PATH = DATA_DIR / "telegram_outbox.db"
+TELEGRAM_CONFIG = {
+    'timeout': 10,
+    # Limiti Telegram: ~1 messaggio/secondo per chat, 20 messaggi/minuto per i gruppi
+    'chat_messages_per_minute': 20,
+    'chat_burst': 3,
+    'max_retries': 5,
+    'retry_base_seconds': 2,
+    'retry_max_seconds': 300,
+    'poll_interval_seconds': 1.0,
+    'batch_size': 20,
+    'sent_retention_days': 7,
+    # Eventi dello stesso tipo nella finestra vengono uniti in un unico messaggio riepilogo
+    'digest_window_seconds': 30,
+    'digest_types': ['new_lead', 'new_task', 'lead_assigned', 'lead_status_changed',
+                     'task_completed', 'task_in_progress', 'user_login',
+                     'task_due_soon', 'task_overdue'],
+    'digest_max_items': 10
+}
+
+# Comandi del bot Telegram (/stats, /overdue, /lead, /today) via long polling
+TELEGRAM_BOT_CONFIG = {
+    'enabled': os.getenv("TELEGRAM_BOT_COMMANDS", "true").lower() == "true",
+    'long_poll_seconds': 25,
+    'error_backoff_seconds': 5,
+    'stats_days': 30,
+    'list_limit': 10
+}
+
+# Link ai dettagli nei messaggi riepilogo
+APP_BASE_URL = os.getenv("APP_BASE_URL", "http://localhost:8501")
+
+# Scheduler scadenze task: avvisi "in scadenza"/"scaduto" e report giornaliero
+TASK_SCHEDULER_PATH = DATA_DIR / "task_scheduler.db"
+TASK_SCHEDULER_CONFIG = {
+    'due_soon_hours': 24,
+    # Stati chiusi: Completato, Annullato
+    'closed_state_ids': [3, 4],
+    'daily_report_time': '08:30',
+    'max_sleep_seconds': 60
+}
+
+# Storage file: upload in streaming con hash calcolato durante la scrittura
+STORAGE_DOWNLOAD_PORT = int(os.getenv("STORAGE_DOWNLOAD_PORT", "8502"))
+STORAGE_DOWNLOAD_URL = os.getenv("STORAGE_DOWNLOAD_URL")
+STORAGE_CONFIG = {
+    'chunk_size': 1024 * 1024,
+    # Endpoint per i download (streaming e richieste Range): solo su richiesta,
+    # perché su Streamlit Cloud la porta locale non è raggiungibile dal browser.
+    # Attivo se STORAGE_DOWNLOAD_URL è impostato o con STORAGE_DOWNLOAD_SERVER=true
+    # (sviluppo locale); altrimenti si usa st.download_button
+    'download_server_enabled': os.getenv(
+        "STORAGE_DOWNLOAD_SERVER", "true" if STORAGE_DOWNLOAD_URL else "false"
+    ).lower() == "true",
+    'download_host': os.getenv("STORAGE_DOWNLOAD_HOST", "127.0.0.1"),
+    'download_port': STORAGE_DOWNLOAD_PORT,
+    'download_base_url': STORAGE_DOWNLOAD_URL or f"http://localhost:{STORAGE_DOWNLOAD_PORT}",
+    'download_link_ttl_seconds': 3600,
+    # Contatori download scritti a blocchi
+    'download_flush_seconds': 10,
+    'download_flush_batch': 100,
+    # Compressione gzip dei file comprimibili (testo, CSV, script...) salvata solo se conviene
+    'compression_enabled': os.getenv("STORAGE_COMPRESSION", "true").lower() == "true",
+    'compression_level': 6,
+    'compression_min_saving': 0.1,
+    # Verifica integrità (utils/storage_maintenance.py): hash ricalcolati per esecuzione
+    'verify_batch_size': 200,
+    'verify_workers': 4,
+    'orphan_grace_seconds': 3600,
+    # File per pagina nella lista dello storage
+    'page_size': 50,
+    # Anteprime (immagini e prima pagina PDF) in storage/previews
+    'preview_on_upload': True,
+    'preview_size': 160,
+    'preview_quality': 70,
+    'preview_max_cache_bytes': 100 * 1024 * 1024
+}
+
 # Creazione directory necessarie
 def create_directories():
     """Crea le directory necessarie per il funzionamento dell'app"""
@@ -7,17 +7,21 @@ Creato da Ezio Camporeale
 
 import os
 import json
+import queue
 import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 import sys
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any
 
 # Aggiungi il percorso della directory corrente al path di Python
 current_dir = Path(__file__).parent.parent
 sys.path.append(str(current_dir))
 
-from config import SUPABASE_URL, SUPABASE_KEY
+from config import SUPABASE_URL, SUPABASE_KEY, BACKUP_CONFIG
 
 try:
     from supabase import create_client, Client
@@ -26,22 +30,142 @@ except ImportError:
     SUPABASE_AVAILABLE = False
     print("❌ Libreria supabase non installata. Installa con: pip install supabase")
 
+# Codici errore Postgres/PostgREST per colonna inesistente (tabella senza colonna chiave)
+MISSING_COLUMN_CODES = ('42703', 'PGRST204')
+
+
+class BackupCancelled(Exception):
+    """Backup interrotto da un errore di scrittura"""
+
+
+class BackupWriter:
+    """
+    Scrive le pagine di righe nei file di backup man mano che arrivano
+    
+    Ogni pagina viene inserita nel backup SQLite con executemany (commit ogni
+    `commit_rows` righe) e aggiunta ai file JSONL e SQL: nessuna tabella
+    viene tenuta in memoria per intero.
+    """
+    
+    def __init__(self, backup_dir: Path, backup_name: str, commit_rows: int = BACKUP_CONFIG['commit_rows']):
+        self.paths = {
+            'sqlite': backup_dir / f"{backup_name}.db",
+            'jsonl': backup_dir / f"{backup_name}.jsonl",
+            'sql': backup_dir / f"{backup_name}.sql"
+        }
+        self.commit_rows = commit_rows
+        self.counts = Counter()
+        self.columns: Dict[str, List[str]] = {}
+        self._uncommitted = 0
+        
+        self.conn = sqlite3.connect(self.paths['sqlite'])
+        # File nuovo, scartato se il backup fallisce: niente journal su disco
+        self.conn.execute("PRAGMA journal_mode = MEMORY")
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.jsonl = open(self.paths['jsonl'], 'w', encoding='utf-8')
+        self.sql = open(self.paths['sql'], 'w', encoding='utf-8')
+        self.sql.write(f"-- Backup Supabase DASH_GESTIONE_LEAD\n")
+        self.sql.write(f"-- Data: {datetime.now().isoformat()}\n")
+        self.sql.write(f"-- URL: {SUPABASE_URL}\n\n")
+    
+    @staticmethod
+    def _quote(identifier: str) -> str:
+        return '"' + identifier.replace('"', '""') + '"'
+    
+    @staticmethod
+    def _sqlite_value(value: Any) -> Any:
+        if value is None or isinstance(value, (int, float, str)):
+            return value
+        return json.dumps(value, ensure_ascii=False, default=str)
+    
+    @staticmethod
+    def _sql_literal(value: Any) -> str:
+        if value is None:
+            return 'NULL'
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, ensure_ascii=False, default=str)
+        return f"'{str(value).replace(chr(39), chr(39) + chr(39))}'"
+    
+    def _ensure_columns(self, table_name: str, rows: List[Dict]) -> List[str]:
+        """Crea la tabella SQLite alla prima pagina e aggiunge colonne nuove"""
+        seen = self.columns.get(table_name)
+        new_columns = []
+        known = set(seen or [])
+        for row in rows:
+            for column in row:
+                if column not in known:
+                    known.add(column)
+                    new_columns.append(column)
+        
+        if seen is None:
+            self.columns[table_name] = new_columns
+            definitions = ', '.join(f"{self._quote(column)} TEXT" for column in new_columns)
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {self._quote(table_name)} ({definitions})")
+        else:
+            for column in new_columns:
+                self.conn.execute(f"ALTER TABLE {self._quote(table_name)} ADD COLUMN {self._quote(column)} TEXT")
+            seen.extend(new_columns)
+        return self.columns[table_name]
+    
+    def write_page(self, table_name: str, rows: List[Dict]):
+        """Aggiunge una pagina di righe di `table_name` a tutti i formati"""
+        if not rows:
+            return
+        columns = self._ensure_columns(table_name, rows)
+        
+        # SQLite: un solo executemany per pagina
+        placeholders = ', '.join('?' for _ in columns)
+        insert_sql = f"INSERT INTO {self._quote(table_name)} ({', '.join(map(self._quote, columns))}) VALUES ({placeholders})"
+        self.conn.executemany(insert_sql, ([self._sqlite_value(row.get(column)) for column in columns] for row in rows))
+        self._uncommitted += len(rows)
+        if self._uncommitted >= self.commit_rows:
+            self.conn.commit()
+            self._uncommitted = 0
+        
+        # JSONL: una riga per record
+        self.jsonl.writelines(
+            json.dumps({'table': table_name, 'row': row}, ensure_ascii=False, default=str) + '\n' for row in rows
+        )
+        
+        # SQL: INSERT per record
+        if not self.counts[table_name]:
+            self.sql.write(f"-- Tabella: {table_name}\n\n")
+        self.sql.writelines(
+            f"INSERT INTO {table_name} ({', '.join(row.keys())}) "
+            f"VALUES ({', '.join(self._sql_literal(value) for value in row.values())});\n"
+            for row in rows
+        )
+        
+        self.counts[table_name] += len(rows)
+    
+    def close(self) -> Dict[str, str]:
+        """Chiude i file e restituisce i percorsi per formato"""
+        self.conn.commit()
+        self.conn.close()
+        self.jsonl.close()
+        self.sql.close()
+        return {format_type: str(path) for format_type, path in self.paths.items()}
+
+
 class SupabaseBackup:
     """Gestisce il backup completo del database Supabase"""
     
-    def __init__(self):
+    def __init__(self, supabase=None, backup_dir: Path = None, config: Dict = BACKUP_CONFIG):
         """Inizializza il backup manager"""
-        if not SUPABASE_AVAILABLE:
-            raise ImportError("Libreria supabase non disponibile")
+        if supabase is None:
+            if not SUPABASE_AVAILABLE:
+                raise ImportError("Libreria supabase non disponibile")
+            supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
         
-        self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        self.backup_dir = Path(__file__).parent / "backups"
+        self.supabase: Client = supabase
+        self.config = config
+        self.backup_dir = Path(backup_dir) if backup_dir else Path(__file__).parent / "backups"
         self.backup_dir.mkdir(exist_ok=True)
         
         # Timestamp per il backup
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.backup_name = f"supabase_backup_{self.timestamp}"
-        
+    
     def get_all_tables(self) -> List[str]:
         """Ottiene la lista di tutte le tabelle nel database"""
         try:
@@ -71,126 +195,54 @@ class SupabaseBackup:
                 'activity_log', 'settings'
             ]
     
-    def backup_table_data(self, table_name: str) -> List[Dict]:
-        """Backup dei dati di una singola tabella"""
-        try:
-            print(f"📥 Scaricando dati tabella: {table_name}")
-            
-            # Ottieni tutti i dati dalla tabella
-            result = self.supabase.table(table_name).select("*").execute()
-            
-            if result.data:
-                print(f"✅ {table_name}: {len(result.data)} record scaricati")
-                return result.data
-            else:
-                print(f"ℹ️ {table_name}: tabella vuota")
-                return []
-                
-        except Exception as e:
-            print(f"❌ Errore backup tabella {table_name}: {e}")
-            return []
-    
-    def create_sqlite_backup(self, all_data: Dict[str, List[Dict]]) -> str:
-        """Crea un backup SQLite con tutti i dati"""
-        backup_path = self.backup_dir / f"{self.backup_name}.db"
-        
-        try:
-            conn = sqlite3.connect(backup_path)
-            cursor = conn.cursor()
-            
-            # Crea le tabelle e inserisci i dati
-            for table_name, data in all_data.items():
-                if not data:
-                    continue
-                    
-                # Crea la tabella basandosi sui dati
-                if data:
-                    columns = list(data[0].keys())
-                    create_sql = f"""
-                    CREATE TABLE IF NOT EXISTS {table_name} (
-                        {', '.join([f"{col} TEXT" for col in columns])}
-                    );
-                    """
-                    cursor.execute(create_sql)
-                    
-                    # Inserisci i dati
-                    for row in data:
-                        placeholders = ', '.join(['?' for _ in columns])
-                        values = [str(row.get(col, '')) for col in columns]
-                        insert_sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
-                        cursor.execute(insert_sql, values)
-            
-            conn.commit()
-            conn.close()
-            
-            print(f"✅ Backup SQLite creato: {backup_path}")
-            return str(backup_path)
-            
-        except Exception as e:
-            print(f"❌ Errore creazione backup SQLite: {e}")
-            return ""
-    
-    def create_json_backup(self, all_data: Dict[str, List[Dict]]) -> str:
-        """Crea un backup JSON con tutti i dati"""
-        backup_path = self.backup_dir / f"{self.backup_name}.json"
+    def iter_table_pages(self, table_name: str) -> Iterator[List[Dict]]:
+        """
+        Scarica una tabella a pagine ordinate per chiave (id > ultimo id)
         
-        try:
-            # Aggiungi metadati al backup
-            backup_info = {
-                'backup_timestamp': self.timestamp,
-                'backup_date': datetime.now().isoformat(),
-                'supabase_url': SUPABASE_URL,
-                'tables_count': len(all_data),
-                'total_records': sum(len(data) for data in all_data.values()),
-                'data': all_data
-            }
-            
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                json.dump(backup_info, f, indent=2, ensure_ascii=False)
-            
-            print(f"✅ Backup JSON creato: {backup_path}")
-            return str(backup_path)
-            
-        except Exception as e:
-            print(f"❌ Errore creazione backup JSON: {e}")
-            return ""
+        L'API Supabase restituisce al massimo un numero limitato di righe
+        per richiesta: si procede finché una pagina torna vuota, quindi il
+        backup è completo anche se il limite del server è inferiore a
+        `page_size`. Le tabelle senza colonna chiave vengono lette a
+        intervalli (range).
+        """
+        page_size = self.config['page_size']
+        key = self.config['key_column']
+        last_key = None
+        while True:
+            query = self.supabase.table(table_name).select("*").order(key).limit(page_size)
+            if last_key is not None:
+                query = query.gt(key, last_key)
+            try:
+                rows = query.execute().data or []
+            except Exception as e:
+                if last_key is None and getattr(e, 'code', None) in MISSING_COLUMN_CODES:
+                    # Colonna chiave assente: pagine per intervallo
+                    yield from self._iter_range_pages(table_name)
+                    return
+                raise
+            if not rows:
+                return
+            yield rows
+            last_key = rows[-1][key]
     
-    def create_sql_backup(self, all_data: Dict[str, List[Dict]]) -> str:
-        """Crea un backup SQL con tutti i dati"""
-        backup_path = self.backup_dir / f"{self.backup_name}.sql"
-        
-        try:
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                f.write(f"-- Backup Supabase DASH_GESTIONE_LEAD\n")
-                f.write(f"-- Data: {datetime.now().isoformat()}\n")
-                f.write(f"-- URL: {SUPABASE_URL}\n\n")
-                
-                for table_name, data in all_data.items():
-                    if not data:
-                        continue
-                    
-                    f.write(f"-- Tabella: {table_name}\n")
-                    f.write(f"-- Record: {len(data)}\n\n")
-                    
-                    # Crea INSERT statements
-                    for row in data:
-                        columns = list(row.keys())
-                        values = [f"'{str(row[col]).replace(chr(39), chr(39)+chr(39))}'" for col in columns]
-                        
-                        insert_sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join(values)});\n"
-                        f.write(insert_sql)
-                    
-                    f.write("\n")
-            
-            print(f"✅ Backup SQL creato: {backup_path}")
-            return str(backup_path)
-            
-        except Exception as e:
-            print(f"❌ Errore creazione backup SQL: {e}")
-            return ""
+    def _iter_range_pages(self, table_name: str) -> Iterator[List[Dict]]:
+        page_size = self.config['page_size']
+        offset = 0
+        while True:
+            rows = self.supabase.table(table_name).select("*").range(offset, offset + page_size - 1).execute().data or []
+            if not rows:
+                return
+            yield rows
+            offset += len(rows)
     
     def run_full_backup(self) -> Dict[str, str]:
-        """Esegue il backup completo del database"""
+        """
+        Esegue il backup completo del database
+        
+        Più tabelle vengono scaricate in parallelo (`workers`) e le pagine
+        passano allo scrittore attraverso una coda limitata (`queue_pages`):
+        la memoria usata non dipende dalla dimensione delle tabelle.
+        """
         print("🚀 Inizio backup completo database Supabase...")
         print(f"📅 Timestamp: {self.timestamp}")
         print(f"📁 Directory backup: {self.backup_dir}")
@@ -199,41 +251,89 @@ class SupabaseBackup:
         # Ottieni tutte le tabelle
         tables = self.get_all_tables()
         
-        # Backup di tutte le tabelle
-        all_data = {}
-        for table in tables:
-            all_data[table] = self.backup_table_data(table)
+        writer = BackupWriter(self.backup_dir, self.backup_name, self.config['commit_rows'])
+        pages: queue.Queue = queue.Queue(maxsize=self.config['queue_pages'])
+        cancelled = threading.Event()
+        errors: Dict[str, str] = {}
+        
+        def put(item):
+            while not cancelled.is_set():
+                try:
+                    pages.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+            raise BackupCancelled()
+        
+        def download(table_name: str):
+            try:
+                print(f"📥 Scaricando dati tabella: {table_name}")
+                for rows in self.iter_table_pages(table_name):
+                    put((table_name, rows))
+                put((table_name, None))
+            except BackupCancelled:
+                pass
+            except Exception as e:
+                if not cancelled.is_set():
+                    put((table_name, e))
+        
+        try:
+            with ThreadPoolExecutor(max_workers=self.config['workers'], thread_name_prefix='backup') as executor:
+                for table_name in tables:
+                    executor.submit(download, table_name)
+                
+                try:
+                    finished = 0
+                    while finished < len(tables):
+                        table_name, item = pages.get()
+                        if item is None:
+                            finished += 1
+                            records = writer.counts[table_name]
+                            print(f"✅ {table_name}: {records} record scaricati" if records else f"ℹ️ {table_name}: tabella vuota")
+                        elif isinstance(item, Exception):
+                            finished += 1
+                            errors[table_name] = str(item)
+                            print(f"❌ Errore backup tabella {table_name}: {item}")
+                        else:
+                            writer.write_page(table_name, item)
+                except BaseException:
+                    # Sblocca i download in attesa sulla coda
+                    cancelled.set()
+                    raise
+        finally:
+            backup_files = writer.close()
         
         print("-" * 50)
         print("📊 Riepilogo backup:")
-        total_records = 0
-        for table, data in all_data.items():
-            records = len(data)
-            total_records += records
-            print(f"  {table}: {records} record")
+        for table_name in tables:
+            status = f" ❌ {errors[table_name]}" if table_name in errors else ""
+            print(f"  {table_name}: {writer.counts[table_name]} record{status}")
         
+        total_records = sum(writer.counts.values())
         print(f"📈 Totale record: {total_records}")
         print("-" * 50)
         
-        # Crea i diversi formati di backup
-        backup_files = {}
-        
-        # Backup JSON
-        json_file = self.create_json_backup(all_data)
-        if json_file:
-            backup_files['json'] = json_file
-        
-        # Backup SQL
-        sql_file = self.create_sql_backup(all_data)
-        if sql_file:
-            backup_files['sql'] = sql_file
+        # Metadati del backup
+        manifest_path = self.backup_dir / f"{self.backup_name}.json"
+        manifest = {
+            'backup_timestamp': self.timestamp,
+            'backup_date': datetime.now().isoformat(),
+            'supabase_url': SUPABASE_URL,
+            'tables_count': len(tables),
+            'total_records': total_records,
+            'records': {table_name: writer.counts[table_name] for table_name in tables},
+            'errors': errors,
+            'complete': not errors,
+            'files': backup_files
+        }
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        backup_files['manifest'] = str(manifest_path)
         
-        # Backup SQLite
-        sqlite_file = self.create_sqlite_backup(all_data)
-        if sqlite_file:
-            backup_files['sqlite'] = sqlite_file
-        
-        print("✅ Backup completato con successo!")
+        if errors:
+            print(f"⚠️ Backup incompleto: {len(errors)} tabelle con errori")
+        else:
+            print("✅ Backup completato con successo!")
         return backup_files
 
 def main():
@@ -247,8 +347,9 @@ def main():
         for format_type, file_path in backup_files.items():
             print(f"  {format_type.upper()}: {file_path}")
         
-        return True
-        
+        with open(backup_files['manifest'], encoding='utf-8') as f:
+            return json.load(f)['complete']
+    
     except Exception as e:
         print(f"❌ Errore durante il backup: {e}")
         return False
@@ -10,7 +10,7 @@ import json
 import logging
 from pathlib import Path
 from typing import List, Dict, Optional, Any
-from datetime import datetime
+from datetime import datetime, date, timedelta, timezone
 import sys
 
 # Aggiungi il percorso della directory corrente al path di Python
@@ -18,11 +18,19 @@ current_dir = Path(__file__).parent.parent
 sys.path.append(str(current_dir))
 
 from config import DATABASE_PATH, USE_SUPABASE, SUPABASE_URL, SUPABASE_KEY
+from utils.lead_contact_index import notify_lead_saved, notify_lead_deleted
+from utils.task_due_scheduler import notify_task_saved, notify_task_deleted
 
 # Configurazione logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tabelle dei rollup analytics e colonna di modifica (lead_contacts in SQLite non ha updated_at)
+ANALYTICS_UPDATED_COLUMNS = {'leads': 'updated_at', 'tasks': 'updated_at', 'lead_contacts': 'created_at'}
+
+# Codici errore Postgres/PostgREST per tabella inesistente
+MISSING_TABLE_CODES = ('42P01', 'PGRST205')
+
 class DatabaseManager:
     """Gestore database per l'applicazione"""
     
@@ -208,12 +216,19 @@ class DatabaseManager:
                         query = query.eq('assigned_to', filters['assigned_to'])
                     if filters.get('group_id'):
                         query = query.eq('group_id', filters['group_id'])
+                    if filters.get('quality_category'):
+                        query = query.eq('quality_category', filters['quality_category'])
                     if filters.get('search'):
                         search_term = filters['search']
                         # Ricerca in più campi
                         query = query.or_(f"name.ilike.%{search_term}%,email.ilike.%{search_term}%,company.ilike.%{search_term}%")
                 
-                # Ordina e limita
+                # Ordina e limita (score qualità decrescente, lead non valutati in fondo)
+                if filters and filters.get('order_by') == 'quality_score':
+                    query = query.order('quality_score', desc=True, nullsfirst=False).order('id')
+                else:
+                    query = query.order('created_at', desc=True)
+                
                 # Se limit è molto alto (es. 10000), ottieni il conteggio reale
                 if limit >= 10000:
                     # Crea una nuova query per il conteggio (non modificare la query originale)
@@ -229,6 +244,8 @@ class DatabaseManager:
                             count_query = count_query.eq('assigned_to', filters['assigned_to'])
                         if filters.get('group_id'):
                             count_query = count_query.eq('group_id', filters['group_id'])
+                        if filters.get('quality_category'):
+                            count_query = count_query.eq('quality_category', filters['quality_category'])
                         if filters.get('search'):
                             search_term = filters['search']
                             count_query = count_query.or_(f"name.ilike.%{search_term}%,email.ilike.%{search_term}%,company.ilike.%{search_term}%")
@@ -241,14 +258,14 @@ class DatabaseManager:
                         page_size = 1000
                         for page_offset in range(offset, min(offset + limit, total), page_size):
                             end = min(page_offset + page_size - 1, total - 1)
-                            page_result = query.order('created_at', desc=True).range(page_offset, end).execute()
+                            page_result = query.range(page_offset, end).execute()
                             all_leads.extend(page_result.data)
                         leads = all_leads
                     else:
-                        result = query.order('created_at', desc=True).limit(limit).execute()
+                        result = query.limit(limit).execute()
                         leads = result.data
                 else:
-                    result = query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
+                    result = query.range(offset, offset + limit - 1).execute()
                     leads = result.data
                 
                 # Ottieni tutti i dati di lookup in una volta sola
@@ -532,6 +549,8 @@ class DatabaseManager:
                 }
                 
                 result = self.supabase.table('leads').insert(supabase_data).execute()
+                if result.data:
+                    notify_lead_saved(result.data[0])
                 return len(result.data) > 0
             except Exception as e:
                 logger.error(f"❌ Errore create_lead Supabase: {e}")
@@ -552,6 +571,9 @@ class DatabaseManager:
                 lead_data['budget'], lead_data['expected_close_date'], lead_data['created_by']
             )
             rows_affected = self.execute_update(query, params)
+            if rows_affected > 0:
+                lead_id = self.conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                notify_lead_saved({**lead_data, 'id': lead_id})
             return rows_affected > 0
     
     def update_lead(self, lead_id: int, lead_data: Dict) -> bool:
@@ -598,6 +620,8 @@ class DatabaseManager:
                     supabase_data['created_by'] = lead_data['created_by']
                 
                 result = self.supabase.table('leads').update(supabase_data).eq('id', lead_id).execute()
+                if result.data:
+                    notify_lead_saved(result.data[0])
                 return len(result.data) > 0
             except Exception as e:
                 logger.error(f"❌ Errore update_lead Supabase: {e}")
@@ -619,6 +643,8 @@ class DatabaseManager:
                 lead_data['budget'], lead_data['expected_close_date'], lead_id
             )
             rows_affected = self.execute_update(query, params)
+            if rows_affected > 0:
+                notify_lead_saved({**lead_data, 'id': lead_id})
             return rows_affected > 0
     
     def delete_lead(self, lead_id: int) -> bool:
@@ -626,6 +652,8 @@ class DatabaseManager:
         if self.use_supabase:
             try:
                 result = self.supabase.table('leads').delete().eq('id', lead_id).execute()
+                if result.data:
+                    notify_lead_deleted(lead_id)
                 return len(result.data) > 0
             except Exception as e:
                 logger.error(f"❌ Errore delete_lead Supabase: {e}")
@@ -633,6 +661,8 @@ class DatabaseManager:
         else:
             query = "DELETE FROM leads WHERE id = ?"
             rows_affected = self.execute_update(query, (lead_id,))
+            if rows_affected > 0:
+                notify_lead_deleted(lead_id)
             return rows_affected > 0
     
     # ==================== METODI TASK ====================
@@ -910,6 +940,8 @@ class DatabaseManager:
         if self.use_supabase:
             try:
                 result = self.supabase.table('tasks').insert(task_data).execute()
+                if result.data:
+                    notify_task_saved(result.data[0])
                 return len(result.data) > 0
             except Exception as e:
                 logger.error(f"❌ Errore create_task Supabase: {e}")
@@ -928,6 +960,9 @@ class DatabaseManager:
                 task_data['created_by']
             )
             rows_affected = self.execute_update(query, params)
+            if rows_affected > 0:
+                task_id = self.conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                notify_task_saved({**task_data, 'id': task_id})
             return rows_affected > 0
     
     def update_task(self, task_id: int, task_data: Dict) -> bool:
@@ -935,6 +970,8 @@ class DatabaseManager:
         if self.use_supabase:
             try:
                 result = self.supabase.table('tasks').update(task_data).eq('id', task_id).execute()
+                if result.data:
+                    notify_task_saved(result.data[0])
                 return len(result.data) > 0
             except Exception as e:
                 logger.error(f"❌ Errore update_task Supabase: {e}")
@@ -953,6 +990,8 @@ class DatabaseManager:
                 task_data['lead_id'], task_data['due_date'], task_data['notes'], task_id
             )
             rows_affected = self.execute_update(query, params)
+            if rows_affected > 0:
+                notify_task_saved({**task_data, 'id': task_id})
             return rows_affected > 0
     
     def get_task_by_id(self, task_id: int) -> Optional[Dict]:
@@ -974,6 +1013,8 @@ class DatabaseManager:
         if self.use_supabase:
             try:
                 result = self.supabase.table('tasks').delete().eq('id', task_id).execute()
+                if result.data:
+                    notify_task_deleted(task_id)
                 return len(result.data) > 0
             except Exception as e:
                 logger.error(f"❌ Errore delete_task Supabase: {e}")
@@ -981,6 +1022,8 @@ class DatabaseManager:
         else:
             query = "DELETE FROM tasks WHERE id = ?"
             rows_affected = self.execute_update(query, (task_id,))
+            if rows_affected > 0:
+                notify_task_deleted(task_id)
             return rows_affected > 0
     
     def update_task_state(self, task_id: int, new_state_id: int) -> bool:
@@ -991,6 +1034,8 @@ class DatabaseManager:
                     'state_id': new_state_id,
                     'updated_at': datetime.now().isoformat()
                 }).eq('id', task_id).execute()
+                if result.data:
+                    notify_task_saved(result.data[0])
                 return len(result.data) > 0
             except Exception as e:
                 logger.error(f"❌ Errore update_task_state Supabase: {e}")
@@ -1001,7 +1046,10 @@ class DatabaseManager:
                     state_id = ?, updated_at = DATETIME('now')
                 WHERE id = ?
             """
-            return self.execute_update(query, (new_state_id, task_id)) > 0
+            if self.execute_update(query, (new_state_id, task_id)) > 0:
+                notify_task_saved({'id': task_id, 'state_id': new_state_id})
+                return True
+            return False
     
     # ==================== METODI UTENTI ====================
     
@@ -1667,31 +1715,19 @@ class DatabaseManager:
         """Ottiene statistiche sui task"""
         if self.use_supabase:
             try:
-                # Ottieni tutti i task
-                tasks = self.get_all_tasks()
+                # Solo la colonna stato: il conteggio dei task scaduti lo fa il database
+                tasks = self._select_all_pages('tasks', 'state_id')
                 
-                # Calcola statistiche
                 total_tasks = len(tasks)
                 tasks_by_state = {}
-                overdue_tasks = 0
-                
                 for task in tasks:
-                    # Per stato
                     state_id = task.get('state_id')
                     if state_id:
                         state_name = f"State_{state_id}"
                         tasks_by_state[state_name] = tasks_by_state.get(state_name, 0) + 1
-                    
-                    # Task scaduti
-                    due_date = task.get('due_date')
-                    if due_date:
-                        from datetime import datetime
-                        try:
-                            due_date_obj = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-                            if due_date_obj < datetime.now() and state_id != 3:  # Non completati
-                                overdue_tasks += 1
-                        except:
-                            pass
+                
+                overdue_tasks = self.supabase.table('tasks').select('id', count='exact') \
+                    .lt('due_date', datetime.now().isoformat()).neq('state_id', 3).limit(1).execute().count or 0
                 
                 return {
                     'total_tasks': total_tasks,
@@ -2717,7 +2753,513 @@ class DatabaseManager:
             query = "SELECT * FROM leads WHERE email = ?"
             results = self.execute_query(query, (email,))
             return results[0] if results else None
-    
+
+    def merge_leads(self, survivor_id: int, duplicate_ids: List[int], survivor_updates: Dict = None) -> Dict:
+        """
+        Unisce lead duplicati nel lead superstite
+
+        Sposta in blocco task, storico contatti e contatti sul lead superstite
+        (una query per tabella, non una per riga) e poi elimina i duplicati. Se lo spostamento
+        fallisce l'unione si interrompe prima dell'eliminazione: solo una
+        tabella assente nello schema viene saltata.
+        """
+        duplicate_ids = [d for d in duplicate_ids if d != survivor_id]
+        moved = {'tasks': 0, 'contact_history': 0, 'lead_contacts': 0}
+
+        if not duplicate_ids:
+            return {'success': True, 'moved': moved, 'deleted_count': 0}
+
+        # Tabelle che referenziano leads.id (contact_history: ON DELETE CASCADE,
+        # se non spostato verrebbe eliminato insieme ai duplicati)
+        referencing_tables = ['tasks', 'contact_history', 'lead_contacts']
+
+        if self.use_supabase:
+            try:
+                for table in referencing_tables:
+                    try:
+                        result = self.supabase.table(table).update({'lead_id': survivor_id}).in_('lead_id', duplicate_ids).execute()
+                        moved[table] = len(result.data) if result.data else 0
+                    except Exception as e:
+                        # Alcune installazioni non hanno tutte le tabelle contatti
+                        if getattr(e, 'code', None) not in MISSING_TABLE_CODES:
+                            logger.error(f"❌ merge_leads: spostamento su {table} fallito, duplicati non eliminati: {e}")
+                            return {'success': False, 'message': str(e), 'moved': moved, 'deleted_count': 0}
+                        logger.warning(f"⚠️ merge_leads: tabella {table} assente, saltata")
+
+                if survivor_updates:
+                    updated = self.supabase.table('leads').update(survivor_updates).eq('id', survivor_id).execute()
+                    if updated.data:
+                        notify_lead_saved(updated.data[0])
+
+                result = self.supabase.table('leads').delete().in_('id', duplicate_ids).execute()
+                deleted_count = len(result.data) if result.data else 0
+                for row in result.data or []:
+                    notify_lead_deleted(row['id'])
+
+                logger.info(f"✅ Uniti {deleted_count} lead duplicati nel lead {survivor_id}")
+                return {'success': True, 'moved': moved, 'deleted_count': deleted_count}
+            except Exception as e:
+                logger.error(f"❌ Errore merge_leads Supabase: {e}")
+                return {'success': False, 'message': str(e), 'moved': moved, 'deleted_count': 0}
+        else:
+            placeholders = ', '.join('?' for _ in duplicate_ids)
+            try:
+                cursor = self.conn.cursor()
+                for table in referencing_tables:
+                    try:
+                        cursor.execute(
+                            f"UPDATE {table} SET lead_id = ? WHERE lead_id IN ({placeholders})",
+                            (survivor_id, *duplicate_ids)
+                        )
+                        moved[table] = cursor.rowcount
+                    except sqlite3.OperationalError as e:
+                        if not str(e).startswith('no such table'):
+                            raise
+                        logger.warning(f"⚠️ merge_leads: tabella {table} assente, saltata")
+
+                if survivor_updates:
+                    columns = ', '.join(f"{column} = ?" for column in survivor_updates)
+                    cursor.execute(
+                        f"UPDATE leads SET {columns} WHERE id = ?",
+                        (*survivor_updates.values(), survivor_id)
+                    )
+
+                cursor.execute(f"DELETE FROM leads WHERE id IN ({placeholders})", tuple(duplicate_ids))
+                deleted_count = cursor.rowcount
+                self.conn.commit()
+
+                if survivor_updates:
+                    notify_lead_saved({**survivor_updates, 'id': survivor_id})
+                for duplicate_id in duplicate_ids:
+                    notify_lead_deleted(duplicate_id)
+
+                logger.info(f"✅ Uniti {deleted_count} lead duplicati nel lead {survivor_id}")
+                return {'success': True, 'moved': moved, 'deleted_count': deleted_count}
+            except Exception as e:
+                logger.error(f"❌ Errore merge_leads SQLite: {e}")
+                self.conn.rollback()
+                return {'success': False, 'message': str(e), 'moved': moved, 'deleted_count': 0}
+
+    def get_leads_for_scoring(self, since: datetime = None, lead_ids: List[int] = None) -> List[Dict]:
+        """
+        Ottiene i lead da (ri)valutare per lo score qualità
+
+        Args:
+            since: Solo lead modificati dopo questo istante (UTC) o mai valutati
+            lead_ids: Solo questi lead
+
+        Gli errori di lettura vengono propagati: con una lista vuota il
+        refresh sposterebbe comunque il watermark.
+        """
+        if self.use_supabase:
+            try:
+                leads = []
+                page_size = 1000
+                if lead_ids is not None:
+                    for start in range(0, len(lead_ids), page_size):
+                        chunk = lead_ids[start:start + page_size]
+                        result = self.supabase.table('leads').select('*').in_('id', chunk).execute()
+                        leads.extend(result.data)
+                    return leads
+
+                offset = 0
+                while True:
+                    query = self.supabase.table('leads').select('*')
+                    if since is not None:
+                        query = query.or_(f"updated_at.gte.{since.isoformat()},quality_score.is.null")
+                    result = query.order('id').range(offset, offset + page_size - 1).execute()
+                    leads.extend(result.data)
+                    if len(result.data) < page_size:
+                        break
+                    offset += page_size
+                return leads
+            except Exception as e:
+                logger.error(f"❌ Errore get_leads_for_scoring Supabase: {e}")
+                raise
+        else:
+            if lead_ids is not None:
+                if not lead_ids:
+                    return []
+                placeholders = ', '.join('?' for _ in lead_ids)
+                return self.execute_query(f"SELECT * FROM leads WHERE id IN ({placeholders})", tuple(lead_ids))
+            if since is not None:
+                # CURRENT_TIMESTAMP di SQLite è UTC al secondo: >= per non perdere modifiche nello stesso secondo
+                since_text = since.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                return self.execute_query(
+                    "SELECT * FROM leads WHERE updated_at >= ? OR quality_score IS NULL",
+                    (since_text,)
+                )
+            return self.execute_query("SELECT * FROM leads")
+
+    def update_lead_scores(self, scores: List[Dict]) -> int:
+        """
+        Salva in blocco gli score qualità
+
+        Args:
+            scores: Lista di {'id', 'quality_score', 'quality_category'}
+
+        Returns:
+            Numero di lead aggiornati
+
+        Gli errori vengono propagati (in SQLite dopo il rollback): il
+        chiamante non deve considerare completo un salvataggio fallito.
+        """
+        if not scores:
+            return 0
+
+        if self.use_supabase:
+            # Una richiesta per ogni coppia (score, categoria): al massimo ~100 richieste
+            groups: Dict[tuple, List[int]] = {}
+            for item in scores:
+                groups.setdefault((item['quality_score'], item['quality_category']), []).append(item['id'])
+
+            updated = 0
+            try:
+                for (score, category), ids in groups.items():
+                    for start in range(0, len(ids), 1000):
+                        result = self.supabase.table('leads').update({
+                            'quality_score': score,
+                            'quality_category': category
+                        }).in_('id', ids[start:start + 1000]).execute()
+                        updated += len(result.data) if result.data else 0
+                return updated
+            except Exception as e:
+                logger.error(f"❌ Errore update_lead_scores Supabase dopo {updated} lead: {e}")
+                raise
+        else:
+            try:
+                cursor = self.conn.cursor()
+                cursor.executemany(
+                    "UPDATE leads SET quality_score = ?, quality_category = ? WHERE id = ?",
+                    [(item['quality_score'], item['quality_category'], item['id']) for item in scores]
+                )
+                self.conn.commit()
+                return cursor.rowcount
+            except Exception as e:
+                logger.error(f"❌ Errore update_lead_scores SQLite: {e}")
+                self.conn.rollback()
+                raise
+
+    def _select_in_pages(self, table: str, column: str, values: List, columns: str = '*',
+                         order_by: str = None) -> List[Dict]:
+        """Supabase: righe con `column` in `values`, a blocchi di id e pagine da 1000 righe"""
+        rows = []
+        page_size = 1000
+        for start in range(0, len(values), 200):
+            chunk = values[start:start + 200]
+            offset = 0
+            while True:
+                query = self.supabase.table(table).select(columns).in_(column, chunk)
+                if order_by:
+                    query = query.order(order_by, desc=True)
+                result = query.order('id').range(offset, offset + page_size - 1).execute()
+                rows.extend(result.data)
+                if len(result.data) < page_size:
+                    break
+                offset += page_size
+        return rows
+
+    def get_lead_contexts(self, lead_ids: List[int], contacts_limit: int = 10,
+                          activities_limit: int = 5) -> Dict[int, Dict]:
+        """
+        Carica in blocco il contesto dei lead per le funzionalità AI
+
+        Lead con nomi di stato/priorità/categoria/fonte/assegnatario, ultimi
+        contatti e ultimi task di ogni lead, con un numero di query che non
+        dipende dal numero di lead.
+
+        Args:
+            lead_ids: ID dei lead
+            contacts_limit: Ultimi contatti per lead (0 = non caricarli)
+            activities_limit: Ultimi task per lead (0 = non caricarli)
+
+        Returns:
+            Dizionario lead_id -> {'lead': {...}, 'contacts': [...], 'activities': [...]};
+            i lead non trovati sono assenti
+        """
+        ids = list(dict.fromkeys(int(lead_id) for lead_id in lead_ids))
+        if not ids:
+            return {}
+
+        if self.use_supabase:
+            try:
+                leads = self._select_in_pages('leads', 'id', ids)
+                contacts = self._select_in_pages('lead_contacts', 'lead_id', ids, order_by='created_at') if contacts_limit else []
+                tasks = self._select_in_pages('tasks', 'lead_id', ids, order_by='created_at') if activities_limit else []
+
+                # Tabelle di lookup piccole: una query ciascuna
+                def names(table):
+                    return {row['id']: row['name'] for row in self.supabase.table(table).select('id,name').execute().data}
+
+                states, priorities = names('lead_states'), names('lead_priorities')
+                categories, sources = names('lead_categories'), names('lead_sources')
+                task_states = names('task_states') if tasks else {}
+                user_ids = {row.get('assigned_to') for row in leads + tasks} | {row.get('created_by') for row in contacts}
+                user_ids = [user_id for user_id in user_ids if user_id]
+                users = {row['id']: row for row in self._select_in_pages('users', 'id', user_ids, 'id,first_name,last_name')} if user_ids else {}
+
+                contexts = {}
+                for lead in leads:
+                    assigned = users.get(lead.get('assigned_to'), {})
+                    name_parts = (lead.get('name') or '').split(' ', 1)
+                    lead.update({
+                        'state_name': states.get(lead.get('state_id')),
+                        'priority_name': priorities.get(lead.get('priority_id')),
+                        'category_name': categories.get(lead.get('category_id')),
+                        'source_name': sources.get(lead.get('source_id')),
+                        'assigned_first_name': assigned.get('first_name', ''),
+                        'assigned_last_name': assigned.get('last_name', ''),
+                        'first_name': name_parts[0],
+                        'last_name': name_parts[1] if len(name_parts) > 1 else ''
+                    })
+                    contexts[lead['id']] = {'lead': lead, 'contacts': [], 'activities': []}
+
+                for contact in contacts:
+                    context = contexts.get(contact['lead_id'])
+                    if context and len(context['contacts']) < contacts_limit:
+                        user = users.get(contact.get('created_by'), {})
+                        contact['user_first_name'] = user.get('first_name', '')
+                        contact['user_last_name'] = user.get('last_name', '')
+                        context['contacts'].append(contact)
+
+                for task in tasks:
+                    context = contexts.get(task['lead_id'])
+                    if context and len(context['activities']) < activities_limit:
+                        user = users.get(task.get('assigned_to'), {})
+                        task['state_name'] = task_states.get(task.get('state_id'))
+                        task['priority_name'] = priorities.get(task.get('priority_id'))
+                        task['assigned_first_name'] = user.get('first_name', '')
+                        task['assigned_last_name'] = user.get('last_name', '')
+                        context['activities'].append(task)
+
+                return contexts
+            except Exception as e:
+                logger.error(f"❌ Errore get_lead_contexts Supabase: {e}")
+                return {}
+        else:
+            try:
+                contexts = {}
+                # Limite parametri SQLite: blocchi da 500 id
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    placeholders = ', '.join('?' for _ in chunk)
+
+                    for lead in self.execute_query(f"""
+                        SELECT l.*,
+                               ls.name as state_name,
+                               lp.name as priority_name,
+                               lc.name as category_name,
+                               ls2.name as source_name,
+                               u.first_name as assigned_first_name,
+                               u.last_name as assigned_last_name
+                        FROM leads l
+                        LEFT JOIN lead_states ls ON l.state_id = ls.id
+                        LEFT JOIN lead_priorities lp ON l.priority_id = lp.id
+                        LEFT JOIN lead_categories lc ON l.category_id = lc.id
+                        LEFT JOIN lead_sources ls2 ON l.source_id = ls2.id
+                        LEFT JOIN users u ON l.assigned_to = u.id
+                        WHERE l.id IN ({placeholders})
+                    """, tuple(chunk)):
+                        contexts[lead['id']] = {'lead': lead, 'contacts': [], 'activities': []}
+
+                    # Ultimi N per lead con ROW_NUMBER: una query per tabella
+                    if contacts_limit:
+                        for contact in self.execute_query(f"""
+                            SELECT * FROM (
+                                SELECT ch.*,
+                                       ct.name as template_name,
+                                       u.first_name as user_first_name,
+                                       u.last_name as user_last_name,
+                                       ROW_NUMBER() OVER (PARTITION BY ch.lead_id ORDER BY ch.created_at DESC, ch.id DESC) as row_number
+                                FROM lead_contacts ch
+                                LEFT JOIN contact_templates ct ON ch.template_id = ct.id
+                                LEFT JOIN users u ON ch.created_by = u.id
+                                WHERE ch.lead_id IN ({placeholders})
+                            ) WHERE row_number <= ?
+                            ORDER BY lead_id, row_number
+                        """, tuple(chunk) + (contacts_limit,)):
+                            contact.pop('row_number')
+                            if contact['lead_id'] in contexts:
+                                contexts[contact['lead_id']]['contacts'].append(contact)
+
+                    if activities_limit:
+                        for task in self.execute_query(f"""
+                            SELECT * FROM (
+                                SELECT t.*,
+                                       ts.name as state_name,
+                                       tp.name as priority_name,
+                                       u.first_name as assigned_first_name,
+                                       u.last_name as assigned_last_name,
+                                       ROW_NUMBER() OVER (PARTITION BY t.lead_id ORDER BY t.created_at DESC, t.id DESC) as row_number
+                                FROM tasks t
+                                LEFT JOIN task_states ts ON t.state_id = ts.id
+                                LEFT JOIN lead_priorities tp ON t.priority_id = tp.id
+                                LEFT JOIN users u ON t.assigned_to = u.id
+                                WHERE t.lead_id IN ({placeholders})
+                            ) WHERE row_number <= ?
+                            ORDER BY lead_id, row_number
+                        """, tuple(chunk) + (activities_limit,)):
+                            task.pop('row_number')
+                            if task['lead_id'] in contexts:
+                                contexts[task['lead_id']]['activities'].append(task)
+
+                return contexts
+            except Exception as e:
+                logger.error(f"❌ Errore get_lead_contexts SQLite: {e}")
+                return {}
+
+    def get_records_for_analytics(self, table: str, columns: List[str], created_since: datetime = None,
+                                  created_until: datetime = None, updated_since: datetime = None) -> List[Dict]:
+        """
+        Righe minime per i rollup giornalieri delle analytics
+
+        Args:
+            table: leads, tasks o lead_contacts
+            columns: Colonne da leggere (created_at è sempre incluso)
+            created_since: Solo righe create da questo istante (UTC)
+            created_until: Solo righe create prima di questo istante (UTC)
+            updated_since: Solo righe modificate da questo istante (UTC)
+
+        Gli errori di lettura vengono propagati: una lista vuota indicherebbe
+        "nessuna riga" e cancellerebbe i rollup esistenti.
+        """
+        if table not in ANALYTICS_UPDATED_COLUMNS:
+            raise ValueError(f"Tabella analytics non supportata: {table}")
+        columns = list(dict.fromkeys(['id', 'created_at'] + list(columns)))
+        updated_column = ANALYTICS_UPDATED_COLUMNS[table]
+
+        if self.use_supabase:
+            try:
+                rows = []
+                page_size = 1000
+                offset = 0
+                while True:
+                    query = self.supabase.table(table).select(','.join(columns))
+                    if created_since is not None:
+                        query = query.gte('created_at', created_since.isoformat())
+                    if created_until is not None:
+                        query = query.lt('created_at', created_until.isoformat())
+                    if updated_since is not None:
+                        query = query.gte(updated_column, updated_since.isoformat())
+                    result = query.order('id').range(offset, offset + page_size - 1).execute()
+                    rows.extend(result.data)
+                    if len(result.data) < page_size:
+                        break
+                    offset += page_size
+                return rows
+            except Exception as e:
+                logger.error(f"❌ Errore get_records_for_analytics Supabase: {e}")
+                raise
+        else:
+            def sqlite_time(value: datetime) -> str:
+                # CURRENT_TIMESTAMP di SQLite è UTC al secondo
+                return value.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+            conditions, params = [], []
+            if created_since is not None:
+                conditions.append("created_at >= ?")
+                params.append(sqlite_time(created_since))
+            if created_until is not None:
+                conditions.append("created_at < ?")
+                params.append(sqlite_time(created_until))
+            if updated_since is not None:
+                conditions.append(f"{updated_column} >= ?")
+                params.append(sqlite_time(updated_since))
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            return self.execute_query(f"SELECT {', '.join(columns)} FROM {table}{where}", tuple(params))
+
+    def _select_all_pages(self, table: str, columns: str = '*', build=None) -> List[Dict]:
+        """Tutte le righe di una tabella Supabase, a pagine da 1000 (build aggiunge i filtri)"""
+        rows = []
+        page_size = 1000
+        offset = 0
+        while True:
+            query = self.supabase.table(table).select(columns)
+            if build:
+                query = build(query)
+            result = query.order('id').range(offset, offset + page_size - 1).execute()
+            rows.extend(result.data)
+            if len(result.data) < page_size:
+                return rows
+            offset += page_size
+
+    def get_open_tasks(self, closed_state_ids) -> List[Dict]:
+        """
+        Task non chiusi con scadenza, solo le colonne usate dallo scheduler scadenze
+
+        Args:
+            closed_state_ids: Stati considerati chiusi (es. Completato, Annullato)
+
+        Gli errori di lettura vengono propagati: una lista vuota farebbe
+        credere allo scheduler che non ci siano task aperti.
+        """
+        closed_state_ids = list(closed_state_ids)
+        columns = 'id, title, due_date, state_id, assigned_to, priority_id'
+        if self.use_supabase:
+            try:
+                def build(query):
+                    query = query.not_.is_('due_date', 'null')
+                    if closed_state_ids:
+                        query = query.not_.in_('state_id', closed_state_ids)
+                    return query
+                return self._select_all_pages('tasks', columns.replace(' ', ''), build)
+            except Exception as e:
+                logger.error(f"❌ Errore get_open_tasks Supabase: {e}")
+                raise
+        else:
+            placeholders = ', '.join('?' * len(closed_state_ids)) or 'NULL'
+            query = f"""
+                SELECT {columns} FROM tasks
+                WHERE due_date IS NOT NULL AND (state_id IS NULL OR state_id NOT IN ({placeholders}))
+            """
+            return self.execute_query(query, tuple(closed_state_ids))
+
+    def get_daily_report_data(self, day: date = None) -> Dict[str, Any]:
+        """Conteggi del report giornaliero calcolati dal database (nessuna riga scaricata)"""
+        day = day or date.today()
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+        report = {'date': day.strftime('%d/%m/%Y')}
+
+        if self.use_supabase:
+            try:
+                def count(table: str, build=None) -> int:
+                    query = self.supabase.table(table).select('id', count='exact')
+                    if build:
+                        query = build(query)
+                    return query.limit(1).execute().count or 0
+
+                states = {state['name']: state['id'] for state in self.get_lead_states()}
+                report.update({
+                    'leads_total': count('leads'),
+                    'leads_new_today': count('leads', lambda q: q.gte('created_at', start.isoformat()).lt('created_at', end.isoformat())),
+                    'leads_qualified': count('leads', lambda q: q.eq('state_id', states.get('Qualificato'))),
+                    'leads_closed': count('leads', lambda q: q.eq('state_id', states.get('Chiuso'))),
+                    'tasks_total': count('tasks'),
+                    'tasks_completed': count('tasks', lambda q: q.eq('state_id', 3)),
+                    'tasks_in_progress': count('tasks', lambda q: q.eq('state_id', 2)),
+                    'users_active_today': count('users', lambda q: q.gte('last_login', start.isoformat()))
+                })
+            except Exception as e:
+                logger.error(f"❌ Errore get_daily_report_data Supabase: {e}")
+            return report
+        else:
+            query = """
+                SELECT
+                    (SELECT COUNT(*) FROM leads) AS leads_total,
+                    (SELECT COUNT(*) FROM leads WHERE DATE(created_at) = ?) AS leads_new_today,
+                    (SELECT COUNT(*) FROM leads l JOIN lead_states ls ON l.state_id = ls.id WHERE ls.name = 'Qualificato') AS leads_qualified,
+                    (SELECT COUNT(*) FROM leads l JOIN lead_states ls ON l.state_id = ls.id WHERE ls.name = 'Chiuso') AS leads_closed,
+                    (SELECT COUNT(*) FROM tasks) AS tasks_total,
+                    (SELECT COUNT(*) FROM tasks WHERE state_id = 3) AS tasks_completed,
+                    (SELECT COUNT(*) FROM tasks WHERE state_id = 2) AS tasks_in_progress,
+                    (SELECT COUNT(*) FROM users WHERE DATE(last_login) = ?) AS users_active_today
+            """
+            result = self.execute_query(query, (day.isoformat(), day.isoformat()))
+            if result:
+                report.update(result[0])
+            return report
+
     def create_lead_source(self, source_data: Dict) -> Optional[int]:
         """Crea una nuova fonte lead"""
         if self.use_supabase:
@@ -0,0 +1,38 @@
+-- MIGRAZIONE: Score qualità lead persistito per DASH_GESTIONE_LEAD
+-- Aggiunge leads.quality_score / leads.quality_category calcolati da utils/lead_scoring.py
+-- Creato da Ezio Camporeale
+-- Data: 2026-10-19
+
+-- ==================== AGGIUNTA COLONNE ====================
+
+DO $$ 
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns 
+        WHERE table_name = 'leads' AND column_name = 'quality_score'
+    ) THEN
+        ALTER TABLE leads ADD COLUMN quality_score INTEGER;
+        RAISE NOTICE '✅ Colonna quality_score aggiunta alla tabella leads';
+    ELSE
+        RAISE NOTICE 'ℹ️ Colonna quality_score già presente nella tabella leads';
+    END IF;
+    
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns 
+        WHERE table_name = 'leads' AND column_name = 'quality_category'
+    ) THEN
+        ALTER TABLE leads ADD COLUMN quality_category VARCHAR(10);
+        RAISE NOTICE '✅ Colonna quality_category aggiunta alla tabella leads';
+    ELSE
+        RAISE NOTICE 'ℹ️ Colonna quality_category già presente nella tabella leads';
+    END IF;
+END $$;
+
+-- ==================== INDICI ====================
+
+CREATE INDEX IF NOT EXISTS idx_leads_quality_score ON leads(quality_score DESC NULLS LAST);
+CREATE INDEX IF NOT EXISTS idx_leads_quality_category ON leads(quality_category);
+CREATE INDEX IF NOT EXISTS idx_leads_updated_at ON leads(updated_at);
+
+-- Dopo la migrazione popolare gli score con:
+--   python utils/lead_scoring.py rebuild
@@ -0,0 +1,36 @@
+-- MIGRAZIONE: Compressione dei file storage per DASH_GESTIONE_LEAD
+-- Aggiunge storage_files.compression e storage_files.stored_size: i file
+-- comprimibili (testo, CSV, script) sono salvati in gzip, file_size resta
+-- la dimensione originale e stored_size quella occupata su disco
+-- Creato da Ezio Camporeale
+-- Data: 2026-10-19
+
+-- ==================== AGGIUNTA COLONNE ====================
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'storage_files' AND column_name = 'compression'
+    ) THEN
+        ALTER TABLE storage_files ADD COLUMN compression VARCHAR(10);
+        RAISE NOTICE '✅ Colonna compression aggiunta alla tabella storage_files';
+    ELSE
+        RAISE NOTICE 'ℹ️ Colonna compression già presente nella tabella storage_files';
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'storage_files' AND column_name = 'stored_size'
+    ) THEN
+        ALTER TABLE storage_files ADD COLUMN stored_size BIGINT;
+        RAISE NOTICE '✅ Colonna stored_size aggiunta alla tabella storage_files';
+    ELSE
+        RAISE NOTICE 'ℹ️ Colonna stored_size già presente nella tabella storage_files';
+    END IF;
+END $$;
+
+-- ==================== COMMENTI ====================
+
+COMMENT ON COLUMN storage_files.compression IS 'Formato di compressione del blob su disco (gzip) o NULL se non compresso';
+COMMENT ON COLUMN storage_files.stored_size IS 'Byte occupati su disco dal blob';
@@ -0,0 +1,19 @@
+-- MIGRAZIONE: Contatori download atomici per DASH_GESTIONE_LEAD
+-- Funzione usata da components/storage/download_counter.py per incrementare
+-- storage_files.download_count a blocchi, senza letture e riscritture
+-- Creato da Ezio Camporeale
+-- Data: 2026-10-19
+
+-- ==================== FUNZIONE INCREMENTO ====================
+
+CREATE OR REPLACE FUNCTION increment_storage_download_counts(file_ids INTEGER[], amounts INTEGER[])
+RETURNS VOID AS $$
+    UPDATE storage_files AS f
+    SET download_count = COALESCE(f.download_count, 0) + d.amount
+    FROM unnest(file_ids, amounts) AS d(file_id, amount)
+    WHERE f.id = d.file_id;
+$$ LANGUAGE sql;
+
+GRANT EXECUTE ON FUNCTION increment_storage_download_counts(INTEGER[], INTEGER[]) TO anon, authenticated;
+
+COMMENT ON FUNCTION increment_storage_download_counts(INTEGER[], INTEGER[]) IS 'Incrementa download_count per più file in un solo UPDATE';
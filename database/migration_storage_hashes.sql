@@ -0,0 +1,37 @@
+-- MIGRAZIONE: Hash contenuto dei file storage per DASH_GESTIONE_LEAD
+-- Aggiunge storage_files.content_hash (SHA-256) e storage_files.md5_hash
+-- calcolati durante l'upload da components/storage/storage_manager.py
+-- Creato da Ezio Camporeale
+-- Data: 2026-10-19
+
+-- ==================== AGGIUNTA COLONNE ====================
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'storage_files' AND column_name = 'content_hash'
+    ) THEN
+        ALTER TABLE storage_files ADD COLUMN content_hash VARCHAR(64);
+        RAISE NOTICE '✅ Colonna content_hash aggiunta alla tabella storage_files';
+    ELSE
+        RAISE NOTICE 'ℹ️ Colonna content_hash già presente nella tabella storage_files';
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'storage_files' AND column_name = 'md5_hash'
+    ) THEN
+        ALTER TABLE storage_files ADD COLUMN md5_hash VARCHAR(32);
+        RAISE NOTICE '✅ Colonna md5_hash aggiunta alla tabella storage_files';
+    ELSE
+        RAISE NOTICE 'ℹ️ Colonna md5_hash già presente nella tabella storage_files';
+    END IF;
+END $$;
+
+-- ==================== INDICI ====================
+
+CREATE INDEX IF NOT EXISTS idx_storage_files_content_hash ON storage_files(content_hash);
+
+COMMENT ON COLUMN storage_files.content_hash IS 'Hash SHA-256 del contenuto, calcolato durante l''upload';
+COMMENT ON COLUMN storage_files.md5_hash IS 'Hash MD5 del contenuto (compatibilità)';
@@ -0,0 +1,47 @@
+-- MIGRAZIONE: Lista file paginata e statistiche storage lato server per DASH_GESTIONE_LEAD
+-- Indici per la paginazione per chiave di StorageManager.get_files_page e
+-- funzione get_storage_stats usata da StorageManager.get_storage_stats
+-- Creato da Ezio Camporeale
+-- Data: 2026-10-19
+
+-- ==================== INDICI ====================
+
+-- Pagine per id decrescente, con o senza filtro categoria (solo file attivi)
+CREATE INDEX IF NOT EXISTS idx_storage_files_active_id ON storage_files(id DESC) WHERE is_active;
+CREATE INDEX IF NOT EXISTS idx_storage_files_active_category_id ON storage_files(category, id DESC) WHERE is_active;
+
+-- Ricerca per nome (ILIKE '%termine%')
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_storage_files_original_filename_trgm
+    ON storage_files USING GIN (original_filename gin_trgm_ops) WHERE is_active;
+
+-- ==================== FUNZIONE STATISTICHE ====================
+
+-- Conteggi e dimensioni per categoria e spazio su disco (ogni blob contato una volta)
+CREATE OR REPLACE FUNCTION get_storage_stats()
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'categories', COALESCE((
+            SELECT json_object_agg(category, json_build_object('count', file_count, 'size', total_size))
+            FROM (
+                SELECT category, COUNT(*) AS file_count, COALESCE(SUM(file_size), 0) AS total_size
+                FROM storage_files
+                WHERE is_active
+                GROUP BY category
+            ) AS per_category
+        ), '{}'::json),
+        'stored_size', (
+            SELECT COALESCE(SUM(blob_size), 0)
+            FROM (
+                SELECT DISTINCT ON (COALESCE(content_hash, id::TEXT)) COALESCE(stored_size, file_size) AS blob_size
+                FROM storage_files
+                WHERE is_active
+                ORDER BY COALESCE(content_hash, id::TEXT)
+            ) AS blobs
+        )
+    );
+$$ LANGUAGE sql STABLE;
+
+GRANT EXECUTE ON FUNCTION get_storage_stats() TO anon, authenticated;
+
+COMMENT ON FUNCTION get_storage_stats() IS 'Statistiche dello storage per categoria calcolate nel database';
@@ -0,0 +1,27 @@
+-- MIGRAZIONE: Verifica integrità dei file storage per DASH_GESTIONE_LEAD
+-- Aggiunge storage_files.last_verified_at, aggiornata da
+-- utils/storage_maintenance.py quando l'hash del file su disco corrisponde
+-- a content_hash; i file mai verificati o verificati da più tempo hanno la priorità
+-- Creato da Ezio Camporeale
+-- Data: 2026-10-19
+
+-- ==================== AGGIUNTA COLONNE ====================
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'storage_files' AND column_name = 'last_verified_at'
+    ) THEN
+        ALTER TABLE storage_files ADD COLUMN last_verified_at TIMESTAMP;
+        RAISE NOTICE '✅ Colonna last_verified_at aggiunta alla tabella storage_files';
+    ELSE
+        RAISE NOTICE 'ℹ️ Colonna last_verified_at già presente nella tabella storage_files';
+    END IF;
+END $$;
+
+-- ==================== INDICI ====================
+
+CREATE INDEX IF NOT EXISTS idx_storage_files_last_verified_at ON storage_files(last_verified_at NULLS FIRST);
+
+COMMENT ON COLUMN storage_files.last_verified_at IS 'Ultima verifica dell''hash del file su disco';
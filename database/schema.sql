@@ -88,6 +88,8 @@ CREATE TABLE IF NOT EXISTS leads (
     notes TEXT,
     budget DECIMAL(10,2),
     expected_close_date DATE,
+    quality_score INTEGER,
+    quality_category VARCHAR(10),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     created_by INTEGER NOT NULL,
@@ -250,6 +252,9 @@ CREATE INDEX IF NOT EXISTS idx_leads_assigned_to ON leads(assigned_to);
 CREATE INDEX IF NOT EXISTS idx_leads_state ON leads(state_id);
 CREATE INDEX IF NOT EXISTS idx_leads_category ON leads(category_id);
 CREATE INDEX IF NOT EXISTS idx_leads_created_at ON leads(created_at);
+CREATE INDEX IF NOT EXISTS idx_leads_quality_score ON leads(quality_score);
+CREATE INDEX IF NOT EXISTS idx_leads_quality_category ON leads(quality_category);
+CREATE INDEX IF NOT EXISTS idx_leads_updated_at ON leads(updated_at);
 CREATE INDEX IF NOT EXISTS idx_tasks_assigned_to ON tasks(assigned_to);
 CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks(state_id);
 CREATE INDEX IF NOT EXISTS idx_tasks_due_date ON tasks(due_date);
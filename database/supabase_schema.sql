@@ -104,6 +104,8 @@ CREATE TABLE IF NOT EXISTS leads (
     assigned_to INTEGER REFERENCES users(id),
     notes TEXT,
     created_by INTEGER REFERENCES users(id),
+    quality_score INTEGER,
+    quality_category VARCHAR(10),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
@@ -247,6 +249,9 @@ CREATE INDEX IF NOT EXISTS idx_leads_state_id ON leads(state_id);
 CREATE INDEX IF NOT EXISTS idx_leads_category_id ON leads(category_id);
 CREATE INDEX IF NOT EXISTS idx_leads_created_at ON leads(created_at);
 CREATE INDEX IF NOT EXISTS idx_leads_expected_close_date ON leads(expected_close_date);
+CREATE INDEX IF NOT EXISTS idx_leads_quality_score ON leads(quality_score DESC NULLS LAST);
+CREATE INDEX IF NOT EXISTS idx_leads_quality_category ON leads(quality_category);
+CREATE INDEX IF NOT EXISTS idx_leads_updated_at ON leads(updated_at);
 
 CREATE INDEX IF NOT EXISTS idx_tasks_assigned_to ON tasks(assigned_to);
 CREATE INDEX IF NOT EXISTS idx_tasks_state_id ON tasks(state_id);
@@ -16,6 +16,13 @@ from pathlib import Path
 current_dir = Path(__file__).parent
 sys.path.append(str(current_dir))
 
+from utils.keyword_classifier import (
+    LEAD_STATUS_CLASSIFIER,
+    LEAD_PRIORITY_CLASSIFIER,
+    extract_budget,
+    extract_budget_series
+)
+
 def clean_phone_number(phone: str) -> str:
     """Pulisce e standardizza il numero di telefono"""
     if pd.isna(phone) or not phone:
@@ -80,58 +87,15 @@ def extract_name_from_full_name(full_name: str) -> tuple:
 
 def categorize_lead_status(feedback: str) -> str:
     """Categorizza lo stato del lead basato sul feedback"""
-    if pd.isna(feedback) or not feedback:
-        return "Nuovo"
-    
-    feedback_lower = str(feedback).lower()
-    
-    if any(word in feedback_lower for word in ["chiuso", "acquistato", "bonifico", "compra"]):
-        return "Chiuso"
-    elif any(word in feedback_lower for word in ["meet", "zoom", "call", "fissata"]):
-        return "In Contatto"
-    elif any(word in feedback_lower for word in ["non risponde", "bloccato", "scomparso"]):
-        return "Non Risponde"
-    elif any(word in feedback_lower for word in ["perditempo", "senza budget", "coglione"]):
-        return "Non Qualificato"
-    elif any(word in feedback_lower for word in ["concorrenza", "competitor"]):
-        return "Concorrenza"
-    else:
-        return "Contattato"
+    return LEAD_STATUS_CLASSIFIER.classify(feedback)
 
 def categorize_lead_priority(feedback: str) -> str:
     """Determina la priorità del lead basata sul feedback"""
-    if pd.isna(feedback) or not feedback:
-        return "Media"
-    
-    feedback_lower = str(feedback).lower()
-    
-    if any(word in feedback_lower for word in ["super in target", "imprenditore", "capitale grossi", "3k", "1699"]):
-        return "Alta"
-    elif any(word in feedback_lower for word in ["chiuso", "acquistato", "bonifico", "800", "500", "1297"]):
-        return "Alta"
-    elif any(word in feedback_lower for word in ["perditempo", "senza budget", "non risponde", "bloccato"]):
-        return "Bassa"
-    else:
-        return "Media"
+    return LEAD_PRIORITY_CLASSIFIER.classify(feedback)
 
 def extract_budget_from_feedback(feedback: str) -> Optional[float]:
     """Estrae il budget dal feedback"""
-    if pd.isna(feedback) or not feedback:
-        return None
-    
-    feedback_str = str(feedback)
-    
-    # Cerca numeri seguiti da k (es. 3k = 3000)
-    k_match = re.search(r'(\d+)k', feedback_str.lower())
-    if k_match:
-        return float(k_match.group(1)) * 1000
-    
-    # Cerca numeri diretti
-    number_match = re.search(r'(\d{3,})', feedback_str)
-    if number_match:
-        return float(number_match.group(1))
-    
-    return None
+    return extract_budget(feedback)
 
 def determine_lead_source() -> str:
     """Determina la fonte del lead (dal contesto sembra essere Facebook Ads)"""
@@ -215,6 +179,12 @@ def create_complete_dataset():
     # Crea DataFrame
     df = pd.DataFrame(raw_data)
     
+    # Classificazione vettoriale di stato, priorità e budget sull'intera colonna
+    feedbacks = df['Feedback'].map(clean_feedback_text)
+    stati = LEAD_STATUS_CLASSIFIER.classify_series(feedbacks)
+    priorita_col = LEAD_PRIORITY_CLASSIFIER.classify_series(feedbacks)
+    budgets = extract_budget_series(feedbacks)
+    
     # Pulisce e struttura TUTTI i dati (senza esclusioni)
     cleaned_data = []
     
@@ -222,7 +192,7 @@ def create_complete_dataset():
         nome, cognome = extract_name_from_full_name(row['Nome Completo'])
         telefono = clean_phone_number(row['Telefono'])
         email = clean_email(row['Email'])
-        feedback = clean_feedback_text(row['Feedback'])
+        feedback = feedbacks[index]
         
         # Per TUTTI i record, anche quelli senza nome completo o email
         if not nome:
@@ -232,9 +202,9 @@ def create_complete_dataset():
             email = f"lead{index + 1}@example.com"  # Email di default se mancante
         
         # Determina stato e priorità
-        stato = categorize_lead_status(feedback)
-        priorita = categorize_lead_priority(feedback)
-        budget = extract_budget_from_feedback(feedback)
+        stato = stati[index]
+        priorita = priorita_col[index]
+        budget = budgets[index]
         
         # Crea record pulito
         cleaned_record = {
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Mock DeepSeek Server - Sostituto locale dell'API chat completions
+Server HTTP locale compatibile con /v1/chat/completions (normale e streaming SSE)
+con latenza, errori e timeout configurabili, per test e benchmark senza rete
+Creato da Ezio Camporeale
+"""
+
+import json
+import time
+import random
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Optional
+
+
+class MockDeepSeekServer:
+    """
+    Server locale che imita l'API DeepSeek
+
+    Args:
+        latency: Secondi prima della risposta (o del primo frammento in streaming)
+        chunk_delay: Secondi tra un frammento e l'altro in streaming
+        error_rate: Probabilità di rispondere 500
+        timeout_rate: Probabilità di non rispondere per `hang_seconds`
+        hang_seconds: Durata dell'attesa simulata per i timeout
+        response_words: Parole nella risposta generata
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.2,
+                 chunk_delay: float = 0.01, error_rate: float = 0.0, timeout_rate: float = 0.0,
+                 hang_seconds: float = 5.0, response_words: int = 60, seed: Optional[int] = None):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.response_words = response_words
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self) -> 'MockDeepSeekServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats.clear()
+
+    def _roll(self) -> str:
+        """Sceglie l'esito della richiesta: ok, error o timeout"""
+        with self._lock:
+            value = self._random.random()
+        if value < self.timeout_rate:
+            return 'timeout'
+        if value < self.timeout_rate + self.error_rate:
+            return 'error'
+        return 'ok'
+
+    def _completion_text(self, prompt: str) -> str:
+        words = prompt.split()[:10] or ['risposta']
+        body = ' '.join(words[i % len(words)] for i in range(self.response_words))
+        return f"**Risposta simulata**\n\n{body}"
+
+    def _make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                messages = payload.get('messages') or [{}]
+                prompt = messages[-1].get('content', '')
+                stream = bool(payload.get('stream'))
+
+                with mock._lock:
+                    mock.stats['requests'] += 1
+                    mock.stats['prompt_chars'] += sum(len(m.get('content', '')) for m in messages)
+                    mock.stats['stream_requests' if stream else 'plain_requests'] += 1
+
+                outcome = mock._roll()
+                if outcome == 'timeout':
+                    with mock._lock:
+                        mock.stats['timeouts'] += 1
+                    time.sleep(mock.hang_seconds)
+                    return
+                time.sleep(mock.latency)
+                if outcome == 'error':
+                    with mock._lock:
+                        mock.stats['errors'] += 1
+                    self._send_json(500, {'error': {'message': 'Errore simulato'}})
+                    return
+
+                text = mock._completion_text(prompt)
+                if stream:
+                    self._send_stream(text)
+                else:
+                    self._send_json(200, {
+                        'id': 'mock-completion',
+                        'object': 'chat.completion',
+                        'model': payload.get('model'),
+                        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text},
+                                     'finish_reason': 'stop'}]
+                    })
+
+            def _send_json(self, status: int, body: Dict):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, text: str):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                words = text.split(' ')
+                for index, word in enumerate(words):
+                    chunk = word if index == 0 else ' ' + word
+                    event = {'choices': [{'index': 0, 'delta': {'content': chunk}}]}
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    if mock.chunk_delay:
+                        time.sleep(mock.chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Server DeepSeek simulato')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='Latenza risposta in secondi')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probabilità errore 500')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='Probabilità di non rispondere')
+
+    args = parser.parse_args()
+
+    server = MockDeepSeekServer(port=args.port, latency=args.latency,
+                                error_rate=args.error_rate, timeout_rate=args.timeout_rate)
+    print(f"🤖 Mock DeepSeek in ascolto su {server.url}")
+    print(f"   Avvia l'app con DEEPSEEK_API_URL={server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Server fermato")
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Mock Telegram Server - Sostituto locale della Bot API Telegram
+Server HTTP locale compatibile con getMe, getUpdates (long polling) e
+sendMessage, per provare bot e notifiche senza rete
+Creato da Ezio Camporeale
+"""
+
+import json
+import time
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+
+class MockTelegramServer:
+    """
+    Server locale che imita la Bot API Telegram
+
+    I messaggi degli utenti si simulano con `push_message`; le risposte del
+    bot inviate con sendMessage finiscono in `sent`.
+
+    Args:
+        token: Token accettato negli URL /bot<token>/<metodo>
+        latency: Secondi prima di ogni risposta
+    """
+
+    def __init__(self, token: str = 'test-token', host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0.0):
+        self.token = token
+        self.latency = latency
+        self.sent: List[Dict[str, Any]] = []
+        self.stats = Counter()
+        self._updates: List[Dict[str, Any]] = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._condition = threading.Condition()
+
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """URL base da usare come TELEGRAM_API_URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockTelegramServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._condition:
+            self._condition.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    # ==================== SIMULAZIONE UTENTI ====================
+
+    def push_message(self, chat_id: Any, text: str, username: str = 'utente') -> int:
+        """Simula un messaggio scritto al bot; restituisce l'update_id"""
+        with self._condition:
+            update_id = self._next_update_id
+            self._next_update_id += 1
+            self._updates.append({
+                'update_id': update_id,
+                'message': {
+                    'message_id': self._next_message_id,
+                    'date': int(time.time()),
+                    'chat': {'id': int(chat_id), 'type': 'group'},
+                    'from': {'id': 1000, 'is_bot': False, 'username': username},
+                    'text': text
+                }
+            })
+            self._next_message_id += 1
+            self._condition.notify_all()
+        return update_id
+
+    def wait_for_messages(self, count: int, timeout: float = 5.0) -> List[Dict[str, Any]]:
+        """Attende che il bot abbia inviato almeno `count` messaggi"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while len(self.sent) < count and time.monotonic() < deadline:
+                self._condition.wait(deadline - time.monotonic())
+            return list(self.sent)
+
+    # ==================== METODI BOT API ====================
+
+    def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            # Come Telegram: un offset conferma (e scarta) gli update precedenti
+            self._updates = [update for update in self._updates if update['update_id'] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._condition.wait(deadline - time.monotonic())
+            return list(self._updates[:limit])
+
+    def _send_message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        with self._condition:
+            message = {
+                'message_id': self._next_message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(params['chat_id'])},
+                'text': params.get('text', ''),
+                'parse_mode': params.get('parse_mode'),
+                'reply_to_message_id': params.get('reply_to_message_id')
+            }
+            self._next_message_id += 1
+            self.sent.append(message)
+            self._condition.notify_all()
+        return message
+
+    def _make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self._dispatch()
+
+            def do_POST(self):
+                self._dispatch()
+
+            def _dispatch(self):
+                parsed = urlparse(self.path)
+                params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+                length = int(self.headers.get('Content-Length', 0))
+                if length:
+                    params.update(json.loads(self.rfile.read(length) or b'{}'))
+
+                prefix, _, method = parsed.path.lstrip('/').partition('/')
+                with mock._condition:
+                    mock.stats['requests'] += 1
+                    mock.stats[method] += 1
+                if prefix != f"bot{mock.token}":
+                    self._send_json(401, {'ok': False, 'error_code': 401, 'description': 'Unauthorized'})
+                    return
+                if mock.latency:
+                    time.sleep(mock.latency)
+
+                if method == 'getMe':
+                    result = {'id': 1, 'is_bot': True, 'first_name': 'Mock Bot', 'username': 'mock_bot'}
+                elif method == 'getUpdates':
+                    result = mock._get_updates(params)
+                elif method == 'sendMessage':
+                    if 'chat_id' not in params:
+                        self._send_json(400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: chat_id is empty'})
+                        return
+                    result = mock._send_message(params)
+                else:
+                    self._send_json(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+                    return
+                self._send_json(200, {'ok': True, 'result': result})
+
+            def _send_json(self, status: int, body: Dict):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Bot API Telegram simulata')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--token', default='test-token', help='Token del bot accettato')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latenza risposta in secondi')
+
+    args = parser.parse_args()
+
+    server = MockTelegramServer(token=args.token, port=args.port, latency=args.latency)
+    print(f"📱 Mock Telegram in ascolto su {server.url}")
+    print(f"   Avvia l'app con TELEGRAM_API_URL={server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Server fermato")
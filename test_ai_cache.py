@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test AI Cache - Test della cache persistente delle risposte AI
+Verifica chiavi normalizzate, TTL, eliminazione LRU e contatori
+Creato da Ezio Camporeale
+"""
+
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from components.ai_assistant.ai_cache import AIResponseCache, make_cache_key
+
+
+def test_cache_key_normalization():
+    """Dati equivalenti producono la stessa chiave"""
+    print("🧪 Test chiavi cache...")
+    key1 = make_cache_key('sales_script', {'industry': 'Finanza', 'lead_data': 'Mario  Rossi\n'})
+    key2 = make_cache_key('sales_script', {'lead_data': 'Mario Rossi', 'industry': 'Finanza'})
+    key3 = make_cache_key('sales_script', {'lead_data': 'Luigi Bianchi', 'industry': 'Finanza'})
+    assert key1 == key2
+    assert key1 != key3
+    assert key1.startswith('sales_script_')
+    print("  ✅ Chiavi cache OK")
+
+
+def test_persistence_and_counters():
+    """La cache sopravvive a una nuova istanza e conta hit/miss"""
+    print("🧪 Test persistenza cache...")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'ai_cache.db'
+        cache = AIResponseCache(db_path, ttl_hours=1, max_entries=10, max_size_mb=1)
+        assert cache.get('k1') is None
+        cache.set('k1', 'risposta', 'sales_script')
+        cache.close()
+
+        reopened = AIResponseCache(db_path, ttl_hours=1, max_entries=10, max_size_mb=1)
+        assert reopened.get('k1') == 'risposta'
+        stats = reopened.stats()
+        assert stats['hits'] == 1 and stats['misses'] == 1
+        assert stats['total_cached'] == 1 and stats['valid_cached'] == 1
+        assert stats['cache_hit_rate'] == 50
+        reopened.close()
+    print("  ✅ Persistenza cache OK")
+
+
+def test_ttl_and_lru_eviction():
+    """Le voci scadute non vengono restituite e le meno usate vengono eliminate"""
+    print("🧪 Test TTL ed eliminazione LRU...")
+    cache = AIResponseCache(':memory:', ttl_hours=1, max_entries=3, max_size_mb=1)
+    for key in ('a', 'b', 'c'):
+        cache.set(key, key * 10)
+        time.sleep(0.01)
+    assert cache.get('a') == 'a' * 10  # 'a' diventa la più recente
+    cache.set('d', 'd' * 10)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['evictions'] == 1
+
+    # Limite per dimensione
+    small = AIResponseCache(':memory:', ttl_hours=1, max_entries=100, max_size_mb=100 / (1024 * 1024))
+    small.set('x', 'x' * 60)
+    small.set('y', 'y' * 60)
+    assert small.get('x') is None and small.get('y') is not None
+
+    # TTL
+    expired = AIResponseCache(':memory:', ttl_hours=0, max_entries=10, max_size_mb=1)
+    expired.set('z', 'vecchia')
+    assert expired.get('z') is None
+    print("  ✅ TTL ed eliminazione LRU OK")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio Test AI Cache")
+    print("=" * 50)
+
+    test_cache_key_normalization()
+    test_persistence_and_counters()
+    test_ttl_and_lru_eviction()
+
+    print("=" * 50)
+    print("✅ Test completati!")
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Test AI Executor - Test dell'esecuzione concorrente delle chiamate AI
+Verifica parallelismo, rate limiting e consegna dei risultati parziali
+Creato da Ezio Camporeale
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+import threading
+
+from components.ai_assistant.ai_executor import AIBatchExecutor, TokenBucket, SingleFlight
+
+
+def test_batch_runs_in_parallel():
+    """50 richieste da 0.2s durano circa quanto una richiesta"""
+    print("🧪 Test batch parallelo...")
+    delivered = []
+
+    def slow_call(value):
+        time.sleep(0.2)
+        return value * 2
+
+    started = time.monotonic()
+    batch = AIBatchExecutor(max_workers=50).map(
+        slow_call, {i: i for i in range(50)},
+        on_result=lambda key, result: delivered.append(key)
+    )
+    elapsed = time.monotonic() - started
+
+    assert batch.complete
+    assert batch.results == {i: i * 2 for i in range(50)}
+    assert sorted(delivered) == list(range(50))
+    assert elapsed < 1.5, elapsed
+    print(f"  ✅ Batch parallelo OK ({elapsed:.2f}s)")
+
+
+def test_deadline_returns_partial_results():
+    """Alla deadline vengono restituiti i risultati già pronti"""
+    print("🧪 Test deadline batch...")
+
+    def call(delay):
+        if delay == 'errore':
+            raise ValueError('API non disponibile')
+        time.sleep(delay)
+        return delay
+
+    batch = AIBatchExecutor(max_workers=4).map(
+        call, {'veloce': 0.01, 'lenta': 2, 'rotta': 'errore'}, deadline_seconds=0.5
+    )
+    assert batch.results == {'veloce': 0.01}
+    assert batch.timed_out == ['lenta']
+    assert 'rotta' in batch.errors
+    assert not batch.complete
+    assert batch.elapsed_seconds < 1
+    print("  ✅ Deadline batch OK")
+
+
+def test_token_bucket():
+    """Il token bucket consente il burst e poi limita il ritmo"""
+    print("🧪 Test token bucket...")
+    bucket = TokenBucket(rate=20, capacity=5)
+    started = time.monotonic()
+    for _ in range(10):
+        assert bucket.acquire()
+    elapsed = time.monotonic() - started
+    # 5 token subito, altri 5 a 20/s = circa 0.25s
+    assert 0.15 < elapsed < 0.6, elapsed
+
+    empty = TokenBucket(rate=1, capacity=1)
+    assert empty.acquire()
+    started = time.monotonic()
+    assert not empty.acquire(deadline=time.monotonic() + 0.05)
+    # Il token arriverebbe dopo la deadline: nessuna attesa
+    assert time.monotonic() - started < 0.03
+    print("  ✅ Token bucket OK")
+
+
+def test_single_flight_coalesces():
+    """Richieste identiche concorrenti eseguono la funzione una sola volta"""
+    print("🧪 Test coalescenza richieste...")
+    flight = SingleFlight()
+    calls = []
+    results = []
+
+    def expensive():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'risposta'
+
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do('script_1', expensive)))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ['risposta'] * 10
+    assert sum(1 for _, shared in results if shared) == 9
+    assert flight.coalesced == 9 and flight.in_flight() == 0
+
+    # Terminata la chiamata, una nuova richiesta riparte
+    assert flight.do('script_1', lambda: 'nuova') == ('nuova', False)
+    print("  ✅ Coalescenza richieste OK")
+
+
+def test_single_flight_control_exceptions_not_shared():
+    """Un'eccezione di controllo del leader non arriva agli altri richiedenti"""
+    print("🧪 Test uscita anticipata del leader...")
+    flight = SingleFlight()
+
+    class _Rerun(BaseException):
+        """Come RerunException di Streamlit"""
+
+    started = threading.Event()
+    outcomes = {}
+
+    def leader():
+        def interrupted():
+            started.set()
+            time.sleep(0.1)
+            raise _Rerun()
+        try:
+            flight.do('script_1', interrupted)
+        except _Rerun:
+            outcomes['leader'] = 'rerun'
+
+    def follower():
+        started.wait()
+        outcomes['follower'] = flight.do('script_1', lambda: 'propria')
+
+    threads = [threading.Thread(target=leader), threading.Thread(target=follower)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert outcomes == {'leader': 'rerun', 'follower': ('propria', False)}
+
+    # Gli errori ordinari restano condivisi
+    def failing():
+        time.sleep(0.1)
+        raise ValueError('api non disponibile')
+    errors = []
+
+    def request():
+        try:
+            flight.do('script_2', failing)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == ['api non disponibile'] * 3
+    print("  ✅ Eccezioni di controllo non condivise")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio Test AI Executor")
+    print("=" * 50)
+
+    test_batch_runs_in_parallel()
+    test_deadline_returns_partial_results()
+    test_token_bucket()
+    test_single_flight_coalesces()
+    test_single_flight_control_exceptions_not_shared()
+
+    print("=" * 50)
+    print("✅ Test completati!")
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Test AI Streaming - Test delle risposte AI in streaming e condivise
+Verifica parsing server-sent events, salvataggio in cache e coalescenza richieste
+Creato da Ezio Camporeale
+"""
+
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from components.ai_assistant import ai_core
+from components.ai_assistant.ai_core import AIAssistant
+from components.ai_assistant.ai_cache import AIResponseCache
+
+
+class _FakeStreamResponse:
+    """Risposta HTTP in streaming con eventi SSE come quelli di DeepSeek"""
+
+    status_code = 200
+    text = ''
+
+    def __init__(self, chunks):
+        # Righe in byte come requests.iter_lines, JSON con caratteri non ASCII non escapati
+        self.lines = []
+        for chunk in chunks:
+            event = json.dumps({'choices': [{'delta': {'content': chunk}}]}, ensure_ascii=False)
+            self.lines.append(('data: ' + event).encode('utf-8'))
+            self.lines.append(b'')
+        self.lines.append(b': keep-alive')
+        self.lines.append(b'data: [DONE]')
+
+    def iter_lines(self, decode_unicode=False):
+        assert not decode_unicode, "requests decodificherebbe come ISO-8859-1"
+        return iter(self.lines)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def _assistant():
+    assistant = AIAssistant.__new__(AIAssistant)
+    assistant.api_key = 'test'
+    assistant.api_url = 'http://localhost/v1/chat/completions'
+    assistant.model = 'deepseek-chat'
+    assistant.config = dict(ai_core.AI_ASSISTANT_CONFIG)
+    assistant.cache = AIResponseCache(':memory:')
+    assistant.rate_limiter = ai_core.get_ai_rate_limiter()
+    assistant.single_flight = ai_core.get_ai_single_flight()
+    assistant.prompt_builder = ai_core.get_prompt_builder()
+    assistant.memory = ai_core.SessionMemory()
+    assistant.logger = ai_core.logging.getLogger('test_ai_streaming')
+    return assistant
+
+
+def test_stream_and_cache():
+    """I frammenti arrivano alla callback e la risposta completa finisce in cache"""
+    print("🧪 Test streaming risposta...")
+    requests_made = []
+
+    def fake_post(url, headers=None, json=None, timeout=None, stream=False):
+        requests_made.append(json)
+        return _FakeStreamResponse(['Ciao ', 'Mario', ', ecco lo script.'])
+
+    original_post = ai_core.requests.post
+    ai_core.requests.post = fake_post
+    try:
+        _check_stream_and_cache(requests_made)
+    finally:
+        ai_core.requests.post = original_post
+    print("  ✅ Streaming risposta OK")
+
+
+def _check_stream_and_cache(requests_made):
+    assistant = _assistant()
+
+    received = []
+    response = assistant.generate_response('custom', {'lead': 1}, custom_prompt='Script', on_chunk=received.append)
+    assert response == 'Ciao Mario, ecco lo script.'
+    assert received == ['Ciao ', 'Mario', ', ecco lo script.']
+    assert requests_made[0]['stream'] is True
+
+    # Seconda richiesta: servita dalla cache in un unico frammento
+    received = []
+    assert assistant.generate_response('custom', {'lead': 1}, custom_prompt='Script', on_chunk=received.append) == response
+    assert received == [response]
+    assert len(requests_made) == 1
+
+
+def test_concurrent_identical_requests():
+    """Due sessioni che chiedono lo stesso script generano una sola chiamata API"""
+    print("🧪 Test richieste identiche concorrenti...")
+    assistant = _assistant()
+    api_calls = []
+
+    def slow_api_call(prompt, system_message=None, deadline=None):
+        api_calls.append(prompt)
+        time.sleep(0.2)
+        return 'Script condiviso'
+
+    assistant._make_api_call = slow_api_call
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(
+            assistant.generate_response('custom', {'lead': 7}, custom_prompt='Script')
+        ))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['Script condiviso'] * 5
+    assert len(api_calls) == 1
+    print("  ✅ Richieste identiche concorrenti OK")
+
+
+def test_ui_stop_does_not_reach_other_sessions():
+    """Lo stop della UI del primo richiedente non interrompe la chiamata condivisa"""
+    print("🧪 Test stop della sessione in streaming...")
+
+    class _Stop(BaseException):
+        """Come StopException di Streamlit"""
+
+    class _SlowResponse(_FakeStreamResponse):
+        def iter_lines(self, decode_unicode=False):
+            for line in self.lines:
+                time.sleep(0.05)
+                yield line
+
+    requests_made = []
+    first_chunk = threading.Event()
+
+    def fake_post(url, headers=None, json=None, timeout=None, stream=False):
+        requests_made.append(json)
+        return _SlowResponse(['Buongiorno ', 'Anna', ', ecco lo script.'])
+
+    def stopped_ui(chunk):
+        first_chunk.set()
+        raise _Stop()
+
+    assistant = _assistant()
+    outcomes = {}
+
+    def leader():
+        try:
+            assistant.generate_response('custom', {'lead': 11}, custom_prompt='Script stop', on_chunk=stopped_ui)
+        except _Stop:
+            outcomes['leader'] = 'stop'
+
+    def follower():
+        first_chunk.wait()
+        received = []
+        outcomes['follower'] = assistant.generate_response('custom', {'lead': 11}, custom_prompt='Script stop',
+                                                           on_chunk=received.append)
+        outcomes['received'] = received
+
+    original_post = ai_core.requests.post
+    ai_core.requests.post = fake_post
+    try:
+        threads = [threading.Thread(target=leader), threading.Thread(target=follower)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        ai_core.requests.post = original_post
+
+    assert outcomes['leader'] == 'stop'
+    assert outcomes['follower'] == 'Buongiorno Anna, ecco lo script.'
+    assert outcomes['received'] == ['Buongiorno Anna, ecco lo script.']
+    assert len(requests_made) == 1
+    print("  ✅ Stop della UI limitato alla propria sessione")
+
+
+def test_stream_utf8_and_deadline():
+    """Accenti ed emoji arrivano intatti; la deadline interrompe uno stream lento"""
+    print("🧪 Test streaming UTF-8 e deadline...")
+
+    class _SlowResponse(_FakeStreamResponse):
+        def iter_lines(self, decode_unicode=False):
+            for line in self.lines:
+                time.sleep(0.1)
+                yield line
+
+    responses = [_FakeStreamResponse(['Perché ', 'è già così ', '🚀']), _SlowResponse(['a', 'b', 'c', 'd'])]
+
+    def fake_post(url, headers=None, json=None, timeout=None, stream=False):
+        return responses.pop(0)
+
+    original_post = ai_core.requests.post
+    ai_core.requests.post = fake_post
+    try:
+        assistant = _assistant()
+        received = []
+        assert assistant._stream_api_call('Script', received.append) == 'Perché è già così 🚀'
+        assert received == ['Perché ', 'è già così ', '🚀']
+
+        received = []
+        started = time.monotonic()
+        assert assistant._stream_api_call('Script', received.append, deadline=started + 0.25) is None
+        assert time.monotonic() - started < 0.5
+        assert len(received) < 4
+    finally:
+        ai_core.requests.post = original_post
+    print("  ✅ Streaming UTF-8 e deadline OK")
+
+
+def test_retry_respects_deadline():
+    """Il backoff tra i tentativi non supera la deadline del batch"""
+    print("🧪 Test nuovi tentativi entro la deadline...")
+
+    class _ErrorResponse:
+        status_code = 503
+        text = 'Service Unavailable'
+
+    attempts = []
+
+    def fake_post(url, headers=None, json=None, timeout=None, stream=False):
+        attempts.append(time.monotonic())
+        return _ErrorResponse()
+
+    original_post = ai_core.requests.post
+    ai_core.requests.post = fake_post
+    try:
+        assistant = _assistant()
+        assistant.config['retry_attempts'] = 3
+        started = time.monotonic()
+        # Primo backoff (1s) entro la deadline, il secondo (2s) la supererebbe
+        assert assistant._make_api_call('Analisi', deadline=started + 2.5) is None
+        elapsed = time.monotonic() - started
+        assert len(attempts) == 2
+        assert elapsed < 1.5, elapsed
+    finally:
+        ai_core.requests.post = original_post
+    print("  ✅ Nessun tentativo oltre la deadline")
+
+
+def test_all_retries_failed_returns_none():
+    """Se tutti i tentativi falliscono la chiamata restituisce None senza eccezioni"""
+    print("🧪 Test tentativi esauriti...")
+    errors = [ai_core.requests.exceptions.ConnectionError("connessione rifiutata"), ValueError("risposta non valida")]
+
+    def fake_post(url, headers=None, json=None, timeout=None, stream=False):
+        raise errors[0]
+
+    original_post = ai_core.requests.post
+    ai_core.requests.post = fake_post
+    try:
+        assistant = _assistant()
+        assistant.config['retry_attempts'] = 1
+        # Errore di rete (tentativi esauriti) ed errore inatteso (gestore generico)
+        assert assistant._make_api_call('Analisi') is None
+        errors.pop(0)
+        assert assistant._make_api_call('Analisi') is None
+    finally:
+        ai_core.requests.post = original_post
+    print("  ✅ Nessuna eccezione a tentativi esauriti")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio Test AI Streaming")
+    print("=" * 50)
+
+    test_stream_and_cache()
+    test_concurrent_identical_requests()
+    test_ui_stop_does_not_reach_other_sessions()
+    test_stream_utf8_and_deadline()
+    test_retry_respects_deadline()
+    test_all_retries_failed_returns_none()
+
+    print("=" * 50)
+    print("✅ Test completati!")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Test Analytics Snapshot - Test dei rollup giornalieri del Marketing Advisor
+Verifica snapshot per finestra, refresh incrementale e invalidazione
+Creato da Ezio Camporeale
+"""
+
+import sys
+import sqlite3
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from database.database_manager import DatabaseManager
+from components.ai_assistant.analytics_snapshot import AnalyticsSnapshot, build_daily_rollups, LAST_REFRESH_KEY
+
+
+def _sqlite_db() -> DatabaseManager:
+    db = DatabaseManager.__new__(DatabaseManager)
+    db.use_supabase = False
+    db.conn = sqlite3.connect(':memory:')
+    db.conn.row_factory = sqlite3.Row
+    db.conn.executescript((current_dir / 'database' / 'schema.sql').read_text())
+    db.conn.execute("INSERT INTO users (id, username, email, password_hash, first_name, last_name, role_id) "
+                    "VALUES (1, 'mrossi', 'm@rossi.it', 'x', 'Mario', 'Rossi', 1)")
+    # Un lead al giorno negli ultimi 60 giorni, timestamp di modifica uguale alla creazione
+    # (un secondo prima di adesso: il refresh include le modifiche nello stesso secondo del watermark)
+    for days_ago in range(60):
+        db.conn.execute(
+            "INSERT INTO leads (id, first_name, last_name, state_id, source_id, budget, assigned_to, created_by, "
+            "created_at, updated_at) VALUES (?, 'Lead', ?, 1, ?, ?, 1, 1, "
+            "datetime('now', '-1 seconds', ?), datetime('now', '-1 seconds', ?))",
+            (days_ago + 1, str(days_ago), days_ago % 2 + 1, 1000 * (days_ago % 3), f"-{days_ago} days", f"-{days_ago} days")
+        )
+        db.conn.execute(
+            "INSERT INTO tasks (title, lead_id, state_id, priority_id, assigned_to, created_by, created_at, updated_at) "
+            "VALUES ('Task', ?, 1, 2, 1, 1, datetime('now', '-1 seconds', ?), datetime('now', '-1 seconds', ?))",
+            (days_ago + 1, f"-{days_ago} days", f"-{days_ago} days")
+        )
+        db.conn.execute(
+            "INSERT INTO lead_contacts (lead_id, contact_type, response_received, created_by, created_at) "
+            "VALUES (?, 'email', ?, 1, datetime('now', '-1 seconds', ?))",
+            (days_ago + 1, days_ago % 4 == 0, f"-{days_ago} days")
+        )
+    db.conn.commit()
+    return db
+
+
+def test_rollups_by_day():
+    """I rollup contano le righe nel giorno di creazione"""
+    print("🧪 Test rollup giornalieri...")
+    rollups = build_daily_rollups(
+        [{'created_at': '2025-03-01 10:00:00', 'state_id': 1, 'budget': '100', 'assigned_to': 7},
+         {'created_at': '2025-03-01T18:00:00+00:00', 'state_id': 2, 'budget': None}],
+        [{'created_at': '2025-03-02 09:00:00', 'state_id': 3, 'assigned_to': 7, 'completed_at': '2025-03-03'}],
+        [{'created_at': '2025-03-01 11:00:00', 'response_received': 1}]
+    )
+    assert set(rollups) == {'2025-03-01', '2025-03-02'}
+    assert rollups['2025-03-01']['leads']['by_status'] == {'1': 1, '2': 1}
+    assert rollups['2025-03-01']['leads']['budget_count'] == 1
+    assert rollups['2025-03-02']['users']['7']['tasks_completed'] == 1
+    assert rollups['2025-03-01']['contacts'] == {'count': 1, 'responses': 1}
+    print("✅ Rollup corretti")
+
+
+def test_snapshot_windows_and_incremental_refresh():
+    """Snapshot per finestra e refresh che ricalcola solo i giorni modificati"""
+    print("🧪 Test snapshot e refresh incrementale...")
+    db = _sqlite_db()
+    analytics = AnalyticsSnapshot(db, ':memory:', refresh_seconds=3600)
+
+    assert analytics.refresh()['days_updated'] == 60
+    week = analytics.get_snapshot(7)
+    month = analytics.get_snapshot(30)
+    assert sum(week['leads']['by_status'].values()) == 7
+    assert month['leads']['total'] == 30
+    assert month['tasks']['by_priority'] == {'Priority_2': 30}
+    assert month['users']['by_user']['Mario Rossi']['leads_assigned'] == 30
+    assert month['contacts']['by_template']['Default']['usage_count'] == 30
+    assert month['leads']['avg_budget']['General'] == 1000.0
+
+    # Nessuna modifica: nessun giorno ricalcolato
+    assert analytics.refresh()['days_updated'] == 0
+
+    # Modifica di un lead di 10 giorni fa: ricalcolato solo quel giorno
+    db.conn.execute("UPDATE leads SET state_id = 3 WHERE id = 11")
+    db.conn.commit()
+    assert analytics.refresh()['days_updated'] == 1
+    month = analytics.get_snapshot(30)
+    assert month['leads']['by_status'] == {'State_1': 29, 'State_3': 1}
+    assert analytics.get_snapshot(7)['leads']['by_status'] == {'State_1': 7}
+    print("✅ Snapshot e refresh incrementale corretti")
+
+
+def test_snapshot_served_from_memory():
+    """Snapshot ripetuti non interrogano il database finché non scade il refresh"""
+    print("🧪 Test snapshot in memoria...")
+    db = _sqlite_db()
+    analytics = AnalyticsSnapshot(db, ':memory:', refresh_seconds=3600)
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+
+    analytics.get_snapshot(30)
+    first = len(statements)
+    for period in (7, 30, 90, 30, 7):
+        analytics.get_snapshot(period)
+
+    assert first > 0
+    assert len(statements) == first
+    print(f"✅ {first} query al primo snapshot, nessuna per i successivi")
+
+
+def test_failed_read_keeps_rollups():
+    """Un errore di lettura non cancella i rollup e non sposta il watermark"""
+    print("🧪 Test refresh con errore di lettura...")
+    db = _sqlite_db()
+    analytics = AnalyticsSnapshot(db, ':memory:', refresh_seconds=3600)
+    analytics.refresh()
+    before = analytics.get_snapshot(90)
+    watermark = analytics._get_meta(LAST_REFRESH_KEY)
+
+    def failing_read(*args, **kwargs):
+        raise ConnectionError("Supabase non raggiungibile")
+
+    db.get_records_for_analytics = failing_read
+    for full in (False, True):
+        try:
+            analytics.refresh(full=full)
+            assert False, "il refresh doveva fallire"
+        except ConnectionError:
+            pass
+
+    assert analytics._get_meta(LAST_REFRESH_KEY) == watermark
+    assert analytics.conn.execute("SELECT COUNT(*) FROM analytics_rollups").fetchone()[0] == 60
+    assert analytics.get_snapshot(90) == before
+    print("✅ Rollup e watermark invariati")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio test analytics snapshot")
+    print("=" * 50)
+
+    test_rollups_by_day()
+    test_snapshot_windows_and_incremental_refresh()
+    test_snapshot_served_from_memory()
+    test_failed_read_keeps_rollups()
+
+    print("=" * 50)
+    print("🎉 Tutti i test completati!")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test Lead Contact Index - Test dell'indice email/telefono dei lead
+Verifica caricamento, aggiornamenti incrementali e ricerca proprietari
+Creato da Ezio Camporeale
+"""
+
+import sys
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from utils import lead_contact_index
+from utils.lead_contact_index import LeadContactIndex, get_lead_contact_index
+
+
+class _FakeDB:
+    """DatabaseManager minimale per il caricamento dell'indice"""
+
+    def __init__(self, leads):
+        self.leads = leads
+        self.calls = 0
+
+    def get_all_leads(self):
+        self.calls += 1
+        return self.leads
+
+
+def test_lookup_and_events():
+    """Test ricerca e aggiornamenti incrementali"""
+    print("🧪 Test indice contatti...")
+    index = LeadContactIndex()
+    index.load([
+        {'id': 1, 'name': 'Mario Rossi', 'email': 'mario@rossi.it', 'phone': '+39 333 1234567'},
+        {'id': 2, 'first_name': 'Luigi', 'last_name': 'Bianchi', 'email': 'luigi@bianchi.it', 'phone': None},
+    ])
+
+    assert index.lookup_email('MARIO@rossi.it') == [{'id': 1, 'name': 'Mario Rossi'}]
+    assert index.lookup_phone('3331234567')[0]['id'] == 1
+    assert index.find_conflicts(email='mario@rossi.it', exclude_id=1) == {'email': [], 'phone': []}
+
+    # Modifica parziale: cambia solo l'email, il telefono resta indicizzato
+    index.on_lead_saved({'id': 1, 'email': 'mario.rossi@nuovo.it'})
+    assert index.lookup_email('mario@rossi.it') == []
+    assert index.lookup_email('mario.rossi@nuovo.it')[0]['name'] == 'Mario Rossi'
+    assert index.lookup_phone('+393331234567')[0]['id'] == 1
+
+    index.on_lead_saved({'id': 3, 'name': 'Anna Neri', 'email': 'luigi@bianchi.it'})
+    assert [owner['id'] for owner in index.lookup_email('luigi@bianchi.it')] == [2, 3]
+
+    index.on_lead_deleted(2)
+    assert index.find_owner_id(email='luigi@bianchi.it') == 3
+    assert index.size() == 2
+    print("  ✅ Indice contatti OK")
+
+
+def test_shared_index():
+    """L'indice condiviso viene caricato una sola volta e riceve gli eventi"""
+    print("🧪 Test indice condiviso...")
+    lead_contact_index._shared_index = None
+    db = _FakeDB([{'id': 10, 'name': 'Test', 'email': 'test@test.it', 'phone': None}])
+
+    lead_contact_index.notify_lead_saved({'id': 11, 'email': 'ignorato@test.it'})
+    index = get_lead_contact_index(db)
+    assert get_lead_contact_index(db) is index
+    assert db.calls == 1
+    assert index.lookup_email('ignorato@test.it') == []
+
+    lead_contact_index.notify_lead_saved({'id': 12, 'name': 'Nuovo', 'email': 'nuovo@test.it'})
+    assert index.find_owner_id(email='nuovo@test.it') == 12
+    lead_contact_index.notify_lead_deleted(12)
+    assert index.find_owner_id(email='nuovo@test.it') is None
+
+    lead_contact_index._shared_index = None
+    print("  ✅ Indice condiviso OK")
+
+
+def test_empty_load_retried():
+    """Un caricamento vuoto (lettura fallita) non blocca l'indice: si ricarica dopo l'attesa"""
+    print("🧪 Test nuovo caricamento dopo lettura vuota...")
+    lead_contact_index._shared_index = None
+    db = _FakeDB([])
+
+    index = get_lead_contact_index(db)
+    assert not index.loaded
+    get_lead_contact_index(db)
+    assert db.calls == 1
+
+    db.leads = [{'id': 20, 'name': 'Ripreso', 'email': 'ripreso@test.it', 'phone': None}]
+    index.load_attempted_at -= lead_contact_index.RELOAD_RETRY_SECONDS
+    assert get_lead_contact_index(db).find_owner_id(email='ripreso@test.it') == 20
+    assert index.loaded and db.calls == 2
+
+    lead_contact_index._shared_index = None
+    print("  ✅ Nuovo caricamento OK")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio Test Lead Contact Index")
+    print("=" * 50)
+
+    test_lookup_and_events()
+    test_shared_index()
+    test_empty_load_retried()
+
+    print("=" * 50)
+    print("✅ Test completati!")
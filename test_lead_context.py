@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test Lead Context - Test del caricamento in blocco del contesto lead per l'AI
+Verifica ultimi N contatti/attività per lead e numero di query costante
+Creato da Ezio Camporeale
+"""
+
+import sys
+import sqlite3
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from database.database_manager import DatabaseManager
+
+
+def _sqlite_db(leads: int = 30) -> DatabaseManager:
+    db = DatabaseManager.__new__(DatabaseManager)
+    db.use_supabase = False
+    db.conn = sqlite3.connect(':memory:')
+    db.conn.row_factory = sqlite3.Row
+    db.conn.executescript((current_dir / 'database' / 'schema.sql').read_text())
+    db.conn.execute("INSERT INTO users (id, username, email, password_hash, first_name, last_name, role_id) "
+                    "VALUES (1, 'mrossi', 'm@rossi.it', 'x', 'Mario', 'Rossi', 1)")
+    db.conn.execute("INSERT INTO lead_states (id, name, color, order_index) VALUES (1, 'Nuovo', '#00FF00', 1)")
+    for lead_id in range(1, leads + 1):
+        db.conn.execute(
+            "INSERT INTO leads (id, first_name, last_name, state_id, source_id, assigned_to, created_by) "
+            "VALUES (?, ?, 'Lead', 1, 1, 1, 1)", (lead_id, f"Nome{lead_id}")
+        )
+        for n in range(lead_id % 15):
+            db.conn.execute(
+                "INSERT INTO lead_contacts (lead_id, contact_type, notes, created_by, created_at) "
+                "VALUES (?, 'email', ?, 1, datetime('2025-01-01', ?))", (lead_id, f"contatto {n}", f"+{n} hours")
+            )
+        for n in range(lead_id % 8):
+            db.conn.execute(
+                "INSERT INTO tasks (title, lead_id, state_id, assigned_to, created_by, created_at) "
+                "VALUES (?, ?, 1, 1, 1, datetime('2025-01-01', ?))", (f"task {n}", lead_id, f"+{n} hours")
+            )
+    db.conn.commit()
+    return db
+
+
+def test_contexts_last_n_per_lead():
+    """Ogni lead riceve i propri ultimi contatti e attività, dal più recente"""
+    print("🧪 Test contesto lead...")
+    db = _sqlite_db()
+
+    contexts = db.get_lead_contexts([3, 14, 7, 999], contacts_limit=10, activities_limit=5)
+
+    assert set(contexts) == {3, 14, 7}
+    assert contexts[14]['lead']['first_name'] == 'Nome14'
+    assert contexts[14]['lead']['assigned_first_name'] == 'Mario'
+    assert contexts[14]['lead']['state_name'] == 'Nuovo'
+    assert [c['notes'] for c in contexts[14]['contacts']] == [f"contatto {n}" for n in range(13, 3, -1)]
+    assert len(contexts[3]['contacts']) == 3
+    assert [t['title'] for t in contexts[7]['activities']] == [f"task {n}" for n in range(6, 1, -1)]
+    assert all(t['lead_id'] == 7 for t in contexts[7]['activities'])
+    assert 'row_number' not in contexts[7]['activities'][0]
+    print("✅ Ultimi contatti e attività corretti")
+
+
+def test_constant_query_count():
+    """Il numero di query non cresce con il numero di lead"""
+    print("🧪 Test numero query...")
+    db = _sqlite_db(leads=60)
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+
+    db.get_lead_contexts([1, 2])
+    few = len(statements)
+    statements.clear()
+    contexts = db.get_lead_contexts(list(range(1, 61)))
+
+    assert len(contexts) == 60
+    assert len(statements) == few == 3
+
+    statements.clear()
+    db.get_lead_contexts(list(range(1, 61)), contacts_limit=0, activities_limit=0)
+    assert len(statements) == 1
+    print(f"✅ {len(statements)} query per i soli dati lead, {few} con storico")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio test contesto lead")
+    print("=" * 50)
+
+    test_contexts_last_n_per_lead()
+    test_constant_query_count()
+
+    print("=" * 50)
+    print("🎉 Tutti i test completati!")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Test Lead Deduplication - Test del motore di deduplicazione lead
+Verifica normalizzazione, chiavi di blocco e quasi-duplicati MinHash/LSH
+Creato da Ezio Camporeale
+"""
+
+import sys
+import sqlite3
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from utils.lead_deduplication import (
+    LeadDeduplicator,
+    normalize_email,
+    normalize_phone
+)
+from database.database_manager import DatabaseManager
+
+TEST_LEADS = [
+    {'id': 1, 'name': 'Mario Rossi', 'email': 'Mario.Rossi@Gmail.com', 'phone': '+39 333 123 4567', 'company': 'Rossi Srl'},
+    {'id': 2, 'name': 'Mario Rossi', 'email': 'mario.rossi@gmail.com non spunta', 'phone': None, 'company': ''},
+    {'id': 3, 'name': 'Luigi Bianchi', 'email': 'luigi@bianchi.it', 'phone': '3331234567', 'company': None},
+    {'id': 4, 'name': 'Giuseppe Verdi Consulting', 'email': 'g.verdi@verdi.it', 'phone': '0612345678', 'company': 'Verdi Consulting'},
+    {'id': 5, 'name': 'Giuseppe Verdi Consultin', 'email': 'info@verdi.it', 'phone': None, 'company': 'Verdi Consulting'},
+    {'id': 6, 'name': 'Anna Neri', 'email': 'anna@neri.it', 'phone': '+41 79 123 45 67', 'company': 'Neri AG'},
+]
+
+
+def test_normalization():
+    """Test normalizzazione email e telefono"""
+    print("🧪 Test normalizzazione...")
+    assert normalize_email(' Mario.Rossi@Gmail.com non spunta') == 'mario.rossi@gmail.com'
+    assert normalize_email('senza email') is None
+    assert normalize_phone('p:+39 333 123 4567') == '+393331234567'
+    assert normalize_phone('0039 333 1234567') == '+393331234567'
+    assert normalize_phone('333 123 4567') == '+393331234567'
+    assert normalize_phone('393331234567') == '+393331234567'
+    assert normalize_phone('12') is None
+    print("  ✅ Normalizzazione OK")
+
+
+def test_find_duplicates():
+    """Test ricerca gruppi di duplicati"""
+    print("🧪 Test ricerca duplicati...")
+    groups = LeadDeduplicator().find_duplicates(TEST_LEADS)
+    members = sorted(sorted([g['survivor_id']] + g['duplicate_ids']) for g in groups)
+    # 1-2 stessa email, 1-3 stesso telefono, 4-5 nome+azienda quasi uguali
+    assert members == [[1, 2, 3], [4, 5]]
+    by_survivor = {g['survivor_id']: g for g in groups}
+    assert 1 in by_survivor
+    assert by_survivor[1]['reasons'] == ['email', 'phone']
+    print("  ✅ Ricerca duplicati OK")
+
+
+def test_merge_sqlite():
+    """Test unione su database SQLite in memoria"""
+    print("🧪 Test unione lead...")
+    db = DatabaseManager.__new__(DatabaseManager)
+    db.use_supabase = False
+    db.conn = sqlite3.connect(':memory:')
+    db.conn.row_factory = sqlite3.Row
+    # contact_history come in create_contact_tables.sql: eliminato a cascata con il lead
+    db.conn.executescript("""
+        PRAGMA foreign_keys = ON;
+        CREATE TABLE leads (id INTEGER PRIMARY KEY, name TEXT, email TEXT, phone TEXT, company TEXT, notes TEXT);
+        CREATE TABLE tasks (id INTEGER PRIMARY KEY, lead_id INTEGER);
+        CREATE TABLE lead_contacts (id INTEGER PRIMARY KEY, lead_id INTEGER);
+        CREATE TABLE contact_history (id INTEGER PRIMARY KEY, lead_id INTEGER REFERENCES leads(id) ON DELETE CASCADE);
+        INSERT INTO leads VALUES (1, 'Mario Rossi', 'mario@rossi.it', NULL, NULL, 'primo');
+        INSERT INTO leads VALUES (2, 'Mario Rossi', 'mario@rossi.it', '3331234567', 'Rossi Srl', 'secondo');
+        INSERT INTO tasks (lead_id) VALUES (1), (2), (2);
+        INSERT INTO lead_contacts (lead_id) VALUES (2);
+        INSERT INTO contact_history (lead_id) VALUES (1), (2);
+    """)
+
+    deduplicator = LeadDeduplicator(db_manager=db)
+    leads = db.execute_query("SELECT * FROM leads")
+    groups = deduplicator.find_duplicates(leads)
+    assert len(groups) == 1
+
+    result = deduplicator.merge_group(groups[0])
+    assert result['success']
+    assert result['deleted_count'] == 1
+
+    survivor_id = groups[0]['survivor_id']
+    assert db.execute_query("SELECT COUNT(*) AS n FROM leads")[0]['n'] == 1
+    assert db.execute_query("SELECT COUNT(*) AS n FROM tasks WHERE lead_id = ?", (survivor_id,))[0]['n'] == 3
+    assert db.execute_query("SELECT COUNT(*) AS n FROM lead_contacts WHERE lead_id = ?", (survivor_id,))[0]['n'] == 1
+    # Lo storico del duplicato sopravvive all'eliminazione a cascata
+    assert db.execute_query("SELECT COUNT(*) AS n FROM contact_history WHERE lead_id = ?", (survivor_id,))[0]['n'] == 2
+    assert result['moved']['contact_history'] == 1
+    survivor = db.execute_query("SELECT * FROM leads")[0]
+    assert survivor['phone'] and survivor['company'] == 'Rossi Srl'
+    print("  ✅ Unione lead OK")
+
+
+def test_merge_aborts_when_repoint_fails():
+    """Test che un errore nello spostamento dei task blocchi l'eliminazione"""
+    print("🧪 Test unione interrotta...")
+
+    class FailingQuery:
+        def __init__(self, table):
+            self.table = table
+
+        def update(self, values):
+            return self
+
+        def in_(self, column, values):
+            return self
+
+        def delete(self):
+            raise AssertionError("i duplicati non devono essere eliminati")
+
+        def execute(self):
+            if self.table == 'lead_contacts':
+                error = Exception("relation does not exist")
+                error.code = '42P01'
+                raise error
+            raise Exception("permission denied for table tasks")
+
+    class FailingSupabase:
+        def table(self, name):
+            return FailingQuery(name)
+
+    db = DatabaseManager.__new__(DatabaseManager)
+    db.use_supabase = True
+    db.supabase = FailingSupabase()
+    result = db.merge_leads(1, [2, 3])
+    assert not result['success']
+    assert result['deleted_count'] == 0
+    assert 'permission denied' in result['message']
+
+    # Una tabella assente in SQLite viene saltata, gli altri errori annullano tutto
+    db = DatabaseManager.__new__(DatabaseManager)
+    db.use_supabase = False
+    db.conn = sqlite3.connect(':memory:')
+    db.conn.row_factory = sqlite3.Row
+    db.conn.executescript("""
+        CREATE TABLE leads (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE tasks (id INTEGER PRIMARY KEY, lead_id INTEGER);
+        INSERT INTO leads VALUES (1, 'a'), (2, 'b');
+        INSERT INTO tasks (lead_id) VALUES (2);
+    """)
+    assert db.merge_leads(1, [2])['success']
+
+    db.conn.executescript("""
+        INSERT INTO leads VALUES (3, 'c');
+        INSERT INTO tasks (lead_id) VALUES (3);
+        CREATE TABLE lead_contacts (id INTEGER PRIMARY KEY, lead_id INTEGER);
+        CREATE TRIGGER block BEFORE UPDATE ON lead_contacts BEGIN SELECT RAISE(ABORT, 'bloccato'); END;
+        INSERT INTO lead_contacts (lead_id) VALUES (3);
+    """)
+    result = db.merge_leads(1, [3])
+    assert not result['success']
+    assert db.execute_query("SELECT COUNT(*) AS n FROM leads WHERE id = 3")[0]['n'] == 1
+    assert db.execute_query("SELECT lead_id FROM tasks WHERE id = 2")[0]['lead_id'] == 3
+    print("  ✅ Unione interrotta OK")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio Test Lead Deduplication")
+    print("=" * 50)
+
+    test_normalization()
+    test_find_duplicates()
+    test_merge_sqlite()
+    test_merge_aborts_when_repoint_fails()
+
+    print("=" * 50)
+    print("✅ Test completati!")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Test Lead Scoring - Test dello score qualità vettoriale
+Verifica parità con il calcolo per singolo lead e refresh incrementale
+Creato da Ezio Camporeale
+"""
+
+import sys
+import random
+import sqlite3
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from database.database_manager import DatabaseManager
+from utils.keyword_classifier import TIMELINE_URGENCY_CLASSIFIER
+from utils.lead_scoring import LeadScoringEngine, SCORE_WEIGHTS, categorize_score, LAST_REFRESH_SETTING
+
+
+def _reference_score(lead):
+    """Calcolo per singolo lead (logica originale di LeadAnalyzer)"""
+    score = 0
+    contact_score = sum(5 for field in ('first_name', 'last_name', 'email', 'phone') if lead.get(field))
+    score += contact_score * SCORE_WEIGHTS['contact_info_completeness']
+    company_score = sum(5 for field in ('company', 'industry', 'website') if lead.get(field))
+    score += company_score * SCORE_WEIGHTS['company_info_completeness']
+    budget_score = 0
+    if lead.get('budget'):
+        budget = float(lead['budget'])
+        if budget > 10000: budget_score = 25
+        elif budget > 5000: budget_score = 20
+        elif budget > 1000: budget_score = 15
+        elif budget > 0: budget_score = 10
+    score += budget_score * SCORE_WEIGHTS['budget_indication']
+    timeline_score = {100: 15, 67: 10, 33: 5}.get(TIMELINE_URGENCY_CLASSIFIER.classify(lead.get('notes')), 0)
+    score += timeline_score * SCORE_WEIGHTS['timeline_urgency']
+    source = (lead.get('source') or '').lower()
+    if source in ['referral', 'website', 'linkedin']: source_score = 10
+    elif source in ['email', 'social', 'event']: source_score = 7
+    elif source: source_score = 5
+    else: source_score = 0
+    score += source_score * SCORE_WEIGHTS['source_quality']
+    score += 10 * SCORE_WEIGHTS['interaction_history']
+    return min(100, max(0, int(score)))
+
+
+def test_vectorized_matches_reference():
+    """Lo score vettoriale coincide con quello per singolo lead"""
+    print("🧪 Test parità score...")
+    rng = random.Random(42)
+    notes = [None, '', 'urgente, chiamare subito', 'entro questa settimana', 'prossimo mese', 'nessuna fretta']
+    sources = [None, '', 'Referral', 'linkedin', 'email', 'Event', 'fiera']
+    leads = []
+    for i in range(500):
+        lead = {'id': i}
+        for field in ('first_name', 'last_name', 'email', 'phone', 'company', 'industry', 'website'):
+            lead[field] = rng.choice([None, '', f'{field}_{i}'])
+        lead['budget'] = rng.choice([None, 0, 500, 1000, 1500, 5000, 7500, 10000, 20000])
+        lead['notes'] = rng.choice(notes)
+        lead['source'] = rng.choice(sources)
+        leads.append(lead)
+
+    scores = LeadScoringEngine().score_leads(leads)
+    for lead, score, category in zip(leads, scores['quality_score'], scores['quality_category']):
+        assert score == _reference_score(lead), lead
+        assert category == categorize_score(score)
+    print("  ✅ Parità score OK")
+
+
+def _scoring_db() -> DatabaseManager:
+    db = DatabaseManager.__new__(DatabaseManager)
+    db.use_supabase = False
+    db.conn = sqlite3.connect(':memory:')
+    db.conn.row_factory = sqlite3.Row
+    db.conn.executescript("""
+        CREATE TABLE leads (id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, email TEXT, phone TEXT,
+                            company TEXT, budget DECIMAL(10,2), notes TEXT, quality_score INTEGER,
+                            quality_category VARCHAR(10), updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE settings (id INTEGER PRIMARY KEY AUTOINCREMENT, key VARCHAR(100) UNIQUE NOT NULL,
+                               value TEXT, description TEXT, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TRIGGER update_leads_timestamp AFTER UPDATE ON leads
+            BEGIN UPDATE leads SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id; END;
+        INSERT INTO leads (id, first_name, last_name, email, budget) VALUES (1, 'Mario', 'Rossi', 'mario@rossi.it', 20000);
+        INSERT INTO leads (id, first_name, last_name) VALUES (2, 'Luigi', 'Bianchi');
+    """)
+    return db
+
+
+def test_incremental_refresh_sqlite():
+    """Il refresh scrive solo gli score nuovi o cambiati"""
+    print("🧪 Test refresh incrementale...")
+    db = _scoring_db()
+    engine = LeadScoringEngine(db_manager=db)
+    assert engine.refresh_changed() == {'scored': 2, 'updated': 2}
+    # I lead appena valutati vengono riletti ma non riscritti
+    assert engine.refresh_changed()['updated'] == 0
+
+    db.conn.execute("UPDATE leads SET budget = 500 WHERE id = 1")
+    db.conn.commit()
+    assert engine.refresh_changed()['updated'] == 1
+
+    stored = {row['id']: row for row in db.execute_query("SELECT * FROM leads")}
+    expected = engine.score_leads(db.execute_query("SELECT * FROM leads")).set_index('id')
+    for lead_id, row in stored.items():
+        assert row['quality_score'] == expected.loc[lead_id, 'quality_score']
+        assert row['quality_category'] == expected.loc[lead_id, 'quality_category']
+    print("  ✅ Refresh incrementale OK")
+
+
+def test_failed_refresh_keeps_watermark():
+    """Lettura fallita o salvataggio parziale non spostano il watermark"""
+    print("🧪 Test watermark dopo errore...")
+    db = _scoring_db()
+    engine = LeadScoringEngine(db_manager=db)
+    engine.refresh_changed()
+    db.conn.execute("UPDATE settings SET value = '2000-01-01T00:00:00+00:00' WHERE key = ?", (LAST_REFRESH_SETTING,))
+    db.conn.commit()
+    watermark = db.get_setting(LAST_REFRESH_SETTING)['value']
+
+    def failing_read(*args, **kwargs):
+        raise ConnectionError("Supabase non raggiungibile")
+
+    read = db.get_leads_for_scoring
+    db.get_leads_for_scoring = failing_read
+    try:
+        engine.refresh_changed()
+        assert False, "il refresh doveva fallire"
+    except ConnectionError:
+        pass
+    assert db.get_setting(LAST_REFRESH_SETTING)['value'] == watermark
+
+    # Il ramo Supabase propaga l'errore invece di restituire una lista vuota
+    class _BrokenSupabase:
+        def table(self, name):
+            raise ConnectionError("Supabase non raggiungibile")
+
+    remote = DatabaseManager.__new__(DatabaseManager)
+    remote.use_supabase = True
+    remote.supabase = _BrokenSupabase()
+    for call in (lambda: remote.get_leads_for_scoring(), lambda: remote.update_lead_scores([{'id': 1, 'quality_score': 5, 'quality_category': 'Bassa'}])):
+        try:
+            call()
+            assert False, "l'errore doveva essere propagato"
+        except ConnectionError:
+            pass
+
+    # Salvataggio parziale: uno dei due lead non viene aggiornato
+    db.get_leads_for_scoring = read
+    db.conn.execute("UPDATE leads SET budget = 500, quality_score = NULL WHERE id IN (1, 2)")
+    db.conn.commit()
+    db.update_lead_scores = lambda scores: len(scores) - 1
+    assert engine.refresh_changed()['updated'] == 1
+    assert db.get_setting(LAST_REFRESH_SETTING)['value'] == watermark
+    print("  ✅ Watermark invariato")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio Test Lead Scoring")
+    print("=" * 50)
+
+    test_vectorized_matches_reference()
+    test_incremental_refresh_sqlite()
+    test_failed_refresh_keeps_watermark()
+
+    print("=" * 50)
+    print("✅ Test completati!")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test Mock DeepSeek Server - Test dell'AI Assistant contro il server locale simulato
+Verifica risposte normali e in streaming, errori del server e misure del benchmark
+Creato da Ezio Camporeale
+"""
+
+import sys
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from mock_deepseek_server import MockDeepSeekServer
+from benchmark_ai_assistant import build_assistant, run_benchmark
+
+
+def test_plain_and_streamed_responses():
+    """Risposta completa e in streaming dallo stesso server"""
+    print("🧪 Test risposte normali e streaming...")
+
+    with MockDeepSeekServer(latency=0.01, chunk_delay=0) as server:
+        assistant = build_assistant(server.url)
+
+        plain = assistant.generate_response('custom', {}, custom_prompt='Analizza il lead Rossi')
+        assert plain and 'Risposta simulata' in plain
+
+        chunks = []
+        streamed = assistant.generate_response('custom', {}, custom_prompt='Scrivi uno script per Bianchi',
+                                               on_chunk=chunks.append)
+        assert streamed == ''.join(chunks)
+        assert len(chunks) > 1
+
+        assert server.stats['plain_requests'] == 1
+        assert server.stats['stream_requests'] == 1
+        print("✅ Risposte normali e streaming corrette")
+
+
+def test_server_errors_return_none():
+    """Un server che risponde sempre 500 non produce risposte né voci in cache"""
+    print("🧪 Test errori del server...")
+
+    with MockDeepSeekServer(latency=0, error_rate=1.0) as server:
+        assistant = build_assistant(server.url)
+        assistant.config['retry_attempts'] = 2
+
+        response = assistant.generate_response('custom', {}, custom_prompt='Prompt che fallisce')
+        assert response is None
+        assert server.stats['errors'] == 2
+        assert assistant.cache.stats()['total_cached'] == 0
+        print("✅ Errori gestiti con retry e senza cache")
+
+
+def test_benchmark_counts_api_calls():
+    """Il secondo passaggio sugli stessi lead è servito interamente dalla cache"""
+    print("🧪 Test benchmark...")
+
+    results = {row['feature']: row for row in run_benchmark(leads=3, repeats=2, latency=0.01, batch=False)}
+
+    for feature in ('lead_analysis', 'sales_script', 'marketing_advice'):
+        row = results[feature]
+        assert row['failures'] == 0
+        assert row['api_calls_per_request'] == 0.5
+        assert row['cache_hit_rate'] == 50.0
+        assert row['p95_ms'] >= row['p50_ms'] > 0
+    print("✅ Benchmark: metà delle richieste servite dalla cache")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio test mock DeepSeek")
+    print("=" * 50)
+
+    test_plain_and_streamed_responses()
+    test_server_errors_return_none()
+    test_benchmark_counts_api_calls()
+
+    print("=" * 50)
+    print("🎉 Tutti i test completati!")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test Prompt Builder - Test di compattazione e budget di token dei prompt AI
+Verifica record compatti, storici riassunti e rispetto del budget
+Creato da Ezio Camporeale
+"""
+
+import sys
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from config import AI_PROMPTS
+from components.ai_assistant.prompt_builder import (
+    PromptBuilder, compact_json, compact_record, summarize_history, estimate_tokens, truncate_text
+)
+
+
+def test_compact_record_and_history():
+    """Campi vuoti e tecnici rimossi, storico ridotto agli ultimi elementi"""
+    print("🧪 Test record compatti e storici...")
+    record = compact_record({
+        'id': 5, 'state_id': 2, 'first_name': 'Mario', 'email': None, 'phone': '',
+        'notes': 'molto   interessato\n' * 50, 'created_at': '2025-03-01 10:22:33', 'state_name': 'Nuovo'
+    }, max_text=40)
+    assert set(record) == {'first_name', 'notes', 'created_at', 'state_name'}
+    assert record['created_at'] == '2025-03-01'
+    assert len(record['notes']) == 41
+
+    contacts = [{'contact_type': 'email' if n % 2 else 'sms', 'notes': f"contatto {n}",
+                 'created_at': f"2025-03-{30 - n:02d} 09:00:00"} for n in range(12)]
+    summary = summarize_history(contacts, keep=3, type_fields=('contact_type', 'type'))
+    assert summary['total'] == 12
+    assert [c['notes'] for c in summary['recent']] == ['contatto 0', 'contatto 1', 'contatto 2']
+    assert summary['older'] == 9
+    assert summary['older_by_type'] == {'email': 5, 'sms': 4}
+    assert summary['older_since'] == '2025-03-19'
+    assert estimate_tokens(compact_json(summary)) < estimate_tokens(compact_json(contacts))
+    print("✅ Record e storici compatti")
+
+
+def test_small_prompt_unchanged():
+    """Un prompt entro il budget non viene modificato"""
+    print("🧪 Test prompt entro il budget...")
+    builder = PromptBuilder()
+    data = {'lead_data': '{"first_name":"Mario"}', 'contact_history': '{}', 'recent_activities': '{}'}
+    assert builder.build('lead_analysis', AI_PROMPTS['lead_analysis'], data) == AI_PROMPTS['lead_analysis'].format(**data)
+    assert builder.truncated_prompts == 0
+    print("✅ Prompt invariato")
+
+
+def test_large_prompt_within_budget():
+    """I campi grandi vengono troncati, quelli piccoli restano interi"""
+    print("🧪 Test budget di token...")
+    builder = PromptBuilder(budgets={'lead_analysis': 500, 'default': 800})
+    data = {
+        'lead_data': '{"first_name":"Mario","company":"Rossi Srl"}',
+        'contact_history': compact_json([{'notes': f"contatto numero {n} " * 10} for n in range(200)]),
+        'recent_activities': compact_json([{'title': f"task {n} " * 10} for n in range(100)])
+    }
+
+    prompt = builder.build('lead_analysis', AI_PROMPTS['lead_analysis'], data)
+
+    assert estimate_tokens(prompt) <= 500
+    assert data['lead_data'] in prompt
+    assert prompt.count('…[troncato]') == 2
+    assert builder.truncated_prompts == 1
+
+    custom = builder.fit('custom', 'parola ' * 2000)
+    assert estimate_tokens(custom) <= 800
+    assert truncate_text('breve', 10) == 'breve'
+    print(f"✅ Prompt ridotto a ~{estimate_tokens(prompt)} token")
+
+
+def test_budget_leaves_room_for_answer():
+    """Il budget del prompt non supera il contesto meno i token di risposta"""
+    print("🧪 Test spazio per la risposta...")
+    builder = PromptBuilder(budgets={'default': 10000}, context_window=4000, max_output_tokens=1500)
+    assert builder.budget_for('sales_script') == 2500
+    print("✅ Budget limitato dal contesto del modello")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio test prompt builder")
+    print("=" * 50)
+
+    test_compact_record_and_history()
+    test_small_prompt_unchanged()
+    test_large_prompt_within_budget()
+    test_budget_leaves_room_for_answer()
+
+    print("=" * 50)
+    print("🎉 Tutti i test completati!")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test Session Memory - Test della cronologia AI limitata per sessione
+Verifica ring buffer, budget di memoria e report delle sessioni attive
+Creato da Ezio Camporeale
+"""
+
+import gc
+import sys
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+import streamlit as st
+
+from components.ai_assistant import session_memory
+from components.ai_assistant.session_memory import SessionMemory, get_session_memory_report, _sizeof
+
+
+def test_ring_buffer():
+    """Oltre il numero massimo di scambi restano solo i più recenti"""
+    print("🧪 Test ring buffer cronologia...")
+    memory = SessionMemory(max_entries=3, max_chars=100, budget_bytes=1024 * 1024)
+    for n in range(5):
+        memory.record('sales_script', f"prompt {n}", f"risposta {n}")
+
+    history = memory.history()
+    assert [entry['response'] for entry in history] == ['risposta 2', 'risposta 3', 'risposta 4']
+    assert memory.history(limit=1)[0]['prompt'] == 'prompt 4'
+    usage = memory.usage()
+    assert usage['entries'] == 3
+    assert usage['evictions'] == 2
+    assert usage['bytes'] == sum(_sizeof(entry) for entry in history)
+    print(f"✅ Cronologia limitata a {usage['entries']} scambi ({usage['bytes']} byte)")
+
+
+def test_budget_and_clipping():
+    """I testi lunghi sono tagliati e il budget rimuove gli scambi più vecchi"""
+    print("🧪 Test budget memoria...")
+    memory = SessionMemory(max_entries=100, max_chars=200, budget_bytes=1500)
+    for n in range(20):
+        memory.record('lead_analysis', None, f"{n} " + 'x' * 1000, source='cache')
+
+    usage = memory.usage()
+    history = memory.history()
+    assert usage['bytes'] <= 1500
+    assert 0 < usage['entries'] < 20
+    assert usage['evictions'] == 20 - usage['entries']
+    assert history[-1]['response'].startswith('19 ')
+    assert len(history[-1]['response']) < 250
+    assert history[-1]['source'] == 'cache'
+
+    memory.clear()
+    assert memory.usage()['bytes'] == 0 and memory.history() == []
+    print(f"✅ Budget rispettato: {usage['entries']} scambi in {usage['bytes']} byte")
+
+
+def test_session_report():
+    """Il report elenca le sessioni attive e dimentica quelle chiuse"""
+    print("🧪 Test report sessioni...")
+    heavy = SessionMemory(session_id='pesante')
+    light = SessionMemory(session_id='leggera')
+    heavy.record('marketing_advice', 'p', 'r' * 2000)
+    light.record('marketing_advice', 'p', 'r')
+
+    report = get_session_memory_report()
+    ids = [usage['session_id'] for usage in report]
+    assert ids.index('pesante') < ids.index('leggera')
+
+    del light
+    gc.collect()
+    assert 'leggera' not in [usage['session_id'] for usage in get_session_memory_report()]
+    print(f"✅ Sessioni attive nel report: {len(get_session_memory_report())}")
+
+
+def test_features_share_session_memory():
+    """Assistenti creati dalle diverse funzionalità scrivono nella stessa cronologia di sessione"""
+    print("🧪 Test memoria condivisa nella sessione...")
+    from components.ai_assistant.ai_core import AIAssistant
+
+    original = session_memory.get_script_run_ctx
+    session_memory.get_script_run_ctx = lambda: object()
+    st.session_state.pop('ai_session_memory', None)
+    try:
+        analyzer_assistant = AIAssistant()
+        advisor_assistant = AIAssistant()
+        assert analyzer_assistant.memory is advisor_assistant.memory
+        analyzer_assistant.memory.record('lead_analysis', 'p', 'r')
+        assert advisor_assistant.get_conversation_history()[0]['prompt_type'] == 'lead_analysis'
+    finally:
+        session_memory.get_script_run_ctx = original
+        st.session_state.pop('ai_session_memory', None)
+
+    # Fuori da una sessione ogni assistente ha la sua memoria
+    assert AIAssistant().memory is not AIAssistant().memory
+    print("✅ Una sola memoria per sessione")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio test memoria sessioni AI")
+    print("=" * 50)
+
+    test_ring_buffer()
+    test_budget_and_clipping()
+    test_session_report()
+    test_features_share_session_memory()
+
+    print("=" * 50)
+    print("🎉 Tutti i test completati!")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test Storage Downloads - Test dei download in streaming dello storage
+Verifica richieste Range (anche su file compressi), link temporanei e
+contatori download scritti a blocchi
+Creato da Ezio Camporeale
+"""
+
+import sys
+import gzip
+import tempfile
+from pathlib import Path
+
+import requests
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from components.storage import storage_manager as storage_module
+from components.storage.download_counter import DownloadCounter
+from components.storage.file_server import FileServer, parse_range
+from test_storage_manager import _FakeSupabase, _Upload, _as_admin, _manager
+
+
+def test_parse_range():
+    """Interpretazione degli header Range"""
+    print("🧪 Test header Range...")
+    assert parse_range(None, 100) is None
+    assert parse_range('bytes=0-9', 100) == (0, 9)
+    assert parse_range('bytes=90-', 100) == (90, 99)
+    assert parse_range('bytes=-10', 100) == (90, 99)
+    assert parse_range('bytes=50-500', 100) == (50, 99)
+    assert parse_range('bytes=0-1,5-6', 100) is None
+    assert parse_range('items=0-1', 100) is None
+    for unsatisfiable in ('bytes=100-', 'bytes=-0'):
+        try:
+            parse_range(unsatisfiable, 100)
+            assert False, unsatisfiable
+        except ValueError:
+            pass
+    print("✅ Range interpretati")
+
+
+def test_ranged_streaming_and_single_count():
+    """Il server invia intervalli del file e conta un download per link"""
+    print("🧪 Test server download...")
+    content = bytes(range(256)) * 4096
+    counter = DownloadCounter(_FakeSupabase(), flush_batch=1000)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'video.mp4'
+        path.write_bytes(content)
+        server = FileServer('127.0.0.1', 0, counter=counter, chunk_size=64 * 1024).start()
+        try:
+            url = server.register(path, 'presentazione finale.mp4', 'video/mp4', file_id=7, user_id=1)
+
+            full = requests.get(url, timeout=5)
+            assert full.status_code == 200 and full.content == content
+            assert full.headers['Accept-Ranges'] == 'bytes'
+            assert "presentazione%20finale.mp4" in full.headers['Content-Disposition']
+
+            part = requests.get(url, headers={'Range': 'bytes=1000-1999'}, timeout=5)
+            assert part.status_code == 206
+            assert part.content == content[1000:2000]
+            assert part.headers['Content-Range'] == f"bytes 1000-1999/{len(content)}"
+
+            tail = requests.get(url, headers={'Range': 'bytes=-16'}, timeout=5)
+            assert tail.content == content[-16:]
+
+            outside = requests.get(url, headers={'Range': f'bytes={len(content)}-'}, timeout=5)
+            assert outside.status_code == 416
+
+            assert requests.get(url.replace('/files/', '/files/x'), timeout=5).status_code == 404
+        finally:
+            server.stop()
+
+    # Un solo download nonostante le richieste parziali
+    assert counter.pending() == 1
+    assert server.stats['downloads'] == 1
+    print(f"✅ {server.stats['bytes_sent']} byte inviati in streaming")
+
+
+def test_ranged_streaming_of_compressed_file():
+    """I file salvati in gzip vengono inviati decompressi, anche a intervalli"""
+    print("🧪 Test server download file compresso...")
+    content = b''.join(f"{i};lead;Nuovo\n".encode() for i in range(50000))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'leads.csv.gz'
+        path.write_bytes(gzip.compress(content))
+        server = FileServer('127.0.0.1', 0, chunk_size=16 * 1024).start()
+        try:
+            url = server.register(path, 'leads.csv', 'text/csv', compression='gzip', size=len(content))
+
+            full = requests.get(url, timeout=5)
+            assert full.status_code == 200 and full.content == content
+            assert int(full.headers['Content-Length']) == len(content)
+
+            part = requests.get(url, headers={'Range': 'bytes=300000-300099'}, timeout=5)
+            assert part.status_code == 206 and part.content == content[300000:300100]
+            assert part.headers['Content-Range'] == f"bytes 300000-300099/{len(content)}"
+        finally:
+            server.stop()
+    print("✅ File compresso inviato decompresso")
+
+
+def test_counter_batches_and_retries():
+    """I download vengono scritti con un solo incremento atomico per blocco"""
+    print("🧪 Test contatori download...")
+    supabase = _FakeSupabase()
+    files = supabase.table('storage_files')
+    files.rows = [{'id': 1, 'download_count': 5}, {'id': 2, 'download_count': 0}]
+    counter = DownloadCounter(supabase, flush_batch=1000)
+
+    for file_id in (1, 1, 2, 1):
+        counter.record(file_id, user_id=3)
+    supabase.rpc_error = RuntimeError('rete non disponibile')
+    assert counter.flush() == 0
+    assert counter.pending() == 4
+
+    supabase.rpc_error = None
+    assert counter.flush() == 4
+    assert supabase.rpc_calls == [('increment_storage_download_counts', {'file_ids': [1, 2], 'amounts': [3, 1]})]
+    assert [row['download_count'] for row in files.rows] == [8, 1]
+    assert len(supabase.table('storage_downloads').rows) == 4
+    assert counter.flush() == 0
+    print("✅ 4 download scritti con una chiamata")
+
+
+@_as_admin
+def test_manager_download_paths():
+    """Link al server download e download diretto registrano il download senza scritture sincrone"""
+    print("🧪 Test download dal manager...")
+    counter = DownloadCounter(None, flush_batch=1000)
+    original_server, original_counter = storage_module.get_file_server, storage_module.get_download_counter
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = _manager(Path(tmp))
+        counter.supabase = manager.supabase
+        server = FileServer('127.0.0.1', 0, counter=counter).start()
+        storage_module.get_file_server = lambda supabase=None: server
+        storage_module.get_download_counter = lambda supabase=None: counter
+        try:
+            file_id = manager.upload_file(_Upload('listino.csv', b'a;b\n1;2\n'))['file_id']
+
+            ok, url = manager.get_download_link(file_id)
+            assert ok, url
+            assert requests.get(url, timeout=5).content == b'a;b\n1;2\n'
+
+            ok, filename, content = manager.download_file(file_id)
+            assert ok and filename == 'listino.csv' and content == b'a;b\n1;2\n'
+            assert manager.supabase.table('storage_downloads').rows == []
+
+            assert counter.flush() == 2
+            assert manager.supabase.table('storage_files').rows[0]['download_count'] == 2
+        finally:
+            server.stop()
+            storage_module.get_file_server, storage_module.get_download_counter = original_server, original_counter
+    print("✅ Download registrati a blocchi")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio test download storage")
+    print("=" * 50)
+
+    test_parse_range()
+    test_ranged_streaming_and_single_count()
+    test_ranged_streaming_of_compressed_file()
+    test_counter_batches_and_retries()
+    test_manager_download_paths()
+
+    print("=" * 50)
+    print("🎉 Tutti i test completati!")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test Storage Maintenance - Test della verifica integrità dello storage
+Verifica il confronto disco/database (file mancanti e orfani) e la
+verifica incrementale degli hash
+Creato da Ezio Camporeale
+"""
+
+import os
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from utils import storage_maintenance as maintenance_module
+from utils.storage_maintenance import StorageScanner
+from test_storage_manager import _Upload, _as_admin, _manager
+
+
+def _upload_all(manager, files):
+    for name, content in files:
+        assert manager.upload_file(_Upload(name, content))['success']
+    return manager.supabase.table('storage_files').rows
+
+
+@_as_admin
+def test_scan_finds_missing_orphaned_and_corrupt():
+    """Record senza file, file senza record e contenuti alterati"""
+    print("🧪 Test verifica integrità...")
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        manager = _manager(root)
+        rows = _upload_all(manager, [
+            ('listino.pdf', b'%PDF listino ' * 1000),
+            ('listino copia.pdf', b'%PDF listino ' * 1000),
+            ('leads.csv', b'1;Mario Rossi;Nuovo\n' * 5000),
+            ('contratto.pdf', b'%PDF contratto ' * 1000),
+            ('brochure.pdf', b'%PDF brochure ' * 1000)
+        ])
+
+        # Blob eliminato, blob alterato (stessa dimensione) e file orfani
+        os.remove(manager.resolve_path(rows[3]['file_path']))
+        brochure = manager.resolve_path(rows[4]['file_path'])
+        brochure.write_bytes(b'X' + brochure.read_bytes()[1:])
+        (manager.blob_dir / 'ff').mkdir()
+        (manager.blob_dir / 'ff' / 'ff00').write_bytes(b'orfano')
+        (manager.storage_dir / 'vecchio.txt').write_bytes(b'legacy')
+
+        scanner = StorageScanner(manager.supabase, root, verify_limit=10, workers=2)
+        report = scanner.scan()
+
+        assert [row['id'] for row in report['missing']] == [rows[3]['id']]
+        assert report['orphaned'] == ['storage/blobs/ff/ff00', 'storage/uploads/vecchio.txt']
+        assert [row['id'] for row in report['corrupt']] == [rows[4]['id']]
+        assert report['verified'] == 3 and report['pending_verification'] == 0
+        assert report['records'] == 5 and report['files_on_disk'] == 5
+
+        # I record verificati (anche quelli che condividono il blob) sono marcati
+        verified = {row['id'] for row in manager.supabase.table('storage_files').rows if row.get('last_verified_at')}
+        assert verified == {rows[0]['id'], rows[1]['id'], rows[2]['id']}
+
+        # Orfani eliminati solo dopo il periodo di tolleranza
+        assert report['listing_complete']
+        assert scanner.remove_orphans(report) == []
+        old = time.time() - 7200
+        for relative in report['orphaned']:
+            os.utime(root / relative, (old, old))
+        assert scanner.remove_orphans(report) == report['orphaned']
+        assert not (manager.blob_dir / 'ff').exists()
+
+        assert scanner.deactivate_records(report['missing']) == 1
+        assert scanner.scan(verify=False)['missing'] == []
+    print("✅ 1 mancante, 2 orfani, 1 corrotto")
+
+
+@_as_admin
+def test_listing_paged_and_orphans_kept_when_incomplete():
+    """I record sono letti a pagine; con una lista parziale gli orfani non vengono eliminati"""
+    print("🧪 Test lista record a pagine...")
+    original_page_size = maintenance_module.PAGE_SIZE
+    maintenance_module.PAGE_SIZE = 2
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = _manager(Path(tmp))
+            _upload_all(manager, [(f'file{i}.pdf', f'%PDF {i} '.encode() * 100) for i in range(5)])
+            scanner = StorageScanner(manager.supabase, Path(tmp), verify_limit=0)
+
+            report = scanner.scan()
+            assert report['records'] == 5 and report['orphaned'] == [] and report['listing_complete']
+
+            # Il database conta più record di quelli letti: lista non affidabile
+            full = list(manager.supabase.table('storage_files').rows)
+            scanner.load_records = lambda: ({}, False)
+            report = scanner.scan(verify=False)
+            assert len(report['orphaned']) == 5 and not report['listing_complete']
+            try:
+                scanner.remove_orphans(report)
+                assert False, "eliminazione rifiutata attesa"
+            except RuntimeError:
+                pass
+            assert all(manager.resolve_path(row['file_path']).exists() for row in full)
+    finally:
+        maintenance_module.PAGE_SIZE = original_page_size
+    print("✅ Orfani conservati con lista incompleta")
+
+
+@_as_admin
+def test_verification_is_incremental():
+    """Ogni esecuzione verifica un blocco limitato, partendo dai meno recenti"""
+    print("🧪 Test verifica incrementale...")
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = _manager(Path(tmp))
+        rows = _upload_all(manager, [(f'file{i}.pdf', f'%PDF {i} '.encode() * 500) for i in range(5)])
+        scanner = StorageScanner(manager.supabase, Path(tmp), verify_limit=2, workers=2)
+
+        checked = []
+        original_hash = scanner.hash_file
+        scanner.hash_file = lambda path, compression=None: checked.append(path.name) or original_hash(path, compression)
+
+        for expected_pending in (3, 3, 3):
+            report = scanner.scan()
+            assert report['verified'] == 2 and report['pending_verification'] == expected_pending
+            assert report['corrupt'] == []
+
+        # 6 verifiche su 5 blob: tutti verificati prima di ricominciare dai più vecchi
+        assert set(checked[:5]) == {row['content_hash'] for row in rows}
+        assert checked[5] in checked[:2]
+    print("✅ Blob verificati a rotazione")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio test manutenzione storage")
+    print("=" * 50)
+
+    test_scan_finds_missing_orphaned_and_corrupt()
+    test_listing_paged_and_orphans_kept_when_incomplete()
+    test_verification_is_incremental()
+
+    print("=" * 50)
+    print("🎉 Tutti i test completati!")
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Test Storage Manager - Test della gestione file dello storage
+Verifica upload in streaming con hash calcolati durante la scrittura e
+deduplicazione dei contenuti con conteggio dei riferimenti e compressione
+dei file comprimibili, lista paginata e statistiche lato server
+Creato da Ezio Camporeale
+"""
+
+import io
+import os
+import sys
+import gzip
+import hashlib
+import tempfile
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from config import STORAGE_CONFIG
+from components.storage import storage_manager as storage_module
+from components.storage.storage_manager import StorageManager
+
+
+class _Result:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Query:
+    """Query builder minimale compatibile con il client Supabase"""
+
+    def __init__(self, table, action, payload=None):
+        self.table = table
+        self.action = action
+        self.payload = payload
+        self.filters = []
+        self.with_count = False
+        self.max_rows = None
+        self.ordering = None
+
+    def select(self, *args, count=None):
+        self.with_count = count == 'exact'
+        return self
+
+    def limit(self, count):
+        self.max_rows = count
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) > value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) < value)
+        return self
+
+    def ilike(self, column, pattern):
+        term = pattern.strip('%').lower()
+        self.filters.append(lambda row: term in (row.get(column) or '').lower())
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self.ordering = (column, desc)
+        return self
+
+    def execute(self):
+        rows = [row for row in self.table.rows if all(check(row) for check in self.filters)]
+        if self.ordering:
+            rows.sort(key=lambda row: row[self.ordering[0]], reverse=self.ordering[1])
+        if self.action == 'insert':
+            inserted = []
+            for payload in (self.payload if isinstance(self.payload, list) else [self.payload]):
+                row = dict(payload, id=len(self.table.rows) + 1, is_active=True, download_count=0)
+                self.table.rows.append(row)
+                inserted.append(dict(row))
+            return _Result(inserted)
+        if self.action == 'update':
+            for row in rows:
+                row.update(self.payload)
+        count = len(rows) if self.with_count else None
+        return _Result([dict(row) for row in rows[:self.max_rows]], count)
+
+
+class _Table:
+    def __init__(self):
+        self.rows = []
+
+    def select(self, *args, **kwargs):
+        return _Query(self, 'select').select(*args, **kwargs)
+
+    def insert(self, payload):
+        return _Query(self, 'insert', payload)
+
+    def update(self, payload):
+        return _Query(self, 'update', payload)
+
+
+def _storage_stats(rows):
+    """Stesso risultato della funzione SQL get_storage_stats"""
+    active = [row for row in rows if row['is_active']]
+    categories, blobs = {}, {}
+    for row in active:
+        category = categories.setdefault(row['category'], {'count': 0, 'size': 0})
+        category['count'] += 1
+        category['size'] += row['file_size']
+        blobs[row.get('content_hash') or str(row['id'])] = row.get('stored_size') or row['file_size']
+    return {'categories': categories, 'stored_size': sum(blobs.values())}
+
+
+class _Rpc:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        if self.client.rpc_error:
+            raise self.client.rpc_error
+        self.client.rpc_calls.append((self.name, self.params))
+        if self.name == 'increment_storage_download_counts':
+            files = {row['id']: row for row in self.client.table('storage_files').rows}
+            for file_id, amount in zip(self.params['file_ids'], self.params['amounts']):
+                files[file_id]['download_count'] += amount
+        if self.name == 'get_storage_stats':
+            return _Result(_storage_stats(self.client.table('storage_files').rows))
+        return _Result(None)
+
+
+class _FakeSupabase:
+    def __init__(self):
+        self.tables = {}
+        self.rpc_calls = []
+        self.rpc_error = None
+
+    def table(self, name):
+        return self.tables.setdefault(name, _Table())
+
+    def rpc(self, name, params):
+        return _Rpc(self, name, params)
+
+
+class _Admin:
+    def get_current_user(self):
+        return {'id': 1, 'username': 'admin', 'role_name': 'Admin'}
+
+
+class _Stream:
+    """Stream non in memoria (es. file su disco o rete): conta le letture"""
+
+    def __init__(self, name, content):
+        self.name = name
+        self._buffer = io.BytesIO(content)
+        self.bytes_read = 0
+
+    def seek(self, offset):
+        self._buffer.seek(offset)
+
+    def read(self, size=-1):
+        chunk = self._buffer.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+class _Upload(io.BytesIO):
+    """File caricato in memoria, come UploadedFile di Streamlit"""
+
+    def __init__(self, name, content):
+        super().__init__(content)
+        self.name = name
+
+
+def _manager(root: Path) -> StorageManager:
+    manager = StorageManager.__new__(StorageManager)
+    manager.supabase = _FakeSupabase()
+    manager._init_dirs(root)
+    manager.categories = {'Documenti': ['pdf'], 'Altro': []}
+    return manager
+
+
+def _as_admin(test):
+    """Esegue il test con un utente admin autenticato"""
+    def wrapper():
+        original_auth = storage_module.auth_manager
+        storage_module.auth_manager = _Admin()
+        try:
+            test()
+        finally:
+            storage_module.auth_manager = original_auth
+    wrapper.__name__ = test.__name__
+    wrapper.__doc__ = test.__doc__
+    return wrapper
+
+
+@_as_admin
+def test_streamed_upload_hashes():
+    """L'upload legge il file una sola volta e salva SHA-256 e MD5"""
+    print("🧪 Test upload in streaming...")
+    content = bytes(range(256)) * (STORAGE_CONFIG['chunk_size'] // 256 * 3 + 7)
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = _manager(Path(tmp))
+        upload = _Stream('brochure.pdf', content)
+        result = manager.upload_file(upload, description='Brochure')
+
+        assert result['success'], result['message']
+        assert upload.bytes_read == len(content)
+        row = manager.supabase.table('storage_files').rows[0]
+        assert row['file_size'] == len(content)
+        assert row['content_hash'] == hashlib.sha256(content).hexdigest()
+        assert row['md5_hash'] == hashlib.md5(content).hexdigest()
+        assert row['category'] == 'Documenti'
+
+        stored = manager.resolve_path(row['file_path'])
+        assert stored.read_bytes() == content
+        assert manager.calculate_file_hash(str(stored), 'sha256') == row['content_hash']
+        assert list(manager.temp_dir.iterdir()) == []
+    print(f"✅ {len(content)} byte letti una sola volta")
+
+
+@_as_admin
+def test_identical_uploads_share_blob():
+    """Contenuti identici condividono un blob, eliminato con l'ultimo riferimento"""
+    print("🧪 Test deduplicazione...")
+    content = b'%PDF brochure ' * 10000
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = _manager(Path(tmp))
+        first = manager.upload_file(_Upload('brochure.pdf', content))
+        second = manager.upload_file(_Stream('brochure copia.pdf', content))
+        third = manager.upload_file(_Upload('brochure (2).pdf', content))
+        manager.upload_file(_Upload('listino.pdf', b'listino'))
+
+        assert not first['deduplicated'] and second['deduplicated'] and third['deduplicated']
+        blobs = [path for path in manager.blob_dir.rglob('*') if path.is_file()]
+        assert len(blobs) == 2
+        rows = manager.supabase.table('storage_files').rows
+        assert len({row['file_path'] for row in rows[:3]}) == 1
+        assert [row['original_filename'] for row in rows[:3]] == ['brochure.pdf', 'brochure copia.pdf', 'brochure (2).pdf']
+        assert manager.count_blob_references(rows[0]['content_hash']) == 3
+
+        blob = manager.resolve_path(rows[0]['file_path'])
+        for result in (first, second):
+            assert manager.delete_file(result['file_id'])['success']
+            assert blob.exists()
+        assert manager.delete_file(third['file_id'])['success']
+        assert not blob.exists()
+        assert manager.resolve_path(rows[3]['file_path']).exists()
+        assert list(manager.temp_dir.iterdir()) == []
+    print("✅ 3 upload identici, 1 blob eliminato con l'ultimo riferimento")
+
+
+@_as_admin
+def test_upload_survives_concurrent_release():
+    """Un blob rilasciato da un'eliminazione durante l'upload viene riscritto prima di registrarlo"""
+    print("🧪 Test upload con eliminazione concorrente...")
+    content = b'%PDF listino ' * 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = _manager(Path(tmp))
+        first = manager.upload_file(_Upload('listino.pdf', content))
+        store_blob = manager.store_blob
+
+        def store_then_delete(*args, **kwargs):
+            stored = store_blob(*args, **kwargs)
+            if stored['deduplicated'] and manager.count_blob_references(stored['content_hash']):
+                # L'ultimo riferimento sparisce tra il riuso del blob e la registrazione
+                assert manager.delete_file(first['file_id'])['success']
+            return stored
+
+        manager.store_blob = store_then_delete
+        second = manager.upload_file(_Stream('listino copia.pdf', content))
+
+        assert second['success'], second['message']
+        row = manager.supabase.table('storage_files').rows[-1]
+        assert manager.count_blob_references(row['content_hash']) == 1
+        assert manager.resolve_path(row['file_path']).read_bytes() == content
+    print("✅ Blob riscritto e registrato")
+
+
+def test_failed_write_leaves_nothing():
+    """Un errore durante la copia non lascia file parziali"""
+    print("🧪 Test upload interrotto...")
+
+    class _Broken(_Stream):
+        def read(self, size=-1):
+            if self.bytes_read:
+                raise IOError("connessione interrotta")
+            return super().read(size)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = _manager(Path(tmp))
+        destination = manager.storage_dir / 'parziale.bin'
+        try:
+            manager.write_stream(_Broken('parziale.bin', b'x' * (STORAGE_CONFIG['chunk_size'] * 2)), destination)
+            assert False, "errore atteso"
+        except IOError:
+            pass
+        assert not destination.exists()
+        assert list(manager.temp_dir.iterdir()) == []
+    print("✅ Nessun file parziale")
+
+
+@_as_admin
+def test_compressible_files_stored_gzipped():
+    """CSV e testo vengono salvati in gzip, i formati già compressi restano intatti"""
+    print("🧪 Test compressione...")
+    csv_content = ''.join(f"{i};Mario Rossi;mario{i}@example.com;Nuovo\n" for i in range(20000)).encode()
+    png_content = b'\x89PNG' + bytes(range(256)) * 100
+    random_content = os.urandom(4096)
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = _manager(Path(tmp))
+        assert manager.is_compressible('leads.csv') and manager.is_compressible('note.txt')
+        assert not manager.is_compressible('logo.png') and not manager.is_compressible('contratto.docx')
+
+        for upload in (_Upload('leads.csv', csv_content), _Stream('leads copia.csv', csv_content),
+                       _Upload('logo.png', png_content), _Stream('casuale.txt', random_content)):
+            assert manager.upload_file(upload)['success']
+        rows = manager.supabase.table('storage_files').rows
+
+        csv_row = rows[0]
+        assert csv_row['compression'] == 'gzip' and csv_row['file_path'].endswith('.gz')
+        assert csv_row['content_hash'] == hashlib.sha256(csv_content).hexdigest()
+        assert csv_row['file_size'] == len(csv_content) and csv_row['stored_size'] < len(csv_content) / 4
+        blob = manager.resolve_path(csv_row['file_path'])
+        assert blob.stat().st_size == csv_row['stored_size']
+        assert gzip.decompress(blob.read_bytes()) == csv_content
+        assert rows[1]['file_path'] == csv_row['file_path'] and rows[1]['stored_size'] == csv_row['stored_size']
+
+        # Nessun risparmio: salvati non compressi
+        assert rows[2]['compression'] is None and rows[2]['stored_size'] == len(png_content)
+        assert rows[3]['compression'] is None and manager.resolve_path(rows[3]['file_path']).stat().st_size == len(random_content)
+
+        ok, filename, content = manager.download_file(csv_row['id'])
+        assert ok and filename == 'leads.csv' and content == csv_content
+
+        stats = manager.get_storage_stats()
+        assert stats['total_size'] == 2 * len(csv_content) + len(png_content) + len(random_content)
+        assert stats['stored_size'] == csv_row['stored_size'] + len(png_content) + len(random_content)
+        assert stats['saved_size'] == stats['total_size'] - stats['stored_size']
+
+        for row in rows[:2]:
+            assert manager.delete_file(row['id'])['success']
+        assert not blob.exists()
+        assert list(manager.temp_dir.iterdir()) == []
+    print(f"✅ CSV da {len(csv_content)} a {csv_row['stored_size']} byte")
+
+
+def test_keyset_pages_and_server_stats():
+    """Lista a pagine per chiave con filtri e statistiche calcolate dal database"""
+    print("🧪 Test lista paginata...")
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = _manager(Path(tmp))
+        files = manager.supabase.table('storage_files')
+        for i in range(120):
+            files.insert({
+                'original_filename': f"{'listino' if i % 3 == 0 else 'report'}_{i}.pdf",
+                'category': 'Documenti' if i % 2 else 'Altro',
+                'file_size': 100
+            }).execute()
+        files.rows[5]['is_active'] = False
+
+        pages, after_id = [], None
+        while True:
+            page, after_id = manager.get_files_page(after_id=after_id, page_size=50)
+            pages.append([row['id'] for row in page])
+            if after_id is None:
+                break
+        assert [len(page) for page in pages] == [50, 50, 19]
+        ids = [file_id for page in pages for file_id in page]
+        assert ids == sorted(ids, reverse=True) and 6 not in ids
+
+        # Filtri combinati: stessi risultati della lista completa
+        listini = manager.get_files(category='Documenti', search='LISTINO')
+        expected = [row['id'] for row in reversed(files.rows)
+                    if row['is_active'] and row['category'] == 'Documenti' and 'listino' in row['original_filename']]
+        assert [row['id'] for row in listini] == expected and len(expected) == 20
+
+        page, after_id = manager.get_files_page(category='Altro', page_size=60)
+        assert len(page) == 60 and after_id is None
+
+        stats = manager.get_storage_stats()
+        assert manager.supabase.rpc_calls[-1][0] == 'get_storage_stats'
+        assert stats['total_files'] == 119 and stats['total_size'] == 11900
+        assert stats['categories'] == {'Altro': {'count': 60, 'size': 6000}, 'Documenti': {'count': 59, 'size': 5900}}
+    print(f"✅ {len(ids)} file in {len(pages)} pagine")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio test storage manager")
+    print("=" * 50)
+
+    test_streamed_upload_hashes()
+    test_identical_uploads_share_blob()
+    test_upload_survives_concurrent_release()
+    test_failed_write_leaves_nothing()
+    test_compressible_files_stored_gzipped()
+    test_keyset_pages_and_server_stats()
+
+    print("=" * 50)
+    print("🎉 Tutti i test completati!")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Test Storage Previews - Test della cache anteprime dello storage
+Verifica miniature generate una sola volta per contenuto, limite di spazio
+LRU e integrazione con upload, lista file ed eliminazione
+Creato da Ezio Camporeale
+"""
+
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from PIL import Image
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from components.storage import storage_manager as storage_module
+from components.storage.preview_cache import PreviewCache
+from test_storage_manager import _Upload, _as_admin, _manager
+
+
+def _image_bytes(size, color, mode='RGB', fmt='PNG'):
+    output = io.BytesIO()
+    Image.new(mode, size, color).save(output, fmt)
+    return output.getvalue()
+
+
+def test_thumbnails_generated_once():
+    """Le miniature sono JPEG piccoli, generati una volta per hash"""
+    print("🧪 Test generazione miniature...")
+    photo = _image_bytes((3000, 2000), (200, 30, 30), fmt='JPEG')
+    logo = _image_bytes((800, 800), (0, 0, 255, 128), mode='RGBA')
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = PreviewCache(Path(tmp), size=160)
+        opened = []
+
+        def opener(content):
+            def open_source():
+                opened.append(1)
+                return io.BytesIO(content)
+            return open_source
+
+        first = cache.get_or_create('aa' * 32, 'image/jpeg', opener(photo))
+        second = cache.get_or_create('aa' * 32, 'image/jpeg', opener(photo))
+        assert first == second and len(opened) == 1
+        thumbnail = Image.open(io.BytesIO(first))
+        assert thumbnail.format == 'JPEG' and max(thumbnail.size) <= 160
+        assert len(first) < 5 * 1024
+
+        assert Image.open(io.BytesIO(cache.get_or_create('bb' * 32, 'image/png', opener(logo)))).mode == 'RGB'
+
+        # Tipi senza anteprima e contenuti non validi (tentati una sola volta)
+        assert cache.get_or_create('cc' * 32, 'text/csv', opener(b'a;b')) is None
+        assert cache.get_or_create('dd' * 32, 'image/png', opener(b'non immagine')) is None
+        assert cache.get_or_create('dd' * 32, 'image/png', opener(b'non immagine')) is None
+        assert len(opened) == 3 and cache.stats['errors'] == 1
+    print(f"✅ Miniatura da {len(photo)} a {len(first)} byte")
+
+
+def test_lru_size_cap():
+    """Oltre il limite vengono eliminate le anteprime usate meno di recente"""
+    print("🧪 Test limite cache...")
+    with tempfile.TemporaryDirectory() as tmp:
+        # 8 anteprime di circa 2,4 KB: il limite obbliga a eliminarne due
+        cache = PreviewCache(Path(tmp), max_bytes=17_000, size=64)
+        hashes = [f"{i:02x}" * 32 for i in range(8)]
+        for i, content_hash in enumerate(hashes):
+            output = io.BytesIO()
+            Image.effect_noise((64, 64), 80 + i).convert('RGB').save(output, 'PNG')
+            cache.get_or_create(content_hash, 'image/png', lambda data=output.getvalue(): io.BytesIO(data))
+            if i < 4:
+                # Accessi in ordine: il primo hash è il meno recente...
+                os.utime(cache.path_for(content_hash), (1000 + i, 1000 + i))
+            if i == 3:
+                # ...ma viene riletto prima delle nuove anteprime
+                cache.get(hashes[0])
+
+        assert cache.total_bytes() <= 17_000
+        assert cache.stats['evicted'] == 2
+        assert not cache.path_for(hashes[1]).exists() and not cache.path_for(hashes[2]).exists()
+        assert all(cache.path_for(content_hash).exists() for content_hash in hashes[:1] + hashes[3:])
+    print(f"✅ {cache.stats['evicted']} anteprime eliminate, {cache.total_bytes()} byte in cache")
+
+
+@_as_admin
+def test_manager_previews():
+    """Anteprima all'upload, rigenerata alla prima visualizzazione ed eliminata con il blob"""
+    print("🧪 Test anteprime dal manager...")
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = _manager(Path(tmp))
+        manager.upload_file(_Upload('foto.png', _image_bytes((1200, 900), (10, 120, 10))))
+        manager.upload_file(_Upload('listino.csv', b'a;b\n1;2\n'))
+        files, _ = manager.get_files_page()
+        csv_file, photo = files
+
+        preview_path = next(manager.preview_dir.rglob('*.jpg'))
+        assert preview_path.name == f"{photo['content_hash']}.jpg"
+        assert manager.get_preview(csv_file) is None
+
+        os.remove(preview_path)
+        preview = manager.get_preview(photo)
+        assert preview and preview_path.exists() and max(Image.open(io.BytesIO(preview)).size) <= 160
+
+        assert manager.delete_file(photo['id'])['success']
+        assert not preview_path.exists()
+    print("✅ Anteprime gestite per hash")
+
+
+@_as_admin
+def test_preview_error_does_not_fail_upload():
+    """Un errore dell'anteprima (es. disco pieno) non fa fallire un upload già salvato"""
+    print("🧪 Test upload con errore anteprima...")
+
+    class _BrokenCache:
+        def get_or_create(self, *args):
+            raise OSError("No space left on device")
+
+    original = storage_module.get_preview_cache
+    storage_module.get_preview_cache = lambda cache_dir: _BrokenCache()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = _manager(Path(tmp))
+            result = manager.upload_file(_Upload('foto.png', _image_bytes((300, 200), (200, 10, 10))))
+            assert result['success'], result['message']
+            row = manager.supabase.table('storage_files').rows[0]
+            assert manager.resolve_path(row['file_path']).exists()
+    finally:
+        storage_module.get_preview_cache = original
+    print("✅ Upload riuscito senza anteprima")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio test anteprime storage")
+    print("=" * 50)
+
+    test_thumbnails_generated_once()
+    test_lru_size_cap()
+    test_manager_previews()
+    test_preview_error_does_not_fail_upload()
+
+    print("=" * 50)
+    print("🎉 Tutti i test completati!")
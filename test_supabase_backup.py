@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Test Supabase Backup - Test del backup del database Supabase
+Verifica backup completo oltre il limite di righe dell'API, tabelle scaricate
+in parallelo e scritte in streaming nei file SQLite, JSONL e SQL
+Creato da Ezio Camporeale
+"""
+
+import json
+import sqlite3
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from postgrest.exceptions import APIError
+
+from config import BACKUP_CONFIG
+from database.backup_supabase import SupabaseBackup
+
+# Righe massime per richiesta, come il max-rows di PostgREST
+SERVER_MAX_ROWS = 70
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, client, table_name):
+        self.client = client
+        self.table_name = table_name
+        self.key = None
+        self.after = None
+        self.max_rows = None
+        self.offsets = None
+
+    def select(self, columns):
+        return self
+
+    def order(self, column):
+        self.key = column
+        return self
+
+    def gt(self, column, value):
+        self.after = value
+        return self
+
+    def limit(self, count):
+        self.max_rows = count
+        return self
+
+    def range(self, start, end):
+        self.offsets = (start, end)
+        self.client.range_requests += 1
+        return self
+
+    def execute(self):
+        self.client.threads.add(threading.current_thread().name)
+        rows = self.client.tables[self.table_name]
+        if self.table_name in self.client.broken:
+            raise RuntimeError(f"connessione interrotta (order by {self.key})")
+        if self.key is not None:
+            if rows and self.key not in rows[0]:
+                raise APIError({'code': '42703', 'message': f'column {self.table_name}.{self.key} does not exist',
+                                'details': None, 'hint': None})
+            rows = sorted(rows, key=lambda row: row[self.key])
+            if self.after is not None:
+                rows = [row for row in rows if row[self.key] > self.after]
+            rows = rows[:self.max_rows]
+        if self.offsets:
+            rows = rows[self.offsets[0]:self.offsets[1] + 1]
+        self.client.requests += 1
+        return _Result([dict(row) for row in rows[:SERVER_MAX_ROWS]])
+
+
+class _Rpc:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def execute(self):
+        return _Result([{'table_name': name} for name in self.tables])
+
+
+class _FakeSupabase:
+    def __init__(self, tables, broken=()):
+        self.tables = tables
+        self.broken = set(broken)
+        self.threads = set()
+        self.requests = 0
+        self.range_requests = 0
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params):
+        return _Rpc(self.tables)
+
+
+def _tables():
+    return {
+        'leads': [{'id': i, 'name': f"Lead {i}", 'email': f"lead{i}@example.com", 'notes': None,
+                   'tags': ['vip'] if i % 10 == 0 else []} for i in range(1, 2501)],
+        'tasks': [{'id': i, 'title': f"Chiamare l'utente {i}", 'lead_id': i} for i in range(1, 201)],
+        'settings': [{'key': f"opzione_{i}", 'value': str(i)} for i in range(150)],
+        'roles': []
+    }
+
+
+def test_full_backup_is_complete():
+    """Tabelle oltre il limite di righe dell'API salvate per intero in tutti i formati"""
+    print("🧪 Test backup completo...")
+    tables = _tables()
+    supabase = _FakeSupabase(tables)
+    with tempfile.TemporaryDirectory() as tmp:
+        config = dict(BACKUP_CONFIG, page_size=100, workers=3, queue_pages=2, commit_rows=500)
+        files = SupabaseBackup(supabase, Path(tmp), config).run_full_backup()
+
+        manifest = json.loads(Path(files['manifest']).read_text(encoding='utf-8'))
+        assert manifest['complete'] and manifest['total_records'] == 2850
+        assert manifest['records'] == {'leads': 2500, 'tasks': 200, 'settings': 150, 'roles': 0}
+
+        conn = sqlite3.connect(files['sqlite'])
+        assert conn.execute("SELECT COUNT(*), COUNT(DISTINCT id) FROM leads").fetchone() == (2500, 2500)
+        assert conn.execute("SELECT COUNT(*) FROM settings").fetchone() == (150,)
+        assert conn.execute("SELECT notes, tags FROM leads WHERE id = 10").fetchone() == (None, '["vip"]')
+        conn.close()
+
+        lines = Path(files['jsonl']).read_text(encoding='utf-8').splitlines()
+        assert len(lines) == 2850
+        assert sorted(json.loads(line)['row']['id'] for line in lines if '"table": "tasks"' in line) == list(range(1, 201))
+
+        sql = Path(files['sql']).read_text(encoding='utf-8')
+        assert sql.count("INSERT INTO leads") == 2500
+        assert "'Chiamare l''utente 7'" in sql and "NULL" in sql
+
+    assert len({name for name in supabase.threads if name.startswith('backup')}) > 1
+    print(f"✅ 2850 record in {supabase.requests} richieste")
+
+
+def test_failed_table_marks_backup_incomplete():
+    """Un errore su una tabella non blocca le altre e rende il backup incompleto"""
+    print("🧪 Test tabella non disponibile...")
+    supabase = _FakeSupabase(_tables(), broken={'tasks'})
+    with tempfile.TemporaryDirectory() as tmp:
+        config = dict(BACKUP_CONFIG, page_size=100, workers=2, queue_pages=1)
+        files = SupabaseBackup(supabase, Path(tmp), config).run_full_backup()
+        manifest = json.loads(Path(files['manifest']).read_text(encoding='utf-8'))
+        assert not manifest['complete']
+        assert list(manifest['errors']) == ['tasks']
+        assert manifest['records']['leads'] == 2500
+    print("✅ Backup segnato come incompleto")
+
+
+def test_range_fallback_only_for_missing_key_column():
+    """Solo l'errore "colonna inesistente" fa passare alle pagine per intervallo"""
+    print("🧪 Test fallback per intervallo...")
+    supabase = _FakeSupabase(_tables(), broken={'tasks'})
+    backup = SupabaseBackup(supabase, Path(tempfile.gettempdir()), dict(BACKUP_CONFIG, page_size=100))
+
+    assert sum(len(page) for page in backup.iter_table_pages('settings')) == 150
+    assert supabase.range_requests > 0
+
+    supabase.range_requests = 0
+    try:
+        list(backup.iter_table_pages('tasks'))
+        assert False, "l'errore doveva essere propagato"
+    except RuntimeError:
+        pass
+    assert supabase.range_requests == 0
+    print("✅ Fallback limitato alla colonna chiave mancante")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio test backup Supabase")
+    print("=" * 50)
+
+    test_full_backup_is_complete()
+    test_failed_table_marks_backup_incomplete()
+    test_range_fallback_only_for_missing_key_column()
+
+    print("=" * 50)
+    print("🎉 Tutti i test completati!")
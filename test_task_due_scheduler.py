@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Test Task Due Scheduler - Test dello scheduler scadenze task
+Verifica avvisi in scadenza/scaduto inviati una sola volta, aggiornamenti
+incrementali dai metodi task di DatabaseManager e report giornaliero
+Creato da Ezio Camporeale
+"""
+
+import sys
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from config import TASK_SCHEDULER_CONFIG
+from database.database_manager import DatabaseManager
+from utils import task_due_scheduler
+from utils.task_due_scheduler import TaskDueScheduler, parse_due
+
+
+class _Clock:
+    def __init__(self, start: datetime):
+        self.now = start.timestamp()
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **delta):
+        self.now += timedelta(**delta).total_seconds()
+
+
+def _scheduler(clock, db_path=':memory:', **config):
+    sent = []
+    settings = dict(TASK_SCHEDULER_CONFIG, daily_report_time='08:30')
+    settings.update(config)
+    scheduler = TaskDueScheduler(
+        notifier=lambda kind, data: sent.append((kind, data)),
+        report_provider=lambda: {'tasks_total': 3},
+        task_fetcher=lambda task_id: None,
+        db_path=db_path, config=settings, clock=clock
+    )
+    return scheduler, sent
+
+
+def _alerts(sent):
+    """Avvisi sui task (senza report giornaliero)"""
+    return [(kind, data['title']) for kind, data in sent if kind != 'daily_report']
+
+
+def _iso(clock, **delta):
+    return (datetime.fromtimestamp(clock()) + timedelta(**delta)).isoformat()
+
+
+def test_parse_due():
+    """Date senza orario scadono a fine giornata"""
+    print("🧪 Test lettura scadenze...")
+    assert parse_due('2025-03-10') == datetime(2025, 3, 11).timestamp()
+    assert parse_due('2025-03-10T15:00:00') == datetime(2025, 3, 10, 15).timestamp()
+    assert parse_due(None) is None and parse_due('non valida') is None
+    print("✅ Scadenze interpretate")
+
+
+def test_due_soon_then_overdue_once():
+    """Ogni task riceve un solo avviso per tipo, nell'ordine delle scadenze"""
+    print("🧪 Test avvisi scadenza...")
+    clock = _Clock(datetime(2025, 3, 10, 9, 0))
+    scheduler, sent = _scheduler(clock)
+    scheduler.load([
+        {'id': 1, 'title': 'Chiamare', 'due_date': _iso(clock, hours=30), 'state_id': 1, 'assigned_to': 7},
+        {'id': 2, 'title': 'Proposta', 'due_date': _iso(clock, hours=3), 'state_id': 2},
+        {'id': 3, 'title': 'Chiuso', 'due_date': _iso(clock, hours=1), 'state_id': 3},
+        {'id': 4, 'title': 'Senza scadenza', 'due_date': None, 'state_id': 1},
+    ], user_names={7: 'Mario Rossi'})
+    assert scheduler.size() == 2
+
+    scheduler.run_pending()
+    assert _alerts(sent) == [('task_due_soon', 'Proposta')]
+    assert scheduler.run_pending() == 0
+
+    clock.advance(hours=7)
+    scheduler.run_pending()
+    assert _alerts(sent) == [('task_due_soon', 'Proposta'), ('task_overdue', 'Proposta'), ('task_due_soon', 'Chiamare')]
+    assert next(data for kind, data in sent if data.get('title') == 'Chiamare')['assigned_to'] == ['Mario Rossi']
+    assert scheduler.overdue_count() == 1
+    assert [task['id'] for task in scheduler.overdue_tasks()] == [2]
+    print(f"✅ {len(sent)} avvisi inviati una sola volta")
+
+
+def test_updates_invalidate_old_events():
+    """Scadenza spostata o task completato: gli eventi vecchi non partono"""
+    print("🧪 Test aggiornamenti incrementali...")
+    clock = _Clock(datetime(2025, 3, 10, 9, 0))
+    scheduler, sent = _scheduler(clock)
+    scheduler.load([
+        {'id': 1, 'title': 'Spostato', 'due_date': _iso(clock, hours=2), 'state_id': 1},
+        {'id': 2, 'title': 'Completato', 'due_date': _iso(clock, hours=2), 'state_id': 1},
+    ])
+    scheduler.run_pending()
+    sent.clear()
+
+    scheduler.on_task_saved({'id': 1, 'due_date': _iso(clock, days=5)})
+    scheduler.on_task_saved({'id': 2, 'state_id': 3})
+    scheduler.on_task_saved({'id': 5, 'title': 'Nuovo', 'due_date': _iso(clock, hours=1), 'state_id': 1})
+    clock.advance(hours=3)
+    scheduler.run_pending()
+
+    # L'avviso "in scadenza" di Nuovo è superato dalla scadenza stessa
+    assert _alerts(sent) == [('task_overdue', 'Nuovo')]
+    assert scheduler.overdue_count() == 1
+    assert scheduler.stats['stale'] >= 2
+    print("✅ Eventi superati ignorati")
+
+
+def test_fired_events_survive_restart():
+    """Dopo un riavvio gli avvisi già inviati non vengono ripetuti"""
+    print("🧪 Test persistenza avvisi...")
+    clock = _Clock(datetime(2025, 3, 10, 9, 0))
+    tasks = [{'id': 1, 'title': 'Scaduto', 'due_date': _iso(clock, hours=-2), 'state_id': 1}]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'scheduler.db'
+        first, first_sent = _scheduler(clock, path)
+        first.load(tasks)
+        first.run_pending()
+
+        second, second_sent = _scheduler(clock, path)
+        second.load(tasks)
+        second.run_pending()
+
+    assert [kind for kind, _ in first_sent] == ['task_overdue', 'daily_report']
+    assert second_sent == []
+    assert second.overdue_count() == 1
+    print("✅ Nessun avviso duplicato dopo il riavvio")
+
+
+def test_daily_report_once_per_day():
+    """Il report giornaliero parte all'orario configurato, una volta al giorno"""
+    print("🧪 Test report giornaliero...")
+    clock = _Clock(datetime(2025, 3, 10, 7, 0))
+    scheduler, sent = _scheduler(clock)
+    scheduler.load([])
+
+    scheduler.run_pending()
+    assert sent == []
+    clock.advance(hours=2)
+    scheduler.run_pending()
+    clock.advance(hours=5)
+    scheduler.run_pending()
+    assert sent == [('daily_report', {'tasks_total': 3})]
+
+    clock.advance(days=1)
+    scheduler.run_pending()
+    assert len(sent) == 2
+    print("✅ Un report al giorno")
+
+
+def test_failed_report_retried_without_duplicates():
+    """Un report non inviato viene ritentato senza creare una seconda catena giornaliera"""
+    print("🧪 Test nuovo tentativo report giornaliero...")
+    clock = _Clock(datetime(2025, 3, 10, 8, 0))
+    sent = []
+    failures = [1]
+
+    def notifier(kind, data):
+        if failures:
+            failures.pop()
+            raise ConnectionError("Telegram non raggiungibile")
+        sent.append(kind)
+
+    scheduler, _ = _scheduler(clock)
+    scheduler.notifier = notifier
+    scheduler.load([])
+
+    clock.advance(minutes=31)
+    assert scheduler.run_pending() == 0
+    clock.advance(seconds=scheduler.max_sleep)
+    assert scheduler.run_pending() == 1
+    for _ in range(3):
+        clock.advance(days=1)
+        scheduler.run_pending()
+    assert sent == ['daily_report'] * 4
+    assert sum(1 for entry in scheduler._heap if entry[2] == 'daily_report') == 1
+    print("✅ Un solo report al giorno dopo l'errore")
+
+
+def test_priority_names_in_alerts():
+    """Gli avvisi mostrano il nome della priorità anche se i task portano solo priority_id"""
+    print("🧪 Test priorità negli avvisi...")
+    clock = _Clock(datetime(2025, 3, 10, 9, 0))
+    scheduler, sent = _scheduler(clock)
+    scheduler.load([{'id': 1, 'title': 'Richiamare', 'due_date': _iso(clock, hours=1), 'state_id': 1, 'priority_id': 3}],
+                   priority_names={2: 'Media', 3: 'Alta'})
+    scheduler.on_task_saved({'id': 2, 'title': 'Offerta', 'due_date': _iso(clock, hours=2), 'state_id': 1, 'priority_id': 2})
+
+    scheduler.run_pending()
+    priorities = {data['title']: data['priority'] for kind, data in sent if kind != 'daily_report'}
+    assert priorities == {'Richiamare': 'Alta', 'Offerta': 'Media'}
+    print("✅ Priorità risolte dai nomi")
+
+
+def test_shared_scheduler_retries_failed_load():
+    """Una lettura fallita non lascia lo scheduler condiviso caricato e vuoto"""
+    print("🧪 Test nuovo caricamento dopo errore...")
+
+    class _FailingDB:
+        def __init__(self):
+            self.fail = True
+
+        def get_open_tasks(self, closed_state_ids):
+            if self.fail:
+                raise ConnectionError("Supabase non raggiungibile")
+            return [{'id': 5, 'title': 'Task', 'due_date': '2099-01-01', 'state_id': 1, 'priority_id': 1}]
+
+        def get_all_users(self):
+            return []
+
+        def get_lead_priorities(self):
+            return [{'id': 1, 'name': 'Bassa'}]
+
+    original = task_due_scheduler._shared_scheduler
+    scheduler, _ = _scheduler(_Clock(datetime.now()))
+    task_due_scheduler._shared_scheduler = scheduler
+    try:
+        db = _FailingDB()
+        assert not task_due_scheduler.get_task_due_scheduler(db, start=False).loaded
+        db.fail = False
+        assert not task_due_scheduler.get_task_due_scheduler(db, start=False).loaded
+        scheduler.load_attempted_at -= task_due_scheduler.RELOAD_RETRY_SECONDS
+        loaded = task_due_scheduler.get_task_due_scheduler(db, start=False)
+        assert loaded.loaded and loaded.size() == 1
+        assert loaded.due_tasks(float('inf'))[0]['priority'] == 'Bassa'
+    finally:
+        task_due_scheduler._shared_scheduler = original
+    print("✅ Caricamento ritentato")
+
+
+def test_database_events_reach_scheduler():
+    """create_task, update_task_state e delete_task aggiornano lo scheduler condiviso"""
+    print("🧪 Test eventi DatabaseManager...")
+    db = DatabaseManager.__new__(DatabaseManager)
+    db.use_supabase = False
+    db.conn = sqlite3.connect(':memory:')
+    db.conn.row_factory = sqlite3.Row
+    db.conn.executescript((current_dir / 'database' / 'schema.sql').read_text())
+    db.conn.execute("INSERT INTO users (id, username, email, password_hash, first_name, last_name, role_id) "
+                    "VALUES (1, 'mrossi', 'm@rossi.it', 'x', 'Mario', 'Rossi', 1)")
+    # create_task scrive anche le note
+    db.conn.execute("ALTER TABLE tasks ADD COLUMN notes TEXT")
+    db.conn.execute("INSERT INTO tasks (title, state_id, created_by, due_date) VALUES ('Esistente', 1, 1, '2099-01-01')")
+    db.conn.commit()
+
+    clock = _Clock(datetime.now())
+    scheduler, _ = _scheduler(clock)
+    original = task_due_scheduler._shared_scheduler
+    task_due_scheduler._shared_scheduler = scheduler
+    try:
+        scheduler.load(db.get_open_tasks(TASK_SCHEDULER_CONFIG['closed_state_ids']))
+        assert scheduler.size() == 1
+
+        assert db.create_task({
+            'title': 'Nuovo', 'description': '', 'task_type_id': None, 'state_id': 1, 'priority_id': 2,
+            'assigned_to': 1, 'lead_id': None, 'due_date': '2099-02-01', 'notes': '', 'created_by': 1
+        })
+        assert scheduler.size() == 2
+        assert db.update_task_state(1, 3)
+        assert scheduler.size() == 1
+        assert db.update_task_state(1, 1)
+        assert scheduler.size() == 1  # task_fetcher finto: il task riaperto non ha scadenza nota
+        assert db.delete_task(2)
+        assert scheduler.size() == 0
+    finally:
+        task_due_scheduler._shared_scheduler = original
+
+    report = db.get_daily_report_data()
+    assert report['tasks_total'] == 1 and report['leads_total'] == 0
+    print("✅ Scheduler aggiornato senza rileggere la tabella task")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio test scheduler scadenze task")
+    print("=" * 50)
+
+    test_parse_due()
+    test_due_soon_then_overdue_once()
+    test_updates_invalidate_old_events()
+    test_fired_events_survive_restart()
+    test_daily_report_once_per_day()
+    test_failed_report_retried_without_duplicates()
+    test_priority_names_in_alerts()
+    test_shared_scheduler_retries_failed_load()
+    test_database_events_reach_scheduler()
+
+    print("=" * 50)
+    print("🎉 Tutti i test completati!")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test Telegram Bot - Test dei comandi bot contro la Bot API simulata
+Verifica /stats, /today, /overdue, /lead, chat non autorizzate e long polling
+senza accessi al database durante i comandi
+Creato da Ezio Camporeale
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from config import TASK_SCHEDULER_CONFIG, TELEGRAM_BOT_CONFIG
+from mock_telegram_server import MockTelegramServer
+from components.telegram.telegram_bot import TelegramCommandBot
+from utils.lead_contact_index import LeadContactIndex
+from utils.task_due_scheduler import TaskDueScheduler
+
+CHAT_ID = -100123
+
+
+class _Snapshot:
+    """Snapshot analytics finto con gli stessi campi di AnalyticsSnapshot.get_snapshot"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_snapshot(self, time_period):
+        self.calls.append(time_period)
+        today = time_period == 1
+        return {
+            'leads': {'total': 2 if today else 152},
+            'tasks': {'total': 1 if today else 40, 'completed': 0 if today else 30},
+            'users': {'by_user': {'Mario Rossi': {'leads_assigned': 90}, 'Anna_Bianchi': {'leads_assigned': 62}}},
+            'contacts': {'by_template': {'Default': {'usage_count': 20, 'response_rate': 0.25}}}
+        }
+
+
+class _NoDatabase:
+    """Qualsiasi accesso al database durante i comandi fa fallire il test"""
+
+    def __getattr__(self, name):
+        raise AssertionError(f"accesso al database: {name}")
+
+
+def _bot(server, **config):
+    now = time.time()
+    index = LeadContactIndex()
+    index.load([
+        {'id': 1, 'first_name': 'Mario', 'last_name': 'Verdi', 'email': 'Mario.Verdi@Example.com', 'phone': '+39 333 1234567'},
+        {'id': 2, 'first_name': 'Luca', 'last_name': 'Neri', 'email': 'luca@example.com'},
+    ])
+    scheduler = TaskDueScheduler(notifier=lambda kind, data: None, report_provider=dict,
+                                 task_fetcher=lambda task_id: None, db_path=':memory:',
+                                 config=TASK_SCHEDULER_CONFIG)
+    tomorrow = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    scheduler.load([
+        {'id': 10, 'title': 'Richiamare_cliente', 'due_date': datetime.fromtimestamp(now - 7200).isoformat(), 'state_id': 1},
+        {'id': 11, 'title': 'Inviare proposta', 'due_date': datetime.fromtimestamp(now - 60).isoformat(), 'state_id': 2},
+        {'id': 12, 'title': 'Futuro', 'due_date': (tomorrow + timedelta(days=3)).isoformat(), 'state_id': 1},
+    ])
+    scheduler.run_pending()
+    settings = dict(TELEGRAM_BOT_CONFIG, **config)
+    return TelegramCommandBot(server.token, [CHAT_ID], snapshot=_Snapshot(), contact_index=index,
+                              scheduler=scheduler, db_manager=_NoDatabase(), api_url=server.url,
+                              config=settings)
+
+
+def test_commands_from_caches():
+    """Ogni comando risponde dalle cache in memoria, in pochi millisecondi"""
+    print("🧪 Test comandi bot...")
+    with MockTelegramServer() as server:
+        bot = _bot(server)
+        commands = ['/stats', '/today', '/overdue', '/lead mario.verdi@example.com ', '/lead nessuno@example.com', '/lead']
+        for text in commands:
+            server.push_message(CHAT_ID, text)
+
+        started = time.perf_counter()
+        assert bot.poll_once(timeout=0) == len(commands)
+        elapsed = time.perf_counter() - started
+
+        replies = [message['text'] for message in server.sent]
+        stats, today, overdue, found, missing, usage = replies
+        assert '*STATISTICHE ULTIMI 30 GIORNI*' in stats
+        assert '👤 *LEAD:* 152' in stats and 'completati 30, 75%' in stats
+        assert '🚨 *TASK SCADUTI:* 2' in stats
+        assert '• Anna\\_Bianchi: 62' in stats
+        assert 'Nuovi lead: 2' in today and 'Task scaduti: 2' in today
+        assert overdue.startswith('🚨 *2 TASK SCADUTI*')
+        assert overdue.index('Richiamare\\_cliente') < overdue.index('Inviare proposta')
+        assert '*Mario Verdi* (ID 1)' in found and '3331234567' in found
+        assert missing.startswith('🔍 Nessun lead')
+        assert usage.startswith('ℹ️ Uso: /lead')
+        assert all(message['chat']['id'] == CHAT_ID for message in server.sent)
+        assert all(message['reply_to_message_id'] for message in server.sent)
+        assert bot.stats['commands'] == len(commands)
+    print(f"✅ {len(commands)} comandi gestiti in {elapsed * 1000:.0f} ms")
+
+
+def test_unauthorized_and_unknown():
+    """Le chat non autorizzate vengono ignorate, i comandi sconosciuti mostrano l'aiuto"""
+    print("🧪 Test chat non autorizzate...")
+    with MockTelegramServer() as server:
+        bot = _bot(server)
+        server.push_message(-999, '/stats')
+        server.push_message(CHAT_ID, 'ciao a tutti')
+        server.push_message(CHAT_ID, '/boh@mock_bot')
+        server.push_message(CHAT_ID, '/Stats@mock_bot')
+
+        assert bot.poll_once(timeout=0) == 4
+        replies = [message['text'] for message in server.sent]
+        assert len(replies) == 2
+        assert replies[0].startswith('🤖 *COMANDI DISPONIBILI*')
+        assert replies[1].startswith('📊 *STATISTICHE')
+        assert bot.stats['ignored'] == 1
+
+        # Gli update già confermati non vengono riproposti
+        assert bot.poll_once(timeout=0) == 0
+    print("✅ Solo la chat configurata riceve risposte")
+
+
+def test_long_polling_worker():
+    """Il worker in background risponde appena arriva un comando"""
+    print("🧪 Test long polling...")
+    with MockTelegramServer() as server:
+        bot = _bot(server, long_poll_seconds=1)
+        bot.start()
+        try:
+            time.sleep(0.1)
+            sent_at = time.perf_counter()
+            server.push_message(CHAT_ID, '/overdue')
+            replies = server.wait_for_messages(1)
+            latency = time.perf_counter() - sent_at
+        finally:
+            bot.stop()
+        assert replies and replies[0]['text'].startswith('🚨')
+        assert latency < 1.0
+        assert server.stats['getUpdates'] >= 1
+    print(f"✅ Risposta in {latency * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio test bot comandi Telegram")
+    print("=" * 50)
+
+    test_commands_from_caches()
+    test_unauthorized_and_unknown()
+    test_long_polling_worker()
+
+    print("=" * 50)
+    print("🎉 Tutti i test completati!")
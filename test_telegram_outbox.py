@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Test Telegram Outbox - Test della coda persistente delle notifiche Telegram
+Verifica ordine per chat, rate limit, retry con backoff, 429, log a blocchi e riepiloghi
+Creato da Ezio Camporeale
+"""
+
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+# Aggiungi il percorso della directory principale
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from config import TELEGRAM_CONFIG
+from components.telegram import telegram_manager as telegram_module
+from components.telegram.telegram_outbox import TelegramOutbox, SendResult
+
+
+def _config(**overrides):
+    config = dict(TELEGRAM_CONFIG)
+    config.update(chat_messages_per_minute=6000, chat_burst=100, retry_base_seconds=0, poll_interval_seconds=0.05)
+    config.update(overrides)
+    return config
+
+
+class _Sender:
+    """Sender finto: esiti programmati per messaggio, poi successo"""
+
+    def __init__(self, outcomes=None):
+        self.outcomes = dict(outcomes or {})
+        self.sent = []
+        self.calls = 0
+
+    def __call__(self, chat_id, text, parse_mode, disable_preview):
+        self.calls += 1
+        planned = self.outcomes.get(text)
+        if planned:
+            return planned.pop(0)
+        self.sent.append((chat_id, text))
+        return SendResult(True)
+
+
+def test_delivery_and_batched_logs():
+    """I messaggi partono in ordine e i log arrivano in un'unica scrittura"""
+    print("🧪 Test invio e log a blocchi...")
+    batches = []
+    sender = _Sender()
+    outbox = TelegramOutbox(':memory:', sender, batches.append, _config())
+    for n in range(5):
+        outbox.enqueue('-100', f"msg {n}", 'new_lead')
+
+    assert outbox.drain_once() == 5
+    assert [text for _, text in sender.sent] == [f"msg {n}" for n in range(5)]
+    assert len(batches) == 1 and len(batches[0]) == 5
+    assert {log['status'] for log in batches[0]} == {'sent'}
+    assert outbox.counts() == {'pending': 0, 'sent': 5, 'failed': 0}
+    print("✅ 5 messaggi inviati, log scritti in un blocco")
+
+
+def test_retry_and_permanent_failure():
+    """Errori temporanei ritentati con retry_count, errori 4xx scartati subito"""
+    print("🧪 Test retry e backoff...")
+    batches = []
+    sender = _Sender({
+        'instabile': [SendResult(False, 'Timeout'), SendResult(False, 'HTTP 502')],
+        'sbagliato': [SendResult(False, 'Bad Request: chat not found', permanent=True)],
+    })
+    outbox = TelegramOutbox(':memory:', sender, batches.append, _config(max_retries=3))
+    outbox.enqueue('-100', 'instabile')
+    outbox.enqueue('-200', 'sbagliato')
+
+    for _ in range(3):
+        outbox.drain_once()
+
+    assert sender.sent == [('-100', 'instabile')]
+    logs = [log for batch in batches for log in batch]
+    by_message = {log['message']: log for log in logs}
+    assert by_message['instabile']['status'] == 'sent'
+    assert by_message['instabile']['retry_count'] == 2
+    assert by_message['sbagliato']['status'] == 'failed'
+    assert by_message['sbagliato']['retry_count'] == 1
+    assert outbox.stats['retried'] == 2
+    print("✅ Retry con retry_count e scarto degli errori definitivi")
+
+
+def test_backoff_delays_next_attempt():
+    """Dopo un errore il messaggio non viene ritentato prima del backoff"""
+    print("🧪 Test attesa backoff...")
+    sender = _Sender({'lento': [SendResult(False, 'HTTP 500')]})
+    outbox = TelegramOutbox(':memory:', sender, None, _config(retry_base_seconds=60))
+    outbox.enqueue('-100', 'lento')
+
+    assert outbox.drain_once() == 1
+    assert outbox.drain_once() == 0
+    assert sender.calls == 1
+    assert outbox.counts()['pending'] == 1
+    print("✅ Tentativo successivo rimandato")
+
+
+def test_chat_rate_limit_and_retry_after():
+    """Il bucket per chat limita i messaggi e un 429 blocca solo quella chat"""
+    print("🧪 Test rate limit per chat...")
+    sender = _Sender({'a1': [SendResult(False, 'Too Many Requests', retry_after=30)]})
+    outbox = TelegramOutbox(':memory:', sender, None, _config(chat_messages_per_minute=1, chat_burst=2))
+    for text in ('a1', 'a2', 'b1', 'b2', 'b3'):
+        outbox.enqueue('-A' if text.startswith('a') else '-B', text)
+
+    outbox.drain_once()
+    # a1 limitato da Telegram (a2 resta dietro), chat B ferma dopo il burst di 2
+    assert sender.sent == [('-B', 'b1'), ('-B', 'b2')]
+    assert outbox.counts()['pending'] == 3
+    assert outbox.stats['rate_limited'] == 1
+    print("✅ Limiti per chat rispettati")
+
+
+def test_persistence_and_worker():
+    """I messaggi in coda sopravvivono al riavvio e il worker li invia"""
+    print("🧪 Test persistenza e worker...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'outbox.db'
+        TelegramOutbox(path, None, None, _config()).enqueue('-100', 'dopo il riavvio')
+
+        sender = _Sender()
+        outbox = TelegramOutbox(path, sender, None, _config())
+        outbox.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not sender.sent and time.monotonic() < deadline:
+                time.sleep(0.02)
+        finally:
+            outbox.stop()
+        assert sender.sent == [('-100', 'dopo il riavvio')]
+    print("✅ Coda persistente svuotata dal worker")
+
+
+def test_send_notification_is_queued():
+    """send_notification accoda senza chiamare l'API Telegram"""
+    print("🧪 Test notifica accodata...")
+    manager = telegram_module.TelegramManager.__new__(telegram_module.TelegramManager)
+    manager.bot_token = 'token'
+    manager.chat_id = '-100'
+    manager.is_configured = True
+    manager.supabase_manager = None
+    manager.outbox = TelegramOutbox(':memory:', None, None, _config())
+
+    original_post = telegram_module.requests.post
+    telegram_module.requests.post = lambda *args, **kwargs: (_ for _ in ()).throw(AssertionError('chiamata sincrona'))
+    try:
+        success, message = manager.send_notification('user_login', {'nome': 'Mario'})
+    finally:
+        telegram_module.requests.post = original_post
+
+    assert success, message
+    assert manager.outbox.counts()['pending'] == 1
+    print(f"✅ {message}")
+
+
+def test_digest_merges_same_type():
+    """Eventi dello stesso tipo nella finestra partono come un unico riepilogo"""
+    print("🧪 Test riepilogo eventi...")
+    batches = []
+    sender = _Sender()
+    outbox = TelegramOutbox(':memory:', sender, batches.append, _config())
+    for n in range(12):
+        outbox.enqueue('-100', f"lead {n}", 'new_lead', digest_window=0.2, summary=f"Lead {n}")
+    outbox.enqueue('-100', 'task singolo', 'new_task', digest_window=0.2, summary='Task')
+    outbox.enqueue('-100', 'urgente', 'message')
+
+    # Solo il messaggio senza finestra parte subito
+    assert outbox.drain_once() == 1
+    assert sender.sent == [('-100', 'urgente')]
+
+    time.sleep(0.25)
+    assert outbox.drain_once() == 2
+    digest, single = sender.sent[1][1], sender.sent[2][1]
+    assert digest.startswith('📦 12 notifiche new_lead')
+    assert 'Lead 11' in digest
+    assert single == 'task singolo'
+    assert [log['notification_type'] for batch in batches for log in batch] == ['message', 'new_lead_digest', 'new_task']
+    assert outbox.stats['coalesced'] == 11
+    assert outbox.counts() == {'pending': 0, 'sent': 14, 'failed': 0}
+    print("✅ 12 eventi inviati come un solo messaggio")
+
+
+def test_manager_digest_message():
+    """Il riepilogo del TelegramManager conta gli eventi e rimanda alla dashboard"""
+    print("🧪 Test formato riepilogo...")
+    manager = telegram_module.TelegramManager.__new__(telegram_module.TelegramManager)
+    rows = [{'summary': manager._summarize_notification('new_lead', {'nome': f"Cliente_{n}", 'fonte': 'Import Excel'})}
+            for n in range(152)]
+    message = manager._format_digest_message('new_lead', rows)
+    assert message.startswith('👤 *152 NUOVI LEAD INSERITI*')
+    assert '• Cliente\\_0 (Import Excel)' in message
+    assert '… e altri 142' in message
+    assert telegram_module.APP_BASE_URL in message
+    print("✅ Riepilogo: 152 nuovi lead")
+
+
+if __name__ == "__main__":
+    print("🚀 Avvio test coda notifiche Telegram")
+    print("=" * 50)
+
+    test_delivery_and_batched_logs()
+    test_retry_and_permanent_failure()
+    test_backoff_delays_next_attempt()
+    test_chat_rate_limit_and_retry_after()
+    test_persistence_and_worker()
+    test_send_notification_is_queued()
+    test_digest_merges_same_type()
+    test_manager_digest_message()
+
+    print("=" * 50)
+    print("🎉 Tutti i test completati!")
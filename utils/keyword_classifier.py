@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Classificatore a parole chiave per DASH_GESTIONE_LEAD
+Compila regole (etichetta -> parole chiave) in un'unica regex multi-pattern
+e la applica in modo vettoriale su colonne pandas
+Creato da Ezio Camporeale
+"""
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple, Any
+
+import pandas as pd
+
+
+class KeywordClassifier:
+    """
+    Classificatore a regole ordinate: vince la prima regola (in ordine di
+    dichiarazione) che contiene almeno una parola chiave presente nel testo.
+
+    Tutte le parole chiave sono compilate in un'unica regex con lookahead,
+    così ogni testo viene scansionato una sola volta invece di eseguire
+    un `any(word in text ...)` per ogni regola.
+    """
+
+    def __init__(self, rules: Sequence[Tuple[Any, Sequence[str]]],
+                 default: Any = None, empty: Any = None):
+        """
+        Args:
+            rules: Lista ordinata di (etichetta, parole chiave)
+            default: Etichetta se nessuna parola chiave è presente
+            empty: Etichetta per testi vuoti o NaN (default: `default`)
+        """
+        self.rules = [(label, [kw.lower() for kw in keywords]) for label, keywords in rules]
+        self.default = default
+        self.empty = default if empty is None else empty
+
+        # Parola chiave -> indice della regola con priorità più alta
+        self._keyword_rank: Dict[str, int] = {}
+        for rank, (_, keywords) in enumerate(self.rules):
+            for kw in keywords:
+                self._keyword_rank.setdefault(kw, rank)
+
+        # Alternative ordinate per priorità e poi per lunghezza: a parità di
+        # posizione la regex sceglie la parola della regola più importante
+        ordered = sorted(self._keyword_rank, key=lambda kw: (self._keyword_rank[kw], -len(kw)))
+        self.pattern = re.compile('(?=(' + '|'.join(re.escape(kw) for kw in ordered) + '))') if ordered else None
+
+    def _best_rank(self, text_lower: str) -> Optional[int]:
+        """Restituisce l'indice della regola migliore trovata nel testo"""
+        if self.pattern is None:
+            return None
+        best = None
+        for match in self.pattern.finditer(text_lower):
+            rank = self._keyword_rank[match.group(1)]
+            if best is None or rank < best:
+                best = rank
+                if best == 0:
+                    break
+        return best
+
+    def classify(self, text: Any) -> Any:
+        """Classifica un singolo testo"""
+        if text is None or (not isinstance(text, str) and pd.isna(text)) or not text:
+            return self.empty
+        rank = self._best_rank(str(text).lower())
+        return self.default if rank is None else self.rules[rank][0]
+
+    def classify_series(self, series: pd.Series) -> pd.Series:
+        """
+        Classifica una colonna pandas
+
+        I valori distinti vengono classificati una sola volta e poi mappati,
+        quindi colonne con feedback ripetuti costano quanto i soli valori unici.
+        """
+        if series.empty:
+            return pd.Series([], index=series.index, dtype=object)
+
+        is_empty = series.isna() | (series.astype(str) == '')
+        lowered = series.astype(str).str.lower()
+        uniques = pd.unique(lowered[~is_empty])
+
+        labels = {}
+        for value in uniques:
+            rank = self._best_rank(value)
+            labels[value] = self.default if rank is None else self.rules[rank][0]
+
+        result = lowered.map(labels)
+        result[is_empty] = self.empty
+        return result.astype(object)
+
+
+# ==================== CLASSIFICATORI LEAD ====================
+
+LEAD_STATUS_CLASSIFIER = KeywordClassifier(
+    rules=[
+        ("Chiuso", ["chiuso", "acquistato", "bonifico", "compra"]),
+        ("In Contatto", ["meet", "zoom", "call", "fissata"]),
+        ("Non Risponde", ["non risponde", "bloccato", "scomparso"]),
+        ("Non Qualificato", ["perditempo", "senza budget", "coglione"]),
+        ("Concorrenza", ["concorrenza", "competitor"]),
+    ],
+    default="Contattato",
+    empty="Nuovo"
+)
+
+LEAD_PRIORITY_CLASSIFIER = KeywordClassifier(
+    rules=[
+        ("Alta", ["super in target", "imprenditore", "capitale grossi", "3k", "1699",
+                  "chiuso", "acquistato", "bonifico", "800", "500", "1297"]),
+        ("Bassa", ["perditempo", "senza budget", "non risponde", "bloccato"]),
+    ],
+    default="Media"
+)
+
+# Punteggio urgenza timeline (0-100) usato da LeadAnalyzer
+TIMELINE_URGENCY_CLASSIFIER = KeywordClassifier(
+    rules=[
+        (100, ["urgente", "immediato", "subito", "asap", "presto"]),
+        (67, ["settimana", "giorni"]),
+        (33, ["mese"]),
+    ],
+    default=0
+)
+
+
+# ==================== ESTRAZIONE BUDGET ====================
+
+_BUDGET_K_PATTERN = re.compile(r'(\d+)k')
+_BUDGET_NUMBER_PATTERN = re.compile(r'(\d{3,})')
+
+
+def extract_budget(text: Any) -> Optional[float]:
+    """Estrae il budget da un testo (es. '3k' -> 3000, '1297' -> 1297)"""
+    if text is None or (not isinstance(text, str) and pd.isna(text)) or not text:
+        return None
+
+    text = str(text)
+
+    k_match = _BUDGET_K_PATTERN.search(text.lower())
+    if k_match:
+        return float(k_match.group(1)) * 1000
+
+    number_match = _BUDGET_NUMBER_PATTERN.search(text)
+    if number_match:
+        return float(number_match.group(1))
+
+    return None
+
+
+def extract_budget_series(series: pd.Series) -> pd.Series:
+    """Versione vettoriale di `extract_budget` su una colonna pandas"""
+    text = series.where(series.notna(), '').astype(str)
+    k_values = text.str.lower().str.extract(_BUDGET_K_PATTERN, expand=False).astype(float) * 1000
+    numbers = text.str.extract(_BUDGET_NUMBER_PATTERN, expand=False).astype(float)
+    budget = k_values.fillna(numbers)
+    return budget.astype(object).where(budget.notna(), None)
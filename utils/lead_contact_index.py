@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Indice email/telefono dei lead per DASH_GESTIONE_LEAD
+Indice hash in memoria, condiviso da tutto il processo, per rispondere in O(1)
+a "questa email o questo telefono esiste già, e di chi è?"
+Creato da Ezio Camporeale
+"""
+
+import sys
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Any, Tuple
+
+# Aggiungi il percorso della directory corrente al path di Python
+current_dir = Path(__file__).parent.parent
+sys.path.append(str(current_dir))
+
+from utils.lead_deduplication import normalize_email, normalize_phone, lead_full_name
+
+logger = logging.getLogger(__name__)
+
+# Dopo un caricamento vuoto (errore di lettura o tabella vuota) si riprova al più ogni N secondi
+RELOAD_RETRY_SECONDS = 30
+
+
+class LeadContactIndex:
+    """
+    Indice email/telefono -> lead proprietari
+
+    Viene caricato una sola volta dalla tabella leads e poi mantenuto
+    incrementalmente dagli eventi di creazione, modifica ed eliminazione
+    emessi da DatabaseManager. Un caricamento vuoto non conta come
+    caricato: get_all_leads restituisce [] anche quando la lettura fallisce.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_email: Dict[str, Set[Any]] = {}
+        self._by_phone: Dict[str, Set[Any]] = {}
+        # lead_id -> (email normalizzata, telefono normalizzato, nome)
+        self._leads: Dict[Any, Tuple[Optional[str], Optional[str], str]] = {}
+        self.loaded = False
+        self.load_attempted_at: Optional[float] = None
+
+    # ==================== CARICAMENTO ====================
+
+    def load(self, leads: List[Dict[str, Any]]):
+        """Ricostruisce l'indice da una lista completa di lead"""
+        with self._lock:
+            self._by_email.clear()
+            self._by_phone.clear()
+            self._leads.clear()
+            for lead in leads:
+                self._add(lead)
+            self.loaded = bool(self._leads)
+            self.load_attempted_at = time.monotonic()
+        if self.loaded:
+            logger.info(f"✅ Indice contatti lead caricato: {len(self._leads)} lead")
+        else:
+            logger.warning(f"⚠️ Indice contatti lead vuoto: nuovo caricamento tra {RELOAD_RETRY_SECONDS}s")
+
+    # ==================== EVENTI ====================
+
+    def _add(self, lead: Dict[str, Any]):
+        lead_id = lead.get('id')
+        if lead_id is None:
+            return
+        email = normalize_email(lead.get('email'))
+        phone = normalize_phone(lead.get('phone'))
+        self._leads[lead_id] = (email, phone, lead_full_name(lead))
+        if email:
+            self._by_email.setdefault(email, set()).add(lead_id)
+        if phone:
+            self._by_phone.setdefault(phone, set()).add(lead_id)
+
+    def _remove(self, lead_id: Any):
+        entry = self._leads.pop(lead_id, None)
+        if not entry:
+            return
+        email, phone, _ = entry
+        for key, index in ((email, self._by_email), (phone, self._by_phone)):
+            if key and key in index:
+                index[key].discard(lead_id)
+                if not index[key]:
+                    del index[key]
+
+    def on_lead_saved(self, lead: Dict[str, Any]):
+        """Evento creazione/modifica: `lead` deve contenere almeno id"""
+        lead_id = lead.get('id')
+        if lead_id is None:
+            return
+        with self._lock:
+            previous = self._leads.get(lead_id)
+            if previous:
+                # Aggiornamento parziale: conserva i campi non forniti
+                merged = {'id': lead_id}
+                merged['email'] = lead['email'] if 'email' in lead else previous[0]
+                merged['phone'] = lead['phone'] if 'phone' in lead else previous[1]
+                if 'name' in lead or 'first_name' in lead or 'last_name' in lead:
+                    merged['name'] = lead_full_name(lead)
+                else:
+                    merged['name'] = previous[2]
+                lead = merged
+            self._remove(lead_id)
+            self._add(lead)
+
+    def on_lead_deleted(self, lead_id: Any):
+        """Evento eliminazione"""
+        with self._lock:
+            self._remove(lead_id)
+
+    # ==================== RICERCA ====================
+
+    def _owners(self, ids: Set[Any], exclude_id: Any = None) -> List[Dict[str, Any]]:
+        return [
+            {'id': lead_id, 'name': self._leads[lead_id][2]}
+            for lead_id in sorted(ids, key=str)
+            if lead_id != exclude_id and lead_id in self._leads
+        ]
+
+    def lookup_email(self, email: Any, exclude_id: Any = None) -> List[Dict[str, Any]]:
+        """Lead che possiedono questa email"""
+        key = normalize_email(email)
+        if not key:
+            return []
+        with self._lock:
+            return self._owners(self._by_email.get(key, set()), exclude_id)
+
+    def lookup_phone(self, phone: Any, exclude_id: Any = None) -> List[Dict[str, Any]]:
+        """Lead che possiedono questo telefono"""
+        key = normalize_phone(phone)
+        if not key:
+            return []
+        with self._lock:
+            return self._owners(self._by_phone.get(key, set()), exclude_id)
+
+    def find_conflicts(self, email: Any = None, phone: Any = None,
+                       exclude_id: Any = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Conflitti per email e telefono
+
+        Args:
+            exclude_id: Lead da ignorare (il lead che si sta modificando)
+
+        Returns:
+            {'email': [...], 'phone': [...]} con i lead proprietari
+        """
+        return {
+            'email': self.lookup_email(email, exclude_id),
+            'phone': self.lookup_phone(phone, exclude_id)
+        }
+
+    def find_owner_id(self, email: Any = None, phone: Any = None) -> Optional[Any]:
+        """Primo lead che possiede l'email (o, in mancanza, il telefono)"""
+        owners = self.lookup_email(email) or self.lookup_phone(phone)
+        return owners[0]['id'] if owners else None
+
+    def get_contact(self, lead_id: Any) -> Optional[Dict[str, Any]]:
+        """Nome, email e telefono (normalizzati) di un lead indicizzato"""
+        with self._lock:
+            entry = self._leads.get(lead_id)
+        if not entry:
+            return None
+        email, phone, name = entry
+        return {'id': lead_id, 'name': name, 'email': email, 'phone': phone}
+
+    def size(self) -> int:
+        """Numero di lead indicizzati"""
+        return len(self._leads)
+
+
+# ==================== ISTANZA CONDIVISA ====================
+
+_shared_index: Optional[LeadContactIndex] = None
+_shared_lock = threading.Lock()
+
+
+def get_lead_contact_index(db_manager=None) -> LeadContactIndex:
+    """
+    Restituisce l'indice condiviso dal processo, caricandolo al primo uso
+
+    Se il caricamento non ha trovato lead l'indice viene ricaricato, al più
+    ogni RELOAD_RETRY_SECONDS secondi.
+    """
+    global _shared_index
+    if _shared_index is not None and _shared_index.loaded:
+        return _shared_index
+
+    with _shared_lock:
+        if _shared_index is None:
+            _shared_index = LeadContactIndex()
+        attempted_at = _shared_index.load_attempted_at
+        retry_due = attempted_at is None or time.monotonic() - attempted_at >= RELOAD_RETRY_SECONDS
+        if not _shared_index.loaded and retry_due:
+            if db_manager is None:
+                from database.database_manager import DatabaseManager
+                db_manager = DatabaseManager()
+            _shared_index.load(db_manager.get_all_leads())
+    return _shared_index
+
+
+def notify_lead_saved(lead: Dict[str, Any]):
+    """Propaga una creazione/modifica all'indice se già caricato"""
+    if _shared_index is not None and _shared_index.loaded:
+        _shared_index.on_lead_saved(lead)
+
+
+def notify_lead_deleted(lead_id: Any):
+    """Propaga un'eliminazione all'indice se già caricato"""
+    if _shared_index is not None and _shared_index.loaded:
+        _shared_index.on_lead_deleted(lead_id)
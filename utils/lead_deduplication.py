@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Motore di deduplicazione lead per DASH_GESTIONE_LEAD
+Normalizza email e telefono (E.164), raggruppa i lead per chiavi di blocco
+e trova i quasi-duplicati su nome+azienda con MinHash/LSH
+Creato da Ezio Camporeale
+"""
+
+import re
+import sys
+import zlib
+import logging
+import unicodedata
+from pathlib import Path
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Any, Iterable, Tuple
+
+import numpy as np
+
+# Aggiungi il percorso della directory corrente al path di Python
+current_dir = Path(__file__).parent.parent
+sys.path.append(str(current_dir))
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COUNTRY_CODE = '39'
+
+_EMAIL_PATTERN = re.compile(r'[a-z0-9._%+\-]+@[a-z0-9.\-]+\.[a-z]{2,}')
+_NON_DIGITS = re.compile(r'\D')
+_NON_WORD = re.compile(r'[^a-z0-9 ]+')
+_SPACES = re.compile(r'\s+')
+
+
+# ==================== NORMALIZZAZIONE ====================
+
+def normalize_email(email: Any) -> Optional[str]:
+    """
+    Normalizza un'email: minuscolo, senza spazi e senza note aggiuntive
+
+    Es. 'Mario.Rossi@Gmail.com non spunta' -> 'mario.rossi@gmail.com'
+    """
+    if not email or not isinstance(email, str):
+        return None
+    match = _EMAIL_PATTERN.search(email.strip().lower())
+    return match.group(0) if match else None
+
+
+def normalize_phone(phone: Any, default_country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    """
+    Normalizza un numero di telefono in formato E.164
+
+    Es. 'p:+39 333 123 4567', '0039 3331234567', '333 1234567' -> '+393331234567'
+    """
+    if phone is None or (isinstance(phone, float) and np.isnan(phone)):
+        return None
+
+    raw = str(phone).strip().lower().replace('p:', '')
+    if not raw:
+        return None
+
+    digits = _NON_DIGITS.sub('', raw)
+    if raw.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    elif digits.startswith(default_country_code) and len(digits) > 10:
+        pass
+    else:
+        # Numero nazionale (cellulare 3xx o fisso 0xx)
+        digits = default_country_code + digits
+
+    # E.164: massimo 15 cifre, scartiamo numeri troppo corti per essere reali
+    if len(digits) < 8 or len(digits) > 15:
+        return None
+    return '+' + digits
+
+
+def normalize_text(text: Any) -> str:
+    """Normalizza un testo libero (nome, azienda) per il confronto"""
+    if not text or not isinstance(text, str):
+        return ''
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+    text = _NON_WORD.sub(' ', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+def lead_full_name(lead: Dict[str, Any]) -> str:
+    """Nome completo del lead (Supabase usa 'name', SQLite first_name/last_name)"""
+    if lead.get('name'):
+        return lead['name']
+    return f"{lead.get('first_name') or ''} {lead.get('last_name') or ''}".strip()
+
+
+# ==================== MINHASH / LSH ====================
+
+class MinHashLSH:
+    """
+    Indice MinHash con Locality Sensitive Hashing a bande
+
+    Con `num_perm = bands * rows` la probabilità che due insiemi con
+    similarità di Jaccard s finiscano nello stesso bucket è 1 - (1 - s^rows)^bands,
+    quindi solo le coppie simili vengono confrontate.
+    """
+
+    _PRIME = (1 << 61) - 1
+    _MAX_HASH = (1 << 32) - 1
+
+    def __init__(self, bands: int = 16, rows: int = 4, seed: int = 42):
+        self.bands = bands
+        self.rows = rows
+        self.num_perm = bands * rows
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=self.num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=self.num_perm, dtype=np.uint64)
+
+        self._buckets: List[Dict[bytes, List[Any]]] = [defaultdict(list) for _ in range(bands)]
+
+    def signature(self, shingles: Set[str]) -> Optional[np.ndarray]:
+        """Calcola la firma MinHash di un insieme di shingle"""
+        if not shingles:
+            return None
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        # (a * x + b) mod p su tutte le permutazioni in un'unica operazione
+        permuted = (np.outer(hashes, self._a) + self._b) % np.uint64(self._PRIME)
+        return (permuted & np.uint64(self._MAX_HASH)).min(axis=0)
+
+    def insert(self, key: Any, signature: np.ndarray):
+        """Inserisce una firma nei bucket di ogni banda"""
+        for band in range(self.bands):
+            band_slice = signature[band * self.rows:(band + 1) * self.rows]
+            self._buckets[band][band_slice.tobytes()].append(key)
+
+    def candidate_pairs(self, max_bucket_size: int = 200) -> Set[Tuple[Any, Any]]:
+        """
+        Coppie candidate che condividono almeno un bucket
+
+        I bucket enormi (nomi generici) vengono ignorati per evitare
+        di ricadere nel confronto quadratico.
+        """
+        pairs = set()
+        for band_buckets in self._buckets:
+            for keys in band_buckets.values():
+                if len(keys) < 2 or len(keys) > max_bucket_size:
+                    continue
+                for i in range(len(keys)):
+                    for j in range(i + 1, len(keys)):
+                        a, b = keys[i], keys[j]
+                        pairs.add((a, b) if a < b else (b, a))
+        return pairs
+
+
+def shingles(text: str, k: int = 3) -> Set[str]:
+    """Shingle di k caratteri di un testo normalizzato"""
+    if not text:
+        return set()
+    padded = f" {text} "
+    if len(padded) <= k:
+        return {padded}
+    return {padded[i:i + k] for i in range(len(padded) - k + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    """Similarità di Jaccard tra due insiemi"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# ==================== UNION-FIND ====================
+
+class _UnionFind:
+    """Union-find con path compression per costruire i gruppi di duplicati"""
+
+    def __init__(self):
+        self.parent: Dict[Any, Any] = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+# ==================== MOTORE DEDUPLICAZIONE ====================
+
+class LeadDeduplicator:
+    """
+    Trova e unisce lead duplicati
+
+    - Chiavi di blocco esatte: email normalizzata, telefono E.164
+    - Quasi-duplicati: MinHash/LSH su nome+azienda, verificati con Jaccard
+    """
+
+    # Campi copiati dai duplicati nel superstite se lì sono vuoti
+    MERGE_FIELDS = ['email', 'phone', 'company', 'position', 'budget',
+                    'expected_close_date', 'source_id', 'category_id',
+                    'priority_id', 'assigned_to', 'group_id']
+
+    def __init__(self, db_manager=None, similarity_threshold: float = 0.8,
+                 bands: int = 16, rows: int = 4):
+        self.db = db_manager
+        self.similarity_threshold = similarity_threshold
+        self.bands = bands
+        self.rows = rows
+
+    def _get_db(self):
+        if self.db is None:
+            from database.database_manager import DatabaseManager
+            self.db = DatabaseManager()
+        return self.db
+
+    def find_duplicates(self, leads: Optional[Iterable[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        Trova i gruppi di lead duplicati
+
+        Args:
+            leads: Lead da analizzare (default: tutta la tabella leads)
+
+        Returns:
+            Lista di gruppi {survivor_id, duplicate_ids, reasons, leads}
+        """
+        if leads is None:
+            leads = self._get_db().get_all_leads()
+        leads_by_id = {lead['id']: lead for lead in leads if lead.get('id') is not None}
+
+        union_find = _UnionFind()
+        reasons: Dict[Tuple[Any, Any], Set[str]] = defaultdict(set)
+
+        # 1. Chiavi di blocco esatte
+        blocks: Dict[Tuple[str, str], List[Any]] = defaultdict(list)
+        for lead_id, lead in leads_by_id.items():
+            email = normalize_email(lead.get('email'))
+            phone = normalize_phone(lead.get('phone'))
+            if email:
+                blocks[('email', email)].append(lead_id)
+            if phone:
+                blocks[('phone', phone)].append(lead_id)
+
+        for (kind, _), ids in blocks.items():
+            for other in ids[1:]:
+                union_find.union(ids[0], other)
+                reasons[tuple(sorted((ids[0], other)))].add(kind)
+
+        # 2. Quasi-duplicati su nome + azienda
+        lsh = MinHashLSH(bands=self.bands, rows=self.rows)
+        lead_shingles: Dict[Any, Set[str]] = {}
+        for lead_id, lead in leads_by_id.items():
+            key_text = normalize_text(f"{lead_full_name(lead)} {lead.get('company') or ''}")
+            lead_shingles[lead_id] = shingles(key_text)
+            signature = lsh.signature(lead_shingles[lead_id])
+            if signature is not None:
+                lsh.insert(lead_id, signature)
+
+        for a, b in lsh.candidate_pairs():
+            if jaccard(lead_shingles[a], lead_shingles[b]) >= self.similarity_threshold:
+                union_find.union(a, b)
+                reasons[(a, b)].add('name_company')
+
+        # 3. Costruzione gruppi
+        groups: Dict[Any, List[Any]] = defaultdict(list)
+        for lead_id in leads_by_id:
+            groups[union_find.find(lead_id)].append(lead_id)
+
+        results = []
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            group_leads = [leads_by_id[m] for m in members]
+            survivor = self.choose_survivor(group_leads)
+            member_set = set(members)
+            group_reasons = set()
+            for pair, pair_reasons in reasons.items():
+                if pair[0] in member_set:
+                    group_reasons |= pair_reasons
+            results.append({
+                'survivor_id': survivor['id'],
+                'duplicate_ids': sorted(m for m in members if m != survivor['id']),
+                'reasons': sorted(group_reasons),
+                'leads': group_leads
+            })
+
+        results.sort(key=lambda g: g['survivor_id'])
+        logger.info(f"🔍 Trovati {len(results)} gruppi di lead duplicati su {len(leads_by_id)} lead")
+        return results
+
+    @staticmethod
+    def _completeness(lead: Dict[str, Any]) -> int:
+        """Numero di campi valorizzati del lead"""
+        return sum(1 for value in lead.values() if value not in (None, '', 0))
+
+    def choose_survivor(self, leads: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Sceglie il lead superstite: il più completo, a parità il più vecchio"""
+        return min(leads, key=lambda lead: (-self._completeness(lead), str(lead.get('created_at') or ''), lead['id']))
+
+    def build_survivor_updates(self, survivor: Dict[str, Any], duplicates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Campi del superstite da riempire con i valori dei duplicati"""
+        updates = {}
+        for field in self.MERGE_FIELDS:
+            if survivor.get(field) not in (None, ''):
+                continue
+            for duplicate in duplicates:
+                if duplicate.get(field) not in (None, ''):
+                    updates[field] = duplicate[field]
+                    break
+
+        notes = [d.get('notes') for d in duplicates if d.get('notes') and d.get('notes') != survivor.get('notes')]
+        if notes:
+            updates['notes'] = ' | '.join(filter(None, [survivor.get('notes')] + notes))
+        return updates
+
+    def merge_group(self, group: Dict[str, Any]) -> Dict[str, Any]:
+        """Unisce un gruppo restituito da `find_duplicates`"""
+        leads_by_id = {lead['id']: lead for lead in group['leads']}
+        survivor = leads_by_id[group['survivor_id']]
+        duplicates = [leads_by_id[d] for d in group['duplicate_ids']]
+        updates = self.build_survivor_updates(survivor, duplicates)
+        return self._get_db().merge_leads(group['survivor_id'], group['duplicate_ids'], updates)
+
+    def merge_all(self, groups: Optional[List[Dict[str, Any]]] = None) -> Dict[str, int]:
+        """Unisce tutti i gruppi di duplicati trovati"""
+        if groups is None:
+            groups = self.find_duplicates()
+
+        merged_groups = 0
+        deleted_leads = 0
+        for group in groups:
+            result = self.merge_group(group)
+            if result.get('success'):
+                merged_groups += 1
+                deleted_leads += result.get('deleted_count', 0)
+
+        return {'groups': len(groups), 'merged_groups': merged_groups, 'deleted_leads': deleted_leads}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Deduplicazione Lead')
+    parser.add_argument('action', choices=['scan', 'merge'], help='Azione da eseguire')
+    parser.add_argument('--threshold', type=float, default=0.8, help='Soglia similarità nome+azienda')
+    parser.add_argument('--auto', action='store_true', help='Auto-conferma (solo per merge)')
+
+    args = parser.parse_args()
+
+    deduplicator = LeadDeduplicator(similarity_threshold=args.threshold)
+    groups = deduplicator.find_duplicates()
+
+    print("🔍 DEDUPLICAZIONE LEAD")
+    print("=" * 80)
+    for group in groups:
+        print(f"👤 Lead {group['survivor_id']} ← duplicati {group['duplicate_ids']} ({', '.join(group['reasons'])})")
+    print("=" * 80)
+    print(f"📊 Gruppi di duplicati: {len(groups)}")
+
+    if args.action == 'merge' and groups:
+        if not args.auto:
+            confirm = input("Procedere con l'unione? (s/N): ").strip().lower()
+            if confirm != 's':
+                print("❌ Operazione annullata")
+                sys.exit(0)
+        summary = deduplicator.merge_all(groups)
+        print(f"✅ Gruppi uniti: {summary['merged_groups']}/{summary['groups']}")
+        print(f"🗑️  Lead eliminati: {summary['deleted_leads']}")
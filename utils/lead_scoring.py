@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Motore di scoring lead per DASH_GESTIONE_LEAD
+Calcola lo score qualità (lo stesso di LeadAnalyzer) su tutta la tabella leads
+con operazioni vettoriali pandas/NumPy e lo salva nelle colonne
+leads.quality_score / leads.quality_category
+Creato da Ezio Camporeale
+"""
+
+import sys
+import logging
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Aggiungi il percorso della directory corrente al path di Python
+current_dir = Path(__file__).parent.parent
+sys.path.append(str(current_dir))
+
+from utils.keyword_classifier import TIMELINE_URGENCY_CLASSIFIER
+
+logger = logging.getLogger(__name__)
+
+# Pesi dello score qualità lead
+SCORE_WEIGHTS = {
+    'contact_info_completeness': 0.2,
+    'company_info_completeness': 0.15,
+    'budget_indication': 0.25,
+    'timeline_urgency': 0.15,
+    'source_quality': 0.1,
+    'interaction_history': 0.15
+}
+
+# Soglie per categorizzazione
+SCORE_THRESHOLDS = {
+    'hot': 80,
+    'warm': 60,
+    'cold': 40
+}
+
+HIGH_QUALITY_SOURCES = ['referral', 'website', 'linkedin']
+MEDIUM_QUALITY_SOURCES = ['email', 'social', 'event']
+
+# Punteggio base storico interazioni (placeholder di LeadAnalyzer)
+INTERACTION_BASE_SCORE = 10
+
+QUALITY_CATEGORIES = ['Hot', 'Warm', 'Cold']
+
+# Chiave impostazioni con l'ultimo refresh incrementale
+LAST_REFRESH_SETTING = 'lead_scoring_last_refresh'
+
+
+def categorize_score(score: int, thresholds: Dict[str, int] = None) -> str:
+    """Categorizza uno score in Hot/Warm/Cold"""
+    thresholds = thresholds or SCORE_THRESHOLDS
+    if score >= thresholds['hot']:
+        return 'Hot'
+    elif score >= thresholds['warm']:
+        return 'Warm'
+    return 'Cold'
+
+
+def _present(df: pd.DataFrame, column: str) -> pd.Series:
+    """Maschera dei valori 'veri' in senso Python (non None, non '', non 0)"""
+    if column not in df.columns:
+        return pd.Series(False, index=df.index)
+    values = df[column]
+    return values.notna() & ~values.isin(['', 0, False])
+
+
+def _text(df: pd.DataFrame, column: str) -> pd.Series:
+    """Colonna testuale con i valori mancanti come stringa vuota"""
+    if column not in df.columns:
+        return pd.Series('', index=df.index)
+    values = df[column]
+    return values.where(values.notna(), '').astype(str)
+
+
+class LeadScoringEngine:
+    """
+    Scoring vettoriale dei lead con persistenza incrementale
+    """
+
+    def __init__(self, db_manager=None, weights: Dict[str, float] = None,
+                 thresholds: Dict[str, int] = None):
+        self.db = db_manager
+        self.weights = weights or SCORE_WEIGHTS
+        self.thresholds = thresholds or SCORE_THRESHOLDS
+
+    def _get_db(self):
+        if self.db is None:
+            from database.database_manager import DatabaseManager
+            self.db = DatabaseManager()
+        return self.db
+
+    # ==================== CALCOLO ====================
+
+    def score_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Calcola score e categoria per ogni riga del DataFrame
+
+        Returns:
+            DataFrame con colonne quality_score e quality_category (stesso indice)
+        """
+        if df.empty:
+            return pd.DataFrame({'quality_score': pd.Series(dtype=int),
+                                 'quality_category': pd.Series(dtype=object)}, index=df.index)
+
+        df = df.copy()
+        # Supabase salva il nome completo in 'name'
+        if 'first_name' not in df.columns and 'name' in df.columns:
+            parts = _text(df, 'name').str.split(' ', n=1, expand=True).reindex(columns=[0, 1])
+            df['first_name'] = parts[0].fillna('')
+            df['last_name'] = parts[1].fillna('')
+
+        w = self.weights
+        score = np.zeros(len(df))
+
+        # Completezza informazioni contatto (0-20 punti)
+        contact_score = sum(_present(df, c).to_numpy() * 5 for c in ('first_name', 'last_name', 'email', 'phone'))
+        score += contact_score * w['contact_info_completeness']
+
+        # Completezza informazioni azienda (0-15 punti)
+        company_score = sum(_present(df, c).to_numpy() * 5 for c in ('company', 'industry', 'website'))
+        score += company_score * w['company_info_completeness']
+
+        # Indicazione budget (0-25 punti)
+        budget = pd.to_numeric(df['budget'], errors='coerce').fillna(0).to_numpy() if 'budget' in df.columns else np.zeros(len(df))
+        budget = np.where(_present(df, 'budget').to_numpy(), budget, 0)
+        budget_score = np.select([budget > 10000, budget > 5000, budget > 1000, budget > 0], [25, 20, 15, 10], 0)
+        score += budget_score * w['budget_indication']
+
+        # Urgenza timeline (0-15 punti)
+        timeline = TIMELINE_URGENCY_CLASSIFIER.classify_series(df['notes']) if 'notes' in df.columns else pd.Series(0, index=df.index)
+        timeline_score = timeline.map({100: 15, 67: 10, 33: 5}).fillna(0).to_numpy()
+        score += timeline_score * w['timeline_urgency']
+
+        # Qualità fonte (0-10 punti)
+        source = _text(df, 'source').str.lower()
+        source_score = np.select(
+            [source.isin(HIGH_QUALITY_SOURCES).to_numpy(), source.isin(MEDIUM_QUALITY_SOURCES).to_numpy(), (source != '').to_numpy()],
+            [10, 7, 5], 0
+        )
+        score += source_score * w['source_quality']
+
+        # Storico interazioni (0-15 punti)
+        score += INTERACTION_BASE_SCORE * w['interaction_history']
+
+        quality_score = np.clip(np.trunc(score), 0, 100).astype(int)
+        quality_category = np.select(
+            [quality_score >= self.thresholds['hot'], quality_score >= self.thresholds['warm']],
+            ['Hot', 'Warm'], 'Cold'
+        )
+
+        return pd.DataFrame({'quality_score': quality_score, 'quality_category': quality_category}, index=df.index)
+
+    def score_leads(self, leads: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+        """Calcola gli score per una lista di lead (colonne id, quality_score, quality_category)"""
+        df = pd.DataFrame(list(leads))
+        if df.empty:
+            return pd.DataFrame(columns=['id', 'quality_score', 'quality_category'])
+        scores = self.score_frame(df)
+        scores.insert(0, 'id', df['id'] if 'id' in df.columns else None)
+        return scores
+
+    # ==================== PERSISTENZA ====================
+
+    def _persist(self, leads: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        Salva solo gli score cambiati rispetto a quelli già memorizzati
+
+        Returns:
+            (score cambiati, lead effettivamente aggiornati nel database)
+        """
+        if not leads:
+            return 0, 0
+
+        df = pd.DataFrame(leads)
+        scores = self.score_frame(df)
+
+        stored_score = pd.to_numeric(df.get('quality_score'), errors='coerce') if 'quality_score' in df.columns else pd.Series(np.nan, index=df.index)
+        stored_category = df['quality_category'] if 'quality_category' in df.columns else pd.Series(None, index=df.index)
+        changed = (stored_score != scores['quality_score']) | (stored_category != scores['quality_category'])
+
+        updates = [
+            {'id': lead_id, 'quality_score': int(score), 'quality_category': category}
+            for lead_id, score, category in zip(df.loc[changed, 'id'], scores.loc[changed, 'quality_score'], scores.loc[changed, 'quality_category'])
+        ]
+        written = self._get_db().update_lead_scores(updates) if updates else 0
+        return len(updates), written
+
+    def refresh_all(self) -> Dict[str, int]:
+        """Ricalcola lo score di tutti i lead"""
+        return self.refresh_changed(full=True)
+
+    def refresh_changed(self, full: bool = False) -> Dict[str, int]:
+        """
+        Ricalcola lo score dei lead modificati dall'ultimo refresh
+        (o mai calcolati). Con `full=True` ricalcola tutta la tabella.
+        """
+        db = self._get_db()
+        started_at = datetime.now(timezone.utc)
+
+        since = None
+        if not full:
+            setting = db.get_setting(LAST_REFRESH_SETTING)
+            if setting and setting.get('value'):
+                try:
+                    since = datetime.fromisoformat(setting['value'])
+                except ValueError:
+                    since = None
+
+        # Errori di lettura o scrittura propagati: il watermark resta dov'era
+        leads = db.get_leads_for_scoring(since)
+        changed, written = self._persist(leads)
+
+        if written < changed:
+            # Lead eliminati durante il refresh o salvataggio parziale: si riprova al prossimo giro
+            logger.warning(f"⚠️ Score qualità: {written} di {changed} aggiornati, watermark non spostato")
+        else:
+            # Il watermark è l'inizio del refresh: le modifiche concorrenti verranno riprese al prossimo giro
+            db.update_setting(LAST_REFRESH_SETTING, started_at.isoformat(), "Ultimo aggiornamento score qualità lead")
+
+        logger.info(f"✅ Score qualità: {len(leads)} lead valutati, {written} aggiornati")
+        return {'scored': len(leads), 'updated': written}
+
+    def refresh_leads(self, lead_ids: List[Any]) -> Dict[str, int]:
+        """Ricalcola lo score di lead specifici"""
+        leads = self._get_db().get_leads_for_scoring(lead_ids=lead_ids)
+        _, written = self._persist(leads)
+        return {'scored': len(leads), 'updated': written}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Score qualità lead')
+    parser.add_argument('action', choices=['refresh', 'rebuild'], help='refresh = solo lead modificati, rebuild = tutti')
+
+    args = parser.parse_args()
+
+    engine = LeadScoringEngine()
+    summary = engine.refresh_changed(full=(args.action == 'rebuild'))
+    print(f"📊 Lead valutati: {summary['scored']}")
+    print(f"💾 Score aggiornati: {summary['updated']}")
@@ -1,21 +1,285 @@
 #!/usr/bin/env python3
 """
 Utility per la manutenzione dello storage
-Include verifica e pulizia file orfani
+Include verifica dell'integrità (file mancanti, orfani e corrotti) e pulizia file orfani
 Creato da Ezio Camporeale
 """
 
+import os
 import sys
+import gzip
+import time
+import zlib
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
 
 # Aggiungi il percorso della directory corrente al path di Python
 current_dir = Path(__file__).parent.parent
 sys.path.append(str(current_dir))
 
-from config import SUPABASE_URL, SUPABASE_KEY
+from config import SUPABASE_URL, SUPABASE_KEY, STORAGE_CONFIG
 from supabase import create_client, Client
 
-def check_storage_files(silent=False):
+# Cartelle dello storage (vedi StorageManager._init_dirs): file legacy e blob per hash
+STORAGE_ROOTS = ('storage/uploads', 'storage/blobs')
+SCAN_COLUMNS = 'id, original_filename, file_path, file_size, stored_size, compression, content_hash, last_verified_at'
+# Righe per richiesta: l'API Supabase ne restituisce al massimo 1000
+PAGE_SIZE = 1000
+
+
+class StorageScanner:
+    """
+    Verifica dell'integrità dello storage
+    
+    Confronta i file su disco (letti con os.scandir) con i record attivi di
+    storage_files tramite operazioni su insiemi:
+    - mancanti: record senza file su disco (o con dimensione diversa)
+    - orfani: file su disco senza alcun record attivo
+    - corrotti: file il cui hash non corrisponde a content_hash
+    
+    Il ricalcolo degli hash è incrementale: a ogni esecuzione vengono
+    verificati al massimo `verify_limit` blob, partendo da quelli mai
+    verificati o verificati da più tempo (last_verified_at), in parallelo.
+    """
+    
+    def __init__(self, supabase=None, base_dir: Path = current_dir,
+                 verify_limit: int = STORAGE_CONFIG['verify_batch_size'],
+                 workers: int = STORAGE_CONFIG['verify_workers'],
+                 orphan_grace_seconds: float = STORAGE_CONFIG['orphan_grace_seconds']):
+        self.supabase = supabase or create_client(SUPABASE_URL, SUPABASE_KEY)
+        self.base_dir = Path(base_dir)
+        self.verify_limit = verify_limit
+        self.workers = workers
+        self.orphan_grace_seconds = orphan_grace_seconds
+    
+    # ==================== DISCO ====================
+    
+    def scan_disk(self) -> Dict[str, os.stat_result]:
+        """
+        File presenti nelle cartelle dello storage
+        
+        Returns:
+            Dict: percorso relativo (come salvato in file_path) -> stat del file
+        """
+        files = {}
+        for root in STORAGE_ROOTS:
+            pending = [self.base_dir / root]
+            while pending:
+                try:
+                    entries = os.scandir(pending.pop())
+                except FileNotFoundError:
+                    continue
+                with entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            relative = os.path.relpath(entry.path, self.base_dir).replace(os.sep, '/')
+                            files[relative] = entry.stat(follow_symlinks=False)
+        return files
+    
+    def _absolute_path(self, relative: str) -> Path:
+        return Path(relative) if os.path.isabs(relative) else self.base_dir / relative
+    
+    def _relative_path(self, file_path: str) -> str:
+        """file_path del database nella forma usata da scan_disk"""
+        if os.path.isabs(file_path):
+            try:
+                return Path(file_path).relative_to(self.base_dir).as_posix()
+            except ValueError:
+                # Fuori dallo storage: resta assoluto
+                return file_path
+        return Path(file_path).as_posix()
+    
+    # ==================== DATABASE ====================
+    
+    def load_records(self) -> Tuple[Dict[str, List[Dict]], bool]:
+        """
+        Record attivi raggruppati per percorso (un blob può avere più record)
+        
+        I record sono letti a pagine per id (id > ultimo id) fino a una
+        pagina vuota, quindi il limite di righe per richiesta dell'API non
+        tronca la lista.
+        
+        Returns:
+            Tuple: (record per percorso, True se la lista è completa: letti
+            almeno tanti record quanti ne conta il database)
+        """
+        expected = self.supabase.table('storage_files').select('id', count='exact') \
+            .eq('is_active', True).limit(1).execute().count
+        
+        records = {}
+        loaded = 0
+        last_id = None
+        while True:
+            query = self.supabase.table('storage_files').select(SCAN_COLUMNS).eq('is_active', True)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            rows = query.order('id').limit(PAGE_SIZE).execute().data or []
+            if not rows:
+                break
+            for row in rows:
+                if row.get('file_path'):
+                    records.setdefault(self._relative_path(row['file_path']), []).append(row)
+            loaded += len(rows)
+            last_id = rows[-1]['id']
+        
+        return records, expected is not None and loaded >= expected
+    
+    # ==================== HASH ====================
+    
+    def hash_file(self, path: Path, compression: str = None) -> str:
+        """SHA-256 del contenuto originale (decompresso se il blob è in gzip)"""
+        sha256 = hashlib.sha256()
+        chunk_size = STORAGE_CONFIG['chunk_size']
+        opener = gzip.open if compression == 'gzip' else open
+        with opener(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+    
+    def _verify(self, relative: str, row: Dict) -> Tuple[str, bool]:
+        path = self._absolute_path(relative)
+        try:
+            return relative, self.hash_file(path, row.get('compression')) == row['content_hash']
+        except (OSError, EOFError, zlib.error):
+            # File illeggibile o gzip troncato
+            return relative, False
+    
+    def _due_for_verification(self, candidates: Dict[str, List[Dict]]) -> List[str]:
+        """Percorsi da verificare: prima i mai verificati, poi i più vecchi"""
+        def last_verified(relative):
+            dates = [row.get('last_verified_at') or '' for row in candidates[relative]]
+            return min(dates)
+        return sorted(candidates, key=last_verified)[:self.verify_limit]
+    
+    def _mark_verified(self, rows: Iterable[Dict]):
+        ids = [row['id'] for row in rows]
+        if ids:
+            self.supabase.table('storage_files').update({
+                'last_verified_at': datetime.now().isoformat()
+            }).in_('id', ids).execute()
+    
+    # ==================== SCANSIONE ====================
+    
+    def scan(self, verify: bool = True) -> Dict:
+        """
+        Confronta disco e database e verifica un blocco di hash
+        
+        Returns:
+            Dict: missing (record), orphaned (percorsi relativi), corrupt
+            (record), verified (blob verificati), pending_verification (blob
+            rimasti da verificare in questa tornata), files_on_disk, records,
+            listing_complete (False se la lista dei record potrebbe essere
+            parziale: gli orfani non sono affidabili)
+        """
+        disk = self.scan_disk()
+        records, listing_complete = self.load_records()
+        
+        # Record con percorsi fuori dalle cartelle scansionate: verificati singolarmente
+        for relative in records:
+            if relative not in disk and not relative.startswith(tuple(f"{root}/" for root in STORAGE_ROOTS)):
+                path = self._absolute_path(relative)
+                if path.is_file():
+                    disk[relative] = path.stat()
+        
+        disk_paths = set(disk)
+        record_paths = set(records)
+        
+        missing_paths = record_paths - disk_paths
+        orphaned = sorted(disk_paths - record_paths)
+        
+        # Dimensione diversa da quella registrata: contenuto troncato o sostituito
+        corrupt_paths = set()
+        for relative in record_paths & disk_paths:
+            row = records[relative][0]
+            expected = row.get('stored_size') or (row.get('file_size') if not row.get('compression') else None)
+            if expected is not None and disk[relative].st_size != expected:
+                corrupt_paths.add(relative)
+        
+        verified = 0
+        pending = 0
+        if verify and self.verify_limit > 0:
+            candidates = {
+                relative: rows for relative, rows in records.items()
+                if relative in disk_paths and relative not in corrupt_paths and rows[0].get('content_hash')
+            }
+            due = self._due_for_verification(candidates)
+            pending = len(candidates) - len(due)
+            with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as executor:
+                results = list(executor.map(lambda relative: self._verify(relative, candidates[relative][0]), due))
+            verified = len(results)
+            valid_rows = []
+            for relative, valid in results:
+                if valid:
+                    valid_rows.extend(candidates[relative])
+                else:
+                    corrupt_paths.add(relative)
+            self._mark_verified(valid_rows)
+        
+        return {
+            'missing': [row for relative in sorted(missing_paths) for row in records[relative]],
+            'orphaned': orphaned,
+            'corrupt': [row for relative in sorted(corrupt_paths) for row in records[relative]],
+            'verified': verified,
+            'pending_verification': pending,
+            'files_on_disk': len(disk),
+            'records': sum(len(rows) for rows in records.values()),
+            'listing_complete': listing_complete
+        }
+    
+    # ==================== RICONCILIAZIONE ====================
+    
+    def remove_orphans(self, report: Dict) -> List[str]:
+        """
+        Elimina i file orfani di una scansione più vecchi di `orphan_grace_seconds`
+        
+        Il periodo di tolleranza evita di eliminare un blob appena scritto
+        da un upload il cui record non è ancora stato inserito. Se la lista
+        dei record della scansione non è completa non viene eliminato nulla:
+        un file vivo potrebbe risultare orfano.
+        
+        Returns:
+            List[str]: percorsi eliminati
+        
+        Raises:
+            RuntimeError: lista dei record incompleta
+        """
+        if not report.get('listing_complete'):
+            raise RuntimeError("Lista dei record incompleta: file orfani non eliminati")
+        orphaned = report['orphaned']
+        cutoff = time.time() - self.orphan_grace_seconds
+        removed = []
+        for relative in orphaned:
+            path = self._absolute_path(relative)
+            try:
+                if path.stat().st_mtime > cutoff:
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            removed.append(relative)
+            try:
+                # Cartella del prefisso hash rimasta vuota
+                if path.parent != self.base_dir / STORAGE_ROOTS[1]:
+                    path.parent.rmdir()
+            except OSError:
+                pass
+        return removed
+    
+    def deactivate_records(self, rows: Iterable[Dict]) -> int:
+        """Soft delete dei record senza file su disco, con un solo update"""
+        ids = [row['id'] for row in rows]
+        if not ids:
+            return 0
+        self.supabase.table('storage_files').update({'is_active': False}).in_('id', ids).execute()
+        return len(ids)
+
+
+def check_storage_files(silent=False, verify=False):
     """Verifica tutti i file nello storage"""
     
     if not silent:
@@ -23,55 +287,32 @@ def check_storage_files(silent=False):
         print("=" * 80)
     
     try:
-        # Crea client Supabase
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        report = StorageScanner().scan(verify=verify)
         
-        # Ottieni tutti i file attivi
-        result = supabase.table('storage_files').select('*').eq('is_active', True).order('uploaded_at', desc=True).execute()
-        
-        if not result.data:
+        if not report['records']:
             if not silent:
                 print("❌ Nessun file trovato nel database")
             return []
         
         if not silent:
-            print(f"\n📊 Trovati {len(result.data)} file nel database\n")
-        
-        # Lista dei file mancanti
-        missing_files = []
-        existing_files = []
-        
-        for file in result.data:
-            file_id = file.get('id')
-            filename = file.get('original_filename')
-            file_path = file.get('file_path')
+            print(f"\n📊 Trovati {report['records']} file nel database e {report['files_on_disk']} su disco\n")
+            for file in report['missing']:
+                print(f"❌ {file.get('original_filename')} (ID: {file.get('id')})")
+                print(f"   Path: {file.get('file_path')}")
+            for file in report['corrupt']:
+                print(f"⚠️ {file.get('original_filename')} (ID: {file.get('id')}) - contenuto corrotto")
+            for relative in report['orphaned']:
+                print(f"👻 {relative} - nessun record nel database")
             
-            # Costruisci percorso completo
-            if file_path:
-                if not file_path.startswith('/'):
-                    full_path = current_dir / file_path
-                else:
-                    full_path = Path(file_path)
-                
-                exists = full_path.exists()
-                
-                if not silent:
-                    print(f"{'✅' if exists else '❌'} {filename} (ID: {file_id})")
-                    if not exists:
-                        print(f"   Path: {file_path}")
-                        print()
-                
-                if exists:
-                    existing_files.append(file)
-                else:
-                    missing_files.append(file)
-        
-        if not silent:
             print("=" * 80)
-            print(f"✅ File esistenti: {len(existing_files)}")
-            print(f"❌ File mancanti: {len(missing_files)}")
+            print(f"✅ File esistenti: {report['records'] - len(report['missing'])}")
+            print(f"❌ File mancanti: {len(report['missing'])}")
+            print(f"👻 File orfani su disco: {len(report['orphaned'])}")
+            if verify:
+                print(f"🔐 Hash verificati: {report['verified']} (in attesa: {report['pending_verification']})")
+                print(f"⚠️ File corrotti: {len(report['corrupt'])}")
         
-        return missing_files
+        return report['missing']
     
     except Exception as e:
         if not silent:
@@ -79,6 +320,36 @@ def check_storage_files(silent=False):
         return None
 
 
+def scan_storage(delete_orphans=False):
+    """Verifica completa: file mancanti, orfani e un blocco di hash"""
+    
+    print("🔍 VERIFICA INTEGRITÀ STORAGE")
+    print("=" * 80)
+    
+    try:
+        scanner = StorageScanner()
+        report = scanner.scan()
+        
+        print(f"\n📊 {report['records']} record, {report['files_on_disk']} file su disco")
+        print(f"❌ File mancanti: {len(report['missing'])}")
+        print(f"👻 File orfani su disco: {len(report['orphaned'])}")
+        print(f"⚠️ File corrotti: {len(report['corrupt'])}")
+        print(f"🔐 Hash verificati: {report['verified']} (in attesa: {report['pending_verification']})")
+        
+        for file in report['corrupt']:
+            print(f"   ⚠️ {file.get('original_filename')} (ID: {file.get('id')}): {file.get('file_path')}")
+        
+        if delete_orphans and report['orphaned']:
+            removed = scanner.remove_orphans(report)
+            print(f"\n🧹 File orfani eliminati: {len(removed)}")
+        
+        return report
+    
+    except Exception as e:
+        print(f"❌ Errore: {e}")
+        return None
+
+
 def clean_orphan_files(auto_confirm=False):
     """Elimina record di file orfani"""
     
@@ -107,18 +378,7 @@ def clean_orphan_files(auto_confirm=False):
     print(f"\n🧹 Pulizia in corso...")
     
     try:
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        deleted_count = 0
-        
-        for file in missing:
-            try:
-                supabase.table('storage_files').update({
-                    'is_active': False
-                }).eq('id', file.get('id')).execute()
-                print(f"   ✅ Eliminato: {file.get('original_filename')}")
-                deleted_count += 1
-            except Exception as e:
-                print(f"   ❌ Errore: {e}")
+        deleted_count = StorageScanner().deactivate_records(missing)
         
         print(f"\n✅ PULIZIA COMPLETATA!")
         print(f"   File orfani eliminati: {deleted_count}")
@@ -139,29 +399,24 @@ def get_storage_stats():
     try:
         supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
         
-        # File attivi
-        active = supabase.table('storage_files').select('*').eq('is_active', True).execute()
-        # File inattivi
-        inactive = supabase.table('storage_files').select('*').eq('is_active', False).execute()
+        # Conteggi e somme calcolati nel database (database/migration_storage_listing.sql)
+        stats = supabase.rpc('get_storage_stats', {}).execute().data or {}
+        categories = stats.get('categories') or {}
+        # File inattivi: solo il conteggio
+        inactive = supabase.table('storage_files').select('id', count='exact').eq('is_active', False).limit(1).execute()
         
-        total_size = sum(f.get('file_size', 0) for f in active.data) if active.data else 0
+        total_files = sum(cat['count'] for cat in categories.values())
+        total_size = sum(cat['size'] for cat in categories.values())
         
-        print(f"\n📁 File Attivi: {len(active.data) if active.data else 0}")
-        print(f"🗑️  File Eliminati: {len(inactive.data) if inactive.data else 0}")
+        print(f"\n📁 File Attivi: {total_files}")
+        print(f"🗑️  File Eliminati: {inactive.count or 0}")
         print(f"💾 Spazio Usato: {total_size / 1024 / 1024:.2f} MB")
+        print(f"🗜️  Spazio su Disco: {(stats.get('stored_size') or 0) / 1024 / 1024:.2f} MB")
         
-        if active.data:
+        if categories:
             print(f"\n📂 Per Categoria:")
-            categories = {}
-            for f in active.data:
-                cat = f.get('category', 'Altro')
-                if cat not in categories:
-                    categories[cat] = {'count': 0, 'size': 0}
-                categories[cat]['count'] += 1
-                categories[cat]['size'] += f.get('file_size', 0)
-            
-            for cat, stats in sorted(categories.items()):
-                print(f"   {cat}: {stats['count']} file ({stats['size'] / 1024 / 1024:.2f} MB)")
+            for cat, cat_stats in sorted(categories.items()):
+                print(f"   {cat}: {cat_stats['count']} file ({cat_stats['size'] / 1024 / 1024:.2f} MB)")
         
         print()
     
@@ -173,8 +428,9 @@ if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description='Manutenzione Storage')
-    parser.add_argument('action', choices=['check', 'clean', 'stats'], help='Azione da eseguire')
+    parser.add_argument('action', choices=['check', 'scan', 'clean', 'stats'], help='Azione da eseguire')
     parser.add_argument('--auto', action='store_true', help='Auto-conferma (solo per clean)')
+    parser.add_argument('--delete-orphans', action='store_true', help='Elimina i file su disco senza record (solo per scan)')
     
     args = parser.parse_args()
     
@@ -182,6 +438,10 @@ if __name__ == "__main__":
         missing = check_storage_files()
         sys.exit(1 if missing and len(missing) > 0 else 0)
     
+    elif args.action == 'scan':
+        report = scan_storage(delete_orphans=args.delete_orphans)
+        sys.exit(1 if report is None or report['missing'] or report['corrupt'] else 0)
+    
     elif args.action == 'clean':
         deleted = clean_orphan_files(auto_confirm=args.auto)
         sys.exit(0 if deleted >= 0 else 1)
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Scheduler scadenze task per DASH_GESTIONE_LEAD
+Min-heap in memoria delle scadenze dei task aperti, caricato una sola volta e
+aggiornato dagli eventi di DatabaseManager, che invia una sola volta gli avvisi
+"in scadenza", "scaduto" e il report giornaliero
+Creato da Ezio Camporeale
+"""
+
+import sys
+import math
+import time
+import heapq
+import sqlite3
+import logging
+import itertools
+import threading
+from collections import Counter
+from datetime import datetime, date, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Any, Tuple, Callable
+
+# Aggiungi il percorso della directory corrente al path di Python
+current_dir = Path(__file__).parent.parent
+sys.path.append(str(current_dir))
+
+from config import TASK_SCHEDULER_CONFIG, TASK_SCHEDULER_PATH
+
+logger = logging.getLogger(__name__)
+
+DUE_SOON = 'task_due_soon'
+OVERDUE = 'task_overdue'
+DAILY_REPORT = 'daily_report'
+
+# Dopo una lettura fallita dei task si riprova il caricamento al più ogni N secondi
+RELOAD_RETRY_SECONDS = 30
+
+
+def parse_due(value: Any) -> Optional[float]:
+    """
+    Istante di scadenza (epoch) di un due_date
+
+    Una data senza orario (SQLite) scade alla fine di quel giorno, come nel
+    conteggio `due_date < DATE('now')` di get_task_stats.
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        return datetime.combine(value + timedelta(days=1), datetime.min.time()).timestamp()
+    text = str(value).strip()
+    try:
+        if len(text) == 10:
+            return (datetime.strptime(text, '%Y-%m-%d') + timedelta(days=1)).timestamp()
+        return datetime.fromisoformat(text.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        logger.warning(f"⚠️ due_date non valida: {value}")
+        return None
+
+
+def _default_report_provider() -> Dict[str, Any]:
+    from database.database_manager import DatabaseManager
+    return DatabaseManager().get_daily_report_data()
+
+
+def _default_task_fetcher(task_id: Any) -> Optional[Dict[str, Any]]:
+    from database.database_manager import DatabaseManager
+    return DatabaseManager().get_task_by_id(task_id)
+
+
+_telegram_manager = None
+
+
+def _telegram_notifier(notification_type: str, data: Dict[str, Any]):
+    """Accoda la notifica sul canale Telegram configurato"""
+    global _telegram_manager
+    if _telegram_manager is None:
+        from components.telegram.telegram_manager import TelegramManager
+        _telegram_manager = TelegramManager()
+    if _telegram_manager.is_configured:
+        _telegram_manager.send_notification(notification_type, data)
+
+
+class TaskDueScheduler:
+    """
+    Scadenze dei task aperti ordinate in un min-heap
+
+    Ogni task aperto con scadenza ha due eventi nell'heap: "in scadenza"
+    (`due_soon_hours` prima) e "scaduto". Le modifiche non cercano le voci
+    vecchie nell'heap: le invalidano confrontando la scadenza corrente del
+    task. Gli eventi già inviati sono registrati su SQLite, così ogni avviso
+    parte una sola volta anche dopo un riavvio.
+    """
+
+    def __init__(self, notifier: Callable[[str, Dict[str, Any]], None] = None,
+                 report_provider: Callable[[], Dict[str, Any]] = None,
+                 task_fetcher: Callable[[Any], Optional[Dict[str, Any]]] = None,
+                 db_path: Path = TASK_SCHEDULER_PATH, config: Dict[str, Any] = None,
+                 clock: Callable[[], float] = time.time):
+        config = config or TASK_SCHEDULER_CONFIG
+        self.notifier = notifier or _telegram_notifier
+        self.report_provider = report_provider or _default_report_provider
+        self.task_fetcher = task_fetcher or _default_task_fetcher
+        self.clock = clock
+        self.due_soon_seconds = config['due_soon_hours'] * 3600
+        self.closed_state_ids = set(config['closed_state_ids'])
+        self.report_hour, self.report_minute = (int(part) for part in config['daily_report_time'].split(':'))
+        self.max_sleep = config['max_sleep_seconds']
+        self.stats = Counter()
+        self.loaded = False
+        self.load_attempted_at: Optional[float] = None
+
+        self._lock = threading.RLock()
+        # (istante, progressivo, tipo evento, task_id, scadenza del task quando è stato inserito)
+        self._heap: List[Tuple[float, int, str, Any, float]] = []
+        self._seq = itertools.count()
+        self._tasks: Dict[Any, Dict[str, Any]] = {}
+        self._overdue: Set[Any] = set()
+        self._user_names: Dict[Any, str] = {}
+        self._priority_names: Dict[Any, str] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        db_path = str(db_path)
+        if db_path != ':memory:':
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS fired_events (event_key TEXT PRIMARY KEY, fired_at REAL NOT NULL)")
+        self.conn.commit()
+
+    # ==================== CARICAMENTO ====================
+
+    def load(self, tasks: List[Dict[str, Any]], user_names: Dict[Any, str] = None,
+             priority_names: Dict[Any, str] = None):
+        """
+        Costruisce l'heap dai task aperti (una sola lettura della tabella)
+
+        Args:
+            user_names: id utente -> nome mostrato negli avvisi
+            priority_names: priority_id -> nome della priorità (lead_priorities)
+        """
+        with self._lock:
+            self._heap.clear()
+            self._tasks.clear()
+            self._overdue.clear()
+            self._user_names = dict(user_names or {})
+            self._priority_names = dict(priority_names or {})
+            for task in tasks:
+                self._schedule(task)
+            self._push(self._daily_report_at(self.clock(), include_today=True), DAILY_REPORT, None, 0)
+            self.loaded = True
+        self._wake.set()
+        logger.info(f"✅ Scheduler scadenze caricato: {len(self._tasks)} task aperti con scadenza")
+
+    # ==================== EVENTI ====================
+
+    def _push(self, fire_at: float, kind: str, task_id: Any, due_at: float):
+        heapq.heappush(self._heap, (fire_at, next(self._seq), kind, task_id, due_at))
+
+    def _schedule(self, task: Dict[str, Any]):
+        task_id = task.get('id')
+        self._tasks.pop(task_id, None)
+        self._overdue.discard(task_id)
+        due_at = parse_due(task.get('due_date'))
+        if task_id is None or due_at is None or task.get('state_id') in self.closed_state_ids:
+            return
+        self._tasks[task_id] = {
+            'id': task_id,
+            'title': task.get('title'),
+            'due_date': task.get('due_date'),
+            'due_at': due_at,
+            'state_id': task.get('state_id'),
+            'assigned_to': task.get('assigned_to'),
+            'priority_id': task.get('priority_id'),
+            # Gli eventi di DatabaseManager portano solo priority_id
+            'priority': (task.get('priority_name') or self._priority_names.get(task.get('priority_id'))
+                         or task.get('priority'))
+        }
+        self._push(due_at - self.due_soon_seconds, DUE_SOON, task_id, due_at)
+        self._push(due_at, OVERDUE, task_id, due_at)
+
+    def on_task_saved(self, task: Dict[str, Any]):
+        """Evento creazione/modifica/cambio stato: `task` deve contenere almeno id"""
+        task_id = task.get('id')
+        if task_id is None:
+            return
+        with self._lock:
+            previous = self._tasks.get(task_id)
+            if previous:
+                # Aggiornamento parziale: conserva i campi non forniti
+                task = {**previous, **task}
+        if not previous and 'due_date' not in task and task.get('state_id') not in self.closed_state_ids:
+            # Task riaperto: servono titolo e scadenza
+            task = {**(self.task_fetcher(task_id) or {}), **task}
+        with self._lock:
+            self._schedule(task)
+        self._wake.set()
+
+    def on_task_deleted(self, task_id: Any):
+        """Evento eliminazione"""
+        with self._lock:
+            self._tasks.pop(task_id, None)
+            self._overdue.discard(task_id)
+
+    # ==================== INVIO ====================
+
+    def _daily_report_at(self, now: float, include_today: bool = False) -> float:
+        current = datetime.fromtimestamp(now)
+        report_at = current.replace(hour=self.report_hour, minute=self.report_minute, second=0, microsecond=0)
+        if report_at.timestamp() <= now and not include_today:
+            report_at += timedelta(days=1)
+        return report_at.timestamp()
+
+    def _mark_fired(self, event_key: str) -> bool:
+        """Registra l'evento; False se era già stato inviato"""
+        with self._lock:
+            cursor = self.conn.execute("INSERT OR IGNORE INTO fired_events (event_key, fired_at) VALUES (?, ?)",
+                                       (event_key, self.clock()))
+            self.conn.commit()
+        return cursor.rowcount == 1
+
+    def _unmark_fired(self, event_key: str):
+        with self._lock:
+            self.conn.execute("DELETE FROM fired_events WHERE event_key = ?", (event_key,))
+            self.conn.commit()
+
+    def _assigned_names(self, info: Dict[str, Any]) -> List[str]:
+        assigned_to = info.get('assigned_to')
+        if assigned_to is None:
+            return []
+        return [self._user_names.get(assigned_to, f"Utente {assigned_to}")]
+
+    def _notification_data(self, kind: str, info: Dict[str, Any], now: float) -> Dict[str, Any]:
+        data = {
+            'title': info.get('title') or 'N/A',
+            'assigned_to': self._assigned_names(info),
+            'priority': info.get('priority') or 'N/A',
+            'due_date': str(info.get('due_date'))[:16]
+        }
+        if kind == DUE_SOON:
+            data['days_left'] = max(1, math.ceil((info['due_at'] - now) / 86400))
+        else:
+            data['days_overdue'] = int((now - info['due_at']) // 86400)
+        return data
+
+    def _due_events(self, now: float) -> List[Tuple[str, str, Optional[Dict[str, Any]]]]:
+        """Estrae dall'heap gli eventi scaduti e ancora validi: (chiave, tipo, task)"""
+        events = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, _, kind, task_id, due_at = heapq.heappop(self._heap)
+                if kind == DAILY_REPORT:
+                    # task_id è il giorno del report solo nei nuovi tentativi dopo un invio fallito:
+                    # la catena dei giorni successivi prosegue dalla voce originale
+                    if task_id is None:
+                        task_id = str(datetime.fromtimestamp(fire_at).date())
+                        self._push(self._daily_report_at(now), DAILY_REPORT, None, 0)
+                    events.append((f"{DAILY_REPORT}:{task_id}", kind, {'id': task_id}))
+                    continue
+                info = self._tasks.get(task_id)
+                if not info or info['due_at'] != due_at:
+                    self.stats['stale'] += 1
+                    continue
+                if kind == OVERDUE:
+                    self._overdue.add(task_id)
+                elif now >= due_at:
+                    # Già scaduto: vale solo l'avviso di scadenza superata
+                    continue
+                events.append((f"{kind}:{task_id}:{int(due_at)}", kind, dict(info)))
+        return events
+
+    def run_pending(self) -> int:
+        """
+        Invia gli avvisi arrivati a scadenza
+
+        Returns:
+            Numero di notifiche inviate
+        """
+        now = self.clock()
+        sent = 0
+        for event_key, kind, info in self._due_events(now):
+            if not self._mark_fired(event_key):
+                self.stats['already_fired'] += 1
+                continue
+            try:
+                data = self.report_provider() if kind == DAILY_REPORT else self._notification_data(kind, info, now)
+                self.notifier(kind, data)
+                self.stats[kind] += 1
+                sent += 1
+            except Exception as e:
+                # Riprova al prossimo giro
+                logger.error(f"❌ Errore invio avviso {event_key}: {e}")
+                self._unmark_fired(event_key)
+                with self._lock:
+                    self._push(now + self.max_sleep, kind, info['id'], info.get('due_at', 0))
+        return sent
+
+    # ==================== INTERROGAZIONE ====================
+
+    def overdue_count(self) -> int:
+        """Task aperti con scadenza superata"""
+        with self._lock:
+            return len(self._overdue)
+
+    def overdue_tasks(self, limit: int = None) -> List[Dict[str, Any]]:
+        """Task aperti scaduti, dal più vecchio"""
+        with self._lock:
+            tasks = sorted((dict(self._tasks[task_id]) for task_id in self._overdue), key=lambda task: task['due_at'])
+        return tasks[:limit] if limit else tasks
+
+    def due_tasks(self, until: float, limit: int = None) -> List[Dict[str, Any]]:
+        """Task aperti non ancora scaduti con scadenza entro `until`"""
+        with self._lock:
+            tasks = sorted((dict(task) for task_id, task in self._tasks.items()
+                            if task_id not in self._overdue and task['due_at'] <= until),
+                           key=lambda task: task['due_at'])
+        return tasks[:limit] if limit else tasks
+
+    def next_fire_at(self) -> Optional[float]:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def size(self) -> int:
+        """Task aperti con scadenza nello scheduler"""
+        return len(self._tasks)
+
+    # ==================== WORKER ====================
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.error(f"❌ Errore scheduler scadenze: {e}")
+            next_fire = self.next_fire_at()
+            sleep = self.max_sleep if next_fire is None else min(self.max_sleep, max(next_fire - self.clock(), 0))
+            self._wake.wait(sleep)
+            self._wake.clear()
+
+    def start(self):
+        """Avvia il worker in background (una sola volta per processo)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='task-due-scheduler', daemon=True)
+            self._thread.start()
+        logger.info("⏰ Scheduler scadenze task avviato")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+# ==================== ISTANZA CONDIVISA ====================
+
+_shared_scheduler: Optional[TaskDueScheduler] = None
+_shared_lock = threading.Lock()
+
+
+def get_task_due_scheduler(db_manager=None, start: bool = True) -> TaskDueScheduler:
+    """
+    Restituisce lo scheduler condiviso dal processo, caricandolo e avviandolo al primo uso
+
+    Se la lettura dei task fallisce lo scheduler resta non caricato (e non
+    avviato) e il caricamento viene ritentato al più ogni RELOAD_RETRY_SECONDS.
+    """
+    global _shared_scheduler
+    if _shared_scheduler is not None and _shared_scheduler.loaded:
+        return _shared_scheduler
+
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = TaskDueScheduler()
+        attempted_at = _shared_scheduler.load_attempted_at
+        retry_due = attempted_at is None or time.monotonic() - attempted_at >= RELOAD_RETRY_SECONDS
+        if not _shared_scheduler.loaded and retry_due:
+            _shared_scheduler.load_attempted_at = time.monotonic()
+            if db_manager is None:
+                from database.database_manager import DatabaseManager
+                db_manager = DatabaseManager()
+            try:
+                tasks = db_manager.get_open_tasks(_shared_scheduler.closed_state_ids)
+            except Exception as e:
+                logger.error(f"❌ Scheduler scadenze non caricato, nuovo tentativo tra {RELOAD_RETRY_SECONDS}s: {e}")
+                return _shared_scheduler
+            user_names = {
+                user['id']: f"{user.get('first_name') or ''} {user.get('last_name') or ''}".strip() or user.get('username')
+                for user in db_manager.get_all_users()
+            }
+            priority_names = {priority['id']: priority['name'] for priority in db_manager.get_lead_priorities()}
+            _shared_scheduler.load(tasks, user_names, priority_names)
+            if start:
+                _shared_scheduler.start()
+    return _shared_scheduler
+
+
+def notify_task_saved(task: Dict[str, Any]):
+    """Propaga una creazione/modifica allo scheduler se già caricato"""
+    if _shared_scheduler is not None and _shared_scheduler.loaded:
+        _shared_scheduler.on_task_saved(task)
+
+
+def notify_task_deleted(task_id: Any):
+    """Propaga un'eliminazione allo scheduler se già caricato"""
+    if _shared_scheduler is not None and _shared_scheduler.loaded:
+        _shared_scheduler.on_task_deleted(task_id)